@@ -3,11 +3,16 @@ MVAI Connexx - AI Assistant Module
 Geïsoleerde AI Secretaresse per klant met opt-in systeem
 """
 import json
+import os
 import re
+import threading
+import time
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import database as db
 import config
+import ai_response_cache
+import shared_state
 
 # OpenAI API integration
 try:
@@ -30,13 +35,21 @@ class AIAssistant:
     - Proactieve suggesties
     """
 
+    # Maximaal aantal berichten (user + assistant) in het geheugen
+    HISTORY_LIMIT = 20
+
     def __init__(self, customer_id):
         self.customer_id = customer_id
         self.enabled = self.check_if_enabled()
         self.preferences = self.load_preferences()
-        self.conversation_history = []
         self.learned_patterns = {}
 
+        # Gesprek geheugen: lazy geladen uit ai_conversations
+        self._history = None
+        self._last_conversation_id = None
+        self._history_lock = threading.RLock()
+        self._context = None  # (expires_at, customer, recent_logs)
+
         # Multi-provider AI client (BYOK of platform key)
         self._provider = None
         try:
@@ -91,6 +104,78 @@ class AIAssistant:
             'notifications': True
         }
 
+    # ══════════════════════════════════════════════════
+    # GESPREK GEHEUGEN
+    # ══════════════════════════════════════════════════
+
+    @property
+    def conversation_history(self):
+        """Laatste HISTORY_LIMIT berichten, bij eerste gebruik geladen uit ai_conversations"""
+        with self._history_lock:
+            if self._history is None:
+                self._history = self._load_history()
+            return self._history
+
+    def _load_history(self):
+        with db.get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_message, ai_response, timestamp
+                FROM ai_conversations
+                WHERE customer_id = ? AND success = 1
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (self.customer_id, self.HISTORY_LIMIT // 2))
+            rows = cursor.fetchall()
+            cursor.execute('SELECT MAX(id) FROM ai_conversations WHERE customer_id = ?',
+                           (self.customer_id,))
+            self._last_conversation_id = cursor.fetchone()[0] or 0
+
+        history = []
+        for row in reversed(rows):
+            history.append({"role": "user", "content": row['user_message'], "timestamp": row['timestamp']})
+            history.append({"role": "assistant", "content": row['ai_response'], "timestamp": row['timestamp']})
+        return history
+
+    def _remember(self, user_message, result):
+        """Bewaar chat turn in ai_conversations en in de geladen history"""
+        success = bool(result.get('success', True))
+        ai_response = result.get('message') or ''
+        with self._history_lock:
+            with db.get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT MAX(id) FROM ai_conversations WHERE customer_id = ?',
+                               (self.customer_id,))
+                previous_id = cursor.fetchone()[0] or 0
+                cursor.execute('''
+                    INSERT INTO ai_conversations (customer_id, user_message, ai_response, intent, success)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (self.customer_id, user_message, ai_response,
+                      result.get('intent', 'ai_chat'), success))
+                conversation_id = cursor.lastrowid
+
+            if self._history is None:
+                return
+            if previous_id != self._last_conversation_id:
+                # Andere worker heeft intussen turns opgeslagen: opnieuw laden bij volgend gebruik
+                self._history = None
+                return
+
+            self._last_conversation_id = conversation_id
+            if success:
+                timestamp = datetime.now().isoformat()
+                self._history.append({"role": "user", "content": user_message, "timestamp": timestamp})
+                self._history.append({"role": "assistant", "content": ai_response, "timestamp": timestamp})
+                del self._history[:-self.HISTORY_LIMIT]
+
+    def _get_prompt_context(self):
+        """Klant data en recente logs voor de system prompt (AI_ASSISTANT_CONTEXT_TTL hergebruikt)"""
+        now = time.monotonic()
+        if self._context is None or self._context[0] <= now:
+            self._context = (now + config.Config.AI_ASSISTANT_CONTEXT_TTL,
+                             self._get_customer_data(), self._get_recent_logs(limit=10))
+        return self._context[1], self._context[2]
+
     # ══════════════════════════════════════════════════
     # OPENAI-POWERED CHAT (PRIMARY METHOD)
     # ══════════════════════════════════════════════════
@@ -109,7 +194,15 @@ class AIAssistant:
                 'message': str (AI response),
                 'data': dict (optional structured data)
             }
+
+        Elke turn wordt opgeslagen in ai_conversations.
         """
+        result = self._respond(user_message, context)
+        if self.enabled:
+            self._remember(user_message, result)
+        return result
+
+    def _respond(self, user_message, context=None):
         if not self.enabled:
             return {
                 'success': False,
@@ -136,11 +229,69 @@ class AIAssistant:
         # Fallback: gebruik bestaande rule-based system
         return self.process_command(user_message)
 
-    def _chat_with_provider(self, user_message, context=None):
-        """Gebruik de multi-provider AI layer (BYOK of platform key)"""
+    # ══════════════════════════════════════════════════
+    # STREAMING CHAT
+    # ══════════════════════════════════════════════════
+
+    def chat_stream(self, user_message, context=None):
+        """
+        Streaming variant van chat(): generator van tekst deltas zodra de provider
+        ze levert. De return waarde (via yield from) is het resultaat dict zoals
+        chat() het geeft; de turn wordt na afloop opgeslagen in ai_conversations.
+        """
+        result = yield from self._respond_stream(user_message, context)
+        if self.enabled:
+            self._remember(user_message, result)
+        return result
 
-        customer = self._get_customer_data()
-        recent_logs = self._get_recent_logs(limit=10)
+    def _respond_stream(self, user_message, context=None):
+        if self.enabled and self._provider:
+            cached, cache_key = self._lookup_cached(user_message, context)
+            if cached:
+                return (yield from self._stream_result(cached))
+
+            system_prompt, messages = self._build_provider_request(user_message, context)
+            stream = self._provider.chat_stream(system_prompt, messages, max_tokens=1000)
+            parts = []
+            try:
+                while True:
+                    try:
+                        delta = next(stream)
+                    except StopIteration as stop:
+                        result = {'success': True, 'message': ''.join(parts), **(stop.value or {})}
+                        self._store_cached(cache_key, user_message, context, result)
+                        return result
+                    except Exception as e:
+                        print(f"AI provider error: {e}")
+                        if parts:
+                            # Halverwege afgebroken: gedeeltelijk antwoord is al getoond
+                            return {'success': False, 'message': ''.join(parts), 'error': str(e)}
+                        break
+                    parts.append(delta)
+                    yield delta
+            finally:
+                stream.close()
+            # Fallback naar rule-based system
+            return (yield from self.stream_command(user_message))
+
+        # Legacy OpenAI client en uitgeschakelde assistant: volledig antwoord in één keer
+        return (yield from self._stream_result(self._respond(user_message, context)))
+
+    def stream_command(self, user_input):
+        """process_command() als generator van deltas (rule-based fallback)"""
+        return (yield from self._stream_result(self.process_command(user_input)))
+
+    @staticmethod
+    def _stream_result(result):
+        """Stream een kant-en-klaar resultaat woord voor woord; geeft het resultaat terug"""
+        for chunk in re.findall(r'\s*\S+\s*', result.get('message') or ''):
+            yield chunk
+        return result
+
+    def _build_provider_request(self, user_message, context=None):
+        """System prompt en berichten (laatste 5 uit history) voor de provider"""
+
+        customer, recent_logs = self._get_prompt_context()
 
         system_prompt = f"""Je bent een persoonlijke AI Secretaresse voor MVAI Connexx, een logistiek data platform.
 
@@ -172,38 +323,67 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
             ])
             system_prompt += f"\n\nRecentste logs:\n{logs_summary}"
 
-        # Bouw berichten lijst (laatste 5 uit history)
-        messages = [
+        messages = self._history_window()
+        messages.append({"role": "user", "content": user_message})
+
+        return system_prompt, messages
+
+    def _history_window(self):
+        """Laatste 5 berichten uit history, zoals ze naar de provider gaan"""
+        return [
             {"role": msg["role"], "content": msg["content"]}
             for msg in self.conversation_history[-5:]
         ]
-        messages.append({"role": "user", "content": user_message})
 
+    def _chat_with_provider(self, user_message, context=None):
+        """Gebruik de multi-provider AI layer (BYOK of platform key)"""
+        cached, cache_key = self._lookup_cached(user_message, context)
+        if cached:
+            return cached
+
+        system_prompt, messages = self._build_provider_request(user_message, context)
         result = self._provider.chat(system_prompt, messages, max_tokens=1000)
+        self._store_cached(cache_key, user_message, context, result)
+        return result
 
-        if result.get('success'):
-            ai_response = result['message']
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now().isoformat()
-            })
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.now().isoformat()
-            })
-            if len(self.conversation_history) > 20:
-                self.conversation_history = self.conversation_history[-20:]
+    # ══════════════════════════════════════════════════
+    # RESPONSE CACHE
+    # ══════════════════════════════════════════════════
 
-        return result
+    def _lookup_cached(self, user_message, context=None):
+        """
+        Gecachte antwoord op dezelfde vraag (zelfde klant data versie en provider/model)
+        zonder system prompt op te bouwen. Geeft (resultaat of None, cache_key).
+        Vervolgvragen binnen een gesprek slaan de cache over: hun antwoord hangt af van de history.
+        """
+        if not config.Config.AI_RESPONSE_CACHE_ENABLED:
+            return None, None
+        if self.conversation_history and ai_response_cache.is_follow_up(user_message):
+            return None, None
+        try:
+            cache_key = {
+                'data_version': ai_response_cache.customer_data_version(self.customer_id, self.preferences),
+                'provider': getattr(self._provider, 'provider_name', type(self._provider).__name__),
+                'model': getattr(self._provider, 'model', '') or '',
+            }
+            return ai_response_cache.lookup(self.customer_id, user_message, context=context, **cache_key), cache_key
+        except Exception as e:
+            print(f"⚠️ AI response cache lookup mislukt: {e}")
+            return None, None
+
+    def _store_cached(self, cache_key, user_message, context, result):
+        if cache_key is None:
+            return
+        try:
+            ai_response_cache.store(self.customer_id, user_message, result=result, context=context, **cache_key)
+        except Exception as e:
+            print(f"⚠️ AI response cache store mislukt: {e}")
 
     def _chat_with_openai(self, user_message, context=None):
         """Gebruik OpenAI GPT voor intelligente responses (legacy fallback)"""
 
         # Haal klant data op voor context
-        customer = self._get_customer_data()
-        recent_logs = self._get_recent_logs(limit=10)
+        customer, recent_logs = self._get_prompt_context()
 
         # Bouw system prompt
         system_prompt = f"""Je bent een persoonlijke AI Secretaresse voor MVAI Connexx, een logistiek data platform.
@@ -254,22 +434,6 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
 
             ai_response = response.choices[0].message.content
 
-            # Bewaar in conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now().isoformat()
-            })
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.now().isoformat()
-            })
-
-            # Hou max 20 berichten in history
-            if len(self.conversation_history) > 20:
-                self.conversation_history = self.conversation_history[-20:]
-
             return {
                 'success': True,
                 'message': ai_response,
@@ -390,25 +554,18 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
         # Detecteer tijdsperiode
         period = self._extract_time_period(text)
 
-        # Haal data op
-        logs = db.get_customer_logs(self.customer_id, limit=1000)
-
-        # Filter op periode
-        if period:
-            logs = [
-                log for log in logs
-                if self._is_in_period(log['timestamp'], period)
-            ]
+        # Aggregaten over de hele periode (rollup tabellen, geen ruwe logs)
+        aggregate = self._query_period_aggregate(period)
 
         # Genereer rapport
         report = {
             'title': f'Rapport {period or "Alle data"}',
             'generated_at': datetime.now().isoformat(),
             'period': period or 'all_time',
-            'total_logs': len(logs),
-            'summary': self._generate_summary(logs),
-            'insights': self._generate_insights(logs),
-            'recommendations': self._generate_recommendations(logs)
+            'total_logs': aggregate['total'],
+            'summary': self._generate_summary(aggregate),
+            'insights': self._generate_insights(aggregate),
+            'recommendations': self._generate_recommendations(aggregate)
         }
 
         # Sla rapport op
@@ -423,22 +580,15 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
     def _get_statistics(self, text):
         """Haal statistieken op"""
         period = self._extract_time_period(text)
-        logs = db.get_customer_logs(self.customer_id, limit=10000)
-
-        # Filter op periode
-        if period:
-            logs = [
-                log for log in logs
-                if self._is_in_period(log['timestamp'], period)
-            ]
+        aggregate = self._query_period_aggregate(period)
 
         stats = {
-            'total': len(logs),
+            'total': aggregate['total'],
             'period': period or 'all_time',
-            'unique_ips': len(set(log['ip_address'] for log in logs)),
-            'avg_per_day': len(logs) / max(1, self._days_in_period(period)),
-            'peak_hour': self._get_peak_hour(logs),
-            'trend': self._calculate_trend(logs)
+            'unique_ips': aggregate['unique_ips'],
+            'avg_per_day': aggregate['total'] / max(1, self._days_in_period(period, aggregate)),
+            'peak_hour': self._get_peak_hour(period),
+            'trend': self._calculate_trend(aggregate)
         }
 
         return {
@@ -450,18 +600,9 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
     def _show_trend(self, text):
         """Toon trend analyse"""
         period = self._extract_time_period(text) or 'afgelopen_maand'
-        logs = db.get_customer_logs(self.customer_id, limit=10000)
 
-        # Groepeer per dag
-        daily_counts = defaultdict(int)
-        for log in logs:
-            date = log['timestamp'][:10]
-            daily_counts[date] += 1
-
-        trend_data = [
-            {'date': date, 'count': count}
-            for date, count in sorted(daily_counts.items())
-        ]
+        # Logs per dag in de periode
+        trend_data = self._query_daily_counts(period)
 
         # Bereken trend richting
         if len(trend_data) > 1:
@@ -713,60 +854,124 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
             return 'afgelopen_maand'
         return None
 
-    def _is_in_period(self, timestamp, period):
-        """Check of timestamp in periode valt"""
-        log_date = datetime.strptime(timestamp[:10], '%Y-%m-%d')
-        now = datetime.now()
+    # ══════════════════════════════════════════════════
+    # PERIODE QUERIES (ROLLUP TABELLEN)
+    # ══════════════════════════════════════════════════
+
+    def _period_range(self, period):
+        """(eerste dag, laatste dag) als 'YYYY-MM-DD', of (None, None) voor alle data"""
+        today = datetime.now().date()
 
         if period == 'vandaag':
-            return log_date.date() == now.date()
+            start = end = today
         elif period == 'gisteren':
-            return log_date.date() == (now - timedelta(days=1)).date()
+            start = end = today - timedelta(days=1)
         elif period == 'deze_week':
-            return log_date >= now - timedelta(days=now.weekday())
+            start, end = today - timedelta(days=today.weekday()), today
         elif period == 'afgelopen_week':
-            week_start = now - timedelta(days=now.weekday() + 7)
-            week_end = week_start + timedelta(days=7)
-            return week_start <= log_date <= week_end
+            start = today - timedelta(days=today.weekday() + 7)
+            end = start + timedelta(days=6)
         elif period == 'deze_maand':
-            return log_date.month == now.month and log_date.year == now.year
+            start, end = today.replace(day=1), today
         elif period == 'afgelopen_maand':
-            last_month = now.replace(day=1) - timedelta(days=1)
-            return log_date.month == last_month.month and log_date.year == last_month.year
+            end = today.replace(day=1) - timedelta(days=1)
+            start = end.replace(day=1)
+        else:
+            return None, None
 
-        return True
+        return start.isoformat(), end.isoformat()
+
+    def _query_period_aggregate(self, period):
+        """
+        Totaal, unieke IPs, eerste/laatste dag, laatste log en de verdeling over
+        de eerste en tweede helft van de periode. Constante omvang, ongeacht historie.
+        """
+        start, end = self._period_range(period)
+        with db.get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH r AS (
+                    SELECT bucket, log_count, last_ts FROM log_rollups_daily
+                    WHERE customer_id = ? AND bucket BETWEEN ? AND ?
+                ),
+                span AS (
+                    SELECT julianday(COALESCE(?, MIN(bucket))) AS first_jd,
+                           julianday(COALESCE(?, MAX(bucket))) AS last_jd
+                    FROM r
+                )
+                SELECT
+                    COALESCE(SUM(r.log_count), 0) AS total,
+                    MIN(r.bucket) AS first_day,
+                    MAX(r.bucket) AS last_day,
+                    MAX(r.last_ts) AS last_log,
+                    COALESCE(SUM(CASE WHEN julianday(r.bucket) < (span.first_jd + span.last_jd + 1) / 2.0
+                                      THEN r.log_count END), 0) AS first_half
+                FROM span LEFT JOIN r ON 1
+            ''', (self.customer_id, start or '0000-01-01', end or '9999-12-31', start, end))
+            aggregate = dict(cursor.fetchone())
 
-    def _days_in_period(self, period):
-        """Bereken aantal dagen in periode"""
+            cursor.execute('''
+                SELECT COUNT(DISTINCT ip_address) FROM log_rollup_ips
+                WHERE customer_id = ? AND bucket BETWEEN ? AND ?
+            ''', (self.customer_id, start or '0000-01-01', end or '9999-12-31'))
+            aggregate['unique_ips'] = cursor.fetchone()[0]
+
+        aggregate['second_half'] = aggregate['total'] - aggregate['first_half']
+        return aggregate
+
+    def _query_daily_counts(self, period):
+        """Logs per dag in de periode: [{'date', 'count'}]"""
+        start, end = self._period_range(period)
+        with db.get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT bucket AS date, log_count AS count FROM log_rollups_daily
+                WHERE customer_id = ? AND bucket BETWEEN ? AND ?
+                ORDER BY bucket
+            ''', (self.customer_id, start or '0000-01-01', end or '9999-12-31'))
+            return [{'date': row['date'], 'count': row['count']} for row in cursor.fetchall()]
+
+    def _days_in_period(self, period, aggregate=None):
+        """Bereken aantal dagen in periode (zonder periode: dagen tussen eerste en laatste log)"""
         if period in ['vandaag', 'gisteren']:
             return 1
-        elif 'week' in period:
+        elif period and 'week' in period:
             return 7
-        elif 'maand' in period:
+        elif period and 'maand' in period:
             return 30
+        elif aggregate and aggregate['first_day']:
+            first = datetime.strptime(aggregate['first_day'], '%Y-%m-%d')
+            last = datetime.strptime(aggregate['last_day'], '%Y-%m-%d')
+            return (last - first).days + 1
         return 1
 
-    def _get_peak_hour(self, logs):
+    def _get_peak_hour(self, period):
         """Vind piek uur"""
-        hours = defaultdict(int)
-        for log in logs:
-            hour = int(log['timestamp'][11:13])
-            hours[hour] += 1
+        start, end = self._period_range(period)
+        with db.get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT CAST(substr(bucket, 12, 2) AS INTEGER) AS hour, SUM(log_count) AS count
+                FROM log_rollups_hourly
+                WHERE customer_id = ? AND bucket BETWEEN ? AND ?
+                GROUP BY hour
+                ORDER BY count DESC, hour
+                LIMIT 1
+            ''', (self.customer_id, f"{start or '0000-01-01'} 00:00:00", f"{end or '9999-12-31'} 23:59:59"))
+            peak = cursor.fetchone()
 
-        if not hours:
+        if not peak:
             return None
 
-        peak = max(hours.items(), key=lambda x: x[1])
-        return f"{peak[0]}:00 ({peak[1]} logs)"
+        return f"{peak['hour']}:00 ({peak['count']} logs)"
 
-    def _calculate_trend(self, logs):
-        """Bereken trend"""
-        if len(logs) < 2:
+    def _calculate_trend(self, aggregate):
+        """Bereken trend (tweede helft van de periode t.o.v. de eerste)"""
+        if aggregate['total'] < 2:
             return 'stabiel'
 
-        mid = len(logs) // 2
-        first_half = len(logs[:mid])
-        second_half = len(logs[mid:])
+        first_half = aggregate['first_half']
+        second_half = aggregate['second_half']
 
         if second_half > first_half * 1.2:
             return 'stijgend'
@@ -774,35 +979,35 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
             return 'dalend'
         return 'stabiel'
 
-    def _generate_summary(self, logs):
+    def _generate_summary(self, aggregate):
         """Genereer samenvatting van logs"""
-        if not logs:
+        if not aggregate['total']:
             return "Geen data beschikbaar"
 
-        return f"{len(logs)} logs geanalyseerd. Meest recente: {logs[0]['timestamp'][:16]}"
+        return f"{aggregate['total']} logs geanalyseerd. Meest recente: {aggregate['last_log'][:16]}"
 
-    def _generate_insights(self, logs):
+    def _generate_insights(self, aggregate):
         """Genereer inzichten"""
         insights = []
 
-        if len(logs) > 100:
+        if aggregate['total'] > 100:
             insights.append("Hoge activiteit gedetecteerd")
 
         # Check voor unieke IPs
-        unique_ips = len(set(log['ip_address'] for log in logs))
-        if unique_ips < len(logs) * 0.1:
+        unique_ips = aggregate['unique_ips']
+        if unique_ips < aggregate['total'] * 0.1:
             insights.append(f"Verkeer komt van slechts {unique_ips} IPs - zeer geconcentreerd")
 
         return insights
 
-    def _generate_recommendations(self, logs):
+    def _generate_recommendations(self, aggregate):
         """Genereer aanbevelingen"""
         recommendations = []
 
-        if len(logs) > 1000:
+        if aggregate['total'] > 1000:
             recommendations.append("Overweeg data archivering voor oudere logs")
 
-        if len(set(log['ip_address'] for log in logs)) > 100:
+        if aggregate['unique_ips'] > 100:
             recommendations.append("Veel verschillende IPs - overweeg rate limiting")
 
         return recommendations
@@ -836,9 +1041,111 @@ Geef altijd concrete, actionable antwoorden gebaseerd op de data."""
 # GLOBAL AI FUNCTIONS
 # ═══════════════════════════════════════════════════════
 
+class AssistantRegistry:
+    """
+    Begrensde LRU/TTL registry van AIAssistant instanties per klant (per worker).
+    Bespaart per request de enabled/voorkeuren/provider queries, de Fernet decrypt
+    en een nieuwe SDK client. Invalidatie verhoogt een versie teller per klant in de
+    shared_state backend; elke worker vergelijkt die bij get() en bouwt opnieuw op
+    (een verwijderde BYOK key wordt zo direct in alle workers niet meer gebruikt).
+    """
+
+    # Versie tellers in de shared_state backend (zelfde patroon als de IP lists)
+    VERSION_KEY = 'ai_assistant:version'
+    VERSION_TTL = 10 * 365 * 24 * 3600
+
+    def __init__(self, max_size=None, ttl=None, backend=None):
+        self.max_size = config.Config.AI_ASSISTANT_CACHE_SIZE if max_size is None else max_size
+        self.ttl = config.Config.AI_ASSISTANT_CACHE_TTL if ttl is None else ttl
+        self._backend = backend
+        self._entries = OrderedDict()   # customer_id -> (assistant, expires_at, versie)
+        self._lock = threading.Lock()
+        self._generation = 0            # Verhoogd bij elke invalidatie
+        self.pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        return self._backend or shared_state.get_backend()
+
+    def _version(self, customer_id):
+        """(globale, klant) versie; verandert bij elke invalidatie in welke worker dan ook"""
+        backend = self.backend
+        return (backend.get(self.VERSION_KEY), backend.get(f'{self.VERSION_KEY}:{customer_id}'))
+
+    def get(self, customer_id):
+        version = self._version(customer_id)
+        with self._lock:
+            if self.pid != os.getpid():
+                # Na fork geen SDK clients van de parent hergebruiken
+                self._entries.clear()
+                self.pid = os.getpid()
+            entry = self._entries.get(customer_id)
+            if entry is not None and entry[1] > time.monotonic() and entry[2] == version:
+                self._entries.move_to_end(customer_id)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(customer_id, None)
+            self.misses += 1
+            generation = self._generation
+
+        assistant = AIAssistant(customer_id)
+
+        # Uitgeschakelde assistants niet bewaren: activeren in een andere worker werkt dan direct
+        if assistant.enabled and self.max_size > 0 and self.ttl > 0:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[customer_id] = (assistant, time.monotonic() + self.ttl, version)
+                    self._entries.move_to_end(customer_id)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+        return assistant
+
+    def invalidate(self, customer_id=None):
+        """Verwijder klant (of iedereen bij None) in alle workers zodat de volgende get opnieuw laadt"""
+        key = self.VERSION_KEY if customer_id is None else f'{self.VERSION_KEY}:{customer_id}'
+        self.backend.incr(key, self.VERSION_TTL)
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if customer_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(customer_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_registry = AssistantRegistry()
+
+
 def get_assistant(customer_id):
-    """Haal AI Assistant op voor klant"""
-    return AIAssistant(customer_id)
+    """Haal AI Assistant op voor klant (hergebruikt uit de registry)"""
+    return _registry.get(customer_id)
+
+def invalidate_assistant(customer_id=None):
+    """Gooi gecachte assistant weg na wijziging van activatie, voorkeuren of provider"""
+    _registry.invalidate(customer_id)
+
+def get_assistant_registry_stats():
+    """Registry statistieken voor monitoring"""
+    return _registry.stats()
 
 def enable_assistant(customer_id):
     """Activeer AI Assistant voor klant"""
@@ -849,6 +1156,7 @@ def enable_assistant(customer_id):
             SET ai_assistant_enabled = 1
             WHERE id = ?
         ''', (customer_id,))
+    invalidate_assistant(customer_id)
 
 def disable_assistant(customer_id):
     """Deactiveer AI Assistant"""
@@ -859,6 +1167,7 @@ def disable_assistant(customer_id):
             SET ai_assistant_enabled = 0
             WHERE id = ?
         ''', (customer_id,))
+    invalidate_assistant(customer_id)
 
 if __name__ == '__main__':
     print("AI Assistant module loaded successfully")
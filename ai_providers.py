@@ -3,9 +3,16 @@ MVAI Connexx - Multi-AI Provider Abstraction Layer
 Ondersteunt: OpenAI (GPT-4), Claude (Anthropic), Gemini (Google), Cohere
 Elke klant kan zijn eigen API key gebruiken (BYOK - Bring Your Own Key)
 """
+import atexit
 import base64
 import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
 import requests
+from requests.adapters import HTTPAdapter
 from cryptography.fernet import Fernet
 
 import database as db
@@ -13,11 +20,18 @@ import config
 
 # ── Optional library imports (graceful degradation) ─────────────────────
 try:
+    import openai
     from openai import OpenAI
     OPENAI_LIB = True
 except ImportError:
     OPENAI_LIB = False
 
+try:
+    import httpx  # Pool limieten voor de SDK clients
+    HTTPX_LIB = True
+except ImportError:
+    HTTPX_LIB = False
+
 try:
     import anthropic
     ANTHROPIC_LIB = True
@@ -81,6 +95,167 @@ def decrypt_api_key(ciphertext: str) -> str:
     return _get_fernet().decrypt(ciphertext.encode()).decode()
 
 
+# ── Client registry (keep-alive pools) ───────────────────────────────────
+class ClientRegistry:
+    """
+    Proces-brede HTTP sessions en SDK clients, zodat niet elke chat een nieuwe
+    TCP+TLS handshake naar de provider kost.
+    - REST providers (Gemini, Cohere): één requests.Session per provider; de API
+      key gaat per request mee, dus alle klanten delen dezelfde keep-alive pool
+    - SDK providers (OpenAI, Anthropic): client per provider + API key (LRU
+      begrensd); de SDK client houdt zijn eigen keep-alive pool. Een uit de LRU
+      gevallen client wordt niet gesloten: providers (en lopende requests) kunnen
+      hem nog gebruiken, de GC ruimt hem op zodra niemand hem meer vasthoudt
+    """
+
+    def __init__(self, pool_size=None, max_clients=None):
+        cfg = config.Config
+        self.pool_size = cfg.AI_HTTP_POOL_SIZE if pool_size is None else pool_size
+        self.max_clients = cfg.AI_SDK_CLIENT_CACHE_SIZE if max_clients is None else max_clients
+        self._sessions = {}             # provider -> requests.Session
+        self._clients = OrderedDict()   # (provider, key fingerprint, base_url) -> SDK client
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+        self.sessions_created = 0
+        self.clients_created = 0
+        self.client_hits = 0
+        self.client_evictions = 0
+
+    @staticmethod
+    def timeout():
+        """(connect, read) timeout voor provider requests"""
+        return (config.Config.AI_HTTP_CONNECT_TIMEOUT, config.Config.AI_HTTP_READ_TIMEOUT)
+
+    def sdk_options(self, sdk) -> dict:
+        """
+        timeout en http_client (pool limieten) voor een OpenAI/Anthropic client.
+        Oudere SDK versies zonder DefaultHttpxClient houden hun eigen pool, alleen met timeout.
+        """
+        cfg = config.Config
+        options = {'timeout': sdk.Timeout(cfg.AI_HTTP_READ_TIMEOUT, connect=cfg.AI_HTTP_CONNECT_TIMEOUT)}
+        http_client_cls = getattr(sdk, 'DefaultHttpxClient', None)
+        if HTTPX_LIB and http_client_cls is not None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            options['http_client'] = http_client_cls(timeout=options['timeout'], limits=limits)
+        return options
+
+    def _check_pid(self):
+        # Na fork geen sockets van de parent delen
+        if self.pid != os.getpid():
+            self._sessions = {}
+            self._clients = OrderedDict()
+            self.pid = os.getpid()
+
+    def session(self, provider: str) -> requests.Session:
+        """Gedeelde keep-alive session voor een REST provider"""
+        with self._lock:
+            self._check_pid()
+            session = self._sessions.get(provider)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[provider] = session
+                self.sessions_created += 1
+            return session
+
+    def sdk_client(self, provider: str, api_key: str, factory, base_url=None):
+        """SDK client voor provider + API key; factory(api_key) bouwt hem bij een miss"""
+        fingerprint = hashlib.sha256(api_key.encode()).hexdigest()
+        key = (provider, fingerprint, base_url)
+        with self._lock:
+            self._check_pid()
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.client_hits += 1
+                return client
+
+        client = factory(api_key)
+
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                # Andere thread was ons voor
+                self._clients.move_to_end(key)
+                self.client_hits += 1
+                _close_quietly(client)
+                return existing
+            self._clients[key] = client
+            self.clients_created += 1
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                self.client_evictions += 1
+            return client
+
+    def stats(self) -> dict:
+        """Pool hergebruik: requests vs nieuw geopende connecties per REST provider"""
+        with self._lock:
+            providers = {}
+            for provider, session in self._sessions.items():
+                requests_sent = connections = 0
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+                    for pool_key in pools.keys():
+                        pool = pools.get(pool_key)
+                        if pool is not None:
+                            requests_sent += pool.num_requests
+                            connections += pool.num_connections
+                providers[provider] = {
+                    'requests': requests_sent,
+                    'connections_opened': connections,
+                    'reuse_ratio': round(1 - connections / requests_sent, 3) if requests_sent else 0.0,
+                }
+            client_lookups = self.client_hits + self.clients_created
+            return {
+                'pool_size': self.pool_size,
+                'sessions': providers,
+                'sessions_created': self.sessions_created,
+                'sdk_clients': len(self._clients),
+                'sdk_clients_created': self.clients_created,
+                'sdk_client_hits': self.client_hits,
+                'sdk_client_evictions': self.client_evictions,
+                'sdk_client_hit_rate': round(self.client_hits / client_lookups, 3) if client_lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+            clients, self._clients = self._clients, OrderedDict()
+        for session in sessions.values():
+            _close_quietly(session)
+        for client in clients.values():
+            _close_quietly(client)
+
+
+def _close_quietly(client):
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+_clients = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    return _clients
+
+
+def get_client_stats() -> dict:
+    """Pool en client hergebruik statistieken voor monitoring"""
+    return _clients.stats()
+
+
+def close_clients():
+    """Sluit gedeelde sessions en SDK clients (atexit / gunicorn worker_exit)"""
+    _clients.close()
+
+
+atexit.register(close_clients)
+
+
 # ── Base provider class ───────────────────────────────────────────────────
 class BaseProvider:
     provider_name: str = 'base'
@@ -92,6 +267,16 @@ class BaseProvider:
     def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
         raise NotImplementedError
 
+    def chat_stream(self, system_prompt: str, messages: list, max_tokens: int = 1000):
+        """
+        Generator van tekst deltas zodra de provider ze levert. De return waarde
+        (via yield from) bevat model, provider en tokens_used.
+        Default: één delta met het volledige antwoord van chat().
+        """
+        result = self.chat(system_prompt, messages, max_tokens)
+        yield result['message']
+        return {k: v for k, v in result.items() if k not in ('success', 'message')}
+
     def test_connection(self) -> dict:
         """Test of de API key werkt met een minimaal verzoek"""
         try:
@@ -105,24 +290,42 @@ class BaseProvider:
             return {"success": False, "message": str(e)}
 
 
+def _iter_sse_json(resp):
+    """JSON payloads uit een server-sent events response (regels 'data: {...}')"""
+    resp.encoding = 'utf-8'
+    for line in resp.iter_lines(decode_unicode=True):
+        if line and line.startswith('data:'):
+            data = line[5:].strip()
+            if data and data != '[DONE]':
+                yield json.loads(data)
+
+
 # ── OpenAI provider ───────────────────────────────────────────────────────
 class OpenAIProvider(BaseProvider):
     provider_name = 'openai'
+    BASE_URL = None  # SDK default
 
     def __init__(self, api_key: str, model: str = 'gpt-4-turbo'):
         super().__init__(api_key, model)
         if not OPENAI_LIB:
             raise ImportError("openai package niet geïnstalleerd")
-        self.client = OpenAI(api_key=api_key)
+        self.client = _clients.sdk_client(self.provider_name, api_key, self._create_client, self.BASE_URL)
 
-    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
+    def _create_client(self, api_key):
+        kwargs = {'base_url': self.BASE_URL} if self.BASE_URL else {}
+        return OpenAI(api_key=api_key, **_clients.sdk_options(openai), **kwargs)
+
+    @staticmethod
+    def _api_messages(system_prompt, messages):
         api_messages = [{"role": "system", "content": system_prompt}]
         for msg in messages:
             api_messages.append({"role": msg["role"], "content": msg["content"]})
+        return api_messages
 
+    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=api_messages,
+            messages=self._api_messages(system_prompt, messages),
             max_tokens=max_tokens,
             temperature=0.7
         )
@@ -135,16 +338,40 @@ class OpenAIProvider(BaseProvider):
             'tokens_used': response.usage.total_tokens if response.usage else 0
         }
 
+    def chat_stream(self, system_prompt: str, messages: list, max_tokens: int = 1000):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._api_messages(system_prompt, messages),
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        tokens = 0
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, 'usage', None):
+                tokens = chunk.usage.total_tokens
+
+        return {'model': self.model, 'provider': 'openai', 'tokens_used': tokens}
+
 
 # ── Anthropic / Claude provider ───────────────────────────────────────────
 class AnthropicProvider(BaseProvider):
     provider_name = 'anthropic'
+    BASE_URL = None  # SDK default
 
     def __init__(self, api_key: str, model: str = 'claude-sonnet-4-6'):
         super().__init__(api_key, model)
         if not ANTHROPIC_LIB:
             raise ImportError("anthropic package niet geïnstalleerd")
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = _clients.sdk_client(self.provider_name, api_key, self._create_client, self.BASE_URL)
+
+    def _create_client(self, api_key):
+        kwargs = {'base_url': self.BASE_URL} if self.BASE_URL else {}
+        return anthropic.Anthropic(api_key=api_key, **_clients.sdk_options(anthropic), **kwargs)
 
     def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
         api_messages = [
@@ -167,6 +394,28 @@ class AnthropicProvider(BaseProvider):
             'tokens_used': response.usage.input_tokens + response.usage.output_tokens
         }
 
+    def chat_stream(self, system_prompt: str, messages: list, max_tokens: int = 1000):
+        api_messages = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in messages
+        ]
+
+        with self.client.messages.stream(
+            model=self.model,
+            system=system_prompt,
+            messages=api_messages,
+            max_tokens=max_tokens,
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+            usage = stream.get_final_message().usage
+
+        return {
+            'model': self.model,
+            'provider': 'anthropic',
+            'tokens_used': usage.input_tokens + usage.output_tokens
+        }
+
 
 # ── Google Gemini provider (REST) ─────────────────────────────────────────
 class GeminiProvider(BaseProvider):
@@ -176,9 +425,7 @@ class GeminiProvider(BaseProvider):
     def __init__(self, api_key: str, model: str = 'gemini-1.5-flash'):
         super().__init__(api_key, model)
 
-    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
-        contents = []
-
+    def _payload(self, system_prompt, messages, max_tokens):
         # Gemini system instruction via dedicated field
         payload = {
             "system_instruction": {"parts": [{"text": system_prompt}]},
@@ -195,9 +442,13 @@ class GeminiProvider(BaseProvider):
                 "role": role,
                 "parts": [{"text": msg["content"]}]
             })
+        return payload
+
+    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
+        payload = self._payload(system_prompt, messages, max_tokens)
 
         url = f"{self.BASE_URL}/{self.model}:generateContent?key={self.api_key}"
-        resp = requests.post(url, json=payload, timeout=30)
+        resp = _clients.session(self.provider_name).post(url, json=payload, timeout=_clients.timeout())
         resp.raise_for_status()
         data = resp.json()
 
@@ -212,6 +463,23 @@ class GeminiProvider(BaseProvider):
             'tokens_used': tokens
         }
 
+    def chat_stream(self, system_prompt: str, messages: list, max_tokens: int = 1000):
+        payload = self._payload(system_prompt, messages, max_tokens)
+
+        url = f"{self.BASE_URL}/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        tokens = 0
+        with _clients.session(self.provider_name).post(
+                url, json=payload, timeout=_clients.timeout(), stream=True) as resp:
+            resp.raise_for_status()
+            for event in _iter_sse_json(resp):
+                for candidate in event.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+                tokens = event.get('usageMetadata', {}).get('totalTokenCount', tokens)
+
+        return {'model': self.model, 'provider': 'gemini', 'tokens_used': tokens}
+
 
 # ── Cohere provider (REST v2) ─────────────────────────────────────────────
 class CohereProvider(BaseProvider):
@@ -221,7 +489,7 @@ class CohereProvider(BaseProvider):
     def __init__(self, api_key: str, model: str = 'command-r'):
         super().__init__(api_key, model)
 
-    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
+    def _request(self, system_prompt, messages, max_tokens):
         api_messages = [{"role": "system", "content": system_prompt}]
         for msg in messages:
             api_messages.append({"role": msg["role"], "content": msg["content"]})
@@ -236,8 +504,13 @@ class CohereProvider(BaseProvider):
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        return payload, headers
+
+    def chat(self, system_prompt: str, messages: list, max_tokens: int = 1000) -> dict:
+        payload, headers = self._request(system_prompt, messages, max_tokens)
 
-        resp = requests.post(self.BASE_URL, json=payload, headers=headers, timeout=30)
+        resp = _clients.session(self.provider_name).post(
+            self.BASE_URL, json=payload, headers=headers, timeout=_clients.timeout())
         resp.raise_for_status()
         data = resp.json()
 
@@ -253,6 +526,25 @@ class CohereProvider(BaseProvider):
             'tokens_used': tokens
         }
 
+    def chat_stream(self, system_prompt: str, messages: list, max_tokens: int = 1000):
+        payload, headers = self._request(system_prompt, messages, max_tokens)
+        payload["stream"] = True
+
+        tokens = 0
+        with _clients.session(self.provider_name).post(
+                self.BASE_URL, json=payload, headers=headers, timeout=_clients.timeout(), stream=True) as resp:
+            resp.raise_for_status()
+            for event in _iter_sse_json(resp):
+                if event.get('type') == 'content-delta':
+                    text = event['delta']['message']['content'].get('text')
+                    if text:
+                        yield text
+                elif event.get('type') == 'message-end':
+                    usage = event.get('delta', {}).get('usage', {}).get('tokens', {})
+                    tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+
+        return {'model': self.model, 'provider': 'cohere', 'tokens_used': tokens}
+
 
 # ── Provider factory ──────────────────────────────────────────────────────
 def _build_provider(provider_name: str, api_key: str, model: str) -> BaseProvider:
@@ -364,6 +656,7 @@ def save_customer_provider_config(
                 VALUES (?, ?, ?, ?)
             ''', (customer_id, provider, model, encrypted_key))
 
+    _invalidate_assistant(customer_id)
     return True
 
 
@@ -376,9 +669,16 @@ def delete_customer_api_key(customer_id: int) -> bool:
             SET api_key_encrypted = NULL, updated_at = CURRENT_TIMESTAMP
             WHERE customer_id = ?
         ''', (customer_id,))
+    _invalidate_assistant(customer_id)
     return True
 
 
+def _invalidate_assistant(customer_id: int) -> None:
+    """Gecachte AIAssistant gebruikt nog de oude provider/key"""
+    from ai_assistant import invalidate_assistant
+    invalidate_assistant(customer_id)
+
+
 def test_provider_config(provider: str, api_key: str, model: str) -> dict:
     """Test of een provider + API key combinatie werkt"""
     if provider not in PROVIDERS:
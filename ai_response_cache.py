@@ -0,0 +1,242 @@
+"""
+MVAI Connexx - AI Response Cache
+Hergebruikt AI antwoorden op (vrijwel) dezelfde vraag van dezelfde klant, zolang
+de klant data, voorkeuren en provider/model ongewijzigd zijn. Gedeeld over workers
+via SQLite; hit rate en bespaarde tokens worden per klant bijgehouden.
+"""
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from datetime import date
+from typing import Dict, List, Optional
+
+import database as db
+from config import Config
+
+
+# ═══════════════════════════════════════════════════════
+# SLEUTELS
+# ═══════════════════════════════════════════════════════
+
+def normalize_prompt(text: str) -> str:
+    """Kleine letters, zonder accenten/leestekens en met enkele spaties"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def prompt_key(normalized: str, context: Optional[Dict] = None) -> str:
+    """Hash van prompt plus eventuele extra context"""
+    raw = normalized
+    if context:
+        raw += f"\n{json.dumps(context, sort_keys=True, default=str)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# Woorden die naar een eerder bericht verwijzen ("leg dat uit", "waarom?", "and why is that")
+FOLLOW_UP_WORDS = frozenset({
+    'dat', 'die', 'daar', 'daarvan', 'daarvoor', 'daarmee', 'hiervan', 'hierover', 'ervan', 'erover',
+    'ze', 'zij', 'hun', 'hem', 'vorige', 'eerder', 'eerdere', 'bovenstaande', 'nog', 'ook', 'waarom',
+    'verder', 'meer',
+    'it', 'that', 'those', 'them', 'they', 'previous', 'above', 'earlier', 'why', 'also', 'more',
+})
+
+
+def is_follow_up(prompt: str) -> bool:
+    """
+    Vervolgvraag die pas betekenis heeft met het gesprek ervoor (verwijswoord of
+    hooguit twee woorden). Zo'n antwoord hoort bij dat gesprek en wordt niet gecached.
+    """
+    words = normalize_prompt(prompt).split()
+    return len(words) <= 2 or not FOLLOW_UP_WORDS.isdisjoint(words)
+
+
+def customer_data_version(customer_id: int, preferences: Optional[Dict] = None) -> str:
+    """
+    Goedkope versie van alles wat in de system prompt zit: datum, laatste dag
+    rollup (verandert bij elke nieuwe log) en de AI voorkeuren.
+    """
+    with db.get_db() as conn:
+        row = conn.execute('''
+            SELECT bucket, log_count FROM log_rollups_daily
+            WHERE customer_id = ?
+            ORDER BY bucket DESC
+            LIMIT 1
+        ''', (customer_id,)).fetchone()
+    logs = f"{row['bucket']}:{row['log_count']}" if row else '-'
+    prefs = hashlib.sha256(json.dumps(preferences or {}, sort_keys=True).encode()).hexdigest()[:8]
+    return f"{date.today().isoformat()}|{logs}|{prefs}"
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity van karakter trigrams (0..1)"""
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+# ═══════════════════════════════════════════════════════
+# LOOKUP & STORE
+# ═══════════════════════════════════════════════════════
+
+def lookup(customer_id: int, prompt: str, data_version: str, provider: str, model: str,
+           context: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Gecachte resultaat dict (met cached=True) of None. Exacte match op genormaliseerde
+    prompt plus context; met AI_RESPONSE_CACHE_SIMILARITY > 0 ook de meest gelijkende
+    prompt boven die drempel (alleen zonder context).
+    """
+    if not Config.AI_RESPONSE_CACHE_ENABLED:
+        return None
+    normalized = normalize_prompt(prompt)
+    key = prompt_key(normalized, context)
+    now = time.time()
+
+    with db.get_db() as conn:
+        row = conn.execute('''
+            SELECT id, response, tokens_used, normalized_prompt FROM ai_response_cache
+            WHERE customer_id = ? AND prompt_key = ? AND data_version = ?
+            AND provider = ? AND model = ? AND expires_at > ?
+        ''', (customer_id, key, data_version, provider, model, now)).fetchone()
+        match = 'exact' if row else None
+
+        threshold = Config.AI_RESPONSE_CACHE_SIMILARITY
+        if row is None and threshold > 0 and not context:
+            candidates = conn.execute('''
+                SELECT id, response, tokens_used, normalized_prompt FROM ai_response_cache
+                WHERE customer_id = ? AND data_version = ? AND provider = ? AND model = ?
+                AND expires_at > ? AND has_context = 0
+            ''', (customer_id, data_version, provider, model, now)).fetchall()
+            best = max(((similarity(normalized, c['normalized_prompt']), c) for c in candidates),
+                       key=lambda scored: scored[0], default=(0.0, None))
+            if best[0] >= threshold:
+                row, match = best[1], 'similar'
+
+        tokens_saved = row['tokens_used'] if row else 0
+        conn.execute('''
+            INSERT INTO ai_response_cache_stats (customer_id, lookups, hits, similar_hits, tokens_saved, updated_at)
+            VALUES (?, 1, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(customer_id) DO UPDATE SET
+                lookups = lookups + 1,
+                hits = hits + excluded.hits,
+                similar_hits = similar_hits + excluded.similar_hits,
+                tokens_saved = tokens_saved + excluded.tokens_saved,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (customer_id, int(row is not None), int(match == 'similar'), tokens_saved))
+        if row is None:
+            return None
+        conn.execute('''
+            UPDATE ai_response_cache SET hits = hits + 1, last_hit_at = ? WHERE id = ?
+        ''', (now, row['id']))
+
+    result = json.loads(row['response'])
+    result.update({'cached': True, 'cache_match': match, 'tokens_used': 0,
+                   'tokens_saved': tokens_saved})
+    return result
+
+
+def store(customer_id: int, prompt: str, data_version: str, provider: str, model: str,
+          result: Dict, context: Optional[Dict] = None) -> bool:
+    """Bewaar een succesvol antwoord; oude data versies en overschot worden opgeruimd"""
+    if not Config.AI_RESPONSE_CACHE_ENABLED or not result.get('success'):
+        return False
+    normalized = normalize_prompt(prompt)
+    if not normalized:
+        return False
+    response = {k: v for k, v in result.items()
+                if k not in ('tokens_used', 'cached', 'cache_match', 'tokens_saved')}
+    now = time.time()
+
+    with db.get_db() as conn:
+        # Antwoorden op een oudere data versie worden nooit meer geraakt
+        conn.execute('''
+            DELETE FROM ai_response_cache
+            WHERE customer_id = ? AND (data_version != ? OR expires_at <= ?)
+        ''', (customer_id, data_version, now))
+        conn.execute('''
+            INSERT INTO ai_response_cache (
+                customer_id, prompt_key, normalized_prompt, has_context, data_version,
+                provider, model, response, tokens_used, created_at, expires_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(customer_id, prompt_key, data_version, provider, model) DO UPDATE SET
+                response = excluded.response,
+                tokens_used = excluded.tokens_used,
+                created_at = excluded.created_at,
+                expires_at = excluded.expires_at
+        ''', (customer_id, prompt_key(normalized, context), normalized, int(bool(context)),
+              data_version, provider, model, json.dumps(response, default=str),
+              result.get('tokens_used') or 0, now, now + Config.AI_RESPONSE_CACHE_TTL))
+        _evict(conn, customer_id)
+    return True
+
+
+def _evict(conn, customer_id):
+    """Least recently used entries boven de limiet per klant en in totaal"""
+    conn.execute('''
+        DELETE FROM ai_response_cache WHERE id IN (
+            SELECT id FROM ai_response_cache WHERE customer_id = ?
+            ORDER BY COALESCE(last_hit_at, created_at) DESC
+            LIMIT -1 OFFSET ?
+        )
+    ''', (customer_id, Config.AI_RESPONSE_CACHE_PER_CUSTOMER))
+    conn.execute('''
+        DELETE FROM ai_response_cache WHERE id IN (
+            SELECT id FROM ai_response_cache
+            ORDER BY COALESCE(last_hit_at, created_at) DESC
+            LIMIT -1 OFFSET ?
+        )
+    ''', (Config.AI_RESPONSE_CACHE_MAX_ENTRIES,))
+
+
+def clear(customer_id: Optional[int] = None) -> int:
+    """Verwijder gecachte antwoorden (klant of alles); geeft het aantal terug"""
+    with db.get_db() as conn:
+        if customer_id is None:
+            return conn.execute('DELETE FROM ai_response_cache').rowcount
+        return conn.execute('DELETE FROM ai_response_cache WHERE customer_id = ?', (customer_id,)).rowcount
+
+
+# ═══════════════════════════════════════════════════════
+# RAPPORTAGE
+# ═══════════════════════════════════════════════════════
+
+def _stats_row(row) -> Dict:
+    stats = dict(row)
+    stats['misses'] = stats['lookups'] - stats['hits']
+    stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 3) if stats['lookups'] else 0.0
+    return stats
+
+
+def get_customer_cache_stats(customer_id: int) -> Dict:
+    """Lookups, hits (waarvan similar), hit rate, bespaarde tokens en cache omvang van één klant"""
+    with db.get_db() as conn:
+        row = conn.execute('''
+            SELECT customer_id, lookups, hits, similar_hits, tokens_saved, updated_at
+            FROM ai_response_cache_stats WHERE customer_id = ?
+        ''', (customer_id,)).fetchone()
+        entries = conn.execute('SELECT COUNT(*) FROM ai_response_cache WHERE customer_id = ?',
+                               (customer_id,)).fetchone()[0]
+    stats = _stats_row(row) if row else _stats_row({
+        'customer_id': customer_id, 'lookups': 0, 'hits': 0, 'similar_hits': 0,
+        'tokens_saved': 0, 'updated_at': None})
+    stats['entries'] = entries
+    return stats
+
+
+def get_cache_stats(limit: int = 50) -> List[Dict]:
+    """Per klant statistieken, meeste bespaarde tokens eerst"""
+    with db.get_db() as conn:
+        rows = conn.execute('''
+            SELECT s.customer_id, c.name AS customer_name, s.lookups, s.hits, s.similar_hits,
+                   s.tokens_saved, s.updated_at
+            FROM ai_response_cache_stats s
+            LEFT JOIN customers c ON c.id = s.customer_id
+            ORDER BY s.tokens_saved DESC, s.hits DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [_stats_row(row) for row in rows]
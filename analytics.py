@@ -11,18 +11,17 @@ def get_customer_analytics(customer_id, days=30):
     # Basis stats
     stats = db.get_customer_stats(customer_id)
 
-    # Haal alle logs van afgelopen X dagen
+    # Alle queries lezen uit de rollup tabellen (log_rollups_*), niet uit de ruwe logs
     with db.get_db() as conn:
         cursor = conn.cursor()
 
         # Daily activity (laatste 30 dagen)
         cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM logs
+            SELECT bucket as date, log_count as count
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', ?)
-            GROUP BY DATE(timestamp)
-            ORDER BY date
+            AND bucket >= DATE('now', ?)
+            ORDER BY bucket
         ''', (customer_id, f'-{days} days'))
 
         daily_activity = [
@@ -32,8 +31,8 @@ def get_customer_analytics(customer_id, days=30):
 
         # Hourly distribution (alle tijd)
         cursor.execute('''
-            SELECT strftime('%H', timestamp) as hour, COUNT(*) as count
-            FROM logs
+            SELECT substr(bucket, 12, 2) as hour, SUM(log_count) as count
+            FROM log_rollups_hourly
             WHERE customer_id = ?
             GROUP BY hour
             ORDER BY hour
@@ -46,8 +45,8 @@ def get_customer_analytics(customer_id, days=30):
 
         # IP diversity
         cursor.execute('''
-            SELECT ip_address, COUNT(*) as count
-            FROM logs
+            SELECT ip_address, SUM(log_count) as count
+            FROM log_rollup_ips
             WHERE customer_id = ?
             GROUP BY ip_address
             ORDER BY count DESC
@@ -55,16 +54,16 @@ def get_customer_analytics(customer_id, days=30):
         ''', (customer_id,))
 
         top_ips = [
-            {'ip': row['ip_address'], 'count': row['count']}
+            {'ip': row['ip_address'] or None, 'count': row['count']}
             for row in cursor.fetchall()
         ]
 
         # Weekly trend
         cursor.execute('''
-            SELECT strftime('%Y-%W', timestamp) as week, COUNT(*) as count
-            FROM logs
+            SELECT strftime('%Y-%W', bucket) as week, SUM(log_count) as count
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', '-12 weeks')
+            AND bucket >= DATE('now', '-12 weeks')
             GROUP BY week
             ORDER BY week
         ''', (customer_id,))
@@ -76,21 +75,16 @@ def get_customer_analytics(customer_id, days=30):
 
         # Growth rate (comparison met vorige periode)
         cursor.execute('''
-            SELECT COUNT(*) as current_period
-            FROM logs
-            WHERE customer_id = ?
-            AND timestamp >= DATE('now', '-7 days')
-        ''', (customer_id,))
-        current_period = cursor.fetchone()['current_period']
-
-        cursor.execute('''
-            SELECT COUNT(*) as previous_period
-            FROM logs
+            SELECT
+                COALESCE(SUM(CASE WHEN bucket >= DATE('now', '-7 days') THEN log_count END), 0) as current_period,
+                COALESCE(SUM(CASE WHEN bucket < DATE('now', '-7 days') THEN log_count END), 0) as previous_period
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', '-14 days')
-            AND timestamp < DATE('now', '-7 days')
+            AND bucket >= DATE('now', '-14 days')
         ''', (customer_id,))
-        previous_period = cursor.fetchone()['previous_period']
+        row = cursor.fetchone()
+        current_period = row['current_period']
+        previous_period = row['previous_period']
 
         if previous_period > 0:
             growth_rate = ((current_period - previous_period) / previous_period) * 100
@@ -129,11 +123,11 @@ def get_global_analytics():
 
         # Total logs per day (laatste 30 dagen)
         cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM logs
-            WHERE timestamp >= DATE('now', '-30 days')
-            GROUP BY DATE(timestamp)
-            ORDER BY date
+            SELECT bucket as date, SUM(log_count) as count
+            FROM log_rollups_daily
+            WHERE bucket >= DATE('now', '-30 days')
+            GROUP BY bucket
+            ORDER BY bucket
         ''')
 
         daily_logs = [
@@ -155,10 +149,10 @@ def get_global_analytics():
 
         # Most active customers (laatste 7 dagen)
         cursor.execute('''
-            SELECT c.name, COUNT(l.id) as log_count
+            SELECT c.name, SUM(r.log_count) as log_count
             FROM customers c
-            LEFT JOIN logs l ON c.id = l.customer_id
-            WHERE l.timestamp >= DATE('now', '-7 days')
+            JOIN log_rollups_daily r ON c.id = r.customer_id
+            WHERE r.bucket >= DATE('now', '-7 days')
             GROUP BY c.id
             ORDER BY log_count DESC
             LIMIT 10
@@ -173,8 +167,8 @@ def get_global_analytics():
         cursor.execute('''
             SELECT AVG(log_count) as avg_logs
             FROM (
-                SELECT COUNT(*) as log_count
-                FROM logs
+                SELECT SUM(log_count) as log_count
+                FROM log_rollups_daily
                 GROUP BY customer_id
             )
         ''')
@@ -185,12 +179,12 @@ def get_global_analytics():
         cursor.execute('SELECT COUNT(*) FROM customers WHERE status = "active"')
         active_customers_count = cursor.fetchone()[0]
 
-        cursor.execute('SELECT COUNT(*) FROM logs')
+        cursor.execute('SELECT COALESCE(SUM(log_count), 0) FROM log_rollups_daily')
         total_logs = cursor.fetchone()[0]
 
         cursor.execute('''
-            SELECT COUNT(*) FROM logs
-            WHERE timestamp >= DATE('now', '-1 day')
+            SELECT COALESCE(SUM(log_count), 0) FROM log_rollups_daily
+            WHERE bucket >= DATE('now', '-1 day')
         ''')
         logs_last_24h = cursor.fetchone()[0]
 
@@ -215,11 +209,11 @@ def get_customer_predictions(customer_id):
         # Haal laatste 4 weken op voor trend analysis
         cursor.execute('''
             SELECT
-                strftime('%Y-%W', timestamp) as week,
-                COUNT(*) as count
-            FROM logs
+                strftime('%Y-%W', bucket) as week,
+                SUM(log_count) as count
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', '-4 weeks')
+            AND bucket >= DATE('now', '-4 weeks')
             GROUP BY week
             ORDER BY week
         ''', (customer_id,))
@@ -5,7 +5,10 @@ RESTful API endpoints voor third-party integraties
 from flask import Blueprint, request, jsonify
 from functools import wraps
 import database as db
+import exports
+import ingestion
 import json
+from config import Config
 from datetime import datetime
 import logging
 
@@ -115,13 +118,32 @@ def get_logs():
     except (ValueError, TypeError):
         offset = 0
 
-    logs = db.get_customer_logs(request.customer_id, limit=limit, offset=offset)
+    cursor = request.args.get('cursor')
+    if cursor or not offset:
+        # Keyset paginatie: elke pagina kost evenveel als de eerste
+        try:
+            page = db.get_customer_logs_page(request.customer_id, limit=limit, cursor=cursor)
+        except db.InvalidCursor:
+            return jsonify({
+                'error': 'Invalid cursor',
+                'message': 'Use next_cursor / prev_cursor from a previous response'
+            }), 400
+        logs = page['logs']
+        next_cursor, prev_cursor = page['next_cursor'], page['prev_cursor']
+        offset = 0
+    else:
+        # Backward compatible offset paginatie
+        logs = db.get_customer_logs(request.customer_id, limit=limit, offset=offset)
+        next_cursor = db.encode_log_cursor(logs[-1], 'next') if len(logs) == limit else None
+        prev_cursor = db.encode_log_cursor(logs[0], 'prev') if logs else None
 
     return jsonify({
         'logs': logs,
         'count': len(logs),
         'limit': limit,
-        'offset': offset
+        'offset': offset,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
     }), 200
 
 @api_bp.route('/logs', methods=['POST'])
@@ -141,20 +163,38 @@ def create_log():
         # Data serialiseren
         data_str = json.dumps(request.json)
 
-        # Opslaan
-        log_id = db.create_log(
+        # Opslaan (via write-behind queue als ENABLE_INGESTION_QUEUE aan staat)
+        ack = request.headers.get('X-MVAI-Ack') or request.args.get('ack')
+        log_id = ingestion.ingest_log(
             customer_id=request.customer_id,
             ip_address=ip_address,
             data=data_str,
-            metadata=None
+            metadata=None,
+            ack=ack
         )
 
+        if log_id is None:
+            # Geaccepteerd maar nog niet gecommit (fast ack of durable timeout)
+            return jsonify({
+                'success': True,
+                'queued': True,
+                'timestamp': datetime.now().isoformat()
+            }), 202
+
         return jsonify({
             'success': True,
             'log_id': log_id,
             'timestamp': datetime.now().isoformat()
         }), 201
 
+    except ingestion.IngestionQueueFull as e:
+        response = jsonify({
+            'error': 'Ingestion queue full',
+            'message': str(e)
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
     except Exception as e:
         return jsonify({
             'error': 'Failed to create log',
@@ -188,12 +228,27 @@ def search_logs():
     if not query:
         return jsonify({'error': 'Query parameter "q" required'}), 400
 
-    logs = db.search_logs(query, customer_id=request.customer_id)
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        if limit < 1:
+            limit = 50
+    except (ValueError, TypeError):
+        limit = 50
+
+    try:
+        page = db.search_logs_page(query, customer_id=request.customer_id, limit=limit,
+                                   cursor=request.args.get('cursor'))
+    except db.InvalidCursor:
+        return jsonify({
+            'error': 'Invalid cursor',
+            'message': 'Use next_cursor from a previous response'
+        }), 400
 
     return jsonify({
         'query': query,
-        'results': logs,
-        'count': len(logs)
+        'results': page['results'],
+        'count': len(page['results']),
+        'next_cursor': page['next_cursor']
     }), 200
 
 # ═══════════════════════════════════════════════════════
@@ -222,12 +277,11 @@ def get_daily_analytics():
     with db.get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM logs
+            SELECT bucket as date, log_count as count
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', ?)
-            GROUP BY DATE(timestamp)
-            ORDER BY date
+            AND bucket >= DATE('now', ?)
+            ORDER BY bucket
         ''', (request.customer_id, f'-{days} days'))
 
         daily_data = [
@@ -244,24 +298,43 @@ def get_daily_analytics():
 # EXPORT ENDPOINTS
 # ═══════════════════════════════════════════════════════
 
+def _export_limit():
+    """Optionele limit voor exports (geen limit = alles)"""
+    try:
+        limit = int(request.args['limit'])
+        return limit if limit > 0 else None
+    except (KeyError, ValueError, TypeError):
+        return None
+
 @api_bp.route('/export/json', methods=['GET'])
 @require_api_key
 def export_json():
-    """Export data als JSON"""
-    limit = min(int(request.args.get('limit', 10000)), 100000)
-    logs = db.get_customer_logs(request.customer_id, limit=limit)
-
+    """Export data als JSON (gestreamd, geen row cap)"""
     customer = db.get_customer_by_id(request.customer_id)
-
-    return jsonify({
-        'customer': {
-            'id': customer['id'],
-            'name': customer['name']
+    rows = db.iter_customer_logs(request.customer_id, chunk_size=Config.EXPORT_CHUNK_SIZE,
+                                 limit=_export_limit())
+
+    chunks = exports.json_document_stream(
+        {
+            'customer': {
+                'id': customer['id'],
+                'name': customer['name']
+            },
+            'exported_at': datetime.now().isoformat()
         },
-        'exported_at': datetime.now().isoformat(),
-        'log_count': len(logs),
-        'logs': logs
-    }), 200
+        'logs', rows, count_key='log_count'
+    )
+    return exports.streaming_response(chunks, request, 'application/json')
+
+@api_bp.route('/export/ndjson', methods=['GET'])
+@require_api_key
+def export_ndjson():
+    """Export data als NDJSON (één log per regel, gestreamd)"""
+    rows = db.iter_customer_logs(request.customer_id, chunk_size=Config.EXPORT_CHUNK_SIZE,
+                                 limit=_export_limit())
+    filename = f"mvai_export_{datetime.now().strftime('%Y%m%d')}.ndjson"
+    return exports.streaming_response(exports.ndjson_stream(rows), request,
+                                      'application/x-ndjson', filename=filename)
 
 # ═══════════════════════════════════════════════════════
 # API KEY MANAGEMENT
@@ -298,8 +371,9 @@ def batch_create_logs():
     if not isinstance(logs_data, list):
         return jsonify({'error': '"logs" must be an array'}), 400
 
-    if len(logs_data) > 100:
-        return jsonify({'error': 'Maximum 100 logs per batch'}), 400
+    max_batch = Config.API_BATCH_MAX_LOGS
+    if len(logs_data) > max_batch:
+        return jsonify({'error': f'Maximum {max_batch} logs per batch'}), 400
 
     # Haal IP op
     if request.headers.getlist("X-Forwarded-For"):
@@ -307,25 +381,30 @@ def batch_create_logs():
     else:
         ip_address = request.remote_addr
 
-    created_ids = []
+    rows = []
+    row_indexes = []
     errors = []
 
+    # Serialiseer per item zodat één fout entry de rest niet blokkeert
     for i, log_data in enumerate(logs_data):
         try:
-            data_str = json.dumps(log_data)
-            log_id = db.create_log(
-                customer_id=request.customer_id,
-                ip_address=ip_address,
-                data=data_str,
-                metadata=None
-            )
-            created_ids.append(log_id)
+            rows.append(json.dumps(log_data))
+            row_indexes.append(i)
         except Exception as e:
             errors.append({
                 'index': i,
                 'error': str(e)
             })
 
+    created_ids = []
+    if rows:
+        try:
+            created_ids = list(db.create_logs_bulk(request.customer_id, ip_address, rows))
+        except Exception as e:
+            logger.error(f"Batch insert failed for customer {request.customer_id}: {e}")
+            errors.extend({'index': i, 'error': str(e)} for i in row_indexes)
+            errors.sort(key=lambda err: err['index'])
+
     return jsonify({
         'success': True,
         'created_count': len(created_ids),
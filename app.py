@@ -7,11 +7,16 @@ import sys
 import json
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file, send_from_directory, stream_with_context
+from markupsafe import Markup, escape
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import database as db
+import exports
+import ingestion
 import analytics
+import shared_state
+import webhooks
 import csv
 import io
 from config import Config, ConfigValidator
@@ -96,11 +101,12 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = (environment == 'production')
 
 # Rate limiting voor API protection
+# Storage gedeeld over workers via SHARED_STATE_URL (sqlite:// of redis://), zie shared_state.py
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=shared_state.limiter_storage_uri()
 )
 
 # Initialiseer database bij startup
@@ -338,14 +344,24 @@ def save_entry():
         # Data serialiseren naar JSON string
         data_str = json.dumps(entry)
 
-        # Opslaan in database
-        log_id = db.create_log(
+        # Opslaan in database (via write-behind queue als ENABLE_INGESTION_QUEUE aan staat)
+        ack = request.headers.get('X-MVAI-Ack') or request.args.get('ack')
+        log_id = ingestion.ingest_log(
             customer_id=customer_id,
             ip_address=ip_address,
             data=data_str,
-            metadata=None
+            metadata=None,
+            ack=ack
         )
 
+        if log_id is None:
+            return jsonify({
+                "status": "QUEUED",
+                "message": "Data accepted, commit pending.",
+                "queued": True,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }), 202
+
         return jsonify({
             "status": "SECURE_COMMIT",
             "message": "Data Encrypted & Stored.",
@@ -353,6 +369,14 @@ def save_entry():
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         })
 
+    except ingestion.IngestionQueueFull as e:
+        response = jsonify({
+            "status": "error",
+            "message": str(e)
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -369,15 +393,28 @@ def customer_logs():
     customer_id = session['customer_id']
     page = request.args.get('page', 1, type=int)
     limit = 50
-    offset = (page - 1) * limit
 
-    logs = db.get_customer_logs(customer_id, limit=limit, offset=offset)
+    if page > 1 and not request.args.get('cursor'):
+        # Oude ?page=N links blijven werken via offset
+        logs = db.get_customer_logs(customer_id, limit=limit, offset=(page - 1) * limit)
+        next_cursor = db.encode_log_cursor(logs[-1], 'next') if len(logs) == limit else None
+        prev_cursor = db.encode_log_cursor(logs[0], 'prev') if logs else None
+    else:
+        try:
+            result = db.get_customer_logs_page(customer_id, limit=limit, cursor=request.args.get('cursor'))
+        except db.InvalidCursor:
+            result = db.get_customer_logs_page(customer_id, limit=limit)
+        logs = result['logs']
+        next_cursor, prev_cursor = result['next_cursor'], result['prev_cursor']
+
     customer = db.get_customer_by_id(customer_id)
 
     return render_template('customer_logs.html',
                          customer=customer,
                          logs=logs,
-                         page=page)
+                         page=page,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @app.route('/customer/export/csv')
 @login_required
@@ -388,38 +425,31 @@ def customer_export_csv():
 
     customer_id = session['customer_id']
     customer = db.get_customer_by_id(customer_id)
-    logs = db.get_customer_logs(customer_id, limit=10000)
 
-    # Maak CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Header
-    writer.writerow(['ID', 'Timestamp', 'IP Address', 'Data'])
-
-    # Data
-    for log in logs:
-        writer.writerow([
-            log['id'],
-            log['timestamp'],
-            log['ip_address'],
-            log['data']
-        ])
-
-    # Converteer naar bytes
-    output.seek(0)
-    bytes_output = io.BytesIO()
-    bytes_output.write(output.getvalue().encode('utf-8'))
-    bytes_output.seek(0)
+    # Streaming: rows worden per chunk uit de database gelezen en direct verstuurd
+    rows = db.iter_customer_logs(customer_id, chunk_size=Config.EXPORT_CHUNK_SIZE)
+    chunks = exports.csv_stream(
+        ['ID', 'Timestamp', 'IP Address', 'Data'],
+        rows,
+        lambda log: [log['id'], log['timestamp'], log['ip_address'], log['data']]
+    )
 
     filename = f"mvai_export_{customer['name']}_{datetime.now().strftime('%Y%m%d')}.csv"
 
-    return send_file(
-        bytes_output,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return exports.streaming_response(chunks, request, 'text/csv', filename=filename)
+
+def _search_logs_for_template(query, customer_id=None):
+    """Full-text zoeken met HTML-veilige snippets voor de zoekpagina's"""
+    if not query:
+        return [], None
+    try:
+        page = db.search_logs_page(query, customer_id=customer_id,
+                                   cursor=request.args.get('cursor'), escape=escape)
+    except db.InvalidCursor:
+        page = db.search_logs_page(query, customer_id=customer_id, escape=escape)
+    for log in page['results']:
+        log['snippet'] = Markup(log['snippet']) if log['snippet'] else None
+    return page['results'], page['next_cursor']
 
 @app.route('/customer/search')
 @login_required
@@ -430,18 +460,15 @@ def customer_search():
 
     customer_id = session['customer_id']
     query = request.args.get('q', '')
-
-    if query:
-        logs = db.search_logs(query, customer_id=customer_id)
-    else:
-        logs = []
+    logs, next_cursor = _search_logs_for_template(query, customer_id=customer_id)
 
     customer = db.get_customer_by_id(customer_id)
 
     return render_template('customer_search.html',
                          customer=customer,
                          logs=logs,
-                         query=query)
+                         query=query,
+                         next_cursor=next_cursor)
 
 @app.route('/customer/analytics')
 @login_required
@@ -708,18 +735,52 @@ def customer_ai_chat():
     assistant = get_assistant(customer_id)
 
     # Process with OpenAI-powered chat (fallback to rule-based if OpenAI unavailable)
+    # Het gesprek wordt door de assistant zelf opgeslagen in ai_conversations
     result = assistant.chat(message)
 
-    # Save conversation
-    with db.get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO ai_conversations (customer_id, user_message, ai_response, intent)
-            VALUES (?, ?, ?, ?)
-        ''', (customer_id, message, result['message'], result.get('intent', 'ai_chat')))
-
     return jsonify(result)
 
+@app.route('/customer/ai/chat/stream', methods=['POST'])
+@login_required
+def customer_ai_chat_stream():
+    """AI chat als server-sent events: 'delta' events met tekst, afgesloten met 'done' (volledig resultaat)"""
+    if 'admin' in session:
+        return jsonify({"error": "Admin kan niet AI chat gebruiken"}), 403
+
+    customer_id = session['customer_id']
+    customer = db.get_customer_by_id(customer_id)
+
+    if not customer.get('ai_assistant_enabled', False):
+        return jsonify({"error": "AI Assistant niet geactiveerd"}), 403
+
+    message = (request.get_json(silent=True) or {}).get('message', '').strip()
+
+    if not message:
+        return jsonify({"error": "Geen bericht"}), 400
+
+    from ai_assistant import get_assistant
+    assistant = get_assistant(customer_id)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def events():
+        stream = assistant.chat_stream(message)
+        try:
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as stop:
+                    yield sse('done', stop.value)
+                    return
+                yield sse('delta', {'text': delta})
+        except Exception as e:
+            logger.error("ai_chat_stream_failed", customer_id=customer_id, error=str(e))
+            yield sse('error', {'message': 'AI fout tijdens streamen'})
+
+    return app.response_class(stream_with_context(events()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # ═══════════════════════════════════════════════════════
 # SUBSCRIPTION & BILLING ROUTES
 # ═══════════════════════════════════════════════════════
@@ -847,15 +908,8 @@ def customer_downgrade(tier):
         flash('Dit is geen downgrade. Gebruik upgrade voor een hoger tier.', 'error')
         return redirect(url_for('customer_subscription'))
 
-    # Update tier
-    with db.get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE customers
-            SET pricing_tier = ?,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (tier, customer_id))
+    # Update tier (customer.tier_changed webhook event gaat mee in de transactie)
+    db.update_customer_tier(customer_id, tier)
 
     flash(f'Downgrade naar {tier.upper()} gepland voor einde van de billing cycle', 'success')
     return redirect(url_for('customer_subscription'))
@@ -882,15 +936,8 @@ def gumroad_webhook():
         sale_id = result.get('sale_id')
 
         if customer_id and tier:
-            # Update customer tier in database
-            with db.get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE customers
-                    SET pricing_tier = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (tier, int(customer_id)))
+            # Update customer tier in database (+ customer.tier_changed webhook event)
+            old_tier = db.update_customer_tier(int(customer_id), tier) or 'demo'
 
             # Send upgrade confirmation email
             try:
@@ -898,7 +945,6 @@ def gumroad_webhook():
                 from email_notifications import send_tier_upgrade_email
                 from unit_economics import PricingConfig
 
-                old_tier = customer.get('pricing_tier', 'demo')
                 new_price = PricingConfig.PRICING_TIERS[tier]['price_per_month']
 
                 send_tier_upgrade_email(
@@ -946,16 +992,8 @@ def stripe_webhook():
             tier = result['tier']
             stripe_customer_id = result.get('stripe_customer_id')
 
-            # Update customer tier in database
-            with db.get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE customers
-                    SET pricing_tier = ?,
-                        stripe_customer_id = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (tier, stripe_customer_id, customer_id))
+            # Update customer tier in database (met customer.tier_changed webhook event)
+            old_tier = db.update_customer_tier(customer_id, tier, stripe_customer_id) or 'demo'
 
             # Send upgrade confirmation email
             try:
@@ -963,7 +1001,6 @@ def stripe_webhook():
                 from email_notifications import send_tier_upgrade_email
                 from unit_economics import PricingConfig
 
-                old_tier = customer.get('pricing_tier', 'demo')
                 new_price = PricingConfig.PRICING_TIERS[tier]['price_per_month']
 
                 send_tier_upgrade_email(
@@ -982,14 +1019,7 @@ def stripe_webhook():
             # Subscription canceled - downgrade to demo
             customer_id = int(result['customer_id'])
 
-            with db.get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE customers
-                    SET pricing_tier = 'demo',
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (customer_id,))
+            db.update_customer_tier(customer_id, 'demo')
 
             print(f"⚠️ Subscription canceled for customer {customer_id}")
 
@@ -1050,10 +1080,14 @@ def admin_customer_detail(customer_id):
     stats = db.get_customer_stats(customer_id)
     logs = db.get_customer_logs(customer_id, limit=50)
 
+    import ai_response_cache
+    ai_cache_stats = ai_response_cache.get_customer_cache_stats(customer_id)
+
     return render_template('admin_customer_detail.html',
                          customer=customer,
                          stats=stats,
-                         logs=logs)
+                         logs=logs,
+                         ai_cache_stats=ai_cache_stats)
 
 @app.route('/admin/customer/create', methods=['GET', 'POST'])
 @admin_required
@@ -1120,13 +1154,25 @@ def admin_all_logs():
     """Bekijk alle logs van alle klanten"""
     page = request.args.get('page', 1, type=int)
     limit = 50
-    offset = (page - 1) * limit
 
-    logs = db.get_all_logs(limit=limit, offset=offset)
+    if page > 1 and not request.args.get('cursor'):
+        # Oude ?page=N links blijven werken via offset
+        logs = db.get_all_logs(limit=limit, offset=(page - 1) * limit)
+        next_cursor = db.encode_log_cursor(logs[-1], 'next') if len(logs) == limit else None
+        prev_cursor = db.encode_log_cursor(logs[0], 'prev') if logs else None
+    else:
+        try:
+            result = db.get_all_logs_page(limit=limit, cursor=request.args.get('cursor'))
+        except db.InvalidCursor:
+            result = db.get_all_logs_page(limit=limit)
+        logs = result['logs']
+        next_cursor, prev_cursor = result['next_cursor'], result['prev_cursor']
 
     return render_template('admin_logs.html',
                          logs=logs,
-                         page=page)
+                         page=page,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @app.route('/admin/search')
 @admin_required
@@ -1135,56 +1181,36 @@ def admin_search():
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'customers')
 
+    next_cursor = None
     if query:
         if search_type == 'customers':
             results = db.search_customers(query)
         else:
-            results = db.search_logs(query)
+            results, next_cursor = _search_logs_for_template(query)
     else:
         results = []
 
     return render_template('admin_search.html',
                          results=results,
                          query=query,
-                         search_type=search_type)
+                         search_type=search_type,
+                         next_cursor=next_cursor)
 
 @app.route('/admin/export/all-csv')
 @admin_required
 def admin_export_all_csv():
     """Export alle data naar CSV"""
-    logs = db.get_all_logs(limit=100000)
-
-    # Maak CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    # Header
-    writer.writerow(['ID', 'Customer', 'Timestamp', 'IP Address', 'Data'])
-
-    # Data
-    for log in logs:
-        writer.writerow([
-            log['id'],
-            log.get('customer_name', 'Unknown'),
-            log['timestamp'],
-            log['ip_address'],
-            log['data']
-        ])
-
-    # Converteer naar bytes
-    output.seek(0)
-    bytes_output = io.BytesIO()
-    bytes_output.write(output.getvalue().encode('utf-8'))
-    bytes_output.seek(0)
+    rows = db.iter_all_logs(chunk_size=Config.EXPORT_CHUNK_SIZE)
+    chunks = exports.csv_stream(
+        ['ID', 'Customer', 'Timestamp', 'IP Address', 'Data'],
+        rows,
+        lambda log: [log['id'], log.get('customer_name', 'Unknown'), log['timestamp'],
+                     log['ip_address'], log['data']]
+    )
 
     filename = f"mvai_admin_export_{datetime.now().strftime('%Y%m%d')}.csv"
 
-    return send_file(
-        bytes_output,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return exports.streaming_response(chunks, request, 'text/csv', filename=filename)
 
 # ═══════════════════════════════════════════════════════
 # API ENDPOINTS (voor toekomstige features)
@@ -1209,39 +1235,37 @@ def api_stats():
 @app.route('/admin/enterprise')
 @admin_required
 def admin_enterprise_dashboard():
-    """Enterprise-grade admin dashboard met ICT, Unit Economics, Lean Six Sigma & Marketing"""
-    from monitoring import health_monitor
-    from unit_economics import get_business_metrics, get_customer_grades
-    from lean_six_sigma import track_system_quality_metrics, get_improvement_recommendations, _calculate_sigma_belt
-    from marketing_intelligence import get_marketing_dashboard
-
-    # Get all metrics
-    health_status = health_monitor.get_overall_health()
-    business_metrics = get_business_metrics()
-    customer_grades = get_customer_grades()
-    quality_metrics = track_system_quality_metrics(30)
-    marketing_dashboard = get_marketing_dashboard()
-
-    # Get active alerts
+    """Enterprise-grade admin dashboard met ICT, Unit Economics, Lean Six Sigma & Marketing (uit snapshot)"""
+    import dashboard_snapshots
     from monitoring import get_active_alerts
-    active_alerts = get_active_alerts()
 
-    # Get improvement recommendations
-    improvement_recommendations = get_improvement_recommendations()
+    version = request.args.get('version', type=int)
+    if version:
+        snapshot = dashboard_snapshots.get_snapshot(dashboard_snapshots.ENTERPRISE, version)
+        if snapshot is None:
+            flash(f'Snapshot versie {version} bestaat niet (meer)', 'error')
+            return redirect(url_for('admin_enterprise_dashboard'))
+    else:
+        snapshot = dashboard_snapshots.get_or_refresh(dashboard_snapshots.ENTERPRISE)
 
-    # Get growth strategies
-    growth_strategies = marketing_dashboard['growth_strategies']
+    # Alerts blijven live: één goedkope query
+    active_alerts = get_active_alerts()
 
     return render_template('admin_enterprise_dashboard.html',
-                         health_status=health_status,
-                         business_metrics=business_metrics,
-                         customer_grades=customer_grades,
-                         quality_metrics=quality_metrics,
-                         marketing_summary=marketing_dashboard['summary'],
                          active_alerts=active_alerts,
-                         improvement_recommendations=improvement_recommendations,
-                         growth_strategies=growth_strategies,
-                         sigma_belt=_calculate_sigma_belt(quality_metrics['sigma_level']))
+                         snapshot=snapshot,
+                         snapshot_versions=db.get_dashboard_snapshot_versions(dashboard_snapshots.ENTERPRISE),
+                         **snapshot['payload'])
+
+@app.route('/admin/enterprise/refresh', methods=['POST'])
+@admin_required
+def admin_enterprise_refresh():
+    """Snapshot van het enterprise dashboard direct opnieuw berekenen"""
+    import dashboard_snapshots
+
+    snapshot = dashboard_snapshots.refresh(dashboard_snapshots.ENTERPRISE)
+    flash(f"Dashboard ververst (versie {snapshot['version']}, {snapshot['duration_ms']:.0f} ms)", 'success')
+    return redirect(url_for('admin_enterprise_dashboard'))
 
 @app.route('/admin/ict-monitoring')
 @admin_required
@@ -1253,7 +1277,7 @@ def admin_ict_monitoring():
     health_status = health_monitor.get_overall_health()
     active_alerts = get_active_alerts()
     error_analytics = get_error_analytics(30)
-    recent_errors = get_recent_errors(50)
+    recent_errors = get_recent_errors(50, include_info=False)
     active_incidents = incident_manager.get_active_incidents()
 
     return render_template('admin_ict_monitoring.html',
@@ -1263,6 +1287,18 @@ def admin_ict_monitoring():
                          recent_errors=recent_errors,
                          active_incidents=active_incidents)
 
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """Achtergrond jobs: leader, volgende runs en latency historie"""
+    import scheduler
+
+    return render_template('admin_jobs.html',
+                         scheduler_stats=scheduler.get_scheduler_stats(),
+                         jobs=scheduler.get_scheduler().jobs(),
+                         latency=scheduler.get_job_latency(7),
+                         history=scheduler.get_job_history(100))
+
 @app.route('/admin/unit-economics')
 @admin_required
 def admin_unit_economics():
@@ -1363,6 +1399,8 @@ def server_error(e):
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
+    import scheduler
+    scheduler.start()
     app.run(host='0.0.0.0', port=port, debug=False)
 
 # ═══════════════════════════════════════════════════════
@@ -1558,19 +1596,16 @@ def customer_integration_sync(integration_id):
     """Voer datasync uit voor integratie"""
     if 'admin' in session:
         return redirect(url_for('admin_dashboard'))
-    import json as _json
-    from integrations import sync_integration
+    import integration_sync
     customer_id = session['customer_id']
     integrations = db.get_customer_integrations(customer_id)
     intg = next((i for i in integrations if i['id'] == integration_id), None)
     if not intg:
         flash('Integratie niet gevonden', 'error')
         return redirect(url_for('customer_integrations'))
-    try:
-        count = sync_integration(integration_id, intg['integration_type'], intg['config'], customer_id)
-        flash(f'✓ Sync geslaagd: {count} records gesynchroniseerd', 'success')
-    except Exception as e:
-        flash(f'Sync mislukt: {str(e)[:100]}', 'error')
+    # Sync loopt op de achtergrond; status en foutmelding verschijnen in het overzicht
+    integration_sync.submit_sync(intg)
+    flash('✓ Sync gestart. Nieuwe records verschijnen zodra ze binnen zijn.', 'success')
     return redirect(url_for('customer_integrations'))
 
 
@@ -1704,8 +1739,9 @@ def customer_webhook_create():
     name = request.form.get('name', 'Webhook')
     url = request.form.get('url', '').strip()
     events = request.form.get('events', 'all')
-    if not url or not url.startswith('http'):
-        flash('Ongeldige webhook URL', 'error')
+    error = webhooks.validate_webhook_url(url)
+    if error:
+        flash(error, 'error')
         return redirect(url_for('customer_webhooks'))
     import secrets as _secrets
     secret = _secrets.token_hex(16)
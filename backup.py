@@ -13,19 +13,21 @@ DATABASE = 'mvai_connexx.db'
 BACKUP_DIR = 'backups'
 RETENTION_DAYS = 30  # Bewaar backups voor 30 dagen
 
-def create_backup():
-    """Maak database backup"""
+def create_backup(database=None, backup_dir=None):
+    """Maak database backup (defaults: DATABASE en BACKUP_DIR)"""
+    database = database or DATABASE
+    backup_dir = backup_dir or BACKUP_DIR
 
     # Maak backup directory als het niet bestaat
-    os.makedirs(BACKUP_DIR, exist_ok=True)
+    os.makedirs(backup_dir, exist_ok=True)
 
     # Timestamp voor backup filename
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_file = os.path.join(BACKUP_DIR, f'mvai_connexx_{timestamp}.db')
+    backup_file = os.path.join(backup_dir, f'mvai_connexx_{timestamp}.db')
 
     try:
         # SQLite online backup (werkt ook tijdens gebruik)
-        source_conn = sqlite3.connect(DATABASE)
+        source_conn = sqlite3.connect(database)
         backup_conn = sqlite3.connect(backup_file)
 
         with backup_conn:
@@ -47,13 +49,15 @@ def create_backup():
         print(f"✗ Backup failed: {e}")
         return None
 
-def cleanup_old_backups():
-    """Verwijder oude backups volgens retention policy"""
+def cleanup_old_backups(backup_dir=None, retention_days=None):
+    """Verwijder oude backups volgens retention policy; geeft aantal verwijderde backups terug"""
+    backup_dir = backup_dir or BACKUP_DIR
+    retention_days = retention_days or RETENTION_DAYS
 
-    cutoff_date = datetime.now() - timedelta(days=RETENTION_DAYS)
+    cutoff_date = datetime.now() - timedelta(days=retention_days)
 
     # Vind alle backup bestanden
-    backup_files = glob.glob(os.path.join(BACKUP_DIR, 'mvai_connexx_*.db'))
+    backup_files = glob.glob(os.path.join(backup_dir, 'mvai_connexx_*.db'))
 
     deleted_count = 0
 
@@ -80,6 +84,8 @@ def cleanup_old_backups():
     else:
         print("✓ No old backups to clean")
 
+    return deleted_count
+
 def list_backups():
     """Toon alle beschikbare backups"""
 
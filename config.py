@@ -34,11 +34,70 @@ class Config:
     ENABLE_HONEYPOT = os.getenv('ENABLE_HONEYPOT', 'true').lower() == 'true'
     AUTO_BLACKLIST_THRESHOLD = int(os.getenv('AUTO_BLACKLIST_THRESHOLD', 5))
     BLACKLIST_DURATION_HOURS = int(os.getenv('BLACKLIST_DURATION_HOURS', 24))
+    # Interval waarin workers checken of een andere worker de IP lists heeft gewijzigd
+    IP_LISTS_SYNC_SECONDS = float(os.getenv('IP_LISTS_SYNC_SECONDS', 5))
 
     # Rate Limiting
     RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
     RATELIMIT_DEFAULT = os.getenv('RATELIMIT_DEFAULT', '200 per day;50 per hour')
-    RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL', 'memory://')
+    RATELIMIT_STORAGE_URL = os.getenv('RATELIMIT_STORAGE_URL', '')  # Leeg = SHARED_STATE_URL
+
+    # Gedeelde state voor rate limits en IP reputatie (memory://, sqlite:///pad, redis://...)
+    # Bij GUNICORN_WORKERS > 1: sqlite:// (één host) of redis:// (meerdere hosts)
+    SHARED_STATE_URL = os.getenv('SHARED_STATE_URL', 'memory://')
+    # Max aantal IPs met gefaalde-poging tellers in memory (LRU eviction daarboven)
+    FAILED_ATTEMPT_MAX_IPS = int(os.getenv('FAILED_ATTEMPT_MAX_IPS', 100000))
+
+    # REST API
+    API_BATCH_MAX_LOGS = int(os.getenv('API_BATCH_MAX_LOGS', 5000))
+
+    # Streaming exports (CSV / NDJSON / JSON)
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+
+    # Write-behind ingestie queue voor log writes (opt-in)
+    ENABLE_INGESTION_QUEUE = os.getenv('ENABLE_INGESTION_QUEUE', 'false').lower() == 'true'
+    INGESTION_QUEUE_SIZE = int(os.getenv('INGESTION_QUEUE_SIZE', 10000))
+    INGESTION_BATCH_SIZE = int(os.getenv('INGESTION_BATCH_SIZE', 500))
+    INGESTION_FLUSH_INTERVAL_MS = int(os.getenv('INGESTION_FLUSH_INTERVAL_MS', 50))
+    INGESTION_DEFAULT_ACK = os.getenv('INGESTION_DEFAULT_ACK', 'durable')  # durable, fast
+    INGESTION_DURABLE_TIMEOUT = float(os.getenv('INGESTION_DURABLE_TIMEOUT', 5))
+
+    # Integratie sync engine (incrementeel, parallel, rate limit per host)
+    INTEGRATION_SYNC_WORKERS = int(os.getenv('INTEGRATION_SYNC_WORKERS', 4))
+    INTEGRATION_SYNC_HOST_RPS = float(os.getenv('INTEGRATION_SYNC_HOST_RPS', 2))
+    INTEGRATION_SYNC_HOST_BURST = int(os.getenv('INTEGRATION_SYNC_HOST_BURST', 4))
+    INTEGRATION_SYNC_PAGE_SIZE = int(os.getenv('INTEGRATION_SYNC_PAGE_SIZE', 100))
+    INTEGRATION_SYNC_MAX_PAGES = int(os.getenv('INTEGRATION_SYNC_MAX_PAGES', 100))  # per run, rest volgt
+    INTEGRATION_SYNC_TIMEOUT = float(os.getenv('INTEGRATION_SYNC_TIMEOUT', 15))
+
+    # Webhook delivery (outbox + achtergrond dispatcher, zie webhooks.py)
+    ENABLE_WEBHOOKS = os.getenv('ENABLE_WEBHOOKS', 'true').lower() == 'true'
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+    WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 10))
+    WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+    WEBHOOK_BACKOFF_BASE = float(os.getenv('WEBHOOK_BACKOFF_BASE', 5))     # seconden, verdubbelt per poging
+    WEBHOOK_BACKOFF_MAX = float(os.getenv('WEBHOOK_BACKOFF_MAX', 3600))
+    WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', 1))
+    WEBHOOK_RETENTION_DAYS = int(os.getenv('WEBHOOK_RETENTION_DAYS', 7))
+    # Alleen voor on-premise/ontwikkeling: webhooks naar loopback/privé adressen toestaan
+    WEBHOOK_ALLOW_PRIVATE_URLS = os.getenv('WEBHOOK_ALLOW_PRIVATE_URLS', 'false').lower() == 'true'
+
+    # Achtergrond jobs (APScheduler + leader lease, zie scheduler.py); crontab: 'min uur dag maand weekdag'
+    ENABLE_SCHEDULER = os.getenv('ENABLE_SCHEDULER', 'true').lower() == 'true'
+    SCHEDULER_TIMEZONE = os.getenv('SCHEDULER_TIMEZONE', 'Europe/Amsterdam')
+    SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 60))
+    SCHEDULER_JITTER_SECONDS = int(os.getenv('SCHEDULER_JITTER_SECONDS', 120))
+    BLACKLIST_CLEANUP_MINUTES = int(os.getenv('BLACKLIST_CLEANUP_MINUTES', 15))
+    INTEGRATION_SYNC_INTERVAL_MINUTES = int(os.getenv('INTEGRATION_SYNC_INTERVAL_MINUTES', 60))  # 0 = uit
+    BACKUP_CRON = os.getenv('BACKUP_CRON', '0 2 * * *')
+    ERROR_CLEANUP_CRON = os.getenv('ERROR_CLEANUP_CRON', '30 3 * * *')
+    ERROR_RETENTION_DAYS = int(os.getenv('ERROR_RETENTION_DAYS', 90))
+    ROLLUP_REBUILD_CRON = os.getenv('ROLLUP_REBUILD_CRON', '0 4 * * sun')
+
+    # Voorberekende admin dashboards (zie dashboard_snapshots.py)
+    DASHBOARD_SNAPSHOT_MINUTES = int(os.getenv('DASHBOARD_SNAPSHOT_MINUTES', 5))    # scheduler refresh interval
+    DASHBOARD_SNAPSHOT_MAX_AGE = int(os.getenv('DASHBOARD_SNAPSHOT_MAX_AGE', 900))  # seconden, daarna stale
+    DASHBOARD_SNAPSHOT_VERSIONS = int(os.getenv('DASHBOARD_SNAPSHOT_VERSIONS', 10))
 
     # Private Network
     PRIVATE_NETWORK_MODE = os.getenv('PRIVATE_NETWORK_MODE', 'public')  # public, private, hybrid
@@ -72,12 +131,32 @@ class Config:
     OPENAI_MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', 1000))
     OPENAI_TEMPERATURE = float(os.getenv('OPENAI_TEMPERATURE', 0.7))
 
+    # AI Assistant instanties per klant hergebruiken (LRU per worker)
+    AI_ASSISTANT_CACHE_SIZE = int(os.getenv('AI_ASSISTANT_CACHE_SIZE', 500))
+    AI_ASSISTANT_CACHE_TTL = int(os.getenv('AI_ASSISTANT_CACHE_TTL', 900))
+    # Klant data en recente logs in de system prompt (seconden hergebruikt)
+    AI_ASSISTANT_CONTEXT_TTL = int(os.getenv('AI_ASSISTANT_CONTEXT_TTL', 60))
+
+    # AI response cache (per klant, genormaliseerde prompt, data versie en provider/model)
+    AI_RESPONSE_CACHE_ENABLED = os.getenv('AI_RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    AI_RESPONSE_CACHE_TTL = int(os.getenv('AI_RESPONSE_CACHE_TTL', 3600))
+    AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESPONSE_CACHE_MAX_ENTRIES', 5000))
+    AI_RESPONSE_CACHE_PER_CUSTOMER = int(os.getenv('AI_RESPONSE_CACHE_PER_CUSTOMER', 100))
+    # Trigram similarity drempel voor bijna-gelijke vragen (0 = alleen exacte match)
+    AI_RESPONSE_CACHE_SIMILARITY = float(os.getenv('AI_RESPONSE_CACHE_SIMILARITY', 0))
+
     # Multi-AI Provider keys (platform-brede fallback)
     # Klanten kunnen hun eigen keys opgeven via BYOK (Bring Your Own Key)
     ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', '')
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
     COHERE_API_KEY = os.getenv('COHERE_API_KEY', '')
 
+    # Gedeelde keep-alive HTTP pools naar AI providers (per worker)
+    AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', 10))
+    AI_HTTP_CONNECT_TIMEOUT = float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', 5))
+    AI_HTTP_READ_TIMEOUT = float(os.getenv('AI_HTTP_READ_TIMEOUT', 30))
+    AI_SDK_CLIENT_CACHE_SIZE = int(os.getenv('AI_SDK_CLIENT_CACHE_SIZE', 256))
+
     # Pricing
     DEFAULT_PRICING_TIER = os.getenv('DEFAULT_PRICING_TIER', 'demo')
     ALLOW_TIER_UPGRADE = True
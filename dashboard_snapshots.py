@@ -0,0 +1,133 @@
+"""
+MVAI Connexx - Dashboard Snapshots
+Voorberekende, geversioneerde payloads voor zware admin dashboards. De scheduler
+ververst ze periodiek; wijzigingen aan klanten markeren de laatste versie als stale.
+Pagina's lezen alleen de laatste snapshot en verversen op de achtergrond.
+"""
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+import database as db
+from config import Config
+
+ENTERPRISE = 'enterprise'
+
+
+# ═══════════════════════════════════════════════════════
+# BUILDERS
+# ═══════════════════════════════════════════════════════
+
+def build_enterprise_snapshot() -> Dict:
+    """Alle zware onderdelen van /admin/enterprise (alerts blijven live)"""
+    from monitoring import health_monitor
+    from unit_economics import get_business_metrics, get_customer_grades
+    from lean_six_sigma import track_system_quality_metrics, get_improvement_recommendations, _calculate_sigma_belt
+    from marketing_intelligence import get_marketing_dashboard
+
+    quality_metrics = track_system_quality_metrics(30)
+    marketing_dashboard = get_marketing_dashboard()
+    return {
+        'health_status': health_monitor.get_overall_health(),
+        'business_metrics': get_business_metrics(),
+        'customer_grades': get_customer_grades(),
+        'quality_metrics': quality_metrics,
+        'marketing_summary': marketing_dashboard['summary'],
+        'improvement_recommendations': get_improvement_recommendations(),
+        'growth_strategies': marketing_dashboard['growth_strategies'],
+        'sigma_belt': _calculate_sigma_belt(quality_metrics['sigma_level']),
+    }
+
+
+BUILDERS = {
+    ENTERPRISE: build_enterprise_snapshot,
+}
+
+
+# ═══════════════════════════════════════════════════════
+# REFRESH
+# ═══════════════════════════════════════════════════════
+
+_refresh_locks = {name: threading.Lock() for name in BUILDERS}
+
+
+def refresh(name: str) -> Dict:
+    """Bereken snapshot name opnieuw en sla hem op als nieuwe versie"""
+    with _refresh_locks[name]:
+        return _refresh(name)
+
+
+def _refresh(name):
+    start = time.perf_counter()
+    payload = BUILDERS[name]()
+    duration_ms = round((time.perf_counter() - start) * 1000, 1)
+    db.save_dashboard_snapshot(name, json.dumps(payload, default=str), duration_ms,
+                               keep=Config.DASHBOARD_SNAPSHOT_VERSIONS)
+    return get_snapshot(name)
+
+
+def refresh_async(name: str) -> bool:
+    """Start refresh op de achtergrond; False als er in dit proces al één loopt"""
+    lock = _refresh_locks[name]
+    if not lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            _refresh(name)
+        except Exception as e:
+            print(f"⚠️ Dashboard snapshot {name} refresh failed: {e}")
+        finally:
+            lock.release()
+    threading.Thread(target=run, name=f'mvai-snapshot-{name}', daemon=True).start()
+    return True
+
+
+def refresh_all() -> Dict:
+    """Alle snapshots verversen (scheduler job); geeft versie per snapshot terug"""
+    return {name: refresh(name)['version'] for name in BUILDERS}
+
+
+# ═══════════════════════════════════════════════════════
+# LEZEN
+# ═══════════════════════════════════════════════════════
+
+def get_snapshot(name: str, version: Optional[int] = None) -> Optional[Dict]:
+    """
+    Snapshot met payload (dict), version, computed_at, age_seconds en stale_since
+    (epoch; gezet bij data wijzigingen of als de snapshot ouder is dan de max age).
+    Dashboards tonen age_seconds / stale_seconds.
+    """
+    row = db.get_dashboard_snapshot(name, version)
+    if row is None:
+        return None
+    now = time.time()
+    expires_at = row['computed_at'] + Config.DASHBOARD_SNAPSHOT_MAX_AGE
+    stale_since = row['stale_since']
+    if stale_since is None and now > expires_at:
+        stale_since = expires_at
+    return {
+        'name': name,
+        'version': row['version'],
+        'payload': json.loads(row['payload']),
+        'computed_at': row['computed_at'],
+        'duration_ms': row['duration_ms'],
+        'age_seconds': round(now - row['computed_at'], 1),
+        'stale_since': stale_since,
+        'stale_seconds': round(now - stale_since, 1) if stale_since is not None else None,
+    }
+
+
+def get_or_refresh(name: str) -> Dict:
+    """
+    Laatste snapshot in constante tijd. Alleen zonder enige snapshot wordt er
+    synchroon gerekend; een stale snapshot wordt geserveerd en op de achtergrond ververst.
+    """
+    snapshot = get_snapshot(name)
+    if snapshot is None:
+        return refresh(name)
+    if snapshot['stale_since'] is not None:
+        refresh_async(name)
+        snapshot['refreshing'] = True
+    return snapshot
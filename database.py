@@ -3,11 +3,17 @@ MVAI Connexx - Database Module
 Multi-tenant SQLite database voor klantgegevens en logs
 """
 import os
+import re
 import sqlite3
+import base64
+import json
 import secrets
 import hashlib
 import time
 import functools
+import queue
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from contextlib import contextmanager
 from functools import wraps
@@ -52,27 +58,236 @@ def retry_on_locked(max_retries=5, initial_delay=0.1):
         return wrapper
     return decorator
 
+# ═══════════════════════════════════════════════════════
+# CONNECTION POOL
+# ═══════════════════════════════════════════════════════
+
+# Maximaal aantal gelijktijdig open connecties per worker proces
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+# Hoe lang een checkout wacht op een vrije connectie voordat er een overflow connectie wordt geopend
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+# Connecties die langer dan dit idle waren krijgen een health check (SELECT 1) bij checkout
+DB_POOL_HEALTH_CHECK_SECONDS = float(os.environ.get('DB_POOL_HEALTH_CHECK_SECONDS', '30'))
+# Recycle een connectie na N checkouts (zelfde idee als gunicorn max_requests)
+DB_POOL_MAX_USES = int(os.environ.get('DB_POOL_MAX_USES', '1000'))
+
+
+class _PoolEntry:
+    """Gepoolde connectie met gebruiksstatistieken"""
+    __slots__ = ('conn', 'uses', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Begrensde pool van SQLite connecties voor één database bestand.
+    Connecties worden één keer geopend (PRAGMAs één keer gezet) en hergebruikt
+    over requests en gunicorn threads heen. Nested get_db() aanroepen krijgen
+    elk een eigen connectie, zodat transactie-semantiek ongewijzigd blijft.
+    """
+
+    def __init__(self, database, max_size=None, timeout=None,
+                 health_check_interval=None, max_uses=None):
+        self.database = database
+        self.max_size = max_size if max_size is not None else DB_POOL_SIZE
+        self.timeout = timeout if timeout is not None else DB_POOL_TIMEOUT
+        self.health_check_interval = (health_check_interval if health_check_interval is not None
+                                      else DB_POOL_HEALTH_CHECK_SECONDS)
+        self.max_uses = max_uses if max_uses is not None else DB_POOL_MAX_USES
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'overflows': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+        }
+
+    def _connect(self):
+        """Open nieuwe connectie met WAL mode en timeouts"""
+        conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+
+        # Enable WAL mode for better concurrency
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Set busy timeout to 5 seconds
+        conn.execute('PRAGMA busy_timeout=5000')
+        # Use NORMAL synchronous mode for better performance
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return _PoolEntry(conn)
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _reserve_slot(self, force=False):
+        """Reserveer plek voor een nieuwe connectie (True als het mag)"""
+        with self._lock:
+            if force or self._open < self.max_size:
+                self._open += 1
+                return True
+            return False
+
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+
+    def _open_entry(self):
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _is_healthy(self, entry):
+        if time.monotonic() - entry.last_used < self.health_check_interval:
+            return True
+        try:
+            entry.conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            self._incr('health_check_failures')
+            return False
+
+    def checkout(self):
+        """Haal connectie uit de pool (of open een nieuwe)"""
+        try:
+            entry = self._idle.get_nowait()
+            self._incr('hits')
+        except queue.Empty:
+            if self._reserve_slot():
+                self._incr('misses')
+                return self._open_entry()
+
+            # Pool is vol: wacht op een teruggegeven connectie
+            start = time.monotonic()
+            try:
+                entry = self._idle.get(timeout=self.timeout)
+                self._incr('hits')
+            except queue.Empty:
+                entry = None
+            with self._lock:
+                self._stats['waits'] += 1
+                self._stats['wait_time_ms'] += (time.monotonic() - start) * 1000
+
+            if entry is None:
+                # Liever een extra connectie dan een deadlock bij nested get_db()
+                self._reserve_slot(force=True)
+                self._incr('overflows')
+                return self._open_entry()
+
+        if not self._is_healthy(entry):
+            self._discard(entry)
+            self._reserve_slot(force=True)
+            return self._open_entry()
+        return entry
+
+    def checkin(self, entry, broken=False):
+        """Geef connectie terug aan de pool"""
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+
+        recycle = broken or entry.uses >= self.max_uses or os.getpid() != self.pid
+        with self._lock:
+            over_capacity = self._open > self.max_size
+        if recycle or over_capacity:
+            self._discard(entry)
+            if not broken and entry.uses >= self.max_uses:
+                self._incr('recycled')
+            return
+        self._idle.put(entry)
+
+    def _discard(self, entry):
+        try:
+            entry.conn.close()
+        except sqlite3.Error:
+            pass
+        self._release_slot()
+
+    def close_all(self):
+        """Sluit alle idle connecties (bij worker shutdown)"""
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
+
+    def stats(self):
+        """Pool counters voor monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open_connections'] = self._open
+        stats['idle_connections'] = self._idle.qsize()
+        stats['in_use'] = stats['open_connections'] - stats['idle_connections']
+        stats['max_size'] = self.max_size
+        checkouts = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / checkouts, 4) if checkouts else 0.0
+        stats['avg_wait_ms'] = round(stats['wait_time_ms'] / stats['waits'], 3) if stats['waits'] else 0.0
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool():
+    """Pool voor het huidige DATABASE pad in dit proces (nieuw na fork)"""
+    pool = _pools.get(DATABASE)
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(DATABASE)
+            if pool is None or pool.pid != os.getpid():
+                # Geërfde connecties van de parent nooit hergebruiken na een fork
+                pool = ConnectionPool(DATABASE)
+                _pools[DATABASE] = pool
+    return pool
+
+
+def get_pool_stats():
+    """Hit/miss en checkout-wait counters van de connection pool"""
+    return _get_pool().stats()
+
+
+def close_pool():
+    """Sluit alle gepoolde connecties (gunicorn worker_exit / tests)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close_all()
+
+
 @contextmanager
 def get_db():
-    """Context manager voor database connecties met WAL mode en timeouts"""
-    conn = sqlite3.connect(DATABASE, timeout=30)
-    conn.row_factory = sqlite3.Row
-    
-    # Enable WAL mode for better concurrency
-    conn.execute('PRAGMA journal_mode=WAL')
-    # Set busy timeout to 5 seconds
-    conn.execute('PRAGMA busy_timeout=5000')
-    # Use NORMAL synchronous mode for better performance
-    conn.execute('PRAGMA synchronous=NORMAL')
-    
+    """Context manager voor gepoolde database connecties met WAL mode en timeouts"""
+    pool = _get_pool()
+    entry = pool.checkout()
+    conn = entry.conn
+    broken = False
+
     try:
         yield conn
         conn.commit()
     except Exception as e:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            broken = True
         raise e
     finally:
-        conn.close()
+        pool.checkin(entry, broken=broken)
 
 def init_db():
     """Initialiseer database met multi-tenant schema"""
@@ -269,6 +484,45 @@ def init_db():
             )
         ''')
 
+        # AI response cache: antwoord per klant + genormaliseerde prompt + data versie + provider/model
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_response_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                customer_id INTEGER NOT NULL,
+                prompt_key TEXT NOT NULL,
+                normalized_prompt TEXT NOT NULL,
+                has_context INTEGER NOT NULL DEFAULT 0,
+                data_version TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                tokens_used INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_hit_at REAL,
+                UNIQUE (customer_id, prompt_key, data_version, provider, model),
+                FOREIGN KEY (customer_id) REFERENCES customers(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_response_cache_bucket
+            ON ai_response_cache(customer_id, data_version, provider, model)
+        ''')
+
+        # Hit rate en bespaarde tokens per klant
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_response_cache_stats (
+                customer_id INTEGER PRIMARY KEY,
+                lookups INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                similar_hits INTEGER DEFAULT 0,
+                tokens_saved INTEGER DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (customer_id) REFERENCES customers(id)
+            )
+        ''')
+
         # ═══════════════════════════════════════════════════════
         # ICT MONITORING & ERROR REPORTING TABLES
         # ═══════════════════════════════════════════════════════
@@ -438,11 +692,18 @@ def init_db():
             cursor.execute("ALTER TABLE api_keys ADD COLUMN usage_count INTEGER DEFAULT 0")
 
         # Indices voor performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_customer ON logs(customer_id)')
+        # (customer_id, timestamp) dekt WHERE customer_id = ? ORDER BY timestamp zonder sort
+        # en maakt de losse idx_logs_customer (prefix) overbodig
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_customer_timestamp ON logs(customer_id, timestamp)')
+        cursor.execute('DROP INDEX IF EXISTS idx_logs_customer')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_code ON customers(access_code)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_logs(timestamp)')
+        # Audit trail per admin / per actie, nieuwste eerst zonder volledige index scan
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_admin_timestamp ON audit_logs(admin_username, timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_action_timestamp ON audit_logs(action, timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_keys_value ON api_keys(key_value)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_keys_customer ON api_keys(customer_id, created_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_security_incidents_ip ON security_incidents(ip_address)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_security_incidents_timestamp ON security_incidents(timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_ip_whitelist_ip ON ip_whitelist(ip_address)')
@@ -511,6 +772,20 @@ def init_db():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_integrations_type ON integrations(integration_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_integrations_status ON integrations(status)')
 
+        # Add sync_cursor to integrations if not exists (incrementele sync checkpoint, JSON)
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info('integrations') WHERE name='sync_cursor'")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("ALTER TABLE integrations ADD COLUMN sync_cursor TEXT")
+
+        # Hashes van al gesynchroniseerde records, voor bronnen zonder monotone cursor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS integration_seen_records (
+                integration_id INTEGER NOT NULL,
+                record_hash TEXT NOT NULL,
+                PRIMARY KEY (integration_id, record_hash)
+            ) WITHOUT ROWID
+        ''')
+
         # ═══════════════════════════════════════════════════════
         # WEBHOOK CONFIGS TABLE
         # ═══════════════════════════════════════════════════════
@@ -534,6 +809,87 @@ def init_db():
 
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhooks_customer ON customer_webhooks(customer_id)')
 
+        # Durable outbox: events worden in dezelfde transactie als de bron-write
+        # vastgelegd en door de dispatcher (webhooks.py) asynchroon afgeleverd.
+        # next_attempt_at / locked_until zijn epoch seconden.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                webhook_id INTEGER NOT NULL,
+                customer_id INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                item_count INTEGER DEFAULT 1,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                locked_until REAL,
+                last_error TEXT,
+                last_status_code INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                FOREIGN KEY (webhook_id) REFERENCES customer_webhooks(id)
+            )
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due ON webhook_outbox(status, next_attempt_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_webhook_outbox_webhook ON webhook_outbox(webhook_id, status)')
+
+        # Engagement segmentatie per klant (zie marketing_intelligence.get_customer_segments).
+        # next_review_at (epoch) = eerste moment waarop het segment zonder nieuwe logs kan wisselen.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS customer_segments (
+                customer_id INTEGER PRIMARY KEY,
+                segment TEXT,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                last_activity TIMESTAMP,
+                next_review_at REAL,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (customer_id) REFERENCES customers(id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_segments_review ON customer_segments(next_review_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_segments_segment ON customer_segments(segment, customer_id)')
+
+        # Segmentatie runs: last_log_id is de watermark voor incrementele runs
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS customer_segment_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mode TEXT NOT NULL,
+                last_log_id INTEGER NOT NULL DEFAULT 0,
+                revisited INTEGER NOT NULL DEFAULT 0,
+                removed INTEGER NOT NULL DEFAULT 0,
+                duration_ms REAL,
+                computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Dashboard snapshots: voorberekende admin dashboard payloads (zie dashboard_snapshots.py).
+        # Elke refresh is een nieuwe versie; stale_since (epoch) wordt gezet als onderliggende data wijzigt.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                computed_at REAL NOT NULL,
+                duration_ms REAL,
+                stale_since REAL,
+                UNIQUE(name, version)
+            )
+        ''')
+
+        # Leader leases: welke worker de achtergrond jobs draait (zie scheduler.py).
+        # expires_at is epoch seconden; een verlopen lease mag door een andere holder overgenomen worden.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         # Newsletter subscribers tabel (mindvault-ai.com email capture)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS newsletter_subscribers (
@@ -550,8 +906,154 @@ def init_db():
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_newsletter_email ON newsletter_subscribers(email)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_newsletter_status ON newsletter_subscribers(status)')
 
+        # ═══════════════════════════════════════════════════════
+        # LOG ROLLUPS (materialized analytics per klant)
+        # ═══════════════════════════════════════════════════════
+
+        # Uur buckets: 'YYYY-MM-DD HH:00:00'
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS log_rollups_hourly (
+                customer_id INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (customer_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+
+        # Dag buckets: 'YYYY-MM-DD'
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS log_rollups_daily (
+                customer_id INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                distinct_ips INTEGER NOT NULL DEFAULT 0,
+                first_ts TIMESTAMP,
+                last_ts TIMESTAMP,
+                PRIMARY KEY (customer_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+
+        # Distinct IP sketch per klant per dag (grootte schaalt met unieke IPs, niet met log volume)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS log_rollup_ips (
+                customer_id INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                ip_address TEXT NOT NULL,
+                log_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (customer_id, bucket, ip_address)
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_log_rollups_daily_bucket ON log_rollups_daily(bucket)')
+
+        # Rollups worden in dezelfde transactie als de insert bijgewerkt,
+        # dus alle write paden (API, batch, ingestie queue, integraties) blijven consistent
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_logs_rollup_insert
+            AFTER INSERT ON logs
+            BEGIN
+                INSERT INTO log_rollups_hourly (customer_id, bucket, log_count)
+                VALUES (NEW.customer_id, strftime('%Y-%m-%d %H:00:00', NEW.timestamp), 1)
+                ON CONFLICT(customer_id, bucket) DO UPDATE SET log_count = log_count + 1;
+
+                INSERT INTO log_rollups_daily (customer_id, bucket, log_count, distinct_ips, first_ts, last_ts)
+                VALUES (NEW.customer_id, DATE(NEW.timestamp), 1, 0, NEW.timestamp, NEW.timestamp)
+                ON CONFLICT(customer_id, bucket) DO UPDATE SET
+                    log_count = log_count + 1,
+                    first_ts = MIN(first_ts, excluded.first_ts),
+                    last_ts = MAX(last_ts, excluded.last_ts);
+
+                UPDATE log_rollups_daily
+                SET distinct_ips = distinct_ips + 1
+                WHERE customer_id = NEW.customer_id
+                AND bucket = DATE(NEW.timestamp)
+                AND NOT EXISTS (
+                    SELECT 1 FROM log_rollup_ips
+                    WHERE customer_id = NEW.customer_id
+                    AND bucket = DATE(NEW.timestamp)
+                    AND ip_address = COALESCE(NEW.ip_address, '')
+                );
+
+                INSERT INTO log_rollup_ips (customer_id, bucket, ip_address, log_count)
+                VALUES (NEW.customer_id, DATE(NEW.timestamp), COALESCE(NEW.ip_address, ''), 1)
+                ON CONFLICT(customer_id, bucket, ip_address) DO UPDATE SET log_count = log_count + 1;
+            END
+        ''')
+
+        # ═══════════════════════════════════════════════════════
+        # FULL-TEXT SEARCH (FTS5 external-content index op logs.data)
+        # ═══════════════════════════════════════════════════════
+
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'logs_fts'")
+        fts_row = cursor.fetchone()
+        fts_existed = fts_row is not None and 'customer_id' in fts_row[0]
+        try:
+            if fts_row is not None and not fts_existed:
+                # Oude index zonder customer_id kolom: opnieuw aanmaken zodat de klantfilter in MATCH kan
+                for trigger in ('trg_logs_fts_insert', 'trg_logs_fts_delete', 'trg_logs_fts_update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+                cursor.execute('DROP TABLE logs_fts')
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(
+                    data,
+                    customer_id,
+                    content='logs',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_logs_fts_insert AFTER INSERT ON logs
+                BEGIN
+                    INSERT INTO logs_fts (rowid, data, customer_id) VALUES (NEW.id, NEW.data, NEW.customer_id);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_logs_fts_delete AFTER DELETE ON logs
+                BEGIN
+                    INSERT INTO logs_fts (logs_fts, rowid, data, customer_id)
+                    VALUES ('delete', OLD.id, OLD.data, OLD.customer_id);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_logs_fts_update AFTER UPDATE OF data, customer_id ON logs
+                BEGIN
+                    INSERT INTO logs_fts (logs_fts, rowid, data, customer_id)
+                    VALUES ('delete', OLD.id, OLD.data, OLD.customer_id);
+                    INSERT INTO logs_fts (rowid, data, customer_id) VALUES (NEW.id, NEW.data, NEW.customer_id);
+                END
+            ''')
+            # Bestaande database: index eenmalig vullen (handmatig: python database.py rebuild-search)
+            if not fts_existed:
+                cursor.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            pass  # SQLite zonder FTS5: search_logs valt terug op LIKE
+
+        # Gerangschikte treffers van de eerste zoekpagina; volgende pagina's lezen hieruit
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS log_search_snapshots (
+                token TEXT PRIMARY KEY,
+                customer_id INTEGER,
+                query TEXT NOT NULL,
+                log_ids TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_log_search_snapshots_expires
+            ON log_search_snapshots(expires_at)
+        ''')
+
         conn.commit()
 
+        # Eenmalige backfill voor logs van voor de rollup tabellen
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM log_rollups_daily)')
+        if not cursor.fetchone()[0]:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM logs)')
+            if cursor.fetchone()[0]:
+                _rebuild_log_rollups(cursor)
+                conn.commit()
+
         # Maak standaard admin aan als er nog geen admins zijn
         cursor.execute('SELECT COUNT(*) FROM admins')
         if cursor.fetchone()[0] == 0:
@@ -583,6 +1085,7 @@ def create_customer(name, contact_email=None, company_info=None):
             VALUES (?, ?, ?, ?)
         ''', (name, access_code, contact_email, company_info))
         customer_id = cursor.lastrowid
+        _mark_dashboard_snapshots_stale(cursor)
 
     # Send welcome email (non-blocking - fails gracefully)
     if contact_email:
@@ -629,6 +1132,36 @@ def update_customer_status(customer_id, status):
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('UPDATE customers SET status = ? WHERE id = ?', (status, customer_id))
+        _mark_dashboard_snapshots_stale(cursor)
+
+@retry_on_locked()
+def update_customer_tier(customer_id, tier, stripe_customer_id=None):
+    """
+    Zet pricing tier (en optioneel stripe_customer_id) en leg een customer.tier_changed
+    webhook event vast in dezelfde transactie. Geeft de vorige tier terug (None = onbekende klant).
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        row = cursor.execute('SELECT pricing_tier FROM customers WHERE id = ?', (customer_id,)).fetchone()
+        if row is None:
+            return None
+        old_tier = row['pricing_tier']
+        cursor.execute('''
+            UPDATE customers
+            SET pricing_tier = ?,
+                stripe_customer_id = COALESCE(?, stripe_customer_id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (tier, stripe_customer_id, customer_id))
+        queued = 0
+        if old_tier != tier:
+            _mark_dashboard_snapshots_stale(cursor)
+            queued = _enqueue_webhook_events(cursor, WEBHOOK_EVENT_TIER_CHANGED, {
+                customer_id: [{'customer_id': customer_id, 'old_tier': old_tier, 'new_tier': tier}]
+            })
+    if queued:
+        _notify_webhook_listeners()
+    return old_tier
 
 # Log functies
 @retry_on_locked()
@@ -640,74 +1173,381 @@ def create_log(customer_id, ip_address, data, metadata=None):
             INSERT INTO logs (customer_id, ip_address, data, metadata)
             VALUES (?, ?, ?, ?)
         ''', (customer_id, ip_address, data, metadata))
-        return cursor.lastrowid
+        log_id = cursor.lastrowid
+        queued = _enqueue_log_events(cursor, [(log_id, customer_id, ip_address, data, metadata)])
+    invalidate_customer_stats(customer_id)
+    if queued:
+        _notify_webhook_listeners()
+    return log_id
+
+def create_logs_bulk(customer_id, ip_address, rows):
+    """
+    Maak meerdere log entries in één transactie (één commit / WAL fsync).
+    rows: lijst van data strings of (data, metadata) tuples.
+    Geeft de toegekende id range terug (aaneengesloten binnen de transactie).
+    """
+    return create_logs_many([
+        (customer_id, ip_address, row[0], row[1]) if isinstance(row, tuple)
+        else (customer_id, ip_address, row, None)
+        for row in rows
+    ])
+
+@retry_on_locked()
+def create_logs_many(entries):
+    """
+    Schrijf (customer_id, ip_address, data, metadata) tuples in één transactie.
+    Gebruikt door de batch API en de write-behind ingestie queue.
+    """
+    params = list(entries)
+    if not params:
+        return range(0)
+
+    with get_db() as conn:
+        ids, queued = _insert_logs(conn.cursor(), params)
+    invalidate_customer_stats(*{entry[0] for entry in params})
+    if queued:
+        _notify_webhook_listeners()
+    return ids
+
+def _insert_logs(cursor, params):
+    """executemany binnen de transactie van de caller; geeft (id range, aantal outbox rijen) terug"""
+    cursor.executemany('''
+        INSERT INTO logs (customer_id, ip_address, data, metadata)
+        VALUES (?, ?, ?, ?)
+    ''', params)
+    last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+    ids = range(last_id - len(params) + 1, last_id + 1)
+    queued = _enqueue_log_events(cursor, [(log_id, *entry) for log_id, entry in zip(ids, params)])
+    return ids, queued
 
 def get_customer_logs(customer_id, limit=100, offset=0):
-    """Haal logs op voor specifieke klant"""
+    """Haal logs op voor specifieke klant (offset paginatie, zie get_customer_logs_page)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM logs
             WHERE customer_id = ?
-            ORDER BY timestamp DESC
+            ORDER BY timestamp DESC, id DESC
             LIMIT ? OFFSET ?
         ''', (customer_id, limit, offset))
         return [dict(row) for row in cursor.fetchall()]
 
 def get_all_logs(limit=100, offset=0):
-    """Haal alle logs op (admin functie)"""
+    """Haal alle logs op (admin functie, offset paginatie, zie get_all_logs_page)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT l.*, c.name as customer_name
             FROM logs l
             JOIN customers c ON l.customer_id = c.id
-            ORDER BY l.timestamp DESC
+            ORDER BY l.timestamp DESC, l.id DESC
             LIMIT ? OFFSET ?
         ''', (limit, offset))
         return [dict(row) for row in cursor.fetchall()]
 
-def get_customer_stats(customer_id):
-    """Haal statistieken op voor klant"""
+# ═══════════════════════════════════════════════════════
+# KEYSET (CURSOR) PAGINATIE
+# ═══════════════════════════════════════════════════════
+
+class InvalidCursor(ValueError):
+    """Cursor kon niet gedecodeerd worden"""
+
+
+def encode_log_cursor(log, direction='next'):
+    """Opaque cursor op (timestamp, id) van een log row"""
+    payload = json.dumps({'t': log['timestamp'], 'i': log['id'], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_log_cursor(value):
+    """Geeft (timestamp, id, direction) terug; raises InvalidCursor"""
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = payload.get('d', 'next')
+        if direction not in ('next', 'prev') or not isinstance(payload['i'], int):
+            raise ValueError(direction)
+        return str(payload['t']), payload['i'], direction
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidCursor('Invalid pagination cursor') from e
+
+
+def _fetch_logs_page(conn, select, where, params, limit, cursor, prefix=''):
+    """
+    Gedeelde keyset query: nieuwste eerst op (timestamp, id).
+    Kost per pagina O(limit) ongeacht de diepte, via (customer_id, timestamp) / (timestamp) index.
+    """
+    direction = 'next'
+    clauses = list(where)
+    params = list(params)
+    if cursor:
+        ts, log_id, direction = decode_log_cursor(cursor)
+        op = '<' if direction == 'next' else '>'
+        clauses.append(f'({prefix}timestamp, {prefix}id) {op} (?, ?)')
+        params += [ts, log_id]
+
+    order = 'DESC' if direction == 'next' else 'ASC'
+    where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(f'''
+        {select}
+        {where_sql}
+        ORDER BY {prefix}timestamp {order}, {prefix}id {order}
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+
+    has_more = len(rows) > limit
+    logs = [dict(row) for row in rows[:limit]]
+    if direction == 'prev':
+        logs.reverse()
+
+    if direction == 'next':
+        has_newer, has_older = cursor is not None, has_more
+    else:
+        has_newer, has_older = has_more, True
+
+    return {
+        'logs': logs,
+        'next_cursor': encode_log_cursor(logs[-1], 'next') if logs and has_older else None,
+        'prev_cursor': encode_log_cursor(logs[0], 'prev') if logs and has_newer else None,
+    }
+
+
+def get_customer_logs_page(customer_id, limit=100, cursor=None):
+    """Keyset pagina met logs voor klant: {'logs', 'next_cursor', 'prev_cursor'}"""
     with get_db() as conn:
-        cursor = conn.cursor()
+        return _fetch_logs_page(conn, 'SELECT * FROM logs', ['customer_id = ?'], [customer_id], limit, cursor)
 
-        # Totaal aantal logs
-        cursor.execute('SELECT COUNT(*) as total FROM logs WHERE customer_id = ?', (customer_id,))
-        total_logs = cursor.fetchone()['total']
 
-        # Eerste log datum
-        cursor.execute('SELECT MIN(timestamp) as first_log FROM logs WHERE customer_id = ?', (customer_id,))
-        first_log = cursor.fetchone()['first_log']
+def get_all_logs_page(limit=100, cursor=None):
+    """Keyset pagina met logs van alle klanten (admin functie)"""
+    with get_db() as conn:
+        return _fetch_logs_page(
+            conn,
+            '''SELECT l.*, c.name as customer_name
+            FROM logs l
+            JOIN customers c ON l.customer_id = c.id''',
+            [], [], limit, cursor, prefix='l.'
+        )
 
-        # Laatste log datum
-        cursor.execute('SELECT MAX(timestamp) as last_log FROM logs WHERE customer_id = ?', (customer_id,))
-        last_log = cursor.fetchone()['last_log']
+def iter_customer_logs(customer_id, chunk_size=1000, limit=None):
+    """
+    Stream alle logs van klant (nieuwste eerst) in keyset chunks.
+    Elke chunk is een eigen korte checkout, dus een trage client houdt geen connectie vast.
+    """
+    yield from _iter_log_pages(
+        lambda size, cursor: get_customer_logs_page(customer_id, limit=size, cursor=cursor),
+        chunk_size, limit
+    )
+
+def iter_all_logs(chunk_size=1000, limit=None):
+    """Stream logs van alle klanten (admin export) in keyset chunks"""
+    yield from _iter_log_pages(
+        lambda size, cursor: get_all_logs_page(limit=size, cursor=cursor),
+        chunk_size, limit
+    )
+
+def _iter_log_pages(fetch_page, chunk_size, limit):
+    cursor = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        page = fetch_page(size, cursor)
+        yield from page['logs']
+        if remaining is not None:
+            remaining -= len(page['logs'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return
+
+def _rebuild_log_rollups(cursor, customer_id=None):
+    """Herbereken rollups vanuit de ruwe logs tabel (optioneel voor één klant)"""
+    where, params = ('WHERE customer_id = ?', (customer_id,)) if customer_id is not None else ('', ())
+
+    for table in ('log_rollups_hourly', 'log_rollups_daily', 'log_rollup_ips'):
+        cursor.execute(f'DELETE FROM {table} {where}', params)
+
+    cursor.execute(f'''
+        INSERT INTO log_rollups_hourly (customer_id, bucket, log_count)
+        SELECT customer_id, strftime('%Y-%m-%d %H:00:00', timestamp), COUNT(*)
+        FROM logs {where}
+        GROUP BY 1, 2
+    ''', params)
+    cursor.execute(f'''
+        INSERT INTO log_rollup_ips (customer_id, bucket, ip_address, log_count)
+        SELECT customer_id, DATE(timestamp), COALESCE(ip_address, ''), COUNT(*)
+        FROM logs {where}
+        GROUP BY 1, 2, 3
+    ''', params)
+    cursor.execute(f'''
+        INSERT INTO log_rollups_daily (customer_id, bucket, log_count, distinct_ips, first_ts, last_ts)
+        SELECT customer_id, DATE(timestamp), COUNT(*),
+               COUNT(DISTINCT COALESCE(ip_address, '')), MIN(timestamp), MAX(timestamp)
+        FROM logs {where}
+        GROUP BY 1, 2
+    ''', params)
 
-        # Logs vandaag
-        cursor.execute('''
-            SELECT COUNT(*) as today
-            FROM logs
-            WHERE customer_id = ?
-            AND DATE(timestamp) = DATE('now')
-        ''', (customer_id,))
-        logs_today = cursor.fetchone()['today']
+@retry_on_locked()
+def rebuild_log_rollups(customer_id=None):
+    """
+    Catch-up job: rollups opnieuw opbouwen vanuit logs.
+    Nodig na handmatige imports/deletes buiten de insert trigger om.
+    """
+    with get_db() as conn:
+        _rebuild_log_rollups(conn.cursor(), customer_id)
+    if customer_id is None:
+        _stats_cache.clear()
+    else:
+        invalidate_customer_stats(customer_id)
 
-        # Logs deze week
+# ═══════════════════════════════════════════════════════
+# STATS CACHE
+# ═══════════════════════════════════════════════════════
+
+# Seconden dat get_customer_stats() tussen requests gecached wordt (0 = uit)
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '5'))
+
+try:
+    from flask import g as _request_globals, has_app_context as _has_app_context
+except ImportError:  # database.py los gebruikt (CLI / scripts)
+    _request_globals = None
+
+    def _has_app_context():
+        return False
+
+
+class StatsCache:
+    """
+    Korte TTL cache voor klantstatistieken, per klant geïnvalideerd bij nieuwe logs.
+    Een generatie-teller per klant voorkomt dat een query die vóór een insert
+    startte zijn (verouderde) resultaat na de invalidatie nog terugschrijft.
+    """
+
+    def __init__(self, ttl=STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}       # customer_id -> (stats, expires_at)
+        self._generations = {}   # customer_id -> int
+        self._epoch = 0          # verhoogd door clear()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self, customer_id):
+        with self._lock:
+            return self._epoch, self._generations.get(customer_id, 0)
+
+    def get(self, customer_id):
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(customer_id, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, customer_id, stats, generation):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if (self._epoch, self._generations.get(customer_id, 0)) == generation:
+                self._entries[customer_id] = (stats, time.monotonic() + self.ttl)
+
+    def invalidate(self, customer_ids):
+        with self._lock:
+            for customer_id in customer_ids:
+                self._generations[customer_id] = self._generations.get(customer_id, 0) + 1
+                self._entries.pop(customer_id, None)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_stats_cache = StatsCache()
+
+
+def get_stats_cache_stats():
+    """Cache statistieken voor monitoring"""
+    return _stats_cache.stats()
+
+
+def _request_stats_memo():
+    """Dict op flask.g voor de duur van één request; None buiten een request"""
+    if not _has_app_context():
+        return None
+    memo = getattr(_request_globals, '_customer_stats', None)
+    if memo is None:
+        memo = _request_globals._customer_stats = {}
+    return memo
+
+
+def invalidate_customer_stats(*customer_ids):
+    """Verwijder gecachte stats na nieuwe logs (cross-request cache en request memo)"""
+    _stats_cache.invalidate(customer_ids)
+    memo = _request_stats_memo()
+    if memo:
+        for customer_id in customer_ids:
+            memo.pop(customer_id, None)
+
+
+def get_customer_stats(customer_id):
+    """
+    Haal statistieken op voor klant.
+    Eén request doet de query hooguit één keer (flask.g); tussen requests wordt het
+    resultaat STATS_CACHE_TTL seconden bewaard tot er nieuwe logs binnenkomen.
+    """
+    memo = _request_stats_memo()
+    if memo is not None and customer_id in memo:
+        return dict(memo[customer_id])
+
+    stats = _stats_cache.get(customer_id)
+    if stats is None:
+        generation = _stats_cache.generation(customer_id)
+        stats = _query_customer_stats(customer_id)
+        _stats_cache.put(customer_id, stats, generation)
+
+    if memo is not None:
+        memo[customer_id] = stats
+    return dict(stats)
+
+def _query_customer_stats(customer_id):
+    """Eén aggregaat over log_rollups_daily (total, first/last, vandaag, week)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT COUNT(*) as week
-            FROM logs
+            SELECT
+                COALESCE(SUM(log_count), 0) as total_logs,
+                MIN(first_ts) as first_log,
+                MAX(last_ts) as last_log,
+                COALESCE(SUM(CASE WHEN bucket = DATE('now') THEN log_count END), 0) as logs_today,
+                COALESCE(SUM(CASE WHEN bucket >= DATE('now', '-7 days') THEN log_count END), 0) as logs_week
+            FROM log_rollups_daily
             WHERE customer_id = ?
-            AND timestamp >= DATE('now', '-7 days')
         ''', (customer_id,))
-        logs_week = cursor.fetchone()['week']
+        row = cursor.fetchone()
 
         return {
-            'total_logs': total_logs,
-            'first_log': first_log,
-            'last_log': last_log,
-            'logs_today': logs_today,
-            'logs_week': logs_week
+            'total_logs': row['total_logs'],
+            'first_log': row['first_log'],
+            'last_log': row['last_log'],
+            'logs_today': row['logs_today'],
+            'logs_week': row['logs_week']
         }
 
 def get_admin_stats():
@@ -719,12 +1559,15 @@ def get_admin_stats():
         cursor.execute('SELECT COUNT(*) as total FROM customers WHERE status = "active"')
         total_customers = cursor.fetchone()['total']
 
-        # Totaal aantal logs
-        cursor.execute('SELECT COUNT(*) as total FROM logs')
+        # Totaal aantal logs (dag rollups, geen scan over de ruwe logs)
+        cursor.execute('SELECT COALESCE(SUM(log_count), 0) as total FROM log_rollups_daily')
         total_logs = cursor.fetchone()['total']
 
-        # Logs vandaag
-        cursor.execute('SELECT COUNT(*) as today FROM logs WHERE DATE(timestamp) = DATE("now")')
+        # Logs vandaag (range op idx_logs_timestamp)
+        cursor.execute('''
+            SELECT COUNT(*) as today FROM logs
+            WHERE timestamp >= DATE('now') AND timestamp < DATE('now', '+1 day')
+        ''')
         logs_today = cursor.fetchone()['today']
 
         # Top 5 klanten
@@ -784,8 +1627,176 @@ def search_customers(query):
         ''', (f'%{query}%',))
         return [dict(row) for row in cursor.fetchall()]
 
-def search_logs(query, customer_id=None):
-    """Zoek logs op data inhoud"""
+# ═══════════════════════════════════════════════════════
+# FULL-TEXT SEARCH
+# ═══════════════════════════════════════════════════════
+
+# Markers die snippet() rond treffers zet; worden na escaping vervangen door <mark>
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+_FTS_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def build_fts_query(query):
+    """
+    Zet gebruikersinvoer om naar een veilige FTS5 query.
+    Woorden worden ge-AND, "exacte zin" blijft een phrase, woord* is een prefix query,
+    OR tussen termen blijft behouden.
+    """
+    parts = []
+    for phrase, word in _FTS_TERM.findall(query or ''):
+        if phrase:
+            text, prefix = phrase, False
+        elif word == 'OR':
+            if parts and parts[-1] != 'OR':
+                parts.append('OR')
+            continue
+        else:
+            prefix = word.endswith('*')
+            text = word.rstrip('*')
+        text = text.replace('"', ' ').strip()
+        if not text:
+            continue
+        parts.append(f'"{text}"' + ('*' if prefix else ''))
+    while parts and parts[-1] == 'OR':
+        parts.pop()
+    return ' '.join(parts)
+
+
+def highlight_snippet(snippet, start='<mark>', end='</mark>', escape=None):
+    """Vervang snippet markers; escape (bijv. markupsafe.escape) wordt op de tekst toegepast"""
+    if snippet is None:
+        return None
+    if escape is not None:
+        snippet = str(escape(snippet))
+    return snippet.replace(_HIGHLIGHT_START, start).replace(_HIGHLIGHT_END, end)
+
+
+def rebuild_log_search_index():
+    """Backfill/herbouw de FTS index vanuit logs (python database.py rebuild-search)"""
+    with get_db() as conn:
+        conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+
+
+# Gerangschikte zoekresultaten: max treffers per zoekopdracht en geldigheid van de cursor
+SEARCH_MAX_RESULTS = 1000
+SEARCH_SNAPSHOT_TTL = 900
+
+
+def search_logs_page(query, customer_id=None, limit=50, cursor=None, escape=None):
+    """
+    Full-text zoeken in logs.data, gesorteerd op relevantie (bm25, beste treffer eerst).
+    bm25 verschuift bij elke insert, dus pagina 1 legt de volgorde vast (max SEARCH_MAX_RESULTS
+    ids); volgende pagina's lezen uit die snapshot en slaan zo geen rijen over of dubbel.
+    De klantfilter zit in de MATCH zelf, zodat alleen treffers van die klant gescoord worden.
+    Geeft {'results', 'next_cursor'}; results bevatten 'score' en 'snippet' met <mark> rond treffers.
+    Geef escape (bijv. markupsafe.escape) mee als de snippet als HTML gerenderd wordt.
+    Raises InvalidCursor bij een onbekende of verlopen cursor.
+    """
+    match = build_fts_query(query)
+    if not match:
+        return {'results': [], 'next_cursor': None}
+
+    match = f'data : ({match})'
+    if customer_id:
+        match = f'customer_id : "{int(customer_id)}" AND {match}'
+
+    try:
+        with get_db() as conn:
+            if cursor:
+                token, offset = _decode_search_cursor(cursor)
+                log_ids = _load_search_snapshot(conn, token, match)
+            else:
+                token, offset = None, 0
+                log_ids = [row[0] for row in conn.execute('''
+                    SELECT rowid FROM logs_fts
+                    WHERE logs_fts MATCH ? AND rank MATCH 'bm25(1.0, 0.0)'
+                    ORDER BY rank
+                    LIMIT ?
+                ''', (match, SEARCH_MAX_RESULTS)).fetchall()]
+
+            page_ids = log_ids[offset:offset + limit]
+            next_offset = offset + limit
+            if next_offset < len(log_ids) and token is None:
+                token = _save_search_snapshot(conn, customer_id, match, log_ids)
+            rows = _fetch_search_rows(conn, match, page_ids)
+    except sqlite3.OperationalError as e:
+        if 'logs_fts' not in str(e):
+            raise
+        # Geen FTS5 beschikbaar: oude LIKE scan, zonder ranking
+        return {'results': _search_logs_like(query, customer_id, limit), 'next_cursor': None}
+
+    results = []
+    for log_id in page_ids:
+        if log_id not in rows:
+            continue  # sinds de eerste pagina verwijderd
+        result = dict(rows[log_id])
+        result['snippet'] = highlight_snippet(result['snippet'], escape=escape)
+        results.append(result)
+
+    next_cursor = None
+    if next_offset < len(log_ids):
+        next_cursor = _encode_search_cursor(token, next_offset)
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+def _fetch_search_rows(conn, match, log_ids):
+    """Rijen met score en snippet voor een pagina ids, per id"""
+    if not log_ids:
+        return {}
+    placeholders = ','.join('?' * len(log_ids))
+    rows = conn.execute(f'''
+        SELECT l.*, c.name as customer_name,
+               bm25(logs_fts, 1.0, 0.0) as score,
+               snippet(logs_fts, 0, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', '…', 16) as snippet
+        FROM logs_fts
+        JOIN logs l ON l.id = logs_fts.rowid
+        JOIN customers c ON l.customer_id = c.id
+        WHERE logs_fts MATCH ? AND logs_fts.rowid IN ({placeholders})
+    ''', [match] + list(log_ids)).fetchall()
+    return {row['id']: row for row in rows}
+
+
+def _save_search_snapshot(conn, customer_id, match, log_ids):
+    now = time.time()
+    token = secrets.token_urlsafe(16)
+    conn.execute('DELETE FROM log_search_snapshots WHERE expires_at <= ?', (now,))
+    conn.execute('''
+        INSERT INTO log_search_snapshots (token, customer_id, query, log_ids, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (token, int(customer_id) if customer_id else None, match, json.dumps(log_ids), now + SEARCH_SNAPSHOT_TTL))
+    return token
+
+
+def _load_search_snapshot(conn, token, match):
+    row = conn.execute('''
+        SELECT customer_id, query, log_ids FROM log_search_snapshots
+        WHERE token = ? AND expires_at > ?
+    ''', (token, time.time())).fetchone()
+    # Cursor hoort bij dezelfde zoekopdracht; de klantfilter zit in de MATCH
+    if row is None or row['query'] != match:
+        raise InvalidCursor('Unknown or expired search cursor')
+    return json.loads(row['log_ids'])
+
+
+def _encode_search_cursor(token, offset):
+    payload = json.dumps({'s': token, 'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_search_cursor(value):
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        offset = int(payload['o'])
+        if not isinstance(payload['s'], str) or offset < 0:
+            raise ValueError(offset)
+        return payload['s'], offset
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidCursor('Invalid search cursor') from e
+
+
+def _search_logs_like(query, customer_id, limit):
     with get_db() as conn:
         cursor = conn.cursor()
         if customer_id:
@@ -793,8 +1804,8 @@ def search_logs(query, customer_id=None):
                 SELECT * FROM logs
                 WHERE customer_id = ? AND data LIKE ?
                 ORDER BY timestamp DESC
-                LIMIT 50
-            ''', (customer_id, f'%{query}%'))
+                LIMIT ?
+            ''', (customer_id, f'%{query}%', limit))
         else:
             cursor.execute('''
                 SELECT l.*, c.name as customer_name
@@ -802,10 +1813,15 @@ def search_logs(query, customer_id=None):
                 JOIN customers c ON l.customer_id = c.id
                 WHERE l.data LIKE ?
                 ORDER BY l.timestamp DESC
-                LIMIT 50
-            ''', (f'%{query}%',))
+                LIMIT ?
+            ''', (f'%{query}%', limit))
         return [dict(row) for row in cursor.fetchall()]
 
+
+def search_logs(query, customer_id=None, limit=50):
+    """Zoek logs op data inhoud (FTS5, beste treffers eerst)"""
+    return search_logs_page(query, customer_id=customer_id, limit=limit)['results']
+
 # Audit logging functies
 @retry_on_locked()
 def log_admin_action(admin_username, action, target_type=None, target_id=None, details=None, ip_address=None):
@@ -837,6 +1853,159 @@ def get_audit_logs(limit=50, admin_username=None):
             ''', (limit,))
         return [dict(row) for row in cursor.fetchall()]
 
+# ═══════════════════════════════════════════════════════
+# API KEY CACHE
+# ═══════════════════════════════════════════════════════
+
+# Hoe lang een geverifieerde key → customer_id mapping in memory geldig blijft
+API_KEY_CACHE_TTL = float(os.environ.get('API_KEY_CACHE_TTL', '60'))
+# Maximaal aantal keys in de cache (LRU eviction)
+API_KEY_CACHE_SIZE = int(os.environ.get('API_KEY_CACHE_SIZE', '1024'))
+# Interval waarmee last_used_at / usage_count in één transactie worden weggeschreven
+API_KEY_USAGE_FLUSH_SECONDS = float(os.environ.get('API_KEY_USAGE_FLUSH_SECONDS', '30'))
+
+
+class ApiKeyCache:
+    """
+    TTL/LRU cache voor key → customer_id plus in-memory usage counters.
+    Voorkomt een write (last_used_at) per API request; counters worden periodiek
+    in één batch naar api_keys geflusht.
+    """
+
+    def __init__(self, ttl=API_KEY_CACHE_TTL, max_size=API_KEY_CACHE_SIZE,
+                 flush_interval=API_KEY_USAGE_FLUSH_SECONDS):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()   # key_value -> (key_id, customer_id, expires_at)
+        self._usage = {}                # key_id -> [count, last_used_at]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+
+    def get(self, key_value):
+        """Geeft (key_id, customer_id) of None bij miss/verlopen entry"""
+        with self._lock:
+            entry = self._entries.get(key_value)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key_value]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key_value)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key_value, key_id, customer_id):
+        with self._lock:
+            self._entries[key_value] = (key_id, customer_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key_value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key_id=None, key_value=None):
+        """Verwijder key uit de cache (bij revoke)"""
+        with self._lock:
+            if key_value is not None:
+                self._entries.pop(key_value, None)
+            if key_id is not None:
+                for value in [v for v, e in self._entries.items() if e[0] == key_id]:
+                    del self._entries[value]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._usage.clear()
+
+    def record_usage(self, key_id):
+        # UTC, net als CURRENT_TIMESTAMP waarmee last_used voorheen gezet werd
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            usage = self._usage.get(key_id)
+            if usage is None:
+                self._usage[key_id] = [1, now]
+            else:
+                usage[0] += 1
+                usage[1] = now
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """Schrijf opgespaarde usage counters weg in één transactie"""
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # Andere thread is al aan het flushen
+        try:
+            with self._lock:
+                pending, self._usage = self._usage, {}
+                self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+            try:
+                with get_db() as conn:
+                    conn.executemany('''
+                        UPDATE api_keys
+                        SET usage_count = COALESCE(usage_count, 0) + ?,
+                            last_used_at = ?
+                        WHERE id = ?
+                    ''', [(count, last_used, key_id) for key_id, (count, last_used) in pending.items()])
+            except Exception:
+                # Counters terugzetten zodat ze bij de volgende flush mee gaan
+                with self._lock:
+                    for key_id, (count, last_used) in pending.items():
+                        usage = self._usage.setdefault(key_id, [0, last_used])
+                        usage[0] += count
+                raise
+            self.flushes += 1
+            return len(pending)
+        finally:
+            self._flush_lock.release()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'pending_usage_keys': len(self._usage),
+                'flushes': self.flushes,
+            }
+
+
+_api_key_cache = ApiKeyCache()
+
+
+def get_api_key_cache_stats():
+    """Cache en flush statistieken voor monitoring"""
+    return _api_key_cache.stats()
+
+
+def flush_api_key_usage():
+    """Schrijf in-memory last_used_at / usage_count direct weg (bijv. bij worker exit)"""
+    return _api_key_cache.flush()
+
+
+@retry_on_locked()
+def _lookup_api_key(key_value):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, customer_id FROM api_keys
+            WHERE key_value = ? AND is_active = 1
+        ''', (key_value,))
+        return cursor.fetchone()
+
+
 # API Key functies
 @retry_on_locked()
 def create_api_key(customer_id, name=None):
@@ -852,32 +2021,35 @@ def create_api_key(customer_id, name=None):
 
     return key_value
 
-@retry_on_locked()
 def verify_api_key(key_value):
     """
     Verifieer API key en return customer_id
-    Note: Updates last_used_at timestamp, so requires write access
+    Resultaat wordt API_KEY_CACHE_TTL seconden gecached; last_used_at en usage_count
+    worden periodiek in batch bijgewerkt in plaats van per request.
     """
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT customer_id FROM api_keys
-            WHERE key_value = ? AND is_active = 1
-        ''', (key_value,))
-        row = cursor.fetchone()
-
-        if row:
-            # Update last_used_at
-            cursor.execute('''
-                UPDATE api_keys
-                SET last_used_at = CURRENT_TIMESTAMP
-                WHERE key_value = ?
-            ''', (key_value,))
-            return row['customer_id']
-        return None
+    cached = _api_key_cache.get(key_value)
+    if cached is None:
+        row = _lookup_api_key(key_value)
+        if not row:
+            return None
+        cached = (row['id'], row['customer_id'])
+        _api_key_cache.put(key_value, *cached)
+
+    key_id, customer_id = cached
+    _api_key_cache.record_usage(key_id)
+    if _api_key_cache.flush_due():
+        try:
+            _api_key_cache.flush()
+        except sqlite3.Error:
+            pass  # Usage tracking mag authenticatie nooit blokkeren
+    return customer_id
 
 def get_customer_api_keys(customer_id):
     """Haal alle API keys voor klant op"""
+    try:
+        _api_key_cache.flush()  # Actuele last_used_at / usage_count tonen
+    except sqlite3.Error:
+        pass
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
@@ -897,6 +2069,7 @@ def revoke_api_key(key_id):
             SET is_active = 0
             WHERE id = ?
         ''', (key_id,))
+    _api_key_cache.invalidate(key_id=key_id)
 
 # ═══════════════════════════════════════════════════════
 # SOCIAL LOGIN FUNCTIES
@@ -982,6 +2155,56 @@ def update_integration_sync(integration_id, status='active', error=None):
             WHERE id = ?
         ''', (status, error, integration_id))
 
+def get_integration(integration_id):
+    """Haal één integratie op (incl. sync_cursor)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM integrations WHERE id = ?', (integration_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def get_syncable_integrations(integration_types):
+    """Integraties van de opgegeven types die niet uitgeschakeld zijn, oudste sync eerst"""
+    placeholders = ','.join('?' * len(integration_types))
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT * FROM integrations
+            WHERE integration_type IN ({placeholders}) AND status != 'disabled'
+            ORDER BY last_sync IS NOT NULL, last_sync
+        ''', list(integration_types))
+        return [dict(row) for row in cursor.fetchall()]
+
+@retry_on_locked()
+def write_integration_page(integration_id, entries, sync_cursor, record_hashes=None):
+    """
+    Schrijf één pagina gesynchroniseerde records als logs en zet de cursor in
+    dezelfde transactie: na een crash hervat de volgende sync precies na deze pagina.
+    Met record_hashes (parallel aan entries) worden al eerder geziene records overgeslagen.
+    """
+    params = list(entries)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if record_hashes is not None:
+            fresh = []
+            for entry, record_hash in zip(params, record_hashes):
+                cursor.execute('''
+                    INSERT OR IGNORE INTO integration_seen_records (integration_id, record_hash)
+                    VALUES (?, ?)
+                ''', (integration_id, record_hash))
+                if cursor.rowcount:
+                    fresh.append(entry)
+            params = fresh
+        ids, queued = _insert_logs(cursor, params) if params else (range(0), 0)
+        cursor.execute('''
+            UPDATE integrations SET sync_cursor = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (json.dumps(sync_cursor) if sync_cursor is not None else None, integration_id))
+    if params:
+        invalidate_customer_stats(*{entry[0] for entry in params})
+    if queued:
+        _notify_webhook_listeners()
+    return ids
+
 @retry_on_locked()
 def delete_integration(integration_id, customer_id):
     """Verwijder integratie"""
@@ -990,6 +2213,8 @@ def delete_integration(integration_id, customer_id):
         cursor.execute('''
             DELETE FROM integrations WHERE id = ? AND customer_id = ?
         ''', (integration_id, customer_id))
+        if cursor.rowcount:
+            cursor.execute('DELETE FROM integration_seen_records WHERE integration_id = ?', (integration_id,))
 
 # ═══════════════════════════════════════════════════════
 # WEBHOOK FUNCTIES
@@ -1031,16 +2256,330 @@ def update_webhook_trigger(webhook_id, status_code):
 
 @retry_on_locked()
 def delete_webhook(webhook_id, customer_id):
-    """Verwijder webhook"""
+    """Verwijder webhook (openstaande outbox deliveries vervallen mee)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             DELETE FROM customer_webhooks WHERE id = ? AND customer_id = ?
         ''', (webhook_id, customer_id))
+        if cursor.rowcount:
+            cursor.execute('''
+                DELETE FROM webhook_outbox WHERE webhook_id = ? AND status IN ('pending', 'sending')
+            ''', (webhook_id,))
+
+# ═══════════════════════════════════════════════════════
+# WEBHOOK OUTBOX
+# ═══════════════════════════════════════════════════════
+
+# Outbox rijen aanmaken bij nieuwe logs / tier changes / integratie syncs (false = uit)
+WEBHOOKS_ENABLED = os.environ.get('ENABLE_WEBHOOKS', 'true').lower() == 'true'
+# Max items per outbox rij en per afgeleverde POST (coalescing)
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', '100'))
+
+WEBHOOK_EVENT_LOG_CREATED = 'log.created'
+WEBHOOK_EVENT_INTEGRATION_SYNCED = 'integration.synced'
+WEBHOOK_EVENT_TIER_CHANGED = 'customer.tier_changed'
+WEBHOOK_EVENTS = (WEBHOOK_EVENT_LOG_CREATED, WEBHOOK_EVENT_INTEGRATION_SYNCED, WEBHOOK_EVENT_TIER_CHANGED)
+
+# Oudere event namen uit het webhook formulier
+_WEBHOOK_EVENT_ALIASES = {'new_log': WEBHOOK_EVENT_LOG_CREATED}
+
+_webhook_listeners = []
+
+
+def webhook_subscribes(events, event):
+    """events kolom ('all' of komma-gescheiden namen) bevat event?"""
+    names = {_WEBHOOK_EVENT_ALIASES.get(name.strip(), name.strip())
+             for name in (events or 'all').split(',')}
+    return 'all' in names or event in names
+
+
+def add_webhook_listener(callback):
+    """callback() wordt aangeroepen na commit van nieuwe outbox rijen (wekt de dispatcher)"""
+    if callback not in _webhook_listeners:
+        _webhook_listeners.append(callback)
+
+
+def _notify_webhook_listeners():
+    for callback in list(_webhook_listeners):
+        try:
+            callback()
+        except Exception:
+            pass  # Dispatcher pakt de rijen bij de volgende poll alsnog op
+
+
+def _enqueue_webhook_events(cursor, event, items_by_customer):
+    """
+    Schrijf outbox rijen voor alle actieve webhooks die op event geabonneerd zijn,
+    binnen de transactie van de caller. items_by_customer: {customer_id: [item, ...]}.
+    Items worden per WEBHOOK_BATCH_SIZE in één rij gebundeld. Geeft aantal rijen terug.
+    """
+    if not WEBHOOKS_ENABLED or not items_by_customer:
+        return 0
+
+    customer_ids = list(items_by_customer)
+    placeholders = ','.join('?' * len(customer_ids))
+    cursor.execute(f'''
+        SELECT id, customer_id, events FROM customer_webhooks
+        WHERE customer_id IN ({placeholders}) AND is_active = 1
+    ''', customer_ids)
+    webhooks = [row for row in cursor.fetchall() if webhook_subscribes(row['events'], event)]
+    if not webhooks:
+        return 0
+
+    now = time.time()
+    rows = []
+    for webhook in webhooks:
+        items = items_by_customer[webhook['customer_id']]
+        for start in range(0, len(items), WEBHOOK_BATCH_SIZE):
+            chunk = items[start:start + WEBHOOK_BATCH_SIZE]
+            rows.append((webhook['id'], webhook['customer_id'], event,
+                         json.dumps(chunk, default=str), len(chunk), now))
+    cursor.executemany('''
+        INSERT INTO webhook_outbox (webhook_id, customer_id, event, payload, item_count, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return len(rows)
+
+
+def _enqueue_log_events(cursor, logs):
+    """log.created events voor (log_id, customer_id, ip_address, data, metadata) tuples"""
+    if not WEBHOOKS_ENABLED:
+        return 0
+    items_by_customer = {}
+    for log_id, customer_id, ip_address, data, metadata in logs:
+        items_by_customer.setdefault(customer_id, []).append({
+            'id': log_id, 'ip_address': ip_address, 'data': data, 'metadata': metadata,
+        })
+    return _enqueue_webhook_events(cursor, WEBHOOK_EVENT_LOG_CREATED, items_by_customer)
+
+
+@retry_on_locked()
+def enqueue_webhook_event(customer_id, event, data):
+    """Leg één event vast voor de webhooks van klant (achtergrond werk, tier changes)"""
+    with get_db() as conn:
+        queued = _enqueue_webhook_events(conn.cursor(), event, {customer_id: [data]})
+    if queued:
+        _notify_webhook_listeners()
+    return queued
+
+
+@retry_on_locked()
+def claim_webhook_deliveries(limit, lease_seconds):
+    """
+    Claim openstaande outbox rijen die aan de beurt zijn (of waarvan de lease van
+    een gecrashte worker verlopen is). Eén UPDATE ... RETURNING, dus veilig met
+    meerdere gunicorn workers op dezelfde database.
+    """
+    now = time.time()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE webhook_outbox
+            SET status = 'sending', locked_until = ?
+            WHERE id IN (
+                SELECT id FROM webhook_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                UNION ALL
+                SELECT id FROM webhook_outbox
+                WHERE status = 'sending' AND locked_until <= ?
+                LIMIT ?
+            )
+            RETURNING id, webhook_id, customer_id, event, payload, item_count, attempts
+        ''', (now + lease_seconds, now, now, limit))
+        claimed = [dict(row) for row in cursor.fetchall()]
+        if not claimed:
+            return []
+
+        webhook_ids = sorted({row['webhook_id'] for row in claimed})
+        placeholders = ','.join('?' * len(webhook_ids))
+        cursor.execute(f'''
+            SELECT id, url, secret, is_active FROM customer_webhooks WHERE id IN ({placeholders})
+        ''', webhook_ids)
+        webhooks = {row['id']: dict(row) for row in cursor.fetchall()}
+
+    for row in claimed:
+        row['webhook'] = webhooks.get(row['webhook_id'])
+    return sorted(claimed, key=lambda row: row['id'])
+
+
+@retry_on_locked()
+def complete_webhook_deliveries(outbox_ids, status='delivered', status_code=None, error=None):
+    """Markeer rijen als delivered of (definitief) failed"""
+    if not outbox_ids:
+        return
+    with get_db() as conn:
+        conn.executemany('''
+            UPDATE webhook_outbox
+            SET status = ?, attempts = attempts + 1, last_status_code = ?, last_error = ?,
+                locked_until = NULL, completed_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(status, status_code, error, outbox_id) for outbox_id in outbox_ids])
+
+
+@retry_on_locked()
+def retry_webhook_deliveries(outbox_ids, next_attempt_at, status_code=None, error=None):
+    """Zet rijen terug op pending voor een volgende poging"""
+    if not outbox_ids:
+        return
+    with get_db() as conn:
+        conn.executemany('''
+            UPDATE webhook_outbox
+            SET status = 'pending', attempts = attempts + 1, next_attempt_at = ?,
+                last_status_code = ?, last_error = ?, locked_until = NULL
+            WHERE id = ?
+        ''', [(next_attempt_at, status_code, error, outbox_id) for outbox_id in outbox_ids])
+
+
+@retry_on_locked()
+def release_webhook_deliveries(outbox_ids):
+    """Geef geclaimde maar niet verstuurde rijen terug (dispatcher stopt), zonder poging te tellen"""
+    if not outbox_ids:
+        return
+    with get_db() as conn:
+        conn.executemany('''
+            UPDATE webhook_outbox SET status = 'pending', locked_until = NULL WHERE id = ?
+        ''', [(outbox_id,) for outbox_id in outbox_ids])
+
+
+@retry_on_locked()
+def prune_webhook_outbox(retention_days=7):
+    """Verwijder afgeronde outbox rijen ouder dan retention_days"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM webhook_outbox
+            WHERE status IN ('delivered', 'failed') AND completed_at < datetime('now', ?)
+        ''', (f'-{int(retention_days)} days',))
+        return cursor.rowcount
+
+
+def get_webhook_outbox_stats():
+    """Aantal outbox rijen per status en leeftijd van de oudste openstaande rij"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) AS n FROM webhook_outbox GROUP BY status')
+        stats = {status: 0 for status in ('pending', 'sending', 'delivered', 'failed')}
+        stats.update({row['status']: row['n'] for row in cursor.fetchall()})
+        cursor.execute('''
+            SELECT MIN(next_attempt_at) FROM webhook_outbox WHERE status IN ('pending', 'sending')
+        ''')
+        oldest = cursor.fetchone()[0]
+    stats['oldest_due_age_seconds'] = round(max(0.0, time.time() - oldest), 1) if oldest else 0.0
+    return stats
+
+# ═══════════════════════════════════════════════════════
+# DASHBOARD SNAPSHOTS
+# ═══════════════════════════════════════════════════════
+
+def _mark_dashboard_snapshots_stale(cursor):
+    """Markeer de laatste snapshot per dashboard als verouderd (binnen de lopende transactie)"""
+    cursor.execute('''
+        UPDATE dashboard_snapshots SET stale_since = ?
+        WHERE stale_since IS NULL AND id IN (SELECT MAX(id) FROM dashboard_snapshots GROUP BY name)
+    ''', (time.time(),))
+
+
+@retry_on_locked()
+def mark_dashboard_snapshots_stale():
+    """Voor data wijzigingen buiten de database functies om (bv. payment webhooks)"""
+    with get_db() as conn:
+        _mark_dashboard_snapshots_stale(conn.cursor())
+
+
+@retry_on_locked()
+def save_dashboard_snapshot(name, payload, duration_ms=None, keep=10):
+    """Sla payload (JSON string) op als nieuwe versie; bewaart de laatste keep versies. Geeft versie terug"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO dashboard_snapshots (name, version, payload, computed_at, duration_ms)
+            SELECT ?, COALESCE(MAX(version), 0) + 1, ?, ?, ?
+            FROM dashboard_snapshots WHERE name = ?
+            RETURNING version
+        ''', (name, payload, time.time(), duration_ms, name))
+        version = cursor.fetchone()[0]
+        cursor.execute('DELETE FROM dashboard_snapshots WHERE name = ? AND version <= ?',
+                       (name, version - keep))
+    return version
+
+
+def get_dashboard_snapshot(name, version=None):
+    """Laatste (of specifieke) versie als dict met payload als JSON string, of None"""
+    with get_db() as conn:
+        if version is None:
+            row = conn.execute('''
+                SELECT * FROM dashboard_snapshots WHERE name = ? ORDER BY version DESC LIMIT 1
+            ''', (name,)).fetchone()
+        else:
+            row = conn.execute('SELECT * FROM dashboard_snapshots WHERE name = ? AND version = ?',
+                               (name, version)).fetchone()
+    return dict(row) if row else None
+
+
+def get_dashboard_snapshot_versions(name):
+    """Beschikbare versies (zonder payload), nieuwste eerst"""
+    with get_db() as conn:
+        return [dict(row) for row in conn.execute('''
+            SELECT version, computed_at, duration_ms, stale_since
+            FROM dashboard_snapshots WHERE name = ? ORDER BY version DESC
+        ''', (name,)).fetchall()]
+
+# ═══════════════════════════════════════════════════════
+# SCHEDULER LEADER LEASE
+# ═══════════════════════════════════════════════════════
+
+@retry_on_locked()
+def acquire_lease(name, holder, ttl_seconds):
+    """
+    Neem of verleng lease name voor holder. Lukt alleen als de lease vrij, verlopen
+    of al van holder is; geeft True als holder nu de lease heeft.
+    """
+    now = time.time()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                acquired_at = CASE WHEN holder = excluded.holder THEN acquired_at ELSE CURRENT_TIMESTAMP END,
+                holder = excluded.holder,
+                expires_at = excluded.expires_at
+            WHERE holder = excluded.holder OR expires_at < ?
+        ''', (name, holder, now + ttl_seconds, now))
+        return cursor.rowcount == 1
+
+
+@retry_on_locked()
+def release_lease(name, holder):
+    """Geef lease vrij (alleen als holder hem nog heeft)"""
+    with get_db() as conn:
+        conn.execute('DELETE FROM scheduler_leases WHERE name = ? AND holder = ?', (name, holder))
+
+
+def get_lease(name):
+    """Huidige lease als dict (holder, expires_at, acquired_at) of None"""
+    with get_db() as conn:
+        row = conn.execute('SELECT * FROM scheduler_leases WHERE name = ?', (name,)).fetchone()
+    return dict(row) if row else None
 
 
 if __name__ == '__main__':
+    import sys
+
     # Test database setup
     print("Initialiseer database...")
     init_db()
     print("Database geïnitialiseerd!")
+
+    if len(sys.argv) > 1:
+        command = sys.argv[1]
+        if command == 'rebuild-search':
+            print("Herbouw full-text search index...")
+            rebuild_log_search_index()
+            print("✓ Search index bijgewerkt")
+        elif command == 'rebuild-rollups':
+            print("Herbouw log rollups...")
+            rebuild_log_rollups()
+            print("✓ Rollups bijgewerkt")
+        else:
+            print(f"Onbekend commando: {command} (rebuild-search, rebuild-rollups)")
@@ -0,0 +1,131 @@
+"""
+MVAI Connexx - Streaming Export Module
+Generator-based CSV / NDJSON / JSON exports met optionele gzip
+"""
+import csv
+import io
+import json
+import unicodedata
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.http import dump_options_header
+
+# Aantal rows dat per yield naar de client gaat
+ROWS_PER_CHUNK = 500
+
+
+# ═══════════════════════════════════════════════════════
+# FORMAT GENERATORS
+# ═══════════════════════════════════════════════════════
+
+def csv_stream(header: List[str], rows: Iterable[Dict], row_fn: Callable[[Dict], list]) -> Iterator[bytes]:
+    """CSV in chunks; alleen de huidige chunk staat in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row_fn(row))
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_stream(records: Iterable[Dict]) -> Iterator[bytes]:
+    """Eén JSON object per regel (application/x-ndjson)"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, default=str))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def json_document_stream(header: Dict, key: str, records: Iterable[Dict],
+                         count_key: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Eén JSON document {**header, key: [...], count_key: n} zonder de lijst op te bouwen.
+    count_key komt als laatste veld, pas bekend na de laatste record.
+    """
+    opening = json.dumps(header, default=str)[:-1]
+    yield f'{opening}{", " if header else ""}"{key}": ['.encode('utf-8')
+
+    count = 0
+    parts = []
+    for record in records:
+        parts.append(('' if count == 0 else ', ') + json.dumps(record, default=str))
+        count += 1
+        if len(parts) >= ROWS_PER_CHUNK:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+    if parts:
+        yield ''.join(parts).encode('utf-8')
+
+    tail = f', "{count_key}": {count}' if count_key else ''
+    yield f']{tail}}}'.encode('utf-8')
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprimeer een byte stream incrementeel (gzip container)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ═══════════════════════════════════════════════════════
+# FLASK RESPONSE
+# ═══════════════════════════════════════════════════════
+
+def _content_disposition(filename: str) -> str:
+    """Attachment header zoals send_file hem bouwt (ASCII fallback + RFC 5987)"""
+    try:
+        filename.encode('ascii')
+        names = {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return dump_options_header('attachment', names)
+
+
+def _gzip_requested(request) -> bool:
+    return request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+
+def streaming_response(chunks: Iterable[bytes], request, mimetype: str,
+                       filename: Optional[str] = None, status: int = 200) -> Response:
+    """
+    Streaming Flask response.
+    Met ?gzip=1: Content-Encoding gzip als de client dat accepteert,
+    anders een .gz download (bijv. curl zonder --compressed).
+    """
+    headers = {'X-Accel-Buffering': 'no'}  # nginx: niet bufferen, direct doorsturen
+
+    if _gzip_requested(request):
+        chunks = gzip_stream(chunks)
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+        else:
+            mimetype = 'application/gzip'
+            if filename:
+                filename = f'{filename}.gz'
+
+    if filename:
+        headers['Content-Disposition'] = _content_disposition(filename)
+
+    return Response(chunks, status=status, mimetype=mimetype, headers=headers)
@@ -3,8 +3,9 @@ import os
 
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 
-# BELANGRIJK: gebruik 1 worker zodat in-memory state consistent blijft.
-# Bij meerdere workers: zet RATELIMIT_STORAGE_URL=redis://... in .env
+# Rate limits en IP reputatie staan in SHARED_STATE_URL (zie shared_state.py).
+# Default memory:// is per worker: houd dan workers=1.
+# Bij meerdere workers: SHARED_STATE_URL=sqlite:///data/shared_state.db (één host) of redis://...
 workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
 threads = int(os.environ.get('GUNICORN_THREADS', '4'))
 worker_class = "sync"
@@ -20,3 +21,61 @@ loglevel = "info"
 graceful_timeout = 30
 max_requests = 1000
 max_requests_jitter = 50
+
+
+def post_worker_init(worker):
+    """Start webhook dispatcher en job scheduler na de fork"""
+    try:
+        import webhooks
+        webhooks.start()
+    except Exception:
+        pass
+    try:
+        import scheduler
+        scheduler.start()
+    except Exception:
+        pass
+
+
+def worker_exit(server, worker):
+    """Rond achtergrond werk af en sluit pools bij (max_requests) worker restart"""
+    try:
+        import scheduler
+        scheduler.shutdown()
+    except Exception:
+        pass
+    try:
+        import ingestion
+        ingestion.shutdown()
+    except Exception:
+        pass
+    try:
+        import integration_sync
+        integration_sync.shutdown()
+    except Exception:
+        pass
+    try:
+        import ai_providers
+        ai_providers.close_clients()
+    except Exception:
+        pass
+    try:
+        import webhooks
+        webhooks.shutdown()
+    except Exception:
+        pass
+    try:
+        import database
+        database.flush_api_key_usage()
+    except Exception:
+        pass
+    try:
+        import shared_state
+        shared_state.close_backends()
+    except Exception:
+        pass
+    try:
+        import database
+        database.close_pool()
+    except Exception:
+        pass
@@ -0,0 +1,45 @@
+"""
+MVAI Connexx - HTTP Sessions
+Eén requests.Session per thread voor achtergrond workers (webhooks, integratie sync),
+zodat keep-alive connecties per host hergebruikt worden
+"""
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ThreadLocalSessions:
+    """Geeft per thread een eigen Session; close() sluit ze allemaal bij shutdown"""
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, pool_connections=16, pool_maxsize=4):
+        self.headers = dict(headers or {})
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def get(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            # Geen retries in urllib3: de aanroeper bepaalt zelf backoff en pogingen
+            adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                  pool_maxsize=self.pool_maxsize, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        # Threads die blijven leven krijgen bij de volgende get() een nieuwe Session
+        self._local = threading.local()
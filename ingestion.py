@@ -0,0 +1,303 @@
+"""
+MVAI Connexx - Write-Behind Ingestion Module
+Begrensde in-process queue voor log writes met group commits door één writer thread
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+import database as db
+from config import Config
+
+ACK_DURABLE = 'durable'   # Wacht tot de log gecommit is en geef het log_id terug
+ACK_FAST = 'fast'         # Return direct na enqueue, commit volgt asynchroon
+
+
+class IngestionQueueFull(Exception):
+    """Queue zit vol - caller moet backpressure teruggeven (HTTP 503)"""
+
+
+# ═══════════════════════════════════════════════════════
+# PENDING LOG HANDLE
+# ═══════════════════════════════════════════════════════
+
+class PendingLog:
+    """Log entry in de queue; wordt afgerond door de writer thread"""
+    __slots__ = ('entry', 'log_id', 'error', '_done')
+
+    def __init__(self, customer_id, ip_address, data, metadata=None):
+        self.entry = (customer_id, ip_address, data, metadata)
+        self.log_id = None
+        self.error = None
+        self._done = threading.Event()
+
+    def _complete(self, log_id=None, error=None):
+        self.log_id = log_id
+        self.error = error
+        self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wacht op commit. Geeft log_id terug, of None als de timeout verstrijkt."""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.log_id
+
+
+# ═══════════════════════════════════════════════════════
+# INGESTION QUEUE
+# ═══════════════════════════════════════════════════════
+
+class LogIngestionQueue:
+    """
+    Bounded queue + dedicated writer thread.
+    Flusht als batch_size entries klaarstaan of flush_interval verstreken is,
+    zodat bursts in één transactie (één WAL fsync) terechtkomen.
+    """
+
+    def __init__(self, max_size=None, batch_size=None, flush_interval_ms=None):
+        self.max_size = max_size or Config.INGESTION_QUEUE_SIZE
+        self.batch_size = batch_size or Config.INGESTION_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms if flush_interval_ms is not None
+                               else Config.INGESTION_FLUSH_INTERVAL_MS) / 1000.0
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'failed': 0,
+            'rejected': 0,
+            'flushes': 0,
+            'flush_time_ms_total': 0.0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'last_batch_size': 0,
+        }
+
+    # ── lifecycle ────────────────────────────────────────
+    def start(self):
+        """Start writer thread (lazy, zodat het na een gunicorn fork gebeurt)"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='mvai-log-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop writer thread nadat alle openstaande entries geflusht zijn"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        # Alles wat na het stoppen nog binnenkwam synchroon wegschrijven
+        remaining = self._drain_nowait(self.max_size)
+        if remaining:
+            self._flush(remaining)
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    # ── producers ────────────────────────────────────────
+    def submit(self, customer_id, ip_address, data, metadata=None, block_timeout=None):
+        """
+        Zet log entry in de queue.
+        block_timeout=None faalt direct bij een volle queue (request threads),
+        anders wordt maximaal block_timeout seconden gewacht (achtergrond jobs).
+        """
+        if not self.running:
+            self.start()
+
+        pending = PendingLog(customer_id, ip_address, data, metadata)
+        try:
+            if block_timeout is None:
+                self._queue.put_nowait(pending)
+            else:
+                self._queue.put(pending, timeout=block_timeout)
+        except queue.Full:
+            self._incr('rejected')
+            raise IngestionQueueFull(f'Ingestion queue vol ({self.max_size} entries)')
+
+        self._incr('enqueued')
+        return pending
+
+    # ── writer thread ────────────────────────────────────
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _drain_nowait(self, limit):
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _flush(self, batch: List[PendingLog]):
+        """Group commit; bij een fout per entry opnieuw zodat één slechte entry de rest niet raakt"""
+        start = time.monotonic()
+        written = failed = 0
+        try:
+            ids = db.create_logs_many([p.entry for p in batch])
+            for pending, log_id in zip(batch, ids):
+                pending._complete(log_id=log_id)
+            written = len(batch)
+        except Exception:
+            for pending in batch:
+                try:
+                    log_id = db.create_log(*pending.entry)
+                    pending._complete(log_id=log_id)
+                    written += 1
+                except Exception as e:
+                    pending._complete(error=e)
+                    failed += 1
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self._stats_lock:
+            self._stats['written'] += written
+            self._stats['failed'] += failed
+            self._stats['flushes'] += 1
+            self._stats['flush_time_ms_total'] += elapsed_ms
+            self._stats['last_flush_ms'] = elapsed_ms
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
+            self._stats['last_batch_size'] = len(batch)
+
+    # ── monitoring ───────────────────────────────────────
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self) -> Dict:
+        """Queue depth, flush latency en backpressure counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('flush_time_ms_total')
+        stats['avg_flush_ms'] = round(flushes / stats['flushes'], 3) if stats['flushes'] else 0.0
+        stats['last_flush_ms'] = round(stats['last_flush_ms'], 3)
+        stats['max_flush_ms'] = round(stats['max_flush_ms'], 3)
+        stats['depth'] = self._queue.qsize()
+        stats['max_size'] = self.max_size
+        stats['utilization_pct'] = round(stats['depth'] / self.max_size * 100, 1) if self.max_size else 0.0
+        stats['writer_alive'] = self.running
+        return stats
+
+
+# ═══════════════════════════════════════════════════════
+# MODULE-LEVEL API
+# ═══════════════════════════════════════════════════════
+
+_ingestion_queue: Optional[LogIngestionQueue] = None
+_queue_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return Config.ENABLE_INGESTION_QUEUE
+
+
+def get_ingestion_queue() -> Optional[LogIngestionQueue]:
+    """Queue voor dit proces (None als ingestie mode uit staat)"""
+    global _ingestion_queue
+    if not is_enabled():
+        return None
+    if _ingestion_queue is None or _ingestion_queue.pid != os.getpid():
+        with _queue_lock:
+            if _ingestion_queue is None or _ingestion_queue.pid != os.getpid():
+                _ingestion_queue = LogIngestionQueue()
+    return _ingestion_queue
+
+
+def resolve_ack(requested: Optional[str]) -> str:
+    """Normaliseer gevraagde ack mode (header/query) naar durable of fast"""
+    value = (requested or Config.INGESTION_DEFAULT_ACK or ACK_DURABLE).strip().lower()
+    return ACK_FAST if value == ACK_FAST else ACK_DURABLE
+
+
+def ingest_log(customer_id, ip_address, data, metadata=None, ack=None) -> Optional[int]:
+    """
+    Schrijf één log entry.
+    Zonder ingestie mode: synchroon via db.create_log.
+    Met ingestie mode: durable ack wacht op de group commit en geeft het log_id terug,
+    fast ack geeft None terug zodra de entry in de queue staat.
+    Raises IngestionQueueFull als de queue vol zit.
+    """
+    q = get_ingestion_queue()
+    if q is None:
+        return db.create_log(customer_id, ip_address, data, metadata)
+
+    pending = q.submit(customer_id, ip_address, data, metadata)
+    if resolve_ack(ack) == ACK_FAST:
+        return None
+    # Bij een timeout blijft de entry in de queue staan; caller krijgt None (= geaccepteerd)
+    return pending.wait(Config.INGESTION_DURABLE_TIMEOUT)
+
+
+def ingest_logs(entries, block_timeout=30.0) -> int:
+    """
+    Schrijf meerdere (customer_id, ip_address, data, metadata) entries en wacht op commit.
+    Bedoeld voor achtergrond werk dat mag wachten op ruimte in de queue.
+    Geeft het aantal geschreven entries terug.
+    """
+    entries = list(entries)
+    q = get_ingestion_queue()
+    if q is None:
+        return len(db.create_logs_many(entries))
+
+    handles = [q.submit(*entry, block_timeout=block_timeout) for entry in entries]
+    written = 0
+    for pending in handles:
+        try:
+            if pending.wait(block_timeout) is not None:
+                written += 1
+        except Exception:
+            pass
+    return written
+
+
+def get_ingestion_stats() -> Dict:
+    """Stats voor monitoring (enabled=False als ingestie mode uit staat)"""
+    q = get_ingestion_queue()
+    if q is None:
+        return {'enabled': False}
+    return {'enabled': True, **q.stats()}
+
+
+def shutdown():
+    """Flush openstaande entries (atexit / gunicorn worker_exit)"""
+    global _ingestion_queue
+    q = _ingestion_queue
+    if q is not None and q.pid == os.getpid():
+        q.stop()
+    _ingestion_queue = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,280 @@
+"""
+MVAI Connexx - Integratie Sync Engine
+Incrementele, gepagineerde sync van integraties op een begrensde worker pool,
+met rate limits per host en één transactie per pagina (records + cursor)
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import database as db
+from config import Config
+from http_sessions import ThreadLocalSessions
+
+# Statussen die een nieuwe poging waard zijn (Retry-After wordt gerespecteerd)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+FETCH_RETRIES = 3
+
+
+class SyncError(Exception):
+    """Bron gaf na retries nog steeds een fout"""
+
+
+# ═══════════════════════════════════════════════════════
+# RATE LIMIT PER HOST
+# ═══════════════════════════════════════════════════════
+
+class HostRateLimiter:
+    """
+    GCRA (token bucket) per host: gemiddeld rate requests/s met bursts tot burst.
+    acquire() reserveert een slot onder de lock en slaapt daarbuiten, zodat
+    threads voor andere hosts niet wachten.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.burst = max(1, int(burst))
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tat = {}  # theoretical arrival time per host
+
+    def acquire(self, host) -> float:
+        """Wacht tot host een request mag ontvangen; geeft de wachttijd terug"""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            tat = max(self._tat.get(host, now), now)
+            wait = max(0.0, tat - (self.burst - 1) * self.interval - now)
+            self._tat[host] = tat + self.interval
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+# ═══════════════════════════════════════════════════════
+# SYNC ENGINE
+# ═══════════════════════════════════════════════════════
+
+class SyncEngine:
+    """
+    Draait syncs op een pool van max workers threads. Eén integratie loopt nooit
+    dubbel; elke worker thread houdt een eigen keep-alive sessie.
+    """
+
+    def __init__(self, workers=None, host_rate=None, host_burst=None, page_size=None,
+                 max_pages=None, timeout=None):
+        self.workers = workers or Config.INTEGRATION_SYNC_WORKERS
+        self.page_size = page_size or Config.INTEGRATION_SYNC_PAGE_SIZE
+        self.max_pages = max_pages if max_pages is not None else Config.INTEGRATION_SYNC_MAX_PAGES
+        self.timeout = timeout or Config.INTEGRATION_SYNC_TIMEOUT
+        self.retry_backoff = 0.5  # seconden, verdubbelt per retry (tenzij Retry-After)
+        self.limiter = HostRateLimiter(
+            host_rate if host_rate is not None else Config.INTEGRATION_SYNC_HOST_RPS,
+            host_burst or Config.INTEGRATION_SYNC_HOST_BURST,
+        )
+        self.pid = os.getpid()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._sessions = ThreadLocalSessions()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'syncs': 0,
+            'failed': 0,
+            'skipped_running': 0,
+            'pages': 0,
+            'records': 0,
+            'requests': 0,
+            'retries': 0,
+            'rate_limit_wait_s': 0.0,
+        }
+
+    # ── HTTP ─────────────────────────────────────────────
+    def fetch(self, url, params=None, headers=None, auth=None):
+        """GET met rate limit per host en retries; geeft (json body, response headers) terug"""
+        host = urlsplit(url).netloc
+        for attempt in range(FETCH_RETRIES + 1):
+            waited = self.limiter.acquire(host)
+            self._incr('requests')
+            self._incr('rate_limit_wait_s', waited)
+            try:
+                response = self._sessions.get().get(url, params=params, headers=headers, auth=auth,
+                                               timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == FETCH_RETRIES:
+                    raise SyncError(f'{host}: {e}') from e
+                self._backoff(attempt, None)
+                continue
+            if response.status_code in RETRYABLE_STATUS and attempt < FETCH_RETRIES:
+                self._backoff(attempt, response.headers.get('Retry-After'))
+                continue
+            if response.status_code >= 400:
+                raise SyncError(f'{host}: HTTP {response.status_code}')
+            return (response.json() if response.content else []), response.headers
+        raise SyncError(f'{host}: geen antwoord')
+
+    def _backoff(self, attempt, retry_after):
+        self._incr('retries')
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else self.retry_backoff * (2 ** attempt)
+        time.sleep(min(delay, 30.0))
+
+    # ── sync ─────────────────────────────────────────────
+    def sync(self, integration: Dict) -> int:
+        """
+        Sync één integratie (dict met id, integration_type, config, customer_id) op de
+        huidige thread. Hervat vanaf de opgeslagen cursor; geeft aantal nieuwe records terug.
+        """
+        from integrations import needs_record_dedup, pull_pages, record_hash
+
+        integration_id = integration['id']
+        with self._running_lock:
+            if integration_id in self._running:
+                self._incr('skipped_running')
+                return 0
+            self._running.add(integration_id)
+        try:
+            # Cursor altijd vers uit de database: de dict kan van vóór een vorige sync zijn
+            current = db.get_integration(integration_id)
+            stored = current['sync_cursor'] if current else None
+            cursor = json.loads(stored) if stored else {}
+            config = integration.get('config') or {}
+            if isinstance(config, str):
+                config = json.loads(config) if config else {}
+
+            integration_type = integration['integration_type']
+            customer_id = integration['customer_id']
+            metadata = json.dumps({'source': integration_type, 'integration_id': integration_id})
+            dedup = needs_record_dedup(integration_type, config)
+            total = 0
+            for records, page_cursor in pull_pages(integration_type, config, cursor, self.fetch,
+                                                   self.page_size, self.max_pages):
+                # Bewust niet via ingestion.ingest_logs: records, cursor en dedup hashes moeten in
+                # één transactie landen, anders levert een crash tussen queue en cursor dubbele logs op
+                ids = db.write_integration_page(integration_id, [
+                    (customer_id, 'integration-sync', json.dumps(record), metadata)
+                    for record in records
+                ], page_cursor, [record_hash(record) for record in records] if dedup else None)
+                total += len(ids)
+                self._incr('pages')
+
+            db.update_integration_sync(integration_id, status='active')
+            db.enqueue_webhook_event(customer_id, db.WEBHOOK_EVENT_INTEGRATION_SYNCED, {
+                'integration_id': integration_id,
+                'integration_type': integration_type,
+                'records': total,
+            })
+            self._incr('syncs')
+            self._incr('records', total)
+            return total
+        except Exception as e:
+            self._incr('failed')
+            db.update_integration_sync(integration_id, status='error', error=str(e)[:500])
+            raise
+        finally:
+            with self._running_lock:
+                self._running.discard(integration_id)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='mvai-sync')
+            return self._executor
+
+    def submit(self, integration: Dict):
+        """Sync op de achtergrond; geeft een Future terug"""
+        return self._pool().submit(self.sync, integration)
+
+    def sync_many(self, integrations: List[Dict]) -> Dict:
+        """Sync alle integraties parallel (max workers tegelijk) en wacht op het resultaat"""
+        unique = {integration['id']: integration for integration in integrations}
+        futures = {integration_id: self.submit(integration) for integration_id, integration in unique.items()}
+        results = {}
+        for integration_id, future in futures.items():
+            try:
+                results[integration_id] = {'success': True, 'records': future.result()}
+            except Exception as e:
+                results[integration_id] = {'success': False, 'error': str(e)}
+        return results
+
+    def shutdown(self, wait=True):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+        self._sessions.close()
+
+    # ── monitoring ───────────────────────────────────────
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['rate_limit_wait_s'] = round(stats['rate_limit_wait_s'], 3)
+        with self._running_lock:
+            stats['running'] = len(self._running)
+        stats['workers'] = self.workers
+        return stats
+
+
+# ═══════════════════════════════════════════════════════
+# MODULE-LEVEL API
+# ═══════════════════════════════════════════════════════
+
+_engine: Optional[SyncEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> SyncEngine:
+    """Sync engine voor dit proces"""
+    global _engine
+    if _engine is None or _engine.pid != os.getpid():
+        with _engine_lock:
+            if _engine is None or _engine.pid != os.getpid():
+                _engine = SyncEngine()
+    return _engine
+
+
+def submit_sync(integration: Dict):
+    """Start sync van één integratie op de achtergrond (request threads)"""
+    return get_engine().submit(integration)
+
+
+def sync_all() -> Dict:
+    """Sync alle sync-bare integraties (scheduler / CLI); oudste sync eerst"""
+    from integrations import SYNCABLE_TYPES
+    return get_engine().sync_many(db.get_syncable_integrations(SYNCABLE_TYPES))
+
+
+def get_sync_stats() -> Dict:
+    return get_engine().stats()
+
+
+def shutdown():
+    """Wacht op lopende syncs (atexit / gunicorn worker_exit)"""
+    global _engine
+    engine = _engine
+    if engine is not None and engine.pid == os.getpid():
+        engine.shutdown()
+    _engine = None
+
+
+atexit.register(shutdown)
+
+
+if __name__ == '__main__':
+    results = sync_all()
+    for integration_id, result in results.items():
+        print(f"Integratie {integration_id}: {result}")
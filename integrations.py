@@ -4,6 +4,7 @@ Ondersteunt: SAP, Exact Online, AFAS, Shopify, WooCommerce, Odoo,
              Microsoft Dynamics, Magento, Wix, en generieke REST/webhook koppelingen
 Zowel cloud als on-premise IP-gebaseerde verbindingen
 """
+import hashlib
 import json
 import os
 import secrets
@@ -304,82 +305,186 @@ def _test_printer(config):
 # ═══════════════════════════════════════════════════════
 # DATA SYNC (generiek)
 # ═══════════════════════════════════════════════════════
+#
+# Pullers zijn generators die (records, cursor) per pagina opleveren, oplopend op de
+# cursor waarde. integration_sync.py schrijft elke pagina in één transactie samen met
+# de cursor, zodat de volgende sync alleen de delta ophaalt. fetch(url, params=...,
+# headers=..., auth=...) komt van de sync engine (gedeelde sessie, rate limit, retries).
+
+SYNCABLE_TYPES = ('shopify', 'woocommerce', 'wms_generic', 'afas')
+
 
 def sync_integration(integration_id, integration_type, config_str, customer_id):
     """
-    Voer een datasync uit voor een integratie.
+    Voer een datasync uit voor een integratie (synchroon, op de huidige thread).
     Geeft het aantal gesynchroniseerde records terug.
     """
-    import database as _db
-    try:
-        config = json.loads(config_str) if config_str else {}
-        records = _pull_data(integration_type, config)
-        # Sla elk record op als log
-        for record in records:
-            _db.create_log(
-                customer_id=customer_id,
-                ip_address='integration-sync',
-                data=json.dumps(record),
-                metadata=json.dumps({'source': integration_type, 'integration_id': integration_id})
-            )
-        _db.update_integration_sync(integration_id, status='active')
-        return len(records)
-    except Exception as e:
-        _db.update_integration_sync(integration_id, status='error', error=str(e))
-        raise
+    import integration_sync
+    return integration_sync.get_engine().sync({
+        'id': integration_id,
+        'integration_type': integration_type,
+        'config': config_str,
+        'customer_id': customer_id,
+    })
 
 
-def _pull_data(integration_type, config):
-    """Haal data op uit externe integratie"""
-    if integration_type == 'shopify':
-        return _pull_shopify(config)
-    elif integration_type == 'woocommerce':
-        return _pull_woocommerce(config)
-    elif integration_type == 'wms_generic':
-        return _pull_generic_wms(config)
-    elif integration_type == 'afas':
-        return _pull_afas(config)
-    else:
-        return []
+class Watermark:
+    """
+    Hoogste cursor waarde tot nu toe plus de ids op precies die waarde. Bronnen met
+    een inclusief filter (>=) leveren de grens opnieuw; die records slaan we over.
+    """
 
+    def __init__(self, state, field, id_field='id'):
+        state = state or {}
+        self.field = field
+        self.id_field = id_field
+        self.value = state.get('value')
+        self.ids = set(state.get('ids', []))
 
-def _pull_shopify(config):
-    shop = config.get('shop_domain', '').rstrip('/')
-    key = config.get('api_key')
-    secret = config.get('api_secret')
-    r = requests.get(f"https://{shop}/admin/api/2024-01/orders.json?status=any&limit=50",
-                     auth=(key, secret), timeout=15)
-    r.raise_for_status()
-    return r.json().get('orders', [])
+    def filter(self, records):
+        """Laat records op de grens die al gesynchroniseerd zijn weg"""
+        return [r for r in records
+                if not (self.value is not None and r.get(self.field) == self.value
+                        and str(r.get(self.id_field)) in self.ids)]
 
+    def advance(self, records):
+        for record in records:
+            value = record.get(self.field)
+            if value is None:
+                continue
+            if self.value is None or value > self.value:
+                self.value, self.ids = value, set()
+            if value == self.value:
+                self.ids.add(str(record.get(self.id_field)))
 
-def _pull_woocommerce(config):
-    url = config.get('store_url', '').rstrip('/')
-    ck = config.get('consumer_key')
-    cs = config.get('consumer_secret')
-    r = requests.get(f"{url}/wp-json/wc/v3/orders?per_page=50",
-                     auth=(ck, cs), timeout=15)
-    r.raise_for_status()
-    return r.json()
+    def state(self):
+        return {'value': self.value, 'ids': sorted(self.ids)} if self.value is not None else None
 
 
-def _pull_generic_wms(config):
-    base = config.get('base_url', '').rstrip('/')
-    key = config.get('api_key', '')
+def needs_record_dedup(integration_type, config):
+    """
+    Bronnen zonder betrouwbare cursor (AFAS zonder cursor_field, generieke WMS records
+    zonder cursor_field) leveren bij elke sync opnieuw al bekende records: die worden
+    op inhoud (hash) ontdubbeld.
+    """
+    return integration_type == 'wms_generic' or (integration_type == 'afas' and not config.get('cursor_field'))
+
+
+def record_hash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def pull_pages(integration_type, config, cursor, fetch, page_size=100, max_pages=None):
+    """Pagina generator voor integration_type (leeg voor niet-sync types)"""
+    pullers = {
+        'shopify': _pull_shopify,
+        'woocommerce': _pull_woocommerce,
+        'wms_generic': _pull_generic_wms,
+        'afas': _pull_afas,
+    }
+    puller = pullers.get(integration_type)
+    if puller is None:
+        return
+    for page_number, page in enumerate(puller(config, cursor or {}, fetch, page_size)):
+        yield page
+        if max_pages and page_number + 1 >= max_pages:
+            return  # Rest volgt bij de volgende sync vanaf de opgeslagen cursor
+
+
+def _base_url(value):
+    """Shop domain of URL; zonder schema wordt https aangenomen"""
+    value = (value or '').rstrip('/')
+    return value if value.startswith(('http://', 'https://')) else f'https://{value}'
+
+
+def _pull_shopify(config, cursor, fetch, page_size):
+    # since_id levert orders oplopend op id: exacte, monotone cursor
+    shop = _base_url(config.get('shop_domain'))
+    auth = (config['api_key'], config.get('api_secret') or '') if config.get('api_key') else None
+    since_id = int(cursor.get('since_id', 0))
+    limit = min(page_size, 250)
+    while True:
+        body, _ = fetch(f"{shop}/admin/api/2024-01/orders.json",
+                        params={'status': 'any', 'limit': limit, 'since_id': since_id}, auth=auth)
+        orders = body.get('orders', [])
+        if not orders:
+            return
+        since_id = max(int(order['id']) for order in orders)
+        yield orders, {'since_id': since_id}
+        if len(orders) < limit:
+            return
+
+
+def _pull_woocommerce(config, cursor, fetch, page_size):
+    # modified_after is inclusief; oplopend op date_modified_gmt met watermark dedup
+    url = _base_url(config.get('store_url'))
+    auth = (config['consumer_key'], config.get('consumer_secret') or '') if config.get('consumer_key') else None
+    watermark = Watermark(cursor.get('modified'), 'date_modified_gmt')
+    params = {'per_page': min(page_size, 100), 'orderby': 'modified', 'order': 'asc'}
+    if watermark.value:
+        params['modified_after'] = watermark.value
+        params['dates_are_gmt'] = 'true'
+    page = 1
+    while True:
+        body, headers = fetch(f"{url}/wp-json/wc/v3/orders", params={**params, 'page': page}, auth=auth)
+        orders = watermark.filter(body)
+        watermark.advance(orders)
+        if orders or body:
+            yield orders, {'modified': watermark.state()}
+        total_pages = int(headers.get('X-WP-TotalPages') or page)
+        if not body or page >= total_pages:
+            return
+        page += 1
+
+
+def _pull_generic_wms(config, cursor, fetch, page_size):
+    # Generiek: ?<since_param>=<cursor>&page=N&per_page=M, oplopend op cursor_field
+    base = _base_url(config.get('base_url'))
     path = config.get('endpoint_path', '/api/stock')
-    headers = {'Authorization': f'Bearer {key}', 'Content-Type': 'application/json'}
-    r = requests.get(f"{base}{path}", headers=headers, timeout=15)
-    r.raise_for_status()
-    data = r.json()
-    return data if isinstance(data, list) else [data]
-
-
-def _pull_afas(config):
-    env_url = config.get('environment_url', '').rstrip('/')
-    token = config.get('api_token')
+    headers = {'Authorization': f"Bearer {config.get('api_key', '')}", 'Content-Type': 'application/json'}
+    field = config.get('cursor_field', 'updated_at')
+    watermark = Watermark(cursor.get('updated'), field, config.get('id_field', 'id'))
+    params = {'per_page': page_size}
+    if watermark.value is not None:
+        params[config.get('since_param', 'updated_since')] = watermark.value
+    page = 1
+    while True:
+        body, _ = fetch(f"{base}{path}", params={**params, 'page': page}, headers=headers)
+        records = body if isinstance(body, list) else [body]
+        fresh = watermark.filter(records)
+        watermark.advance(fresh)
+        yield fresh, {'updated': watermark.state()}
+        if not isinstance(body, list) or len(body) < page_size:
+            return
+        page += 1
+
+
+def _pull_afas(config, cursor, fetch, page_size):
+    # GetConnector met skip/take; met cursor_field een >= filter en oplopende sortering
+    env_url = _base_url(config.get('environment_url'))
     connector = config.get('connector_name', 'Profit_Article')
-    headers = {'Authorization': f'AfasToken {token}', 'Content-Type': 'application/json'}
-    r = requests.get(f"{env_url}/profitrestservices/connectors/{connector}",
-                     headers=headers, timeout=15)
-    r.raise_for_status()
-    return r.json().get('rows', [])
+    headers = {'Authorization': f"AfasToken {config.get('api_token')}", 'Content-Type': 'application/json'}
+    field = config.get('cursor_field')
+    watermark = Watermark(cursor.get('updated'), field, config.get('id_field', 'Id')) if field else None
+    params = {'take': page_size}
+    if watermark:
+        params['orderbyfieldids'] = field
+        if watermark.value is not None:
+            params.update({'filterfieldids': field, 'filtervalues': watermark.value, 'operatortypes': 2})
+    # Zonder cursor_field: volledige pull; skip wordt bewaard zodat een afgebroken
+    # (of door max_pages begrensde) ronde hervat, na een volledige ronde terug naar 0
+    skip = 0 if watermark else int(cursor.get('skip', 0))
+    while True:
+        body, _ = fetch(f"{env_url}/profitrestservices/connectors/{connector}",
+                        params={**params, 'skip': skip}, headers=headers)
+        rows = body.get('rows', [])
+        done = len(rows) < page_size
+        if watermark:
+            fresh = watermark.filter(rows)
+            watermark.advance(fresh)
+            yield fresh, {'updated': watermark.state()}
+        else:
+            yield rows, {'skip': 0 if done else skip + page_size}
+        if done:
+            return
+        skip += page_size
@@ -0,0 +1,151 @@
+"""
+MVAI Connexx - IP Matcher Module
+CIDR-aware longest-prefix-match voor IPv4/IPv6 security lists (binaire radix trie)
+"""
+import ipaddress
+import threading
+import time
+
+
+# ═══════════════════════════════════════════════════════
+# PREFIX TRIE
+# ═══════════════════════════════════════════════════════
+
+class PrefixTrie:
+    """
+    Binaire trie per adresfamilie. Een lookup loopt hooguit 32 (IPv4) of
+    128 (IPv6) bits af, onafhankelijk van het aantal entries.
+    Node layout: [child_0, child_1, value, has_value]
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self._root = [None, None, None, False]
+        self.size = 0
+
+    def insert(self, network, value=True):
+        """network: ipaddress.IPv4Network / IPv6Network van dezelfde familie"""
+        node = self._root
+        address = int(network.network_address)
+        for depth in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - depth)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None, False]
+            node = child
+        if not node[3]:
+            self.size += 1
+        node[2], node[3] = value, True
+
+    def longest_match(self, address, accept=None):
+        """
+        Waarde van de langste prefix die address bevat, of None.
+        accept: optioneel filter (bijv. verlopen entries overslaan); de langste
+        geaccepteerde match wint.
+        """
+        node = self._root
+        best = node[2] if node[3] and (accept is None or accept(node[2])) else None
+        shift = self.bits - 1
+        while shift >= 0:
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[3] and (accept is None or accept(node[2])):
+                best = node[2]
+            shift -= 1
+        return best
+
+
+def parse_network(value):
+    """'1.2.3.4', '10.0.0.0/8' of '2001:db8::/32' -> ip_network; None bij ongeldige input"""
+    try:
+        return ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def parse_address(ip):
+    """Client IP -> (familie bits, int) of None. IPv4-mapped IPv6 telt als IPv4."""
+    try:
+        address = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return (32 if address.version == 4 else 128), int(address)
+
+
+# ═══════════════════════════════════════════════════════
+# COMPILED MATCHER
+# ═══════════════════════════════════════════════════════
+
+class CompiledIPLists:
+    """
+    Onveranderlijke set van tries per lijst ('whitelist', 'blacklist', ...).
+    Wordt in z'n geheel opgebouwd en daarna atomisch ingewisseld.
+    """
+
+    def __init__(self, lists):
+        """lists: {naam: iterable van (cidr, value)}"""
+        self._tries = {}
+        self.invalid = []
+        for name, entries in lists.items():
+            tries = {32: PrefixTrie(32), 128: PrefixTrie(128)}
+            for cidr, value in entries:
+                network = parse_network(cidr)
+                if network is None:
+                    self.invalid.append((name, cidr))
+                    continue
+                tries[network.max_prefixlen].insert(network, value)
+            self._tries[name] = tries
+        self.built_at = time.time()
+
+    def lookup(self, name, ip, accept=None):
+        """Value van de langste match in lijst name, of None"""
+        tries = self._tries.get(name)
+        parsed = parse_address(ip)
+        if tries is None or parsed is None:
+            return None
+        bits, address = parsed
+        return tries[bits].longest_match(address, accept)
+
+    def sizes(self):
+        return {name: tries[32].size + tries[128].size for name, tries in self._tries.items()}
+
+
+class IPMatcher:
+    """
+    Houdt de actuele CompiledIPLists vast. reload() bouwt een nieuwe versie met
+    de loader en wisselt de referentie in één assignment; lopende lookups blijven
+    op de oude versie en zien nooit een half opgebouwde trie.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._reload_lock = threading.Lock()
+        self._compiled = CompiledIPLists({})
+        self.reloads = 0
+
+    @property
+    def compiled(self):
+        return self._compiled
+
+    def reload(self, lists=None):
+        """Bouw opnieuw op uit lists (of via de loader) en wissel atomisch"""
+        with self._reload_lock:  # Eén rebuild tegelijk; lookups blokkeren niet
+            compiled = CompiledIPLists(self._loader() if lists is None else lists)
+            self._compiled = compiled
+            self.reloads += 1
+        return compiled
+
+    def lookup(self, name, ip, accept=None):
+        return self._compiled.lookup(name, ip, accept)
+
+    def stats(self):
+        compiled = self._compiled
+        return {
+            'lists': compiled.sizes(),
+            'invalid_entries': len(compiled.invalid),
+            'built_at': compiled.built_at,
+            'reloads': self.reloads,
+        }
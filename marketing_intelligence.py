@@ -2,6 +2,8 @@
 MVAI Connexx - Marketing Intelligence & Growth Module
 Data-driven marketing strategieën voor revenue growth en customer acquisition
 """
+import json
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from enum import Enum
@@ -241,8 +243,128 @@ def _grade_channel_performance(conversion_rate: float, roi: float) -> str:
 # CUSTOMER SEGMENTATION
 # ═══════════════════════════════════════════════════════
 
+ENGAGEMENT_SEGMENTS = ('champions', 'at_risk', 'new_customers', 'loyal')
+SEGMENT_RUNS_KEPT = 100
+
+
+def _classify_engagement(age_days: int, log_count: int, last_activity: Optional[str],
+                         now: datetime) -> Optional[str]:
+    """Engagement segment volgens de regels hieronder (volgorde telt); None = geen segment"""
+    if age_days < 30:
+        return 'new_customers'   # < 30 days old
+    elif age_days > 180 and log_count > 100:
+        return 'loyal'           # > 180 days, consistent activity
+    elif log_count > 50:
+        return 'champions'       # High activity, recent
+    elif log_count < 10 or (last_activity and (now - datetime.fromisoformat(last_activity)).days > 30):
+        return 'at_risk'         # Low activity, not recent
+    return None
+
+
+def _next_review_at(created_at: datetime, last_activity: Optional[str], now: datetime) -> Optional[float]:
+    """
+    Eerste toekomstige grens waarop het segment zonder nieuwe logs kan wisselen:
+    leeftijd 30 of 181 dagen, of 31 dagen sinds de laatste activiteit (epoch, None = nooit)
+    """
+    boundaries = [created_at + timedelta(days=30), created_at + timedelta(days=181)]
+    if last_activity:
+        boundaries.append(datetime.fromisoformat(last_activity) + timedelta(days=31))
+    upcoming = [boundary for boundary in boundaries if boundary > now]
+    return min(upcoming).timestamp() if upcoming else None
+
+
+def _resegment(cursor, customer_ids: Optional[List[int]], now: datetime) -> int:
+    """Herbereken segmenten (alle actieve klanten of alleen customer_ids) in één grouped query op de rollups"""
+    query = '''
+        SELECT c.id, c.created_at,
+               COALESCE(SUM(r.log_count), 0) AS log_count,
+               MAX(r.last_ts) AS last_activity
+        FROM customers c
+        LEFT JOIN log_rollups_daily r ON r.customer_id = c.id
+        WHERE c.status = 'active'
+    '''
+    params = []
+    if customer_ids is not None:
+        query += ' AND c.id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(customer_ids))
+    cursor.execute(query + ' GROUP BY c.id', params)
+
+    rows = []
+    for row in cursor.fetchall():
+        created_at = datetime.fromisoformat(row['created_at'])
+        segment = _classify_engagement((now - created_at).days, row['log_count'], row['last_activity'], now)
+        rows.append((row['id'], segment, row['log_count'], row['last_activity'],
+                     _next_review_at(created_at, row['last_activity'], now)))
+    cursor.executemany('''
+        INSERT INTO customer_segments (customer_id, segment, log_count, last_activity, next_review_at, computed_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(customer_id) DO UPDATE SET
+            segment = excluded.segment,
+            log_count = excluded.log_count,
+            last_activity = excluded.last_activity,
+            next_review_at = excluded.next_review_at,
+            computed_at = excluded.computed_at
+    ''', rows)
+    return len(rows)
+
+
+@db.retry_on_locked()
+def refresh_customer_segments(full: bool = False, now: Optional[datetime] = None) -> Dict:
+    """
+    Werk customer_segments bij. Incrementeel (default) worden alleen klanten herbekeken
+    met nieuwe logs sinds de vorige run, klanten die een leeftijd/inactiviteit grens
+    passeerden en nieuwe of opnieuw geactiveerde klanten. Eerste run is altijd full.
+    """
+    started = time.perf_counter()
+    now = now or datetime.now()
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+
+        # Eerst schrijven: houdt de write lock zodat watermark en rollups consistent zijn
+        cursor.execute('''
+            DELETE FROM customer_segments
+            WHERE customer_id NOT IN (SELECT id FROM customers WHERE status = 'active')
+        ''')
+        removed = cursor.rowcount
+
+        cursor.execute('SELECT last_log_id FROM customer_segment_runs ORDER BY id DESC LIMIT 1')
+        last_run = cursor.fetchone()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM logs')
+        max_log_id = cursor.fetchone()[0]
+
+        if full or last_run is None:
+            mode = 'full'
+            revisited = _resegment(cursor, None, now)
+        else:
+            mode = 'incremental'
+            cursor.execute('''
+                SELECT DISTINCT customer_id FROM logs WHERE id > ? AND id <= ?
+                UNION
+                SELECT customer_id FROM customer_segments WHERE next_review_at <= ?
+                UNION
+                SELECT id FROM customers
+                WHERE status = 'active' AND id NOT IN (SELECT customer_id FROM customer_segments)
+            ''', (last_run['last_log_id'], max_log_id, now.timestamp()))
+            customer_ids = [row[0] for row in cursor.fetchall()]
+            revisited = _resegment(cursor, customer_ids, now) if customer_ids else 0
+            if not customer_ids and not removed and max_log_id == last_run['last_log_id']:
+                return {'mode': mode, 'revisited': 0, 'removed': 0, 'last_log_id': max_log_id}
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        cursor.execute('''
+            INSERT INTO customer_segment_runs (mode, last_log_id, revisited, removed, duration_ms)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (mode, max_log_id, revisited, removed, duration_ms))
+        cursor.execute('DELETE FROM customer_segment_runs WHERE id <= ?', (cursor.lastrowid - SEGMENT_RUNS_KEPT,))
+
+    return {'mode': mode, 'revisited': revisited, 'removed': removed, 'last_log_id': max_log_id,
+            'duration_ms': duration_ms}
+
+
 def get_customer_segments() -> Dict:
     """Segment customers for targeted marketing"""
+    refresh_customer_segments()
+
     with db.get_db() as conn:
         cursor = conn.cursor()
 
@@ -258,53 +380,28 @@ def get_customer_segments() -> Dict:
         ''')
         by_tier = [dict(row) for row in cursor.fetchall()]
 
-        # Segment by engagement (behavioral)
+        # Segment by engagement (behavioral): aantallen + eerste 10 namen per segment
         cursor.execute('''
-            SELECT
-                c.id,
-                c.name,
-                COUNT(l.id) as log_count,
-                MAX(l.timestamp) as last_activity
-            FROM customers c
-            LEFT JOIN logs l ON c.id = l.customer_id
-            WHERE c.status = 'active'
-            GROUP BY c.id, c.name
+            SELECT segment, name, total FROM (
+                SELECT s.segment, c.name, s.customer_id,
+                       COUNT(*) OVER (PARTITION BY s.segment) AS total,
+                       ROW_NUMBER() OVER (PARTITION BY s.segment ORDER BY s.customer_id) AS position
+                FROM customer_segments s
+                JOIN customers c ON c.id = s.customer_id
+                WHERE s.segment IS NOT NULL
+            )
+            WHERE position <= 10
+            ORDER BY segment, customer_id
         ''')
-
-        engagement_segments = {
-            'champions': [],      # High activity, recent
-            'at_risk': [],        # Low activity, not recent
-            'new_customers': [],  # < 30 days old
-            'loyal': []          # > 180 days, consistent activity
-        }
-
+        by_engagement = {segment: {'count': 0, 'customers': []} for segment in ENGAGEMENT_SEGMENTS}
         for row in cursor.fetchall():
-            customer_id = row['id']
-            log_count = row['log_count']
-            last_activity = row['last_activity']
-
-            # Get customer age
-            cursor.execute('SELECT created_at FROM customers WHERE id = ?', (customer_id,))
-            created_at = datetime.fromisoformat(cursor.fetchone()['created_at'])
-            age_days = (datetime.now() - created_at).days
-
-            # Classify
-            if age_days < 30:
-                engagement_segments['new_customers'].append(row['name'])
-            elif age_days > 180 and log_count > 100:
-                engagement_segments['loyal'].append(row['name'])
-            elif log_count > 50:
-                engagement_segments['champions'].append(row['name'])
-            elif log_count < 10 or (last_activity and (datetime.now() - datetime.fromisoformat(last_activity)).days > 30):
-                engagement_segments['at_risk'].append(row['name'])
+            by_engagement[row['segment']]['count'] = row['total']
+            by_engagement[row['segment']]['customers'].append(row['name'])
 
         return {
             'by_tier': by_tier,
-            'by_engagement': {
-                k: {'count': len(v), 'customers': v[:10]}  # Top 10 for display
-                for k, v in engagement_segments.items()
-            },
-            'total_segments': len(engagement_segments)
+            'by_engagement': by_engagement,
+            'total_segments': len(by_engagement)
         }
 
 # ═══════════════════════════════════════════════════════
@@ -161,6 +161,9 @@ class SystemHealthMonitor:
                 'status': 'healthy',
                 'response_time_ms': response_time * 1000,
                 'customer_count': count,
+                'pool': db.get_pool_stats(),
+                'api_key_cache': db.get_api_key_cache_stats(),
+                'stats_cache': db.get_stats_cache_stats(),
                 'timestamp': datetime.now().isoformat()
             }
         except Exception as e:
@@ -224,7 +227,8 @@ class SystemHealthMonitor:
                 ''')
                 errors_by_severity = {row['severity']: row['count'] for row in cursor.fetchall()}
 
-                total_errors = sum(errors_by_severity.values())
+                # Info rijen (o.a. geslaagde scheduler jobs) zijn geen errors
+                total_errors = sum(count for severity, count in errors_by_severity.items() if severity != 'info')
 
                 # Determine health status
                 critical_count = errors_by_severity.get('critical', 0)
@@ -253,14 +257,75 @@ class SystemHealthMonitor:
                 'error': str(e)
             }
 
+    def check_ingestion_queue(self) -> Dict:
+        """Check write-behind ingestion queue (depth, flush latency, writer thread)"""
+        try:
+            import ingestion
+            stats = ingestion.get_ingestion_stats()
+            if not stats['enabled']:
+                return {'status': 'healthy', **stats}
+
+            if stats['depth'] > 0 and not stats['writer_alive']:
+                status = 'critical'
+                error_logger.log_error(
+                    'ingestion_writer_down',
+                    f"Ingestion writer thread gestopt met {stats['depth']} entries in de queue",
+                    ErrorSeverity.CRITICAL,
+                    'ingestion'
+                )
+            elif stats['utilization_pct'] >= 80:
+                status = 'warning'
+            else:
+                status = 'healthy'
+
+            return {'status': status, **stats}
+        except Exception as e:
+            error_logger.log_exception(e, ErrorSeverity.HIGH, 'ingestion')
+            return {
+                'status': 'unknown',
+                'error': str(e)
+            }
+
+    def check_webhook_delivery(self) -> Dict:
+        """Check webhook outbox (achterstand, dispatcher) - falende klant endpoints zijn geen storing"""
+        try:
+            import webhooks
+            stats = webhooks.get_webhook_stats()
+            if not stats['enabled']:
+                return {'status': 'healthy', **stats}
+
+            outbox = stats['outbox']
+            if outbox['oldest_due_age_seconds'] > 300:
+                status = 'warning'
+                error_logger.log_error(
+                    'webhook_backlog',
+                    f"Webhook outbox loopt {outbox['oldest_due_age_seconds']}s achter "
+                    f"({outbox['pending']} pending)",
+                    ErrorSeverity.MEDIUM,
+                    'webhooks'
+                )
+            else:
+                status = 'healthy'
+
+            return {'status': status, **stats}
+        except Exception as e:
+            error_logger.log_exception(e, ErrorSeverity.MEDIUM, 'webhooks')
+            return {
+                'status': 'unknown',
+                'error': str(e)
+            }
+
     def get_overall_health(self) -> Dict:
         """Krijg overall systeem health status"""
         db_health = self.check_database_health()
         disk_health = self.check_disk_space()
         error_health = self.check_error_rates()
+        ingestion_health = self.check_ingestion_queue()
+        webhook_health = self.check_webhook_delivery()
 
         # Determine overall status
-        statuses = [db_health['status'], disk_health['status'], error_health['status']]
+        statuses = [db_health['status'], disk_health['status'], error_health['status'],
+                    ingestion_health['status'], webhook_health['status']]
 
         if 'critical' in statuses or 'unhealthy' in statuses:
             overall_status = 'critical'
@@ -286,7 +351,9 @@ class SystemHealthMonitor:
             'components': {
                 'database': db_health,
                 'disk': disk_health,
-                'errors': error_health
+                'errors': error_health,
+                'ingestion': ingestion_health,
+                'webhooks': webhook_health
             },
             'active_alerts': active_alerts,
             'uptime_percentage': self._calculate_uptime()
@@ -452,8 +519,8 @@ def get_error_analytics(days: int = 7) -> Dict:
 # HELPER FUNCTIONS
 # ═══════════════════════════════════════════════════════
 
-def get_recent_errors(limit: int = 50, severity: Optional[str] = None) -> List[Dict]:
-    """Haal recente errors op"""
+def get_recent_errors(limit: int = 50, severity: Optional[str] = None, include_info: bool = True) -> List[Dict]:
+    """Haal recente errors op (include_info=False laat o.a. geslaagde scheduler runs weg)"""
     with db.get_db() as conn:
         cursor = conn.cursor()
 
@@ -466,6 +533,8 @@ def get_recent_errors(limit: int = 50, severity: Optional[str] = None) -> List[D
         if severity:
             query += ' AND severity = ?'
             params.append(severity)
+        if not include_info:
+            query += " AND severity != 'info'"
 
         query += ' ORDER BY timestamp DESC LIMIT ?'
         params.append(limit)
@@ -0,0 +1,344 @@
+"""
+MVAI Connexx - Achtergrond Job Scheduler
+Onderhoudsjobs (cleanups, backups, rollups, dashboard snapshots, integratie sync) via APScheduler.
+Elke gunicorn worker draait een scheduler, maar alleen de houder van de
+leader lease voert jobs uit; valt die worker weg, dan neemt een andere het over.
+"""
+import atexit
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+import database as db
+from config import Config
+
+LEASE_NAME = 'maintenance'
+COMPONENT = 'scheduler'
+RUN_TYPE = 'scheduled_job'
+FAILED_TYPE = 'scheduled_job_failed'
+
+
+# ═══════════════════════════════════════════════════════
+# JOB SCHEDULER
+# ═══════════════════════════════════════════════════════
+
+class JobScheduler:
+    """
+    Cron/interval jobs met jitter. Een heartbeat verlengt de leader lease elke
+    lease_seconds / 3; jobs op een worker zonder lease worden overgeslagen.
+    """
+
+    def __init__(self, holder=None, lease_seconds=None, timezone=None):
+        self.holder = holder or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds or Config.SCHEDULER_LEASE_SECONDS
+        self.pid = os.getpid()
+        self.is_leader = False
+        self._jobs = {}  # name -> {'func', 'description'}
+        self._scheduler = BackgroundScheduler(
+            timezone=timezone or Config.SCHEDULER_TIMEZONE,
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300},
+        )
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'failed': 0, 'skipped_not_leader': 0}
+
+    # ── registratie ──────────────────────────────────────
+    def add_interval_job(self, name, func, seconds, jitter=0, description=''):
+        trigger = IntervalTrigger(seconds=seconds, jitter=jitter or None,
+                                  timezone=self._scheduler.timezone)
+        self._add(name, func, trigger, description)
+
+    def add_cron_job(self, name, func, crontab, jitter=0, description=''):
+        """crontab: 'minute hour day month day_of_week' (APScheduler velden, bv. 'sun')"""
+        minute, hour, day, month, day_of_week = crontab.split()
+        trigger = CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week,
+                              jitter=jitter or None, timezone=self._scheduler.timezone)
+        self._add(name, func, trigger, description)
+
+    def _add(self, name, func, trigger, description):
+        self._jobs[name] = {'func': func, 'description': description}
+        self._scheduler.add_job(self.run_job, trigger, args=[name], id=name, name=name,
+                                replace_existing=True)
+
+    # ── leader lease ─────────────────────────────────────
+    def heartbeat(self) -> bool:
+        """Neem of verleng de lease; geeft True als deze worker leader is"""
+        try:
+            self.is_leader = db.acquire_lease(LEASE_NAME, self.holder, self.lease_seconds)
+        except Exception:
+            # Database onbereikbaar: liever geen jobs dan dubbele jobs
+            self.is_leader = False
+        return self.is_leader
+
+    # ── uitvoeren ────────────────────────────────────────
+    def run_job(self, name) -> Optional[bool]:
+        """
+        Voer job name uit als deze worker leader is en leg duur en resultaat vast
+        in system_errors. Geeft None (geen leader), True (gelukt) of False (fout).
+        """
+        if not self.heartbeat():
+            self._incr('skipped_not_leader')
+            return None
+        func = self._jobs[name]['func']
+        start = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            self._incr('failed')
+            record_run(name, (time.perf_counter() - start) * 1000, self.holder, error=e)
+            return False
+        self._incr('runs')
+        record_run(name, (time.perf_counter() - start) * 1000, self.holder, result=result)
+        return True
+
+    # ── lifecycle ────────────────────────────────────────
+    def start(self):
+        if self._scheduler.running:
+            return
+        self.heartbeat()
+        self._scheduler.add_job(self.heartbeat, IntervalTrigger(seconds=max(1, self.lease_seconds / 3)),
+                                id='_heartbeat', replace_existing=True)
+        self._scheduler.start()
+
+    @property
+    def running(self) -> bool:
+        return self._scheduler.running
+
+    def shutdown(self, wait=False):
+        if self._scheduler.running:
+            self._scheduler.shutdown(wait=wait)
+        if self.is_leader:
+            try:
+                db.release_lease(LEASE_NAME, self.holder)
+            except Exception:
+                pass
+            self.is_leader = False
+
+    # ── monitoring ───────────────────────────────────────
+    def jobs(self) -> List[Dict]:
+        """Geregistreerde jobs met trigger en volgende run (alleen bekend als de scheduler draait)"""
+        result = []
+        for name, spec in self._jobs.items():
+            job = self._scheduler.get_job(name)
+            result.append({
+                'name': name,
+                'description': spec['description'],
+                'trigger': str(job.trigger) if job else None,
+                'next_run_time': getattr(job, 'next_run_time', None),
+            })
+        return result
+
+    def _incr(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'holder': self.holder, 'is_leader': self.is_leader,
+                      'running': self.running, 'jobs': len(self._jobs)})
+        return stats
+
+
+# ═══════════════════════════════════════════════════════
+# RUN HISTORIE (system_errors, component 'scheduler')
+# ═══════════════════════════════════════════════════════
+
+def record_run(name, duration_ms, holder=None, result=None, error=None):
+    """Leg één job run vast; fouten gaan via error_logger (alerts), successen als info rij"""
+    metadata = {
+        'job': name,
+        'duration_ms': round(duration_ms, 1),
+        'status': 'failed' if error is not None else 'success',
+        'holder': holder,
+    }
+    if error is not None:
+        from monitoring import error_logger, ErrorSeverity
+        error_logger.log_error(FAILED_TYPE, f'{name}: {error}'[:500], ErrorSeverity.HIGH, COMPONENT,
+                               stack_trace=''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+                               metadata=metadata)
+        return
+
+    if isinstance(result, (int, float, str, dict, list)):
+        metadata['result'] = result
+    # Niet via error_logger: die telt elke rij mee voor alert thresholds
+    with db.get_db() as conn:
+        conn.execute('''
+            INSERT INTO system_errors (error_type, message, severity, component, metadata)
+            VALUES (?, ?, 'info', ?, ?)
+        ''', (RUN_TYPE, f'{name} voltooid in {metadata["duration_ms"]:.0f} ms', COMPONENT,
+              json.dumps(metadata, default=str)))
+
+
+def get_job_history(limit: int = 100, job: Optional[str] = None) -> List[Dict]:
+    """Recente job runs, nieuwste eerst"""
+    query = '''
+        SELECT id, timestamp, severity, message,
+               json_extract(metadata, '$.job') AS job,
+               json_extract(metadata, '$.duration_ms') AS duration_ms,
+               json_extract(metadata, '$.status') AS status,
+               json_extract(metadata, '$.holder') AS holder
+        FROM system_errors
+        WHERE component = ? AND error_type IN (?, ?)
+    '''
+    params = [COMPONENT, RUN_TYPE, FAILED_TYPE]
+    if job:
+        query += " AND json_extract(metadata, '$.job') = ?"
+        params.append(job)
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    with db.get_db() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
+def get_job_latency(days: int = 7) -> Dict[str, Dict]:
+    """Per job: aantal runs, failures, p50/p95/max duur (ms) en laatste run over de laatste days dagen"""
+    with db.get_db() as conn:
+        rows = conn.execute('''
+            SELECT timestamp,
+                   json_extract(metadata, '$.job') AS job,
+                   json_extract(metadata, '$.duration_ms') AS duration_ms,
+                   json_extract(metadata, '$.status') AS status
+            FROM system_errors
+            WHERE component = ? AND error_type IN (?, ?) AND timestamp >= datetime('now', ?)
+            ORDER BY id
+        ''', (COMPONENT, RUN_TYPE, FAILED_TYPE, f'-{int(days)} days')).fetchall()
+
+    durations, latency = {}, {}
+    for row in rows:
+        durations.setdefault(row['job'], []).append(row['duration_ms'] or 0.0)
+        entry = latency.setdefault(row['job'], {'runs': 0, 'failures': 0})
+        entry['runs'] += 1
+        entry['failures'] += row['status'] == 'failed'
+        entry['last_run'] = row['timestamp']
+        entry['last_status'] = row['status']
+    for name, values in durations.items():
+        values.sort()
+        latency[name].update({
+            'p50_ms': round(statistics.median(values), 1),
+            'p95_ms': round(values[min(len(values) - 1, int(0.95 * len(values)))], 1),
+            'max_ms': round(values[-1], 1),
+        })
+    return latency
+
+
+# ═══════════════════════════════════════════════════════
+# ONDERHOUDSJOBS
+# ═══════════════════════════════════════════════════════
+
+def _cleanup_expired_blacklists():
+    from security import cleanup_expired_blacklists
+    return cleanup_expired_blacklists()
+
+
+def _cleanup_old_errors():
+    from monitoring import cleanup_old_errors
+    return cleanup_old_errors(Config.ERROR_RETENTION_DAYS)
+
+
+def _backup_database():
+    import backup
+    backup_file = backup.create_backup(db.DATABASE, Config.BACKUP_DIR)
+    if not backup_file:
+        raise RuntimeError('Backup mislukt (zie stdout)')
+    deleted = backup.cleanup_old_backups(Config.BACKUP_DIR, Config.BACKUP_RETENTION_DAYS)
+    return {'backup': os.path.basename(backup_file), 'deleted': deleted}
+
+
+def _rebuild_log_rollups():
+    db.rebuild_log_rollups()
+
+
+def _refresh_dashboard_snapshots():
+    import dashboard_snapshots
+    return dashboard_snapshots.refresh_all()
+
+
+def _sync_integrations():
+    import integration_sync
+    results = integration_sync.sync_all()
+    return {'integrations': len(results), 'failed': sum(1 for r in results.values() if not r['success'])}
+
+
+def register_default_jobs(job_scheduler: JobScheduler):
+    jitter = Config.SCHEDULER_JITTER_SECONDS
+    job_scheduler.add_interval_job('cleanup_expired_blacklists', _cleanup_expired_blacklists,
+                                   Config.BLACKLIST_CLEANUP_MINUTES * 60, jitter=min(jitter, 60),
+                                   description='Verlopen IP blacklist entries deactiveren')
+    job_scheduler.add_cron_job('cleanup_old_errors', _cleanup_old_errors, Config.ERROR_CLEANUP_CRON,
+                               jitter=jitter, description='System errors ouder dan retention opruimen')
+    job_scheduler.add_cron_job('database_backup', _backup_database, Config.BACKUP_CRON, jitter=jitter,
+                               description='SQLite online backup + oude backups opruimen')
+    job_scheduler.add_cron_job('rebuild_log_rollups', _rebuild_log_rollups, Config.ROLLUP_REBUILD_CRON,
+                               jitter=jitter, description='Log rollups herbouwen (catch-up)')
+    job_scheduler.add_interval_job('refresh_dashboard_snapshots', _refresh_dashboard_snapshots,
+                                   Config.DASHBOARD_SNAPSHOT_MINUTES * 60, jitter=min(jitter, 30),
+                                   description='Admin dashboard snapshots voorberekenen')
+    if Config.INTEGRATION_SYNC_INTERVAL_MINUTES > 0:
+        job_scheduler.add_interval_job('sync_integrations', _sync_integrations,
+                                       Config.INTEGRATION_SYNC_INTERVAL_MINUTES * 60, jitter=jitter,
+                                       description='Incrementele sync van alle integraties')
+
+
+# ═══════════════════════════════════════════════════════
+# MODULE-LEVEL API
+# ═══════════════════════════════════════════════════════
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    """Scheduler voor dit proces (met standaard jobs)"""
+    global _scheduler
+    if _scheduler is None or _scheduler.pid != os.getpid():
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler.pid != os.getpid():
+                job_scheduler = JobScheduler()
+                register_default_jobs(job_scheduler)
+                _scheduler = job_scheduler
+    return _scheduler
+
+
+def start():
+    """Start de scheduler in deze worker (gunicorn post_worker_init)"""
+    if Config.ENABLE_SCHEDULER:
+        get_scheduler().start()
+
+
+def get_scheduler_stats() -> Dict:
+    stats = get_scheduler().stats()
+    stats['lease'] = db.get_lease(LEASE_NAME)
+    return stats
+
+
+def shutdown():
+    """Stop scheduler en geef de lease vrij (atexit / gunicorn worker_exit)"""
+    global _scheduler
+    job_scheduler = _scheduler
+    if job_scheduler is not None and job_scheduler.pid == os.getpid():
+        job_scheduler.shutdown()
+    _scheduler = None
+
+
+atexit.register(shutdown)
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Eenmalig uitvoeren: python scheduler.py <job> (zonder lease)
+    job_scheduler = JobScheduler()
+    register_default_jobs(job_scheduler)
+    if len(sys.argv) < 2 or sys.argv[1] not in job_scheduler._jobs:
+        print(f"Usage: python scheduler.py <{'|'.join(job_scheduler._jobs)}>")
+        sys.exit(1)
+    print(job_scheduler._jobs[sys.argv[1]]['func']())
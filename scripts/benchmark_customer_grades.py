@@ -0,0 +1,71 @@
+"""
+MVAI Connexx - Benchmark get_customer_grades
+Vergelijkt het oude per-klant pad (calculate_customer_profitability per klant)
+met de batch berekening, op een tijdelijke database met N klanten, en
+controleert dat beide exact dezelfde uitkomst geven.
+
+Gebruik: python scripts/benchmark_customer_grades.py [aantal_klanten] [logs_per_klant]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import database as db  # noqa: E402
+from unit_economics import PricingConfig, UnitEconomicsCalculator  # noqa: E402
+
+
+def seed(customers, logs_per_customer):
+    rng = random.Random(42)
+    tiers = list(PricingConfig.PRICING_TIERS)
+    with db.get_db() as conn:
+        conn.executemany('''
+            INSERT INTO customers (name, access_code, pricing_tier, status, created_at)
+            VALUES (?, ?, ?, 'active', datetime('now', ?))
+        ''', [(f'Klant {i}', f'BENCH{i:06d}', rng.choice(tiers), f'-{rng.randint(0, 900)} days')
+              for i in range(customers)])
+        ids = [row[0] for row in conn.execute('SELECT id FROM customers')]
+        conn.executemany('''
+            INSERT INTO logs (customer_id, ip_address, data, timestamp)
+            VALUES (?, '10.0.0.1', 'bench', datetime('now', ?))
+        ''', ((customer_id, f'-{rng.randint(0, 120)} days')
+              for customer_id in ids for _ in range(rng.randint(0, 2 * logs_per_customer))))
+        conn.executemany('''
+            INSERT INTO api_keys (customer_id, key_value, name, usage_count) VALUES (?, ?, 'bench', ?)
+        ''', [(customer_id, f'mvai-bench-{customer_id}', rng.randint(0, 500000))
+              for customer_id in ids if rng.random() < 0.7])
+    return ids
+
+
+def main(customers=10000, logs_per_customer=20):
+    db.init_db()
+    start = time.perf_counter()
+    ids = seed(customers, logs_per_customer)
+    print(f'{customers} klanten, ~{customers * logs_per_customer} logs geseed in {time.perf_counter() - start:.1f}s\n')
+
+    calculator = UnitEconomicsCalculator()
+
+    start = time.perf_counter()
+    legacy = [calculator.calculate_customer_profitability(customer_id) for customer_id in ids]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = calculator.calculate_profitability_batch()
+    batch_s = time.perf_counter() - start
+
+    for expected, actual in zip(legacy, batch):
+        actual = {k: v for k, v in actual.items() if k != 'customer_name'}
+        assert actual == expected, (expected, actual)
+    assert len(legacy) == len(batch)
+
+    print(f'per klant  {legacy_s * 1000:>9.0f} ms')
+    print(f'batch      {batch_s * 1000:>9.0f} ms  ({legacy_s / batch_s:.0f}x sneller, uitkomst identiek)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -4,9 +4,11 @@ Advanced security met IP whitelisting, threat detection en intrusion prevention
 """
 import re
 import json
-from datetime import datetime, timedelta
-from collections import defaultdict
+import time
 import database as db
+import shared_state
+from config import Config
+from ip_matcher import IPMatcher
 from functools import wraps
 from flask import request, jsonify
 import hashlib
@@ -16,71 +18,167 @@ import hashlib
 # ═══════════════════════════════════════════════════════
 
 class IPSecurityManager:
-    """Beheer IP whitelists en blacklists"""
-
-    def __init__(self):
-        self.whitelist = set()
-        self.blacklist = set()
-        self.suspicious_ips = defaultdict(int)
-        self.failed_attempts = defaultdict(list)
+    """
+    Beheer IP whitelists en blacklists.
+    De database is de bron; exacte membership en gefaalde pogingen staan in de
+    shared_state backend zodat alle gunicorn workers dezelfde beslissing nemen.
+    CIDR ranges (lists, private networks, admin/trusted/internal IPs) worden in
+    een radix trie gecompileerd, zie ip_matcher.py.
+    """
+
+    WHITELIST = 'ip_whitelist'
+    BLACKLIST = 'ip_blacklist'
+    # Langste window waarin gefaalde pogingen meetellen (reputatie check)
+    FAILED_ATTEMPT_RETENTION = 30 * 60
+    # Versie teller in de backend; andere workers herladen hun trie als hij verandert
+    LISTS_VERSION_KEY = 'ip_lists:version'
+    LISTS_VERSION_TTL = 10 * 365 * 24 * 3600
+
+    def __init__(self, backend=None):
+        self.backend = backend or shared_state.get_backend()
+        self.matcher = IPMatcher(self._read_lists)
+        self._lists_version = None
+        self._lists_checked_at = 0.0
         self.load_lists()
 
-    def load_lists(self):
-        """Laad IP lists van database"""
+    @property
+    def whitelist(self):
+        return self.backend.set_members(self.WHITELIST)
+
+    @property
+    def blacklist(self):
+        return self.backend.set_members(self.BLACKLIST)
+
+    def _read_lists(self):
+        """Alle IP lists uit database en config als {lijst: [(cidr, value)]}"""
         with db.get_db() as conn:
             cursor = conn.cursor()
 
             # Whitelist
             cursor.execute('SELECT ip_address FROM ip_whitelist WHERE is_active = 1')
-            self.whitelist = {row['ip_address'] for row in cursor.fetchall()}
+            whitelist = [(row['ip_address'], True) for row in cursor.fetchall()]
 
-            # Blacklist
-            cursor.execute('SELECT ip_address FROM ip_blacklist WHERE is_active = 1')
-            self.blacklist = {row['ip_address'] for row in cursor.fetchall()}
+            # Blacklist (meerdere rijen per IP mogelijk; langste expiry wint, NULL = permanent)
+            cursor.execute('''
+                SELECT ip_address, CAST(strftime('%s', expires_at) AS REAL) AS expires_epoch
+                FROM ip_blacklist WHERE is_active = 1
+            ''')
+            expiries = {}
+            for row in cursor.fetchall():
+                ip, expires = row['ip_address'], row['expires_epoch']
+                expires = float('inf') if expires is None else expires
+                expiries[ip] = max(expires, expiries.get(ip, 0))
+
+            # Private networks per klant
+            cursor.execute('''
+                SELECT network_cidr, customer_id, description
+                FROM private_networks WHERE is_active = 1
+            ''')
+            private_networks = [
+                (row['network_cidr'], {'customer_id': row['customer_id'], 'description': row['description']})
+                for row in cursor.fetchall()
+            ]
+
+        return {
+            'whitelist': whitelist,
+            'blacklist': list(expiries.items()),
+            'private_networks': private_networks,
+            'internal': [(cidr, True) for cidr in Config.INTERNAL_IP_RANGE.split(',') if cidr.strip()],
+            'trusted': [(ip, True) for ip in Config.TRUSTED_IPS if ip.strip()],
+            'admin': [(ip, True) for ip in Config.ADMIN_IPS if ip.strip()],
+        }
+
+    def load_lists(self):
+        """Laad IP lists van database: exacte entries naar de backend, alles naar de trie"""
+        lists = self._read_lists()
+        self.backend.set_replace(self.WHITELIST, {ip: None for ip, _ in lists['whitelist']})
+        self.backend.set_replace(self.BLACKLIST, {
+            ip: None if expires == float('inf') else expires for ip, expires in lists['blacklist']
+        })
+        self.matcher.reload(lists)
+        self._lists_version = self.backend.get(self.LISTS_VERSION_KEY)
+        self._lists_checked_at = time.monotonic()
+
+    def _lists_changed(self):
+        """Na een wijziging in de lijst tabellen: lokaal herladen en andere workers seinen"""
+        self.backend.incr(self.LISTS_VERSION_KEY, self.LISTS_VERSION_TTL)
+        self.load_lists()
+
+    def _sync_lists(self):
+        """Herlaad de trie als een andere worker de lists heeft gewijzigd (max eens per interval)"""
+        if time.monotonic() - self._lists_checked_at < Config.IP_LISTS_SYNC_SECONDS:
+            return
+        self._lists_checked_at = time.monotonic()
+        if self.backend.get(self.LISTS_VERSION_KEY) != self._lists_version:
+            self.load_lists()
+
+    def _lookup(self, name, ip, accept=None):
+        self._sync_lists()
+        return self.matcher.lookup(name, ip, accept)
 
     def is_whitelisted(self, ip):
-        """Check of IP whitelisted is"""
-        return ip in self.whitelist
+        """Check of IP whitelisted is (exact of binnen een CIDR range)"""
+        return self.backend.set_contains(self.WHITELIST, ip) or self._lookup('whitelist', ip) is not None
 
     def is_blacklisted(self, ip):
-        """Check of IP blacklisted is"""
-        return ip in self.blacklist
+        """Check of IP blacklisted is (exact of binnen een niet verlopen CIDR range)"""
+        if self.backend.set_contains(self.BLACKLIST, ip):
+            return True
+        now = time.time()
+        return self._lookup('blacklist', ip, accept=lambda expires: expires > now) is not None
+
+    def is_trusted(self, ip):
+        """IP in TRUSTED_IPS (IPs of CIDR ranges)"""
+        return self._lookup('trusted', ip) is not None
+
+    def is_internal(self, ip):
+        """IP binnen INTERNAL_IP_RANGE"""
+        return self._lookup('internal', ip) is not None
+
+    def is_admin_ip(self, ip):
+        """IP in ADMIN_IPS; zonder ADMIN_IPS is elk IP toegestaan"""
+        return not Config.ADMIN_IPS or self._lookup('admin', ip) is not None
+
+    def get_private_network(self, ip):
+        """Meest specifieke private network entry voor IP ({customer_id, description}) of None"""
+        return self._lookup('private_networks', ip)
 
     def add_to_whitelist(self, ip, reason=None):
-        """Voeg IP toe aan whitelist"""
+        """Voeg IP of CIDR range toe aan whitelist"""
         with db.get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR IGNORE INTO ip_whitelist (ip_address, reason, added_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
             ''', (ip, reason))
-        self.whitelist.add(ip)
+        self._lists_changed()
 
     def add_to_blacklist(self, ip, reason=None, duration_hours=24):
-        """Voeg IP toe aan blacklist"""
+        """Voeg IP of CIDR range toe aan blacklist"""
         with db.get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR IGNORE INTO ip_blacklist (ip_address, reason, added_at, expires_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP, datetime('now', ?))
             ''', (ip, reason, f'+{duration_hours} hours'))
-        self.blacklist.add(ip)
+        self._lists_changed()
+
+    def _failed_attempts(self, ip, window):
+        return self.backend.count_events(f'failed:{ip}', window)
+
+    def get_failed_attempt_stats(self):
+        """Omvang en evictions van de gefaalde-poging tellers"""
+        return self.backend.event_stats()
 
     def record_failed_attempt(self, ip, reason):
         """Registreer gefaalde login poging"""
-        self.failed_attempts[ip].append({
-            'timestamp': datetime.now(),
-            'reason': reason
-        })
+        self.backend.record_event(f'failed:{ip}', self.FAILED_ATTEMPT_RETENTION)
 
         # Auto-blacklist na 5 pogingen in 10 minuten
-        recent_attempts = [
-            a for a in self.failed_attempts[ip]
-            if datetime.now() - a['timestamp'] < timedelta(minutes=10)
-        ]
+        recent_attempts = self._failed_attempts(ip, 10 * 60)
 
-        if len(recent_attempts) >= 5:
-            self.add_to_blacklist(ip, f'Auto-blocked: {len(recent_attempts)} failed attempts', duration_hours=24)
+        if recent_attempts >= 5:
+            self.add_to_blacklist(ip, f'Auto-blocked: {recent_attempts} failed attempts', duration_hours=24)
             return True
 
         return False
@@ -103,10 +201,7 @@ class IPSecurityManager:
             }
 
         # Check recent failed attempts
-        recent_failures = len([
-            a for a in self.failed_attempts.get(ip, [])
-            if datetime.now() - a['timestamp'] < timedelta(minutes=30)
-        ])
+        recent_failures = self._failed_attempts(ip, self.FAILED_ATTEMPT_RETENTION)
 
         if recent_failures > 2:
             return {
@@ -127,9 +222,58 @@ security_manager = IPSecurityManager()
 # AI-POWERED THREAT DETECTION
 # ═══════════════════════════════════════════════════════
 
+class ThreatScanner:
+    """
+    Literal-anchored scanner. Elk patroon heeft vaste strings (anchors) die in
+    iedere match voorkomen; die worden met str.find (C snelheid) gezocht, op de
+    tekst of op één casefold kopie ervan. Alleen bij een anchor hit draait de
+    voorgecompileerde regex. Schone requests kosten zo één casefold plus een
+    handvol substring scans, in plaats van een regex pass per patroon.
+    """
+
+    def __init__(self, rules):
+        """rules: lijst van (naam, regex of None, anchors of None, fold)"""
+        self._rules = [
+            (name, re.compile(regex) if isinstance(regex, str) else regex, anchors, fold)
+            for name, regex, anchors, fold in rules
+        ]
+
+    def scan(self, text, found, stop=None):
+        """
+        Voeg namen van matchende rules toe aan found.
+        stop(found) -> True breekt de scan af (early exit).
+        """
+        folded = None
+        for name, regex, anchors, fold in self._rules:
+            if name in found:
+                continue
+            if anchors:
+                if fold and folded is None:
+                    folded = text.casefold()
+                haystack = folded if fold else text
+                if not any(anchor in haystack for anchor in anchors):
+                    continue
+            if regex is None or regex.search(text):
+                found.add(name)
+                if stop is not None and stop(found):
+                    return True
+        return False
+
+
 class AIThreatDetector:
     """AI-based threat detection systeem"""
 
+    PATTERN_SCORE = 50
+    LARGE_PAYLOAD_SCORE = 20
+    MARKER_SCORE = 30
+    LARGE_PAYLOAD_CHARS = 10000
+    # Score waarboven risk_level 'high' is
+    HIGH_RISK_SCORE = 50
+    # Per veld niet verder scannen dan dit; grotere payloads zijn al als large_payload gemarkeerd
+    MAX_SCAN_CHARS = 256 * 1024
+    # Volgorde waarin request velden gescand worden (headers als laatste: groot en meestal schoon)
+    FIELD_ORDER = ('args', 'form', 'json', 'headers')
+
     def __init__(self):
         self.attack_patterns = [
             r'(?i)(union|select|insert|update|delete|drop|create|alter)\s+',  # SQL injection
@@ -138,47 +282,77 @@ class AIThreatDetector:
             r'(?i)(exec|eval|system|cmd)',  # Command injection
             r'(?i)(password|passwd|pwd).*[=:]',  # Password fishing
         ]
+        self.suspicious_chars = ['%00', '\x00', '<?php', '<%', '{$']
+        # Vaste strings die in elke match van het patroon zitten (fold = hoofdletterongevoelig)
+        self.pattern_anchors = {
+            self.attack_patterns[0]: (('union', 'select', 'insert', 'update', 'delete', 'drop', 'create', 'alter'), True),
+            self.attack_patterns[1]: (('<script',), False),
+            self.attack_patterns[2]: (('../', '..\\'), False),
+            self.attack_patterns[3]: (('exec', 'eval', 'system', 'cmd'), True),
+            self.attack_patterns[4]: (('passw', 'pwd'), True),
+        }
+        self.scanner = self._build_scanner()
 
-    def analyze_request(self, request_data):
-        """Analyseer request op threats"""
-        threats = []
-        threat_score = 0
-
-        # Check voor attack patterns
-        for pattern in self.attack_patterns:
-            if re.search(pattern, str(request_data)):
-                threats.append({
-                    'type': 'pattern_match',
-                    'pattern': pattern,
-                    'severity': 'high'
-                })
-                threat_score += 50
-
-        # Check voor abnormale request size
-        if len(str(request_data)) > 10000:
-            threats.append({
-                'type': 'large_payload',
-                'size': len(str(request_data)),
-                'severity': 'medium'
-            })
-            threat_score += 20
-
-        # Check voor abnormale characters
-        suspicious_chars = ['%00', '\x00', '<?php', '<%', '{$']
-        for char in suspicious_chars:
-            if char in str(request_data):
-                threats.append({
-                    'type': 'suspicious_characters',
-                    'char': char,
-                    'severity': 'high'
-                })
-                threat_score += 30
+    def _build_scanner(self):
+        """Patterns zonder anchors vallen terug op een regex search per veld"""
+        rules = [
+            (f'p{i}', pattern, *self.pattern_anchors.get(pattern, (None, False)))
+            for i, pattern in enumerate(self.attack_patterns)
+        ]
+        rules += [(f'm{i}', None, (char,), False) for i, char in enumerate(self.suspicious_chars)]
+        return ThreatScanner(rules)
+
+    def _serialize(self, request_data):
+        """Eén string per veld, één keer opgebouwd"""
+        if isinstance(request_data, str):
+            return [request_data]
+        if isinstance(request_data, dict):
+            ordered = [k for k in self.FIELD_ORDER if k in request_data]
+            ordered += [k for k in request_data if k not in self.FIELD_ORDER]
+            values = [request_data[k] for k in ordered]
+            return [v if isinstance(v, str) else str(v) for v in values if v]
+        return [str(request_data)]
+
+    def _score(self, found, large):
+        score = self.PATTERN_SCORE * sum(1 for name in found if name[0] == 'p')
+        score += self.MARKER_SCORE * sum(1 for name in found if name[0] == 'm')
+        return score + (self.LARGE_PAYLOAD_SCORE if large else 0)
+
+    def analyze_request(self, request_data, early_exit=False):
+        """
+        Analyseer request op threats.
+        Elk veld (args, form, json, headers) wordt één keer geserialiseerd en los gescand.
+        early_exit: stop zodra de score 'high' is; de beslissing ligt dan vast,
+        alleen de threats lijst is mogelijk niet compleet.
+        """
+        fields = self._serialize(request_data)
+        size = sum(len(field) for field in fields)
+        large = size > self.LARGE_PAYLOAD_CHARS
+
+        found = set()
+        stop = (lambda f: self._score(f, large) > self.HIGH_RISK_SCORE) if early_exit else None
+        for field in fields:
+            if self.scanner.scan(field[:self.MAX_SCAN_CHARS], found, stop):
+                break
+
+        # Threats in vaste volgorde: patterns, payload size, markers
+        threats = [
+            {'type': 'pattern_match', 'pattern': pattern, 'severity': 'high'}
+            for i, pattern in enumerate(self.attack_patterns) if f'p{i}' in found
+        ]
+        if large:
+            threats.append({'type': 'large_payload', 'size': size, 'severity': 'medium'})
+        threats += [
+            {'type': 'suspicious_characters', 'char': char, 'severity': 'high'}
+            for i, char in enumerate(self.suspicious_chars) if f'm{i}' in found
+        ]
 
+        threat_score = self._score(found, large)
         return {
             'is_threat': threat_score > 30,
             'threat_score': threat_score,
             'threats': threats,
-            'risk_level': 'high' if threat_score > 50 else 'medium' if threat_score > 20 else 'low'
+            'risk_level': 'high' if threat_score > self.HIGH_RISK_SCORE else 'medium' if threat_score > 20 else 'low'
         }
 
     def analyze_behavior(self, ip, actions):
@@ -322,7 +496,7 @@ def require_threat_scan(f):
             'headers': dict(request.headers)
         }
 
-        analysis = threat_detector.analyze_request(request_data)
+        analysis = threat_detector.analyze_request(request_data, early_exit=True)
 
         if analysis['is_threat']:
             # Log threat
@@ -385,6 +559,8 @@ def get_security_status():
         'incidents_24h': incidents,
         'blacklisted_ips': blacklisted_count,
         'whitelisted_ips': whitelisted_count,
+        'ip_matcher': security_manager.matcher.stats(),
+        'failed_attempts': security_manager.get_failed_attempt_stats(),
         'recent_threats': recent_threats,
         'threat_level': 'high' if incidents.get('critical', 0) > 0 else 'low'
     }
@@ -396,12 +572,13 @@ def cleanup_expired_blacklists():
         cursor.execute('''
             UPDATE ip_blacklist
             SET is_active = 0
-            WHERE expires_at < datetime('now')
+            WHERE is_active = 1 AND expires_at < datetime('now')
         ''')
         removed = cursor.rowcount
 
-    # Reload lists
-    security_manager.load_lists()
+    # Reload lists (trie + andere workers), alleen als er iets verliep
+    if removed:
+        security_manager._lists_changed()
 
     return removed
 
@@ -0,0 +1,600 @@
+"""
+MVAI Connexx - Shared State Module
+Gedeelde state voor rate limits en IP reputatie over meerdere gunicorn workers
+
+Backends (SHARED_STATE_URL):
+    memory://                   per proces (default, alleen geschikt voor workers=1)
+    sqlite:///pad/naar/state.db gedeeld SQLite bestand, werkt over processen op één host
+    redis://host:6379/0         Redis-compatible server (optioneel: pip install redis)
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+
+from config import Config
+
+
+# ═══════════════════════════════════════════════════════
+# BACKEND INTERFACE
+# ═══════════════════════════════════════════════════════
+
+class SharedStateBackend(ABC):
+    """
+    Primitieven die rate limiting en IP reputatie nodig hebben:
+    - counters met expiry (fixed window rate limits)
+    - event windows (gefaalde pogingen in de laatste N seconden)
+    - sets met optionele expiry per member (white/blacklist)
+    """
+
+    @abstractmethod
+    def incr(self, key, expiry, amount=1):
+        ...
+
+    @abstractmethod
+    def get(self, key):
+        ...
+
+    @abstractmethod
+    def get_expiry(self, key):
+        """Unix timestamp waarop de counter verloopt (nu als hij niet bestaat)"""
+
+    @abstractmethod
+    def clear(self, key):
+        ...
+
+    @abstractmethod
+    def reset(self):
+        """Verwijder alle counters; geeft het aantal verwijderde keys terug"""
+
+    @abstractmethod
+    def record_event(self, key, retention):
+        """Registreer een event nu; events ouder dan retention seconden vervallen"""
+
+    @abstractmethod
+    def count_events(self, key, window):
+        ...
+
+    def event_stats(self):
+        """Omvang en eviction statistieken van de event windows"""
+        return {}
+
+    @abstractmethod
+    def set_add(self, name, member, ttl=None):
+        ...
+
+    @abstractmethod
+    def set_contains(self, name, member):
+        ...
+
+    @abstractmethod
+    def set_members(self, name):
+        ...
+
+    @abstractmethod
+    def set_replace(self, name, members):
+        """Vervang de complete set atomisch (members: dict member -> expires_at of None)"""
+
+    def check(self):
+        return True
+
+    def close(self):
+        pass
+
+
+# ═══════════════════════════════════════════════════════
+# SLIDING WINDOW COUNTER
+# ═══════════════════════════════════════════════════════
+
+# Breedte van een event bucket; window grenzen zijn tot op deze resolutie nauwkeurig
+EVENT_BUCKET_SECONDS = 10
+
+
+class SlidingWindowCounter:
+    """
+    Gebucketde event tellers per key met vaste bovengrens op het aantal keys.
+    - record: O(1) (teller in de huidige bucket ophogen)
+    - count: O(aantal buckets in retention), onafhankelijk van het aantal events
+    - keys staan in LRU volgorde; idle keys (laatste event ouder dan retention)
+      vallen eraf, en boven max_keys wordt de minst recent actieve key geëvict
+    """
+
+    def __init__(self, max_keys=100000, bucket_seconds=EVENT_BUCKET_SECONDS):
+        self.max_keys = max_keys
+        self.bucket_seconds = bucket_seconds
+        self._keys = OrderedDict()  # key -> [retention, last_bucket, {bucket: count}]
+        self._lock = threading.Lock()
+        self.records = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _bucket(self, ts):
+        return int(ts // self.bucket_seconds)
+
+    def record(self, key, retention, now=None):
+        now = time.time() if now is None else now
+        bucket = self._bucket(now)
+        oldest = self._bucket(now - retention)
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                entry = self._keys[key] = [retention, bucket, {}]
+            else:
+                self._keys.move_to_end(key)
+                entry[0] = max(entry[0], retention)
+            buckets = entry[2]
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+            entry[1] = bucket
+            # Verlopen buckets van deze key opruimen (hooguit retention / bucket_seconds stuks)
+            if len(buckets) > 1:
+                for stale in [b for b in buckets if b < oldest]:
+                    del buckets[stale]
+            self.records += 1
+            self._evict(now)
+
+    def _evict(self, now):
+        """Idle keys aan de LRU kop laten vallen; daarna hard begrenzen op max_keys"""
+        while self._keys:
+            key, (retention, last_bucket, _) = next(iter(self._keys.items()))
+            if last_bucket >= self._bucket(now - retention):
+                break
+            self._keys.popitem(last=False)
+            self.expired += 1
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+            self.evictions += 1
+
+    def count(self, key, window, now=None):
+        now = time.time() if now is None else now
+        since = self._bucket(now - window)
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                return 0
+            return sum(count for bucket, count in entry[2].items() if bucket >= since)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._keys),
+                'max_keys': self.max_keys,
+                'buckets': sum(len(entry[2]) for entry in self._keys.values()),
+                'bucket_seconds': self.bucket_seconds,
+                'records': self.records,
+                'evictions': self.evictions,
+                'expired': self.expired,
+            }
+
+
+# ═══════════════════════════════════════════════════════
+# MEMORY BACKEND
+# ═══════════════════════════════════════════════════════
+
+class MemoryBackend(SharedStateBackend):
+    """In-process backend; state is per worker"""
+
+    def __init__(self):
+        self._counters = {}   # key -> [value, expires_at]
+        self._events = SlidingWindowCounter(max_keys=Config.FAILED_ATTEMPT_MAX_IPS)
+        self._sets = {}       # name -> {member: expires_at | None}
+        self._lock = threading.Lock()
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[1] <= now:
+                counter = self._counters[key] = [0, now + expiry]
+            counter[0] += amount
+            return counter[0]
+
+    def get(self, key):
+        with self._lock:
+            counter = self._counters.get(key)
+            return counter[0] if counter and counter[1] > time.time() else 0
+
+    def get_expiry(self, key):
+        with self._lock:
+            counter = self._counters.get(key)
+            return counter[1] if counter else time.time()
+
+    def clear(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            count = len(self._counters)
+            self._counters.clear()
+            return count
+
+    def record_event(self, key, retention):
+        self._events.record(key, retention)
+
+    def count_events(self, key, window):
+        return self._events.count(key, window)
+
+    def event_stats(self):
+        return self._events.stats()
+
+    def set_add(self, name, member, ttl=None):
+        with self._lock:
+            self._sets.setdefault(name, {})[member] = time.time() + ttl if ttl else None
+
+    def set_contains(self, name, member):
+        with self._lock:
+            members = self._sets.get(name, {})
+            if member not in members:
+                return False
+            expires_at = members[member]
+            return expires_at is None or expires_at > time.time()
+
+    def set_members(self, name):
+        now = time.time()
+        with self._lock:
+            return {m for m, exp in self._sets.get(name, {}).items() if exp is None or exp > now}
+
+    def set_replace(self, name, members):
+        with self._lock:
+            self._sets[name] = dict(members)
+
+
+# ═══════════════════════════════════════════════════════
+# SQLITE BACKEND
+# ═══════════════════════════════════════════════════════
+
+class SQLiteBackend(SharedStateBackend):
+    """
+    Gedeeld SQLite bestand (WAL). Elke mutatie is één atomisch statement of een
+    BEGIN IMMEDIATE transactie, dus consistent over processen op dezelfde host.
+    Los van de hoofd database zodat rate limit writes de log writes niet blokkeren.
+    """
+
+    # Elke N event records een globale prune van verlopen buckets
+    EVENT_PRUNE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._event_records = 0
+        self._event_pruned = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript('''
+            CREATE TABLE IF NOT EXISTS counters (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS event_buckets (
+                key TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (key, bucket)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_event_buckets_expires ON event_buckets(expires_at);
+            CREATE TABLE IF NOT EXISTS set_members (
+                name TEXT NOT NULL,
+                member TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (name, member)
+            ) WITHOUT ROWID;
+        ''')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False):
+        # elastic_expiry: elke hit schuift het window op (limits < 5, fixed-window-elastic-expiry)
+        now = time.time()
+        row = self._conn().execute('''
+            INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,
+                expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END
+            RETURNING value
+        ''', (key, amount, now + expiry, now, now, bool(elastic_expiry))).fetchone()
+        return row[0]
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM counters WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._conn().execute('SELECT expires_at FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def clear(self, key):
+        self._conn().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    def reset(self):
+        return self._conn().execute('DELETE FROM counters').rowcount
+
+    def record_event(self, key, retention):
+        now = time.time()
+        bucket = int(now // EVENT_BUCKET_SECONDS)
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO event_buckets (key, bucket, count, expires_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(key, bucket) DO UPDATE SET
+                count = count + 1,
+                expires_at = MAX(expires_at, excluded.expires_at)
+        ''', (key, bucket, (bucket + 1) * EVENT_BUCKET_SECONDS + retention))
+        # Verlopen buckets van alle keys periodiek in één statement opruimen
+        self._event_records += 1
+        if self._event_records % self.EVENT_PRUNE_EVERY == 0:
+            self._event_pruned += conn.execute(
+                'DELETE FROM event_buckets WHERE expires_at < ?', (now,)
+            ).rowcount
+
+    def count_events(self, key, window):
+        since = int((time.time() - window) // EVENT_BUCKET_SECONDS)
+        return self._conn().execute(
+            'SELECT COALESCE(SUM(count), 0) FROM event_buckets WHERE key = ? AND bucket >= ?', (key, since)
+        ).fetchone()[0]
+
+    def event_stats(self):
+        keys, buckets = self._conn().execute(
+            'SELECT COUNT(DISTINCT key), COUNT(*) FROM event_buckets'
+        ).fetchone()
+        return {
+            'keys': keys,
+            'buckets': buckets,
+            'bucket_seconds': EVENT_BUCKET_SECONDS,
+            'records': self._event_records,
+            'expired': self._event_pruned,
+        }
+
+    def set_add(self, name, member, ttl=None):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO set_members (name, member, expires_at) VALUES (?, ?, ?)',
+            (name, member, time.time() + ttl if ttl else None)
+        )
+
+    def set_contains(self, name, member):
+        return self._conn().execute('''
+            SELECT 1 FROM set_members
+            WHERE name = ? AND member = ? AND (expires_at IS NULL OR expires_at > ?)
+        ''', (name, member, time.time())).fetchone() is not None
+
+    def set_members(self, name):
+        rows = self._conn().execute('''
+            SELECT member FROM set_members
+            WHERE name = ? AND (expires_at IS NULL OR expires_at > ?)
+        ''', (name, time.time())).fetchall()
+        return {row[0] for row in rows}
+
+    def set_replace(self, name, members):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM set_members WHERE name = ?', (name,))
+            conn.executemany(
+                'INSERT INTO set_members (name, member, expires_at) VALUES (?, ?, ?)',
+                [(name, member, expires_at) for member, expires_at in members.items()]
+            )
+
+    def check(self):
+        try:
+            self._conn().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ═══════════════════════════════════════════════════════
+# REDIS BACKEND (OPTIONEEL)
+# ═══════════════════════════════════════════════════════
+
+class RedisBackend(SharedStateBackend):
+    """
+    Redis-compatible backend (Redis, Valkey, KeyDB).
+    Sets zijn sorted sets met expires_at als score (inf = permanent).
+    """
+
+    def __init__(self, url, prefix='mvai:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SHARED_STATE_URL=redis://... vereist het redis package (pip install redis)')
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, kind, key):
+        return f'{self.prefix}{kind}:{key}'
+
+    def incr(self, key, expiry, amount=1):
+        # Eén MULTI: SET NX EX start een nieuw window mét expiry, INCRBY telt op.
+        # Nooit een counter zonder TTL, ook niet als het proces ertussen stopt.
+        name = self._key('counter', key)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.set(name, 0, ex=max(1, int(expiry)), nx=True)
+        pipe.incrby(name, amount)
+        return pipe.execute()[1]
+
+    def get(self, key):
+        return int(self._redis.get(self._key('counter', key)) or 0)
+
+    def get_expiry(self, key):
+        ttl = self._redis.pttl(self._key('counter', key))
+        return time.time() + max(ttl, 0) / 1000
+
+    def clear(self, key):
+        self._redis.delete(self._key('counter', key))
+
+    def reset(self):
+        keys = list(self._redis.scan_iter(self._key('counter', '*')))
+        return self._redis.delete(*keys) if keys else 0
+
+    def record_event(self, key, retention):
+        # Hash per key met een veld per bucket; Redis expiret idle keys zelf
+        name = self._key('events', key)
+        now = time.time()
+        bucket = int(now // EVENT_BUCKET_SECONDS)
+        pipe = self._redis.pipeline()
+        pipe.hincrby(name, bucket, 1)
+        pipe.expire(name, int(retention) + EVENT_BUCKET_SECONDS)
+        pipe.hkeys(name)
+        fields = pipe.execute()[2]
+        oldest = int((now - retention) // EVENT_BUCKET_SECONDS)
+        stale = [f for f in fields if int(f) < oldest]
+        if stale:
+            self._redis.hdel(name, *stale)
+
+    def count_events(self, key, window):
+        since = int((time.time() - window) // EVENT_BUCKET_SECONDS)
+        buckets = self._redis.hgetall(self._key('events', key))
+        return sum(int(count) for bucket, count in buckets.items() if int(bucket) >= since)
+
+    def set_add(self, name, member, ttl=None):
+        self._redis.zadd(self._key('set', name), {member: time.time() + ttl if ttl else float('inf')})
+
+    def set_contains(self, name, member):
+        score = self._redis.zscore(self._key('set', name), member)
+        return score is not None and score > time.time()
+
+    def set_members(self, name):
+        members = self._redis.zrangebyscore(self._key('set', name), f'({time.time()}', '+inf')
+        return {m.decode() if isinstance(m, bytes) else m for m in members}
+
+    def set_replace(self, name, members):
+        key = self._key('set', name)
+        pipe = self._redis.pipeline()  # MULTI/EXEC
+        pipe.delete(key)
+        if members:
+            pipe.zadd(key, {m: exp if exp is not None else float('inf') for m, exp in members.items()})
+        pipe.execute()
+
+    def check(self):
+        try:
+            return bool(self._redis.ping())
+        except Exception:
+            return False
+
+    def close(self):
+        self._redis.close()
+
+
+# ═══════════════════════════════════════════════════════
+# BACKEND REGISTRY
+# ═══════════════════════════════════════════════════════
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _sqlite_path(url):
+    """sqlite:///relatief.db of sqlite:////absoluut/pad.db (zoals SQLAlchemy)"""
+    path = urlparse(url).path
+    return path[1:] if path.startswith('/') else path
+
+
+def create_backend(url):
+    """Maak een backend op basis van de URL scheme"""
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryBackend()
+    if scheme == 'sqlite':
+        return SQLiteBackend(_sqlite_path(url))
+    if scheme in ('redis', 'rediss'):
+        return RedisBackend(url)
+    raise ValueError(f'Onbekende SHARED_STATE_URL scheme: {scheme}')
+
+
+def get_backend(url=None):
+    """Eén backend instantie per URL per proces"""
+    url = url or Config.SHARED_STATE_URL
+    with _backends_lock:
+        backend = _backends.get(url)
+        if backend is None:
+            backend = _backends[url] = create_backend(url)
+        return backend
+
+
+def close_backends():
+    """Sluit alle backends (worker exit / tests)"""
+    with _backends_lock:
+        for backend in _backends.values():
+            backend.close()
+        _backends.clear()
+
+
+def limiter_storage_uri():
+    """
+    Storage URI voor flask_limiter. Een expliciete RATELIMIT_STORAGE_URL wint;
+    anders deelt de limiter de SHARED_STATE_URL backend.
+    """
+    return Config.RATELIMIT_STORAGE_URL or Config.SHARED_STATE_URL
+
+
+# ═══════════════════════════════════════════════════════
+# FLASK-LIMITER STORAGE
+# ═══════════════════════════════════════════════════════
+
+class SharedStateLimitsStorage(Storage):
+    """
+    limits storage voor sqlite:// URIs (memory:// en redis:// levert limits zelf).
+    Fixed window counters via SQLiteBackend.incr, één atomische upsert per hit.
+    Alleen de fixed-window strategie (en fixed-window-elastic-expiry op limits < 5);
+    moving-window en sliding-window-counter weigert limits bij het aanmaken van de
+    limiter met deze storage.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.backend = get_backend(uri)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        # limits 3/4 geven elastic_expiry mee, limits 5 niet (amount altijd als keyword)
+        return self.backend.incr(key, expiry, amount, elastic_expiry=elastic_expiry)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def get_expiry(self, key):
+        return self.backend.get_expiry(key)
+
+    def check(self):
+        return self.backend.check()
+
+    def reset(self):
+        return self.backend.reset()
+
+    def clear(self, key):
+        self.backend.clear(key)
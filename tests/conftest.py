@@ -34,6 +34,29 @@ def temp_db(tmp_path):
 
     yield db_path
 
+    # Gecachte API keys, usage counters en stats horen bij de tijdelijke database
+    db_module._api_key_cache.clear()
+    db_module._stats_cache.clear()
+
+    # Webhook dispatcher pollt de outbox van de tijdelijke database
+    if 'webhooks' in sys.modules:
+        sys.modules['webhooks'].shutdown()
+
+    # Job scheduler houdt een lease in de tijdelijke database
+    if 'scheduler' in sys.modules:
+        sys.modules['scheduler'].shutdown()
+
+    # Gecachte AI assistants horen bij klanten uit de tijdelijke database
+    if 'ai_assistant' in sys.modules:
+        sys.modules['ai_assistant'].invalidate_assistant()
+
+    # Shared state (rate limits, IP reputatie) niet laten lekken naar volgende tests
+    import shared_state
+    shared_state.close_backends()
+
+    # Sluit gepoolde connecties naar de tijdelijke database
+    db_module.close_pool()
+
     # Herstel origineel pad
     db_module.DATABASE = original_db
 
@@ -77,3 +100,19 @@ def sample_api_key(temp_db, sample_customer):
             VALUES (?, ?, ?, 1)
         ''', (sample_customer['id'], key_value, 'Test API Key'))
     return key_value
+
+
+@pytest.fixture
+def http_server():
+    """Factory: http_server(handle) start een lokale HTTP server, na de test worden ze gesloten"""
+    from tests.helpers import LocalHTTPServer
+    servers = []
+
+    def start(handle):
+        server = LocalHTTPServer(handle)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
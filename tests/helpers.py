@@ -0,0 +1,133 @@
+"""
+MVAI Connexx - Gedeelde test helpers
+Lokale HTTP server, nep AI provider en generator helpers voor meerdere test modules
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# ═══════════════════════════════════════════════════════
+# LOKALE HTTP SERVER
+# ═══════════════════════════════════════════════════════
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.owner.lock:
+            self.server.owner.connections += 1
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        server = self.server.owner
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        request = {
+            'method': self.command,
+            'path': self.path,
+            'url_path': url.path,
+            'query': {k: v[0] for k, v in parse_qs(url.query).items()},
+            'headers': dict(self.headers),
+            'body': self.rfile.read(length) if length else b'',
+            'client': self.client_address,
+        }
+        with server.lock:
+            server.requests.append(request)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            request['status'] = server.statuses.pop(0) if server.statuses else 200
+        try:
+            if server.delay:
+                time.sleep(server.delay)
+            status, headers, body = server.handle(request)
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+                headers = {'Content-Type': 'application/json', **headers}
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalHTTPServer:
+    """
+    ThreadingHTTPServer op 127.0.0.1 die elke request bijhoudt.
+    handle(request) -> (status, headers, body); body als bytes of JSON-baar object.
+    request['status'] is de volgende uit statuses (anders 200), zodat tests fouten kunnen injecteren.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        self.statuses = []
+        self.delay = 0
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.owner = self
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ═══════════════════════════════════════════════════════
+# AI PROVIDER
+# ═══════════════════════════════════════════════════════
+
+class FakeProvider:
+    """Provider die berichten registreert in plaats van een model aan te roepen"""
+
+    provider_name = 'fake'
+
+    def __init__(self, model='fake-1'):
+        self.model = model
+        self.calls = []
+        self.gate = None
+        self.fail_after_first = False
+
+    def chat(self, system_prompt, messages, max_tokens=1000):
+        self.calls.append(messages)
+        return {'success': True, 'message': f'antwoord {len(self.calls)}', 'provider': 'fake',
+                'model': self.model, 'tokens_used': 100}
+
+    def chat_stream(self, system_prompt, messages, max_tokens=1000):
+        self.calls.append(messages)
+        yield 'eerste '
+        if self.gate:
+            self.gate.wait(5)
+        if self.fail_after_first:
+            raise ConnectionError('verbinding verbroken')
+        yield 'delta'
+        return {'provider': 'fake', 'model': self.model, 'tokens_used': 12}
+
+
+def drain(stream):
+    """Alle deltas van een generator plus zijn return waarde"""
+    deltas = []
+    while True:
+        try:
+            deltas.append(next(stream))
+        except StopIteration as stop:
+            return deltas, stop.value
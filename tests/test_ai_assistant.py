@@ -0,0 +1,325 @@
+"""
+Tests voor ai_assistant.py - Assistant registry, persistent gesprek geheugen, streaming en
+rapport/statistiek queries op de rollup tabellen
+"""
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import ai_assistant
+import ai_providers
+import database as db
+from tests.helpers import FakeProvider, drain
+
+
+@pytest.fixture
+def provider(temp_db, monkeypatch):
+    built = []
+
+    def get_provider_for_customer(customer_id):
+        built.append(customer_id)
+        return FakeProvider()
+    monkeypatch.setattr(ai_providers, 'get_provider_for_customer', get_provider_for_customer)
+    return built
+
+
+@pytest.fixture
+def customer_id(sample_customer):
+    ai_assistant.enable_assistant(sample_customer['id'])
+    return sample_customer['id']
+
+
+def _conversations(customer_id):
+    with db.get_db() as conn:
+        return conn.execute('''
+            SELECT user_message, ai_response, success FROM ai_conversations
+            WHERE customer_id = ? ORDER BY id
+        ''', (customer_id,)).fetchall()
+
+
+class TestAssistantRegistry:
+
+    def test_instance_reused_until_invalidated(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        assert ai_assistant.get_assistant(customer_id) is assistant
+        assert provider == [customer_id]
+
+        ai_providers.save_customer_provider_config(customer_id, 'anthropic', 'claude-3-haiku')
+        assert ai_assistant.get_assistant(customer_id) is not assistant
+        assert provider == [customer_id, customer_id]
+
+    def test_disable_drops_instance_and_disabled_is_not_cached(self, provider, customer_id):
+        ai_assistant.get_assistant(customer_id)
+        ai_assistant.disable_assistant(customer_id)
+        disabled = ai_assistant.get_assistant(customer_id)
+        assert not disabled.enabled
+        assert ai_assistant.get_assistant(customer_id) is not disabled
+
+        ai_assistant.enable_assistant(customer_id)
+        assert ai_assistant.get_assistant(customer_id).enabled
+
+    def test_invalidation_reaches_other_workers(self, provider, customer_id):
+        # Twee registries op dezelfde shared_state backend = twee gunicorn workers
+        worker_a, worker_b = ai_assistant.AssistantRegistry(), ai_assistant.AssistantRegistry()
+        assistant = worker_a.get(customer_id)
+        assert worker_a.get(customer_id) is assistant
+
+        worker_b.invalidate(customer_id)
+        fresh = worker_a.get(customer_id)
+        assert fresh is not assistant
+        assert worker_a.get(customer_id) is fresh
+
+        worker_b.invalidate()
+        assert worker_a.get(customer_id) is not fresh
+
+    def test_lru_eviction_and_ttl(self, provider, temp_db):
+        registry = ai_assistant.AssistantRegistry(max_size=2, ttl=60)
+        ids = [db.create_customer(f'Klant {i}')['id'] for i in range(3)]
+        for cid in ids:
+            ai_assistant.enable_assistant(cid)
+            registry.get(cid)
+        stats = registry.stats()
+        assert (stats['size'], stats['evictions'], stats['misses']) == (2, 1, 3)
+        registry.get(ids[2])
+        assert registry.stats()['hits'] == 1
+
+        expired = ai_assistant.AssistantRegistry(max_size=2, ttl=0)
+        assert expired.get(ids[0]) is not expired.get(ids[0])
+
+
+class TestConversationMemory:
+
+    def test_turns_persisted_and_history_loaded_lazily(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        assert assistant.chat('Hoeveel logs?')['message'] == 'antwoord 1'
+        assistant.chat('En gisteren?')
+        assert [tuple(r) for r in _conversations(customer_id)] == [
+            ('Hoeveel logs?', 'antwoord 1', 1), ('En gisteren?', 'antwoord 2', 1)]
+
+        # Nieuwe instantie (andere worker / na TTL) kent het gesprek uit de database
+        ai_assistant.invalidate_assistant(customer_id)
+        fresh = ai_assistant.get_assistant(customer_id)
+        assert fresh._history is None
+        fresh.chat('Nog iets')
+        sent = fresh._provider.calls[0]
+        assert [m['content'] for m in sent] == [
+            'Hoeveel logs?', 'antwoord 1', 'En gisteren?', 'antwoord 2', 'Nog iets']
+
+    def test_history_is_capped(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        for i in range(15):
+            assistant.chat(f'vraag {i}')
+        assert len(assistant.conversation_history) == ai_assistant.AIAssistant.HISTORY_LIMIT
+        assert assistant.conversation_history[-2]['content'] == 'vraag 14'
+
+        ai_assistant.invalidate_assistant(customer_id)
+        reloaded = ai_assistant.get_assistant(customer_id).conversation_history
+        assert [(m['role'], m['content']) for m in reloaded] == \
+            [(m['role'], m['content']) for m in assistant.conversation_history]
+
+    def test_turns_from_other_worker_trigger_reload(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        assistant.chat('eerste')
+        other = ai_assistant.AIAssistant(customer_id)
+        other.chat('van andere worker')
+
+        assistant.chat('derde')
+        assert [m['content'] for m in assistant.conversation_history if m['role'] == 'user'] == [
+            'eerste', 'van andere worker', 'derde']
+
+    def test_context_reused_between_turns(self, provider, customer_id, monkeypatch):
+        assistant = ai_assistant.get_assistant(customer_id)
+        calls = []
+        original = assistant._get_customer_data
+        monkeypatch.setattr(assistant, '_get_customer_data', lambda: calls.append(1) or original())
+        assistant.chat('een')
+        assistant.chat('twee')
+        assert len(calls) == 1
+
+
+class TestStreaming:
+
+    def test_first_delta_before_generation_finishes(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        assistant._provider.gate = threading.Event()
+        stream = assistant.chat_stream('Hoe gaat het?')
+
+        assert next(stream) == 'eerste '  # Provider wacht nog op de gate
+        assert _conversations(customer_id) == []
+        assistant._provider.gate.set()
+
+        deltas, result = drain(stream)
+        assert deltas == ['delta']
+        assert result == {'success': True, 'message': 'eerste delta', 'provider': 'fake', 'model': 'fake-1',
+                          'tokens_used': 12}
+        assert [tuple(r) for r in _conversations(customer_id)] == [('Hoe gaat het?', 'eerste delta', 1)]
+        assert assistant.conversation_history[-1]['content'] == 'eerste delta'
+
+    def test_broken_stream_keeps_partial_answer(self, provider, customer_id):
+        assistant = ai_assistant.get_assistant(customer_id)
+        assistant._provider.fail_after_first = True
+        deltas, result = drain(assistant.chat_stream('vraag'))
+        assert deltas == ['eerste ']
+        assert (result['success'], result['message']) == (False, 'eerste ')
+        assert [tuple(r) for r in _conversations(customer_id)] == [('vraag', 'eerste ', 0)]
+
+    def test_provider_failure_falls_back_to_streamed_rules(self, provider, customer_id, monkeypatch):
+        assistant = ai_assistant.get_assistant(customer_id)
+
+        def unavailable(*args, **kwargs):
+            raise ConnectionError('provider onbereikbaar')
+            yield  # pragma: no cover
+        monkeypatch.setattr(assistant._provider, 'chat_stream', unavailable)
+
+        deltas, result = drain(assistant.chat_stream('help'))
+        expected = assistant.process_command('help')
+        assert len(deltas) > 1 and ''.join(deltas) == expected['message']
+        assert result == expected
+
+    def test_stream_command_without_provider(self, temp_db, customer_id, monkeypatch):
+        monkeypatch.setattr(ai_providers, 'get_provider_for_customer', lambda customer_id: None)
+        monkeypatch.setattr(ai_assistant, 'OPENAI_AVAILABLE', False)
+        assistant = ai_assistant.AIAssistant(customer_id)
+        deltas, result = drain(assistant.chat_stream('hoeveel logs vandaag'))
+        assert ''.join(deltas) == result['message']
+        assert _conversations(customer_id)[0]['ai_response'] == result['message']
+
+
+def _add_logs(customer_id, rows):
+    """rows: [(dag, uur, ip, aantal)]"""
+    with db.get_db() as conn:
+        conn.executemany('''
+            INSERT INTO logs (customer_id, ip_address, data, timestamp) VALUES (?, ?, 'x', ?)
+        ''', [(customer_id, ip, f'{day.isoformat()} {hour:02d}:15:00')
+              for day, hour, ip, count in rows for _ in range(count)])
+
+
+def _reference(rows, start, end):
+    """Python referentie over de ruwe logs: (totaal, unieke IPs, piek uur)"""
+    selected = [r for r in rows if start <= r[0] <= end]
+    hours = {}
+    for day, hour, ip, count in selected:
+        hours[hour] = hours.get(hour, 0) + count
+    peak = min(hours, key=lambda h: (-hours[h], h)) if hours else None
+    return (sum(r[3] for r in selected), len({r[2] for r in selected}),
+            f'{peak}:00 ({hours[peak]} logs)' if hours else None)
+
+
+class TestStreamRoute:
+    """POST /customer/ai/chat/stream als server-sent events"""
+
+    @pytest.fixture
+    def client(self, provider, customer_id):
+        import app as app_module  # Pas na temp_db importeren: init_db draait bij import
+        client = app_module.app.test_client()
+        with client.session_transaction() as sess:
+            sess['customer_id'] = customer_id
+        return client
+
+    @staticmethod
+    def _events(response):
+        """[(event, data)] uit een text/event-stream body"""
+        events = []
+        for block in response.get_data(as_text=True).strip().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines())
+            events.append((fields['event'], json.loads(fields['data'])))
+        return events
+
+    def test_stream_sends_deltas_then_done(self, client, customer_id):
+        response = client.post('/customer/ai/chat/stream', json={'message': 'Hoe gaat het?'})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        events = self._events(response)
+        assert events[:-1] == [('delta', {'text': 'eerste '}), ('delta', {'text': 'delta'})]
+        event, result = events[-1]
+        assert event == 'done'
+        assert (result['success'], result['message']) == (True, 'eerste delta')
+        assert [tuple(r) for r in _conversations(customer_id)] == [('Hoe gaat het?', 'eerste delta', 1)]
+
+    def test_empty_message_is_rejected(self, client):
+        response = client.post('/customer/ai/chat/stream', json={'message': '  '})
+        assert response.status_code == 400
+
+
+class TestPeriodQueries:
+
+    @pytest.fixture
+    def history(self, temp_db, customer_id, monkeypatch):
+        monkeypatch.setattr(ai_providers, 'get_provider_for_customer', lambda customer_id: None)
+        monkeypatch.setattr(ai_assistant, 'OPENAI_AVAILABLE', False)
+
+        def no_raw_logs(*args, **kwargs):
+            raise AssertionError('ruwe logs opgehaald')
+        monkeypatch.setattr(db, 'get_customer_logs', no_raw_logs)
+
+        today = date.today()
+        rows = [(today - timedelta(days=back), hour, f'10.0.0.{back % 5}', count)
+                for back, hour, count in [(0, 9, 3), (0, 14, 2), (1, 9, 4), (3, 22, 6),
+                                          (8, 14, 5), (20, 9, 2), (35, 3, 7), (70, 14, 1)]]
+        _add_logs(customer_id, rows)
+        return ai_assistant.AIAssistant(customer_id), rows
+
+    @pytest.mark.parametrize('period', ['vandaag', 'gisteren', 'deze_week', 'afgelopen_week',
+                                        'deze_maand', 'afgelopen_maand', None])
+    def test_statistics_match_raw_logs(self, history, period):
+        assistant, rows = history
+        start, end = assistant._period_range(period)
+        start = date.fromisoformat(start) if start else date.min
+        end = date.fromisoformat(end) if end else date.max
+        total, unique_ips, peak = _reference(rows, start, end)
+
+        aggregate = assistant._query_period_aggregate(period)
+        assert (aggregate['total'], aggregate['unique_ips']) == (total, unique_ips)
+        assert assistant._get_peak_hour(period) == peak
+        assert sum(d['count'] for d in assistant._query_daily_counts(period)) == total
+
+    def test_period_ranges_are_calendar_aligned(self, history):
+        assistant, _ = history
+        today = date.today()
+        monday = today - timedelta(days=today.weekday())
+        last_month_end = today.replace(day=1) - timedelta(days=1)
+        assert assistant._period_range('deze_week') == (monday.isoformat(), today.isoformat())
+        assert assistant._period_range('afgelopen_week') == (
+            (monday - timedelta(days=7)).isoformat(), (monday - timedelta(days=1)).isoformat())
+        assert assistant._period_range('afgelopen_maand') == (
+            last_month_end.replace(day=1).isoformat(), last_month_end.isoformat())
+        assert assistant._period_range(None) == (None, None)
+
+    def test_commands_use_aggregates(self, history):
+        assistant, rows = history
+        stats = assistant.process_command('statistieken')['stats']
+        total, unique_ips, peak = _reference(rows, date.min, date.max)
+        assert (stats['total'], stats['period'], stats['unique_ips']) == (total, 'all_time', unique_ips)
+        assert stats['avg_per_day'] == total / 71
+        assert stats['peak_hour'] == peak
+
+        report = assistant.process_command('maak een rapport')['report']
+        assert report['total_logs'] == total
+        assert report['summary'].startswith(f'{total} logs geanalyseerd')
+
+        trend = assistant.process_command('toon trend')['trend']
+        assert trend['period'] == 'afgelopen_maand'
+        assert all(d['date'].startswith(trend['data'][0]['date'][:7]) for d in trend['data'])
+
+    def test_trend_compares_halves_of_the_period(self, temp_db, customer_id):
+        assistant = ai_assistant.AIAssistant(customer_id)
+        assert assistant._calculate_trend(assistant._query_period_aggregate(None)) == 'stabiel'
+
+        today = date.today()
+        _add_logs(customer_id, [(today - timedelta(days=9), 10, '1.1.1.1', 2),
+                                (today, 10, '1.1.1.1', 8)])
+        aggregate = assistant._query_period_aggregate(None)
+        assert (aggregate['first_half'], aggregate['second_half']) == (2, 8)
+        assert assistant._calculate_trend(aggregate) == 'stijgend'
+
+    def test_full_history_beyond_old_caps(self, history):
+        assistant, rows = history
+        _add_logs(assistant.customer_id, [(date.today(), 12, '10.9.9.9', 12000)])
+        started = datetime.now()
+        stats = assistant.process_command('statistieken vandaag')['stats']
+        assert stats['total'] == 12005 and stats['unique_ips'] == 2
+        assert stats['peak_hour'] == '12:00 (12000 logs)'
+        assert datetime.now() - started < timedelta(seconds=2)
@@ -0,0 +1,142 @@
+"""
+Tests voor ai_providers.py - Gedeelde keep-alive pools, SDK client hergebruik en streaming
+"""
+import json
+
+import pytest
+
+import ai_providers
+from tests.helpers import drain
+
+
+def _sse(events):
+    return ''.join(f'data: {json.dumps(event)}\n\n' for event in events).encode()
+
+
+def _provider_response(request):
+    """Doet zich voor als Gemini en Cohere (gewoon en streaming)"""
+    path, body = request['path'], json.loads(request['body'])
+    if ':streamGenerateContent' in path:
+        events = [{'candidates': [{'content': {'parts': [{'text': word}]}}]} for word in ('OK ', 'gemini')]
+        events[-1]['usageMetadata'] = {'totalTokenCount': 7}
+        return 200, {'Content-Type': 'text/event-stream'}, _sse(events)
+    if ':generateContent' in path:
+        return 200, {}, {'candidates': [{'content': {'parts': [{'text': 'OK gemini'}]}}],
+                         'usageMetadata': {'totalTokenCount': 7}}
+    if body.get('stream'):
+        events = [{'type': 'message-start'}] + [
+            {'type': 'content-delta', 'delta': {'message': {'content': {'text': word}}}}
+            for word in ('OK ', 'cohere')]
+        events.append({'type': 'message-end',
+                       'delta': {'usage': {'tokens': {'input_tokens': 3, 'output_tokens': 2}}}})
+        return 200, {'Content-Type': 'text/event-stream'}, _sse(events)
+    return 200, {}, {'message': {'content': [{'text': 'OK cohere'}]},
+                     'usage': {'tokens': {'input_tokens': 3, 'output_tokens': 2}}}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    clients = ai_providers.ClientRegistry()
+    monkeypatch.setattr(ai_providers, '_clients', clients)
+    yield clients
+    clients.close()
+
+
+@pytest.fixture
+def stub(monkeypatch, http_server):
+    server = http_server(_provider_response)
+    monkeypatch.setattr(ai_providers.GeminiProvider, 'BASE_URL', f'{server.url}/v1beta/models')
+    monkeypatch.setattr(ai_providers.CohereProvider, 'BASE_URL', f'{server.url}/v2/chat')
+    return server
+
+
+MESSAGES = [{'role': 'user', 'content': 'Hallo'}]
+
+
+class TestRestPools:
+
+    def test_connection_reused_across_calls_and_keys(self, registry, stub):
+        for key in ('klant-a', 'klant-b', 'klant-a'):
+            provider = ai_providers._build_provider('gemini', key, 'gemini-1.5-flash')
+            assert provider.chat('systeem', MESSAGES)['message'] == 'OK gemini'
+
+        assert len(stub.requests) == 3
+        assert stub.connections == 1
+        assert [r['path'].rsplit('key=', 1)[1] for r in stub.requests] == ['klant-a', 'klant-b', 'klant-a']
+        stats = ai_providers.get_client_stats()['sessions']['gemini']
+        assert stats == {'requests': 3, 'connections_opened': 1, 'reuse_ratio': 0.667}
+
+    def test_session_per_provider(self, registry, stub):
+        ai_providers.CohereProvider('key-1').chat('systeem', MESSAGES)
+        ai_providers.CohereProvider('key-2').chat('systeem', MESSAGES)
+        ai_providers.GeminiProvider('key-1').chat('systeem', MESSAGES)
+
+        assert [r['headers']['Authorization'] for r in stub.requests[:2]] == ['Bearer key-1', 'Bearer key-2']
+        stats = ai_providers.get_client_stats()
+        assert stats['sessions_created'] == 2
+        assert stats['sessions']['cohere']['connections_opened'] == 1
+        assert stub.connections == 2  # Eén pool per provider
+
+    def test_configured_timeouts(self, registry, monkeypatch):
+        monkeypatch.setattr(ai_providers.config.Config, 'AI_HTTP_CONNECT_TIMEOUT', 2.0)
+        monkeypatch.setattr(ai_providers.config.Config, 'AI_HTTP_READ_TIMEOUT', 45.0)
+        assert registry.timeout() == (2.0, 45.0)
+
+
+class TestStreaming:
+
+    @pytest.mark.parametrize('name, tokens', [('gemini', 7), ('cohere', 5)])
+    def test_rest_providers_yield_deltas(self, registry, stub, name, tokens):
+        provider = ai_providers._build_provider(name, 'key', '')
+        deltas, meta = drain(provider.chat_stream('systeem', MESSAGES))
+        assert deltas == ['OK ', name]
+        assert meta == {'model': '', 'provider': name, 'tokens_used': tokens}
+
+        # Gestreamde response geeft de connectie terug aan de pool
+        provider.chat('systeem', MESSAGES)
+        assert stub.connections == 1
+
+    def test_default_stream_is_single_delta(self):
+        class Blocking(ai_providers.BaseProvider):
+            def chat(self, system_prompt, messages, max_tokens=1000):
+                return {'success': True, 'message': 'alles tegelijk', 'provider': 'x', 'tokens_used': 4}
+
+        deltas, meta = drain(Blocking('key', 'model').chat_stream('systeem', MESSAGES))
+        assert deltas == ['alles tegelijk']
+        assert meta == {'provider': 'x', 'tokens_used': 4}
+
+
+@pytest.mark.skipif(not ai_providers.OPENAI_LIB, reason='openai package niet geïnstalleerd')
+class TestSdkClients:
+
+    def test_client_shared_per_api_key(self, registry):
+        first = ai_providers.OpenAIProvider('sk-test-a')
+        assert ai_providers.OpenAIProvider('sk-test-a', 'gpt-4o').client is first.client
+        assert ai_providers.OpenAIProvider('sk-test-b').client is not first.client
+
+        stats = ai_providers.get_client_stats()
+        assert (stats['sdk_clients_created'], stats['sdk_client_hits']) == (2, 1)
+
+    def test_client_cache_is_bounded(self, monkeypatch):
+        clients = ai_providers.ClientRegistry(max_clients=1)
+        monkeypatch.setattr(ai_providers, '_clients', clients)
+        a = ai_providers.OpenAIProvider('sk-test-a').client
+        ai_providers.OpenAIProvider('sk-test-b')
+        assert ai_providers.OpenAIProvider('sk-test-a').client is not a
+        assert clients.stats()['sdk_client_evictions'] == 2
+        # Uitgezette client blijft bruikbaar voor providers die hem nog vasthouden
+        assert not a.is_closed()
+        clients.close()
+
+    def test_client_uses_configured_timeouts(self, registry, monkeypatch):
+        monkeypatch.setattr(ai_providers.config.Config, 'AI_HTTP_CONNECT_TIMEOUT', 2.0)
+        monkeypatch.setattr(ai_providers.config.Config, 'AI_HTTP_READ_TIMEOUT', 45.0)
+        timeout = ai_providers.OpenAIProvider('sk-test-a').client.timeout
+        assert (timeout.connect, timeout.read) == (2.0, 45.0)
+
+    def test_sdk_without_default_httpx_client(self, registry, monkeypatch):
+        """Oudere SDK zonder DefaultHttpxClient: alleen timeout, geen AttributeError"""
+        class OldSdk:
+            Timeout = ai_providers.openai.Timeout
+        options = ai_providers.ClientRegistry().sdk_options(OldSdk)
+        assert set(options) == {'timeout'}
@@ -0,0 +1,164 @@
+"""
+Tests voor ai_response_cache.py - Response cache per klant, data versie en provider/model
+"""
+import pytest
+
+import ai_assistant
+import ai_providers
+import ai_response_cache as cache
+import database as db
+from tests.helpers import FakeProvider
+
+
+@pytest.fixture
+def customers(temp_db, monkeypatch):
+    monkeypatch.setattr(ai_providers, 'get_provider_for_customer', lambda customer_id: FakeProvider())
+    ids = [db.create_customer(f'Klant {i}')['id'] for i in range(2)]
+    for customer_id in ids:
+        ai_assistant.enable_assistant(customer_id)
+    return ids
+
+
+def _add_log(customer_id):
+    with db.get_db() as conn:
+        conn.execute("INSERT INTO logs (customer_id, ip_address, data) VALUES (?, '1.2.3.4', 'x')",
+                     (customer_id,))
+
+
+class TestNormalization:
+
+    def test_prompt_normalized(self):
+        assert cache.normalize_prompt('  Hoeveel LOGS vandaag?! ') == 'hoeveel logs vandaag'
+        assert cache.normalize_prompt('Créé') == 'cree'
+
+    def test_similarity(self):
+        assert cache.similarity('hoeveel logs vandaag', 'hoeveel logs vandaag') == 1.0
+        assert cache.similarity('hoeveel logs vandaag', 'hoeveel logs vandag') > 0.8
+        assert cache.similarity('hoeveel logs vandaag', 'maak een rapport') < 0.2
+
+
+class TestAssistantCache:
+
+    def test_repeat_question_served_from_cache(self, customers):
+        assistant = ai_assistant.get_assistant(customers[0])
+        provider = assistant._provider
+        first = assistant.chat('Hoeveel logs vandaag?')
+        second = assistant.chat('hoeveel logs vandaag')
+
+        assert len(provider.calls) == 1
+        assert second['message'] == first['message'] == 'antwoord 1'
+        assert (second['cached'], second['tokens_used'], second['tokens_saved']) == (True, 0, 100)
+        assert 'cached' not in first
+
+        stats = cache.get_customer_cache_stats(customers[0])
+        assert (stats['lookups'], stats['hits'], stats['misses'], stats['tokens_saved']) == (2, 1, 1, 100)
+        assert stats['hit_rate'] == 0.5 and stats['entries'] == 1
+
+    def test_repeated_questions_hit_while_history_grows(self, customers):
+        assistant = ai_assistant.get_assistant(customers[0])
+        for _ in range(4):
+            assistant.chat('Hoeveel logs vandaag?')
+        for _ in range(3):
+            assistant.chat('Maak een rapport van deze week')
+
+        assert len(assistant._provider.calls) == 2
+        stats = cache.get_customer_cache_stats(customers[0])
+        assert (stats['hits'], stats['entries']) == (5, 2)
+
+    def test_new_data_provider_or_customer_is_a_miss(self, customers):
+        assistant = ai_assistant.get_assistant(customers[0])
+        assistant.chat('Hoeveel logs vandaag?')
+
+        _add_log(customers[0])
+        assert assistant.chat('Hoeveel logs vandaag?')['message'] == 'antwoord 2'
+
+        assistant._provider = FakeProvider(model='fake-2')
+        assert 'cached' not in assistant.chat('Hoeveel logs vandaag?')
+
+        other = ai_assistant.get_assistant(customers[1])
+        assert 'cached' not in other.chat('Hoeveel logs vandaag?')
+        # Oude data versie is opgeruimd bij het opslaan
+        assert cache.get_customer_cache_stats(customers[0])['entries'] == 2
+
+    def test_streaming_uses_cache(self, customers):
+        assistant = ai_assistant.get_assistant(customers[0])
+        assistant.chat('Maak een rapport van deze week')
+        stream = assistant.chat_stream('maak een rapport van deze week')
+        deltas = list(stream)
+        assert ''.join(deltas) == 'antwoord 1'
+        assert len(assistant._provider.calls) == 1
+
+        list(assistant.chat_stream('Iets nieuws gevraagd'))
+        assert cache.get_customer_cache_stats(customers[0])['entries'] == 2
+
+    def test_follow_up_skips_cache(self, customers):
+        assistant = ai_assistant.get_assistant(customers[0])
+        assistant.chat('Hoeveel logs vandaag?')
+        first = assistant.chat('leg dat uit')
+        second = assistant.chat('leg dat uit')
+        assert 'cached' not in first and 'cached' not in second
+        assert len(assistant._provider.calls) == 3
+        assert cache.get_customer_cache_stats(customers[0])['entries'] == 1
+
+    def test_follow_up_detection(self):
+        assert cache.is_follow_up('Leg dat uit')
+        assert cache.is_follow_up('waarom?')
+        assert cache.is_follow_up('And why is that?')
+        assert not cache.is_follow_up('Hoeveel logs vandaag?')
+        assert not cache.is_follow_up('Maak een rapport van deze week')
+
+    def test_disabled_cache(self, customers, monkeypatch):
+        monkeypatch.setattr(cache.Config, 'AI_RESPONSE_CACHE_ENABLED', False)
+        assistant = ai_assistant.get_assistant(customers[0])
+        assistant.chat('vraag')
+        assistant.chat('vraag')
+        assert len(assistant._provider.calls) == 2
+
+
+class TestCacheStore:
+
+    def _store(self, customer_id, prompt, **kwargs):
+        result = {'success': True, 'message': f'over {prompt}', 'tokens_used': 10}
+        return cache.store(customer_id, prompt, 'v1', 'fake', 'm', result, **kwargs)
+
+    def test_near_duplicates_with_similarity_threshold(self, customers, monkeypatch):
+        self._store(customers[0], 'hoeveel logs vandaag')
+        assert cache.lookup(customers[0], 'hoeveel logs vandag', 'v1', 'fake', 'm') is None
+
+        monkeypatch.setattr(cache.Config, 'AI_RESPONSE_CACHE_SIMILARITY', 0.8)
+        hit = cache.lookup(customers[0], 'hoeveel logs vandag', 'v1', 'fake', 'm')
+        assert (hit['message'], hit['cache_match']) == ('over hoeveel logs vandaag', 'similar')
+        assert cache.lookup(customers[0], 'maak een rapport', 'v1', 'fake', 'm') is None
+        assert cache.get_customer_cache_stats(customers[0])['similar_hits'] == 1
+
+    def test_context_is_part_of_the_key(self, customers):
+        self._store(customers[0], 'vraag', context={'periode': 'week'})
+        assert cache.lookup(customers[0], 'vraag', 'v1', 'fake', 'm') is None
+        assert cache.lookup(customers[0], 'vraag', 'v1', 'fake', 'm', context={'periode': 'week'})
+
+    def test_ttl_and_size_bounded_eviction(self, customers, monkeypatch):
+        monkeypatch.setattr(cache.Config, 'AI_RESPONSE_CACHE_PER_CUSTOMER', 2)
+        for prompt in ('een', 'twee', 'drie'):
+            self._store(customers[0], prompt)
+        assert cache.lookup(customers[0], 'een', 'v1', 'fake', 'm') is None
+        assert cache.lookup(customers[0], 'drie', 'v1', 'fake', 'm')
+
+        monkeypatch.setattr(cache.Config, 'AI_RESPONSE_CACHE_MAX_ENTRIES', 3)
+        for prompt in ('vier', 'vijf'):
+            self._store(customers[1], prompt)
+        with db.get_db() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM ai_response_cache').fetchone()[0] == 3
+
+        monkeypatch.setattr(cache.Config, 'AI_RESPONSE_CACHE_TTL', -1)
+        self._store(customers[0], 'verlopen')
+        assert cache.lookup(customers[0], 'verlopen', 'v1', 'fake', 'm') is None
+
+    def test_failed_results_not_stored_and_stats_ranking(self, customers):
+        assert not cache.store(customers[0], 'vraag', 'v1', 'fake', 'm', {'success': False, 'message': 'fout'})
+        self._store(customers[1], 'vraag')
+        cache.lookup(customers[1], 'vraag', 'v1', 'fake', 'm')
+        cache.lookup(customers[0], 'vraag', 'v1', 'fake', 'm')
+
+        ranking = cache.get_cache_stats()
+        assert [(r['customer_name'], r['hits'], r['tokens_saved']) for r in ranking] == [
+            ('Klant 1', 1, 10), ('Klant 0', 0, 0)]
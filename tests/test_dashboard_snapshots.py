@@ -0,0 +1,90 @@
+"""
+Tests voor dashboard_snapshots.py - Versies, stale markering en achtergrond refresh
+"""
+import threading
+import time
+
+import pytest
+
+import dashboard_snapshots as snapshots
+import database as db
+
+
+@pytest.fixture
+def builder(temp_db, monkeypatch):
+    """Vervang de enterprise builder door een teller (optioneel blokkerend)"""
+    state = {'calls': 0, 'gate': None}
+
+    def build():
+        state['calls'] += 1
+        if state['gate']:
+            state['gate'].wait(5)
+        return {'calls': state['calls']}
+    monkeypatch.setitem(snapshots.BUILDERS, snapshots.ENTERPRISE, build)
+    return state
+
+
+class TestSnapshotStorage:
+
+    def test_versions_are_kept_and_pruned(self, builder, monkeypatch):
+        monkeypatch.setattr(snapshots.Config, 'DASHBOARD_SNAPSHOT_VERSIONS', 3)
+        for expected in range(1, 6):
+            assert snapshots.refresh(snapshots.ENTERPRISE)['version'] == expected
+
+        versions = db.get_dashboard_snapshot_versions(snapshots.ENTERPRISE)
+        assert [v['version'] for v in versions] == [5, 4, 3]
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE, 4)['payload'] == {'calls': 4}
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE, 1) is None
+
+    def test_enterprise_payload_is_serializable(self, temp_db, sample_customer):
+        snapshot = snapshots.refresh(snapshots.ENTERPRISE)
+        payload = snapshot['payload']
+        assert {'health_status', 'business_metrics', 'customer_grades', 'quality_metrics',
+                'marketing_summary', 'sigma_belt'} <= set(payload)
+        assert snapshot['stale_since'] is None and snapshot['duration_ms'] >= 0
+
+
+class TestStaleness:
+
+    def test_customer_changes_mark_latest_stale(self, builder):
+        snapshots.refresh(snapshots.ENTERPRISE)
+        customer = db.create_customer('Nieuwe Klant BV')
+        stale = snapshots.get_snapshot(snapshots.ENTERPRISE)
+        assert stale['stale_since'] is not None and stale['stale_seconds'] >= 0
+
+        snapshots.refresh(snapshots.ENTERPRISE)
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE)['stale_since'] is None
+        db.update_customer_tier(customer['id'], 'professional')
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE)['stale_since'] is not None
+
+    def test_max_age_makes_snapshot_stale(self, builder, monkeypatch):
+        snapshots.refresh(snapshots.ENTERPRISE)
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE)['stale_since'] is None
+        monkeypatch.setattr(snapshots.Config, 'DASHBOARD_SNAPSHOT_MAX_AGE', -1)
+        assert snapshots.get_snapshot(snapshots.ENTERPRISE)['stale_since'] is not None
+
+
+class TestGetOrRefresh:
+
+    def test_first_request_builds_then_serves_snapshot(self, builder):
+        assert snapshots.get_or_refresh(snapshots.ENTERPRISE)['payload'] == {'calls': 1}
+        assert snapshots.get_or_refresh(snapshots.ENTERPRISE)['payload'] == {'calls': 1}
+        assert builder['calls'] == 1
+
+    def test_stale_snapshot_served_while_single_background_refresh_runs(self, builder):
+        snapshots.refresh(snapshots.ENTERPRISE)
+        db.mark_dashboard_snapshots_stale()
+        builder['gate'] = threading.Event()
+
+        start = time.monotonic()
+        served = [snapshots.get_or_refresh(snapshots.ENTERPRISE) for _ in range(5)]
+        assert time.monotonic() - start < 1  # Niet op de builder gewacht
+        assert all(s['version'] == 1 and s['refreshing'] for s in served)
+
+        builder['gate'].set()
+        deadline = time.monotonic() + 5
+        while snapshots.get_snapshot(snapshots.ENTERPRISE)['version'] == 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        fresh = snapshots.get_or_refresh(snapshots.ENTERPRISE)
+        assert fresh['version'] == 2 and fresh['stale_since'] is None
+        assert builder['calls'] == 2  # Eén refresh ondanks vijf requests
@@ -81,6 +81,62 @@ class TestGetDb:
             assert row['contact_email'] == 'dict@test.com'
 
 
+class TestConnectionPool:
+    """Test de gepoolde connecties achter get_db"""
+
+    def test_connection_is_reused(self, temp_db):
+        with db.get_db() as conn:
+            first = conn
+        with db.get_db() as conn:
+            assert conn is first
+        stats = db.get_pool_stats()
+        assert stats['hits'] >= 1
+        assert stats['misses'] >= 1
+
+    def test_nested_get_db_uses_separate_connections(self, temp_db):
+        with db.get_db() as outer:
+            with db.get_db() as inner:
+                assert inner is not outer
+
+    def test_pragmas_set_on_pooled_connection(self, temp_db):
+        with db.get_db() as conn:
+            pass
+        with db.get_db() as conn:
+            assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+
+    def test_connection_recycled_after_max_uses(self, tmp_path):
+        pool = db.ConnectionPool(str(tmp_path / 'pool.db'), max_size=2, max_uses=2)
+        entry = pool.checkout()
+        pool.checkin(entry)
+        assert pool.checkout() is entry
+        pool.checkin(entry)
+        assert pool.stats()['recycled'] == 1
+        assert pool.checkout() is not entry
+
+    def test_broken_connection_discarded(self, tmp_path):
+        pool = db.ConnectionPool(str(tmp_path / 'pool.db'), health_check_interval=0)
+        entry = pool.checkout()
+        pool.checkin(entry)
+        entry.conn.close()
+        fresh = pool.checkout()
+        assert fresh is not entry
+        assert fresh.conn.execute('SELECT 1').fetchone()[0] == 1
+        assert pool.stats()['health_check_failures'] == 1
+
+    def test_checkout_waits_then_overflows_when_full(self, tmp_path):
+        pool = db.ConnectionPool(str(tmp_path / 'pool.db'), max_size=1, timeout=0.01)
+        first = pool.checkout()
+        second = pool.checkout()
+        assert second is not first
+        stats = pool.stats()
+        assert stats['waits'] == 1
+        assert stats['overflows'] == 1
+        pool.checkin(second)
+        pool.checkin(first)
+        assert pool.stats()['open_connections'] == 1
+
+
 class TestInitDb:
     """Test database initialisatie"""
 
@@ -215,6 +271,386 @@ class TestApiKeyOperations:
                 )
 
 
+class TestApiKeyCache:
+    """Test gecachte API key verificatie en gebatchte usage flush"""
+
+    def test_verify_hits_cache_without_db_query(self, sample_customer, temp_db):
+        key = db.create_api_key(sample_customer['id'])
+        assert db.verify_api_key(key) == sample_customer['id']
+        with patch.object(db, '_lookup_api_key') as lookup:
+            assert db.verify_api_key(key) == sample_customer['id']
+            lookup.assert_not_called()
+        assert db.get_api_key_cache_stats()['hits'] == 1
+
+    def test_verify_does_not_write_per_request(self, sample_customer, temp_db):
+        key = db.create_api_key(sample_customer['id'])
+        for _ in range(3):
+            db.verify_api_key(key)
+        with db.get_db() as conn:
+            row = conn.execute(
+                "SELECT last_used_at, usage_count FROM api_keys WHERE key_value = ?", (key,)
+            ).fetchone()
+        assert row['last_used_at'] is None
+        assert row['usage_count'] == 0
+
+    def test_flush_writes_batched_usage(self, sample_customer, temp_db):
+        key = db.create_api_key(sample_customer['id'])
+        for _ in range(3):
+            db.verify_api_key(key)
+        assert db.flush_api_key_usage() == 1
+        with db.get_db() as conn:
+            row = conn.execute(
+                "SELECT last_used_at, usage_count FROM api_keys WHERE key_value = ?", (key,)
+            ).fetchone()
+        assert row['last_used_at'] is not None
+        assert row['usage_count'] == 3
+
+    def test_last_used_is_utc(self, sample_customer, temp_db):
+        # Host in een andere tijdzone: last_used_at blijft UTC, net als CURRENT_TIMESTAMP
+        original_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Etc/GMT-5'
+        time.tzset()
+        try:
+            key = db.create_api_key(sample_customer['id'])
+            db.verify_api_key(key)
+            db.flush_api_key_usage()
+        finally:
+            if original_tz is None:
+                os.environ.pop('TZ')
+            else:
+                os.environ['TZ'] = original_tz
+            time.tzset()
+        with db.get_db() as conn:
+            drift = conn.execute(
+                "SELECT ABS(julianday(last_used_at) - julianday('now')) * 86400 FROM api_keys WHERE key_value = ?",
+                (key,)
+            ).fetchone()[0]
+        assert drift < 60
+
+    def test_revoke_invalidates_cache(self, sample_customer, temp_db):
+        key = db.create_api_key(sample_customer['id'])
+        assert db.verify_api_key(key) == sample_customer['id']
+        key_id = db.get_customer_api_keys(sample_customer['id'])[0]['id']
+        db.revoke_api_key(key_id)
+        assert db.verify_api_key(key) is None
+
+    def test_ttl_and_lru_eviction(self):
+        cache = db.ApiKeyCache(ttl=60, max_size=2, flush_interval=30)
+        cache.put('a', 1, 10)
+        cache.put('b', 2, 20)
+        cache.get('a')
+        cache.put('c', 3, 30)
+        assert cache.get('b') is None
+        assert cache.get('a') == (1, 10)
+        assert cache.stats()['evictions'] == 1
+
+        expired = db.ApiKeyCache(ttl=0, max_size=2, flush_interval=30)
+        expired.put('a', 1, 10)
+        time.sleep(0.01)
+        assert expired.get('a') is None
+
+
+class TestCustomerStatsCache:
+    """Test request memo en TTL cache rond get_customer_stats"""
+
+    def test_cached_between_calls(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_log(cid, '10.0.0.1', '{}')
+        assert db.get_customer_stats(cid)['total_logs'] == 1
+        with patch.object(db, '_query_customer_stats') as query:
+            assert db.get_customer_stats(cid)['total_logs'] == 1
+            query.assert_not_called()
+
+    def test_insert_invalidates(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_log(cid, '10.0.0.1', '{}')
+        assert db.get_customer_stats(cid)['total_logs'] == 1
+        db.create_logs_bulk(cid, '10.0.0.1', ['{}'] * 3)
+        assert db.get_customer_stats(cid)['total_logs'] == 4
+        db.create_log(cid, '10.0.0.1', '{}')
+        assert db.get_customer_stats(cid)['total_logs'] == 5
+
+    def test_request_memo_queries_once(self, sample_customer):
+        from flask import Flask
+        cid = sample_customer['id']
+        with patch.object(db._stats_cache, 'ttl', 0):
+            with Flask(__name__).test_request_context('/'):
+                with patch.object(db, '_query_customer_stats', wraps=db._query_customer_stats) as query:
+                    db.get_customer_stats(cid)
+                    db.get_customer_stats(cid)
+                    assert query.call_count == 1
+                    db.create_log(cid, '10.0.0.1', '{}')
+                    assert db.get_customer_stats(cid)['total_logs'] == 1
+                    assert query.call_count == 2
+
+    def test_returned_dict_is_a_copy(self, sample_customer):
+        cid = sample_customer['id']
+        db.get_customer_stats(cid)['total_logs'] = 999
+        assert db.get_customer_stats(cid)['total_logs'] == 0
+
+    def test_stale_result_not_stored_after_invalidate(self):
+        cache = db.StatsCache(ttl=60)
+        generation = cache.generation(1)
+        cache.invalidate([1])
+        cache.put(1, {'total_logs': 0}, generation)
+        assert cache.get(1) is None
+
+
+class TestLogOperations:
+    """Test log insert operaties"""
+
+    def test_create_logs_bulk_returns_id_range(self, sample_customer):
+        ids = db.create_logs_bulk(sample_customer['id'], '10.0.0.1', ['{"a": 1}', '{"a": 2}', '{"a": 3}'])
+        assert len(ids) == 3
+        assert list(ids) == list(range(ids[0], ids[0] + 3))
+        with db.get_db() as conn:
+            rows = conn.execute(
+                'SELECT id, data, ip_address FROM logs WHERE customer_id = ? ORDER BY id',
+                (sample_customer['id'],)
+            ).fetchall()
+        assert [row['id'] for row in rows] == list(ids)
+        assert rows[2]['data'] == '{"a": 3}'
+        assert rows[0]['ip_address'] == '10.0.0.1'
+
+    def test_create_logs_bulk_with_metadata(self, sample_customer):
+        ids = db.create_logs_bulk(sample_customer['id'], 'sync', [('{"x": 1}', '{"source": "test"}')])
+        with db.get_db() as conn:
+            row = conn.execute('SELECT metadata FROM logs WHERE id = ?', (ids[0],)).fetchone()
+        assert row['metadata'] == '{"source": "test"}'
+
+    def test_create_logs_bulk_empty(self, sample_customer):
+        assert len(db.create_logs_bulk(sample_customer['id'], '10.0.0.1', [])) == 0
+
+    def test_create_logs_bulk_is_atomic(self, sample_customer):
+        with pytest.raises(sqlite3.IntegrityError):
+            db.create_logs_bulk(sample_customer['id'], '10.0.0.1', ['{"ok": 1}', None])
+        with db.get_db() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+        assert count == 0
+
+
+class TestKeysetPagination:
+    """Test cursor paginatie op (timestamp, id)"""
+
+    @pytest.fixture
+    def logs(self, sample_customer):
+        cid = sample_customer['id']
+        with db.get_db() as conn:
+            # Meerdere logs per timestamp om de id tie-breaker te testen
+            conn.executemany(
+                "INSERT INTO logs (customer_id, timestamp, ip_address, data) VALUES (?, ?, ?, ?)",
+                [(cid, f'2024-01-01 00:00:{i // 3:02d}', '10.0.0.1', f'log-{i}') for i in range(25)]
+            )
+        return cid
+
+    def test_pages_cover_all_logs_in_order(self, logs):
+        expected = [row['id'] for row in db.get_customer_logs(logs, limit=100)]
+        seen, cursor = [], None
+        while True:
+            page = db.get_customer_logs_page(logs, limit=7, cursor=cursor)
+            seen += [log['id'] for log in page['logs']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert seen == expected
+
+    def test_first_page_has_no_prev_cursor(self, logs):
+        page = db.get_customer_logs_page(logs, limit=10)
+        assert page['prev_cursor'] is None
+        assert page['next_cursor'] is not None
+
+    def test_prev_cursor_returns_previous_page(self, logs):
+        first = db.get_customer_logs_page(logs, limit=10)
+        second = db.get_customer_logs_page(logs, limit=10, cursor=first['next_cursor'])
+        back = db.get_customer_logs_page(logs, limit=10, cursor=second['prev_cursor'])
+        assert [l['id'] for l in back['logs']] == [l['id'] for l in first['logs']]
+        assert back['prev_cursor'] is None
+
+    def test_matches_offset_pagination(self, logs):
+        first = db.get_customer_logs_page(logs, limit=10)
+        second = db.get_customer_logs_page(logs, limit=10, cursor=first['next_cursor'])
+        assert second['logs'] == db.get_customer_logs(logs, limit=10, offset=10)
+
+    def test_all_logs_page_includes_customer_name(self, logs):
+        page = db.get_all_logs_page(limit=5)
+        assert page['logs'][0]['customer_name'] == 'Test Bedrijf BV'
+        assert page['next_cursor'] is not None
+
+    def test_invalid_cursor_raises(self, logs):
+        with pytest.raises(db.InvalidCursor):
+            db.get_customer_logs_page(logs, cursor='not-a-cursor')
+
+
+class TestFullTextSearch:
+    """Test FTS5 zoeken in logs.data"""
+
+    @pytest.fixture
+    def logs(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', [
+            '{"action": "container_arrived", "container_id": "CONT-1234"}',
+            '{"action": "shipment_sent", "tracking": "TR12345"}',
+            '{"note": "container container container"}',
+            '{"note": "<b>vrachtwagen</b> geladen"}',
+        ])
+        return cid
+
+    def test_search_ranks_best_match_first(self, logs):
+        results = db.search_logs('container', customer_id=logs)
+        assert len(results) == 2
+        assert 'container container container' in results[0]['data']
+        assert results[0]['score'] <= results[1]['score']
+
+    def test_customer_id_is_not_searched_as_text(self, logs):
+        assert db.search_logs(str(logs), customer_id=logs) == []
+
+    def test_phrase_and_prefix_queries(self, logs):
+        assert len(db.search_logs('"CONT-1234"', customer_id=logs)) == 1
+        assert len(db.search_logs('ship*', customer_id=logs)) == 1
+        assert len(db.search_logs('container OR shipment', customer_id=logs)) == 3
+
+    def test_snippet_highlighting_and_escaping(self, logs):
+        from markupsafe import escape
+        result = db.search_logs_page('vrachtwagen', customer_id=logs, escape=escape)['results'][0]
+        assert '<mark>vrachtwagen</mark>' in result['snippet']
+        assert '&lt;b&gt;' in result['snippet']
+
+    def test_search_is_scoped_to_customer(self, logs):
+        other = db.create_customer('Ander BV')
+        db.create_log(other['id'], '10.0.0.2', '{"action": "container_lost"}')
+        assert all(r['customer_id'] == logs for r in db.search_logs('container', customer_id=logs))
+        assert len(db.search_logs('container')) == 3
+
+    def test_cursor_pagination(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', [f'{{"pallet": {i}}}' for i in range(12)])
+        first = db.search_logs_page('pallet', customer_id=cid, limit=5)
+        second = db.search_logs_page('pallet', customer_id=cid, limit=5, cursor=first['next_cursor'])
+        third = db.search_logs_page('pallet', customer_id=cid, limit=5, cursor=second['next_cursor'])
+        ids = [r['id'] for page in (first, second, third) for r in page['results']]
+        assert len(ids) == len(set(ids)) == 12
+        assert third['next_cursor'] is None
+
+    def test_inserts_between_pages_do_not_skip_or_repeat(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', [f'{{"pallet": {i}, "note": "{"x " * i}"}}' for i in range(10)])
+        first = db.search_logs_page('pallet', customer_id=cid, limit=5)
+        # Betere treffers en extra documenten verschuiven bm25 van alle bestaande rijen
+        db.create_logs_bulk(cid, '10.0.0.1', ['{"pallet": "pallet pallet"}'] * 3 + ['{"other": 1}'] * 20)
+        second = db.search_logs_page('pallet', customer_id=cid, limit=5, cursor=first['next_cursor'])
+        ids = [r['id'] for page in (first, second) for r in page['results']]
+        assert len(ids) == len(set(ids)) == 10
+        assert second['next_cursor'] is None
+
+    def test_search_cursor_is_bound_to_query_and_customer(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', ['{"pallet": 1}'] * 6)
+        cursor = db.search_logs_page('pallet', customer_id=cid, limit=5)['next_cursor']
+        other = db.create_customer('Ander BV')['id']
+        with pytest.raises(db.InvalidCursor):
+            db.search_logs_page('pallet', customer_id=other, cursor=cursor)
+        with pytest.raises(db.InvalidCursor):
+            db.search_logs_page('container', customer_id=cid, cursor=cursor)
+
+    def test_expired_search_cursor_is_invalid(self, sample_customer, monkeypatch):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', ['{"pallet": 1}'] * 6)
+        monkeypatch.setattr(db, 'SEARCH_SNAPSHOT_TTL', -1)
+        cursor = db.search_logs_page('pallet', customer_id=cid, limit=5)['next_cursor']
+        with pytest.raises(db.InvalidCursor):
+            db.search_logs_page('pallet', customer_id=cid, cursor=cursor)
+
+    def test_special_characters_do_not_break_query(self, logs):
+        assert db.search_logs('AND ( NOT "', customer_id=logs) == []
+
+    def test_rebuild_backfills_existing_logs(self, logs):
+        with db.get_db() as conn:
+            conn.execute("INSERT INTO logs_fts (logs_fts) VALUES ('delete-all')")
+        assert db.search_logs('container', customer_id=logs) == []
+        db.rebuild_log_search_index()
+        assert len(db.search_logs('container', customer_id=logs)) == 2
+
+
+class TestLogRollups:
+    """Test materialized log rollups (trigger + catch-up rebuild)"""
+
+    def _insert(self, customer_id, timestamp, ip):
+        with db.get_db() as conn:
+            conn.execute(
+                "INSERT INTO logs (customer_id, timestamp, ip_address, data) VALUES (?, ?, ?, ?)",
+                (customer_id, timestamp, ip, '{}')
+            )
+
+    def _rollups(self, customer_id):
+        with db.get_db() as conn:
+            daily = [tuple(r) for r in conn.execute(
+                "SELECT bucket, log_count, distinct_ips, first_ts, last_ts FROM log_rollups_daily "
+                "WHERE customer_id = ? ORDER BY bucket", (customer_id,))]
+            hourly = [tuple(r) for r in conn.execute(
+                "SELECT bucket, log_count FROM log_rollups_hourly WHERE customer_id = ? ORDER BY bucket",
+                (customer_id,))]
+        return daily, hourly
+
+    def test_insert_trigger_maintains_rollups(self, sample_customer):
+        cid = sample_customer['id']
+        self._insert(cid, '2024-03-01 09:15:00', '10.0.0.1')
+        self._insert(cid, '2024-03-01 09:45:00', '10.0.0.1')
+        self._insert(cid, '2024-03-01 14:00:00', '10.0.0.2')
+        self._insert(cid, '2024-03-02 08:00:00', '10.0.0.3')
+
+        daily, hourly = self._rollups(cid)
+        assert daily == [
+            ('2024-03-01', 3, 2, '2024-03-01 09:15:00', '2024-03-01 14:00:00'),
+            ('2024-03-02', 1, 1, '2024-03-02 08:00:00', '2024-03-02 08:00:00'),
+        ]
+        assert hourly == [
+            ('2024-03-01 09:00:00', 2),
+            ('2024-03-01 14:00:00', 1),
+            ('2024-03-02 08:00:00', 1),
+        ]
+
+    def test_bulk_insert_updates_rollups(self, sample_customer):
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', ['{"a": 1}'] * 25)
+        stats = db.get_customer_stats(cid)
+        assert stats['total_logs'] == 25
+        assert stats['logs_today'] == 25
+        assert stats['logs_week'] == 25
+
+    def test_rebuild_matches_trigger(self, sample_customer):
+        cid = sample_customer['id']
+        for i in range(10):
+            self._insert(cid, f'2024-03-0{i % 3 + 1} 1{i % 4}:00:00', f'10.0.0.{i % 5}')
+        before = self._rollups(cid)
+        with db.get_db() as conn:
+            conn.execute('DELETE FROM log_rollups_daily')
+        db.rebuild_log_rollups(cid)
+        assert self._rollups(cid) == before
+
+    def test_stats_match_raw_logs(self, sample_customer):
+        cid = sample_customer['id']
+        self._insert(cid, '2024-01-05 10:00:00', '10.0.0.1')
+        db.create_log(cid, '10.0.0.2', '{}')
+        stats = db.get_customer_stats(cid)
+        with db.get_db() as conn:
+            raw = conn.execute(
+                "SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM logs WHERE customer_id = ?", (cid,)
+            ).fetchone()
+        assert (stats['total_logs'], stats['first_log'], stats['last_log']) == tuple(raw)
+        assert stats['logs_today'] == 1
+
+    def test_customer_analytics_reads_rollups(self, sample_customer):
+        import analytics
+        cid = sample_customer['id']
+        db.create_logs_bulk(cid, '10.0.0.1', ['{}'] * 3)
+        db.create_log(cid, '10.0.0.2', '{}')
+        result = analytics.get_customer_analytics(cid)
+        assert sum(d['count'] for d in result['daily_activity']) == 4
+        assert sum(h['count'] for h in result['hourly_distribution']) == 4
+        assert result['top_ips'][0] == {'ip': '10.0.0.1', 'count': 3}
+        assert result['current_week_logs'] == 4
+
+
 class TestRetryOnLocked:
     """Test de retry_on_locked decorator"""
 
@@ -0,0 +1,105 @@
+"""
+Tests voor exports.py - Streaming CSV / NDJSON / JSON exports
+"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from flask import Flask, request
+
+import database as db
+import exports
+
+
+@pytest.fixture
+def many_logs(sample_customer):
+    cid = sample_customer['id']
+    db.create_logs_bulk(cid, '10.0.0.1', [json.dumps({'n': i}) for i in range(1234)])
+    return cid
+
+
+@pytest.fixture
+def flask_app():
+    return Flask(__name__)
+
+
+class TestLogIterators:
+    """Test keyset chunked iteratie over logs"""
+
+    def test_iter_customer_logs_yields_everything(self, many_logs):
+        ids = [log['id'] for log in db.iter_customer_logs(many_logs, chunk_size=100)]
+        assert len(ids) == 1234
+        assert ids == sorted(ids, reverse=True)
+
+    def test_iter_customer_logs_respects_limit(self, many_logs):
+        assert len(list(db.iter_customer_logs(many_logs, chunk_size=100, limit=250))) == 250
+
+    def test_iter_all_logs_includes_customer_name(self, many_logs):
+        first = next(db.iter_all_logs(chunk_size=10))
+        assert first['customer_name'] == 'Test Bedrijf BV'
+
+
+class TestFormatStreams:
+    """Test de format generators"""
+
+    def test_csv_stream_is_chunked_and_valid(self, many_logs):
+        chunks = list(exports.csv_stream(
+            ['ID', 'Data'],
+            db.iter_customer_logs(many_logs, chunk_size=100),
+            lambda log: [log['id'], log['data']]
+        ))
+        assert len(chunks) > 1
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        assert rows[0] == ['ID', 'Data']
+        assert len(rows) == 1235
+
+    def test_ndjson_stream_one_object_per_line(self):
+        body = b''.join(exports.ndjson_stream({'i': i} for i in range(3))).decode()
+        assert [json.loads(line) for line in body.splitlines()] == [{'i': 0}, {'i': 1}, {'i': 2}]
+
+    def test_json_document_stream_is_valid_json(self):
+        body = b''.join(exports.json_document_stream(
+            {'customer': {'id': 1}}, 'logs', ({'i': i} for i in range(1200)), count_key='log_count'
+        ))
+        doc = json.loads(body)
+        assert doc['customer'] == {'id': 1}
+        assert doc['log_count'] == 1200
+        assert doc['logs'][-1] == {'i': 1199}
+
+    def test_json_document_stream_empty(self):
+        doc = json.loads(b''.join(exports.json_document_stream({}, 'logs', [], count_key='n')))
+        assert doc == {'logs': [], 'n': 0}
+
+    def test_gzip_stream_roundtrip(self):
+        chunks = [b'a,b\n' * 1000, b'c,d\n' * 1000]
+        assert gzip.decompress(b''.join(exports.gzip_stream(chunks))) == b''.join(chunks)
+
+
+class TestStreamingResponse:
+    """Test Flask streaming response + optionele gzip"""
+
+    def _respond(self, flask_app, query='', headers=None, filename='export.csv'):
+        with flask_app.test_request_context(f'/export{query}', headers=headers or {}):
+            return exports.streaming_response(iter([b'a,b\n']), request, 'text/csv', filename=filename)
+
+    def test_plain_response_is_streamed(self, flask_app):
+        response = self._respond(flask_app)
+        assert response.is_streamed
+        assert response.headers['Content-Disposition'] == 'attachment; filename=export.csv'
+        assert 'Content-Encoding' not in response.headers
+
+    def test_gzip_content_encoding(self, flask_app):
+        response = self._respond(flask_app, '?gzip=1', {'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.response)) == b'a,b\n'
+
+    def test_gzip_without_accept_encoding_is_gz_download(self, flask_app):
+        response = self._respond(flask_app, '?gzip=1')
+        assert response.mimetype == 'application/gzip'
+        assert 'export.csv.gz' in response.headers['Content-Disposition']
+
+    def test_non_ascii_filename(self, flask_app):
+        response = self._respond(flask_app, filename='mvai_export_Café.csv')
+        assert "filename*=UTF-8''mvai_export_Caf%C3%A9.csv" in response.headers['Content-Disposition']
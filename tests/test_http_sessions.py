@@ -0,0 +1,31 @@
+"""
+Tests voor http_sessions.py - Sessions per thread voor achtergrond workers
+"""
+import threading
+
+from http_sessions import ThreadLocalSessions
+
+
+class TestThreadLocalSessions:
+    """Test hergebruik per thread en opruimen bij shutdown"""
+
+    def test_same_thread_reuses_session(self):
+        sessions = ThreadLocalSessions(headers={'User-Agent': 'test/1.0'})
+        assert sessions.get() is sessions.get()
+        assert sessions.get().headers['User-Agent'] == 'test/1.0'
+
+    def test_each_thread_gets_own_session(self):
+        sessions = ThreadLocalSessions()
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(sessions.get())) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(s) for s in seen}) == 3
+
+    def test_close_gives_fresh_session_afterwards(self):
+        sessions = ThreadLocalSessions()
+        first = sessions.get()
+        sessions.close()
+        assert sessions.get() is not first
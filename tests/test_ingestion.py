@@ -0,0 +1,106 @@
+"""
+Tests voor ingestion.py - Write-behind ingestion queue
+"""
+import pytest
+from unittest.mock import patch
+
+import database as db
+import ingestion
+from config import Config
+
+
+def _count_logs(customer_id):
+    with db.get_db() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM logs WHERE customer_id = ?', (customer_id,)
+        ).fetchone()[0]
+
+
+@pytest.fixture
+def ingest_queue(temp_db):
+    """Losse queue instantie; wordt na de test gestopt"""
+    q = ingestion.LogIngestionQueue(max_size=100, batch_size=50, flush_interval_ms=20)
+    yield q
+    q.stop()
+
+
+class TestLogIngestionQueue:
+    """Test de queue + writer thread"""
+
+    def test_durable_submit_returns_log_id(self, ingest_queue, sample_customer):
+        cid = sample_customer['id']
+        pending = ingest_queue.submit(cid, '1.2.3.4', '{"a": 1}')
+        log_id = pending.wait(5)
+        assert log_id is not None
+        logs = db.get_customer_logs(cid)
+        assert logs[0]['id'] == log_id
+        assert logs[0]['data'] == '{"a": 1}'
+
+    def test_burst_is_group_committed(self, ingest_queue, sample_customer):
+        cid = sample_customer['id']
+        handles = [ingest_queue.submit(cid, '1.2.3.4', f'entry-{i}') for i in range(40)]
+        ids = [h.wait(5) for h in handles]
+        assert len(set(ids)) == 40
+        stats = ingest_queue.stats()
+        assert stats['written'] == 40
+        assert stats['flushes'] < 40
+
+    def test_stop_flushes_pending_entries(self, ingest_queue, sample_customer):
+        cid = sample_customer['id']
+        for i in range(10):
+            ingest_queue.submit(cid, '1.2.3.4', f'fast-{i}')
+        ingest_queue.stop()
+        assert _count_logs(cid) == 10
+        assert ingest_queue.stats()['depth'] == 0
+
+    def test_full_queue_raises(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        q = ingestion.LogIngestionQueue(max_size=2, batch_size=10, flush_interval_ms=20)
+        # Writer niet starten zodat de queue vol blijft
+        with patch.object(q, 'start'):
+            q.submit(cid, '1.2.3.4', 'a')
+            q.submit(cid, '1.2.3.4', 'b')
+            with pytest.raises(ingestion.IngestionQueueFull):
+                q.submit(cid, '1.2.3.4', 'c')
+        assert q.stats()['rejected'] == 1
+        q.stop()
+        assert _count_logs(cid) == 2
+
+    def test_bad_entry_does_not_fail_batch(self, ingest_queue, sample_customer):
+        cid = sample_customer['id']
+        good = ingest_queue.submit(cid, '1.2.3.4', 'good')
+        bad = ingest_queue.submit(cid, '1.2.3.4', None)
+        assert good.wait(5) is not None
+        with pytest.raises(Exception):
+            bad.wait(5)
+        assert ingest_queue.stats()['failed'] == 1
+
+
+class TestIngestLog:
+    """Test de module-level helpers"""
+
+    def test_disabled_writes_synchronously(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        with patch.object(Config, 'ENABLE_INGESTION_QUEUE', False):
+            log_id = ingestion.ingest_log(cid, '1.2.3.4', 'sync')
+            assert log_id is not None
+            assert ingestion.get_ingestion_stats() == {'enabled': False}
+
+    def test_enabled_durable_and_fast_ack(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        with patch.object(Config, 'ENABLE_INGESTION_QUEUE', True):
+            try:
+                assert ingestion.ingest_log(cid, '1.2.3.4', 'durable', ack='durable')
+                assert ingestion.ingest_log(cid, '1.2.3.4', 'fast', ack='fast') is None
+                stats = ingestion.get_ingestion_stats()
+                assert stats['enabled'] is True
+                assert stats['enqueued'] == 2
+            finally:
+                ingestion.shutdown()
+        assert _count_logs(cid) == 2
+
+    def test_ingest_logs_bulk(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        entries = [(cid, 'integration-sync', f'r{i}', None) for i in range(5)]
+        assert ingestion.ingest_logs(entries) == 5
+        assert _count_logs(cid) == 5
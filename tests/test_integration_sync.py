@@ -0,0 +1,238 @@
+"""
+Tests voor integration_sync.py - Incrementele sync tegen lokale mock API servers
+"""
+import json
+import time
+
+import pytest
+
+import database as db
+import integration_sync
+
+
+def shopify_api(orders):
+    def handle(path, query):
+        assert path == '/admin/api/2024-01/orders.json'
+        since_id, limit = int(query.get('since_id', 0)), int(query['limit'])
+        return {'orders': [o for o in orders if o['id'] > since_id][:limit]}, {}
+    return handle
+
+
+def woocommerce_api(orders):
+    def handle(path, query):
+        assert path == '/wp-json/wc/v3/orders' and query['orderby'] == 'modified'
+        matching = sorted((o for o in orders if o['date_modified_gmt'] >= query.get('modified_after', '')),
+                          key=lambda o: (o['date_modified_gmt'], o['id']))
+        per_page, page = int(query['per_page']), int(query['page'])
+        total_pages = max(1, -(-len(matching) // per_page))
+        return matching[(page - 1) * per_page:page * per_page], {'X-WP-TotalPages': str(total_pages)}
+    return handle
+
+
+@pytest.fixture
+def apis(http_server):
+    """Factory: apis(handle) met handle(path, query) -> (json body, headers)"""
+    def start(handle):
+        def respond(request):
+            if request['status'] != 200:
+                return request['status'], {'Retry-After': '0'}, {}
+            body, headers = handle(request['url_path'], request['query'])
+            return 200, headers, body
+        return http_server(respond)
+    return start
+
+
+@pytest.fixture
+def engine():
+    e = integration_sync.SyncEngine(workers=3, host_rate=0, page_size=100, max_pages=0, timeout=5)
+    e.retry_backoff = 0.01
+    yield e
+    e.shutdown()
+
+
+def _integration(customer_id, integration_type, config):
+    integration_id = db.create_integration(customer_id, integration_type, integration_type, config)
+    return db.get_integration(integration_id)
+
+
+def _synced_logs(integration_id):
+    with db.get_db() as conn:
+        rows = conn.execute("SELECT data, metadata FROM logs WHERE ip_address = 'integration-sync'").fetchall()
+    return [json.loads(r['data']) for r in rows if json.loads(r['metadata'])['integration_id'] == integration_id]
+
+
+class TestIncrementalSync:
+
+    def test_shopify_paginates_and_fetches_only_new_orders(self, temp_db, sample_customer, engine, apis):
+        orders = [{'id': i, 'total': i * 10} for i in range(1, 251)]
+        api = apis(shopify_api(orders))
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url, 'api_key': 'k'})
+
+        assert engine.sync(intg) == 250
+        assert [r['query']['since_id'] for r in api.requests] == ['0', '100', '200']
+        assert json.loads(db.get_integration(intg['id'])['sync_cursor']) == {'since_id': 250}
+
+        # Geen nieuwe orders: één request, niets geschreven
+        assert engine.sync(intg) == 0
+        assert api.requests[-1]['query']['since_id'] == '250'
+
+        orders.extend({'id': i, 'total': 0} for i in range(251, 256))
+        assert engine.sync(intg) == 5
+        assert len(_synced_logs(intg['id'])) == 255
+        assert db.get_integration(intg['id'])['status'] == 'active'
+
+    def test_woocommerce_inclusive_cursor_skips_boundary_duplicates(self, temp_db, sample_customer, engine, apis):
+        orders = [{'id': i, 'date_modified_gmt': f'2025-01-01T00:00:{i // 2:02d}'} for i in range(1, 151)]
+        api = apis(woocommerce_api(orders))
+        intg = _integration(sample_customer['id'], 'woocommerce', {'store_url': api.url, 'consumer_key': 'ck'})
+
+        assert engine.sync(intg) == 150
+        cursor = json.loads(db.get_integration(intg['id'])['sync_cursor'])['modified']
+        assert cursor == {'value': '2025-01-01T00:00:75', 'ids': ['150']}
+
+        # Order 149 krijgt dezelfde grens-timestamp, 151 is nieuw; 150 komt terug maar is al binnen
+        orders[148]['date_modified_gmt'] = '2025-01-01T00:00:75'
+        orders.append({'id': 151, 'date_modified_gmt': '2025-01-01T00:01:00'})
+        assert engine.sync(intg) == 2
+        assert api.requests[-1]['query']['modified_after'] == '2025-01-01T00:00:75'
+        assert sorted(o['id'] for o in _synced_logs(intg['id']))[-3:] == [149, 150, 151]
+
+    def test_generic_wms_cursor_field(self, temp_db, sample_customer, engine, apis):
+        stock = [{'sku': f'SKU{i}', 'changed': f'2025-02-{i:02d}'} for i in range(1, 21)]
+
+        def handle(path, query):
+            rows = [s for s in stock if s['changed'] >= query.get('since', '')]
+            per_page, page = int(query['per_page']), int(query['page'])
+            return rows[(page - 1) * per_page:page * per_page], {}
+
+        api = apis(handle)
+        engine.page_size = 8
+        intg = _integration(sample_customer['id'], 'wms_generic', {
+            'base_url': api.url, 'api_key': 'x', 'cursor_field': 'changed', 'id_field': 'sku', 'since_param': 'since',
+        })
+        assert engine.sync(intg) == 20
+        assert len(api.requests) == 3
+        assert engine.sync(intg) == 0
+        assert api.requests[-1]['query']['since'] == '2025-02-20'
+
+    def test_afas_without_cursor_field_never_duplicates(self, temp_db, sample_customer, engine, apis):
+        articles = [{'Id': i, 'Voorraad': i} for i in range(1, 26)]
+
+        def handle(path, query):
+            skip, take = int(query['skip']), int(query['take'])
+            return {'rows': articles[skip:skip + take]}, {}
+
+        api = apis(handle)
+        engine.page_size = 10
+        intg = _integration(sample_customer['id'], 'afas', {'environment_url': api.url, 'api_token': 't'})
+
+        assert engine.sync(intg) == 25
+        assert engine.sync(intg) == 0
+        assert len(_synced_logs(intg['id'])) == 25
+
+        # Gewijzigde en nieuwe rijen komen wel binnen
+        articles[0]['Voorraad'] = 99
+        articles.append({'Id': 26, 'Voorraad': 26})
+        assert engine.sync(intg) == 2
+        assert len(_synced_logs(intg['id'])) == 27
+
+    def test_afas_full_pull_resumes_after_max_pages(self, temp_db, sample_customer, engine, apis):
+        def handle(path, query):
+            skip, take = int(query['skip']), int(query['take'])
+            return {'rows': [{'Id': i} for i in range(1, 31)][skip:skip + take]}, {}
+
+        api = apis(handle)
+        engine.page_size, engine.max_pages = 10, 2
+        intg = _integration(sample_customer['id'], 'afas', {'environment_url': api.url, 'api_token': 't'})
+
+        assert engine.sync(intg) == 20
+        assert json.loads(db.get_integration(intg['id'])['sync_cursor']) == {'skip': 20}
+        assert engine.sync(intg) == 10
+        assert json.loads(db.get_integration(intg['id'])['sync_cursor']) == {'skip': 0}
+        assert engine.sync(intg) == 0
+        assert len(_synced_logs(intg['id'])) == 30
+
+    def test_generic_wms_records_without_cursor_field(self, temp_db, sample_customer, engine, apis):
+        api = apis(lambda path, query: ([{'sku': f'SKU{i}'} for i in range(5)], {}))
+        intg = _integration(sample_customer['id'], 'wms_generic', {'base_url': api.url, 'api_key': 'x'})
+        assert engine.sync(intg) == 5
+        assert engine.sync(intg) == 0
+        assert len(_synced_logs(intg['id'])) == 5
+
+    def test_failure_keeps_committed_pages_and_resumes(self, temp_db, sample_customer, engine, apis):
+        api = apis(shopify_api([{'id': i} for i in range(1, 301)]))
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+
+        api.statuses = [200] + [500] * 4  # Tweede pagina faalt ook na retries
+        with pytest.raises(integration_sync.SyncError):
+            engine.sync(intg)
+        stored = db.get_integration(intg['id'])
+        assert stored['status'] == 'error'
+        assert json.loads(stored['sync_cursor']) == {'since_id': 100}
+
+        assert engine.sync(intg) == 200
+        assert len(_synced_logs(intg['id'])) == 300
+
+    def test_retry_after_on_rate_limit(self, temp_db, sample_customer, engine, apis):
+        api = apis(shopify_api([{'id': 1}]))
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+        api.statuses = [429]
+        assert engine.sync(intg) == 1
+        assert engine.stats()['retries'] == 1
+
+
+class TestParallelSync:
+
+    def test_bounded_concurrency_across_integrations(self, temp_db, sample_customer, engine, apis):
+        api = apis(shopify_api([{'id': 1}]))
+        api.delay = 0.2
+        integrations = [_integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+                        for _ in range(6)]
+
+        start = time.monotonic()
+        results = engine.sync_many(integrations)
+        elapsed = time.monotonic() - start
+        assert all(r == {'success': True, 'records': 1} for r in results.values())
+        assert api.max_active == 3  # workers=3
+        assert elapsed < 6 * 0.2
+
+    def test_same_integration_never_runs_twice(self, temp_db, sample_customer, engine, apis):
+        api = apis(shopify_api([{'id': 1}]))
+        api.delay = 0.2
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+        first, second = engine.submit(intg), engine.submit(dict(intg))
+        assert sorted([first.result(), second.result()]) == [0, 1]
+        assert engine.stats()['skipped_running'] == 1
+        assert len(_synced_logs(intg['id'])) == 1
+
+    def test_sync_all_uses_stored_integrations(self, temp_db, sample_customer, apis, monkeypatch):
+        api = apis(shopify_api([{'id': 1}, {'id': 2}]))
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+        _integration(sample_customer['id'], 'smtp', {'smtp_host': 'x'})  # Geen sync type
+        monkeypatch.setattr(integration_sync.Config, 'INTEGRATION_SYNC_HOST_RPS', 0)
+        try:
+            assert integration_sync.sync_all() == {intg['id']: {'success': True, 'records': 2}}
+        finally:
+            integration_sync.shutdown()
+
+
+class TestHostRateLimiter:
+
+    def test_spacing_per_host_with_burst(self):
+        clock = [0.0]
+        waits = []
+        limiter = integration_sync.HostRateLimiter(2, burst=2, clock=lambda: clock[0], sleep=waits.append)
+        results = [limiter.acquire('a') for _ in range(4)]
+        assert results == [0.0, 0.0, 0.5, 1.0]
+        assert limiter.acquire('b') == 0.0  # Andere host heeft eigen budget
+        clock[0] = 10.0
+        assert limiter.acquire('a') == 0.0
+
+    def test_engine_respects_host_rate(self, temp_db, sample_customer, apis):
+        api = apis(shopify_api([{'id': i} for i in range(1, 6)]))
+        engine = integration_sync.SyncEngine(workers=1, host_rate=20, host_burst=1, page_size=1, max_pages=0)
+        intg = _integration(sample_customer['id'], 'shopify', {'shop_domain': api.url})
+        start = time.monotonic()
+        assert engine.sync(intg) == 5
+        assert time.monotonic() - start >= 5 * 0.05 - 0.01  # 6 requests, 1 per 50ms
+        engine.shutdown()
@@ -0,0 +1,139 @@
+"""
+Tests voor ip_matcher.py - CIDR radix trie en IPSecurityManager integratie
+"""
+import ipaddress
+import threading
+
+import pytest
+from unittest.mock import patch
+
+import database as db
+import shared_state
+from config import Config
+from ip_matcher import CompiledIPLists, IPMatcher, PrefixTrie
+
+
+class TestPrefixTrie:
+    """Longest-prefix-match per adresfamilie"""
+
+    def test_longest_prefix_wins(self):
+        trie = PrefixTrie(32)
+        trie.insert(ipaddress.ip_network('10.0.0.0/8'), 'wide')
+        trie.insert(ipaddress.ip_network('10.1.0.0/16'), 'narrow')
+        trie.insert(ipaddress.ip_network('10.1.2.3/32'), 'host')
+        assert trie.longest_match(int(ipaddress.ip_address('10.1.2.3'))) == 'host'
+        assert trie.longest_match(int(ipaddress.ip_address('10.1.9.9'))) == 'narrow'
+        assert trie.longest_match(int(ipaddress.ip_address('10.200.0.1'))) == 'wide'
+        assert trie.longest_match(int(ipaddress.ip_address('11.0.0.1'))) is None
+
+    def test_accept_skips_to_shorter_prefix(self):
+        trie = PrefixTrie(32)
+        trie.insert(ipaddress.ip_network('10.0.0.0/8'), 1)
+        trie.insert(ipaddress.ip_network('10.1.0.0/16'), 0)
+        address = int(ipaddress.ip_address('10.1.0.1'))
+        assert trie.longest_match(address, accept=lambda v: v > 0) == 1
+
+    def test_default_route(self):
+        trie = PrefixTrie(128)
+        trie.insert(ipaddress.ip_network('::/0'), 'any')
+        assert trie.longest_match(int(ipaddress.ip_address('2001:db8::1'))) == 'any'
+
+
+class TestCompiledIPLists:
+    """IPv4/IPv6 lists, ongeldige entries en atomische reload"""
+
+    def test_ipv4_and_ipv6(self):
+        lists = CompiledIPLists({'bl': [('192.0.2.0/24', 'v4'), ('2001:db8::/32', 'v6')]})
+        assert lists.lookup('bl', '192.0.2.77') == 'v4'
+        assert lists.lookup('bl', '2001:db8:1::5') == 'v6'
+        assert lists.lookup('bl', '::ffff:192.0.2.1') == 'v4'
+        assert lists.lookup('bl', '198.51.100.1') is None
+        assert lists.lookup('bl', 'not-an-ip') is None
+        assert lists.lookup('missing', '192.0.2.1') is None
+
+    def test_invalid_entries_are_skipped(self):
+        lists = CompiledIPLists({'wl': [('10.0.0.0/33', True), ('garbage', True), ('10.0.0.1', True)]})
+        assert lists.sizes() == {'wl': 1}
+        assert len(lists.invalid) == 2
+
+    def test_reload_swaps_atomically(self):
+        state = {'entries': [('10.0.0.0/8', True)]}
+        matcher = IPMatcher(lambda: {'wl': state['entries']})
+        matcher.reload()
+        assert matcher.lookup('wl', '10.1.1.1')
+
+        results = []
+
+        def reader():
+            for _ in range(2000):
+                results.append(matcher.lookup('wl', '10.1.1.1') or matcher.lookup('wl', '172.16.0.1'))
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for i in range(20):
+            state['entries'] = [('10.0.0.0/8', True)] if i % 2 else [('10.0.0.0/8', True), ('172.16.0.0/12', True)]
+            matcher.reload()
+        thread.join()
+        assert all(results)
+        assert matcher.stats()['reloads'] == 21
+
+
+class TestSecurityManagerCidr:
+    """IPSecurityManager evalueert CIDR ranges uit database en config"""
+
+    @pytest.fixture
+    def manager(self, temp_db):
+        from security import IPSecurityManager
+        return IPSecurityManager(backend=shared_state.MemoryBackend())
+
+    def test_blacklisted_cidr(self, manager):
+        manager.add_to_blacklist('203.0.113.0/24', 'Botnet range', duration_hours=1)
+        assert manager.is_blacklisted('203.0.113.99')
+        assert not manager.is_blacklisted('203.0.114.1')
+        assert manager.check_ip_reputation('203.0.113.5')['status'] == 'blocked'
+
+    def test_whitelisted_ipv6_range(self, manager):
+        manager.add_to_whitelist('2001:db8:abcd::/48', 'Office')
+        assert manager.is_whitelisted('2001:db8:abcd:12::1')
+        assert not manager.is_whitelisted('2001:db8:abce::1')
+
+    def test_expired_cidr_not_blocked(self, manager):
+        with db.get_db() as conn:
+            conn.execute(
+                "INSERT INTO ip_blacklist (ip_address, expires_at) VALUES ('198.51.100.0/24', datetime('now', '-1 hour'))"
+            )
+        manager.load_lists()
+        assert not manager.is_blacklisted('198.51.100.7')
+
+    def test_cleanup_reloads_trie(self, manager):
+        import security
+        manager.add_to_blacklist('192.0.2.0/24', 'test')
+        with db.get_db() as conn:
+            conn.execute("UPDATE ip_blacklist SET expires_at = datetime('now', '-1 minute')")
+        with patch.object(security, 'security_manager', manager):
+            assert security.cleanup_expired_blacklists() == 1
+        assert not manager.is_blacklisted('192.0.2.10')
+
+    def test_private_networks_and_config_ranges(self, manager, sample_customer):
+        with db.get_db() as conn:
+            conn.execute(
+                "INSERT INTO private_networks (network_cidr, customer_id, description) VALUES (?, ?, ?)",
+                ('100.64.0.0/10', sample_customer['id'], 'Klant VPN')
+            )
+        with patch.object(Config, 'ADMIN_IPS', ['198.51.100.0/28']), \
+                patch.object(Config, 'TRUSTED_IPS', ['192.0.2.1']):
+            manager.load_lists()
+            assert manager.get_private_network('100.64.1.1')['customer_id'] == sample_customer['id']
+            assert manager.is_admin_ip('198.51.100.3')
+            assert not manager.is_admin_ip('198.51.100.30')
+            assert manager.is_trusted('192.0.2.1')
+            assert manager.is_internal('192.168.1.10')
+
+    def test_other_worker_picks_up_cidr_change(self, temp_db):
+        from security import IPSecurityManager
+        backend = shared_state.MemoryBackend()
+        worker_a = IPSecurityManager(backend=backend)
+        worker_b = IPSecurityManager(backend=backend)
+        worker_a.add_to_blacklist('203.0.113.0/24', 'range')
+        with patch.object(Config, 'IP_LISTS_SYNC_SECONDS', 0):
+            assert worker_b.is_blacklisted('203.0.113.1')
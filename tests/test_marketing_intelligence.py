@@ -0,0 +1,142 @@
+"""
+Tests voor marketing_intelligence.py - Set-based en incrementele klant segmentatie
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db
+import marketing_intelligence as mi
+
+
+def _add_customer(conn, name, age_days, status='active'):
+    return conn.execute('''
+        INSERT INTO customers (name, access_code, status, created_at)
+        VALUES (?, ?, ?, datetime('now', ?))
+    ''', (name, f'CODE-{name}', status, f'-{age_days} days')).lastrowid
+
+
+def _add_logs(conn, customer_id, count, days_ago=0):
+    conn.executemany('''
+        INSERT INTO logs (customer_id, ip_address, data, timestamp)
+        VALUES (?, '1.2.3.4', 'x', datetime('now', ?))
+    ''', [(customer_id, f'-{days_ago} days')] * count)
+
+
+def _legacy_engagement(now=None):
+    """De oude N+1 implementatie (zonder display limiet), ter referentie"""
+    now = now or datetime.now()
+    segments = {k: [] for k in mi.ENGAGEMENT_SEGMENTS}
+    with db.get_db() as conn:
+        rows = conn.execute('''
+            SELECT c.id, c.name, c.created_at, COUNT(l.id) as log_count, MAX(l.timestamp) as last_activity
+            FROM customers c LEFT JOIN logs l ON c.id = l.customer_id
+            WHERE c.status = 'active' GROUP BY c.id, c.name
+        ''').fetchall()
+    for row in rows:
+        age_days = (now - datetime.fromisoformat(row['created_at'])).days
+        if age_days < 30:
+            segments['new_customers'].append(row['name'])
+        elif age_days > 180 and row['log_count'] > 100:
+            segments['loyal'].append(row['name'])
+        elif row['log_count'] > 50:
+            segments['champions'].append(row['name'])
+        elif row['log_count'] < 10 or (row['last_activity'] and
+                                       (now - datetime.fromisoformat(row['last_activity'])).days > 30):
+            segments['at_risk'].append(row['name'])
+    return segments
+
+
+def _stored_engagement():
+    with db.get_db() as conn:
+        rows = conn.execute('''
+            SELECT s.segment, c.name FROM customer_segments s JOIN customers c ON c.id = s.customer_id
+            WHERE s.segment IS NOT NULL ORDER BY s.customer_id
+        ''').fetchall()
+    segments = {k: [] for k in mi.ENGAGEMENT_SEGMENTS}
+    for row in rows:
+        segments[row['segment']].append(row['name'])
+    return segments
+
+
+@pytest.fixture
+def population(temp_db):
+    with db.get_db() as conn:
+        ids = {
+            'nieuw': _add_customer(conn, 'nieuw', 5),
+            'bijna_oud': _add_customer(conn, 'bijna_oud', 29),
+            'loyaal': _add_customer(conn, 'loyaal', 400),
+            'kampioen': _add_customer(conn, 'kampioen', 90),
+            'stil': _add_customer(conn, 'stil', 100),
+            'weggezakt': _add_customer(conn, 'weggezakt', 200),
+            'midden': _add_customer(conn, 'midden', 60),
+            'inactief': _add_customer(conn, 'inactief', 300, status='inactive'),
+        }
+        _add_logs(conn, ids['loyaal'], 120, days_ago=3)
+        _add_logs(conn, ids['kampioen'], 60, days_ago=1)
+        _add_logs(conn, ids['stil'], 3, days_ago=2)
+        _add_logs(conn, ids['weggezakt'], 20, days_ago=45)
+        _add_logs(conn, ids['midden'], 20, days_ago=25)
+        _add_logs(conn, ids['inactief'], 500)
+    return ids
+
+
+class TestSegmentation:
+
+    def test_matches_legacy_classification(self, population):
+        result = mi.get_customer_segments()
+        legacy = _legacy_engagement()
+        assert {k: v['customers'] for k, v in result['by_engagement'].items()} == legacy
+        assert {k: v['count'] for k, v in result['by_engagement'].items()} == {k: len(v) for k, v in legacy.items()}
+        assert legacy['at_risk'] == ['stil', 'weggezakt'] and legacy['loyal'] == ['loyaal']
+        assert result['total_segments'] == 4
+        assert sum(t['count'] for t in result['by_tier']) == 7
+
+    def test_display_list_capped_at_ten_with_full_count(self, temp_db):
+        with db.get_db() as conn:
+            for i in range(15):
+                _add_customer(conn, f'klant{i:02d}', 2)
+        new = mi.get_customer_segments()['by_engagement']['new_customers']
+        assert new['count'] == 15
+        assert new['customers'] == [f'klant{i:02d}' for i in range(10)]
+
+
+class TestIncrementalRefresh:
+
+    def test_only_changed_customers_are_revisited(self, population):
+        assert mi.refresh_customer_segments()['mode'] == 'full'
+        unchanged = mi.refresh_customer_segments()
+        assert (unchanged['mode'], unchanged['revisited'], unchanged['removed']) == ('incremental', 0, 0)
+
+        with db.get_db() as conn:
+            _add_logs(conn, population['stil'], 60)
+            nieuwkomer = _add_customer(conn, 'nieuwkomer', 1)
+            conn.execute("UPDATE customers SET status = 'inactive' WHERE id = ?", (population['kampioen'],))
+
+        run = mi.refresh_customer_segments()
+        assert (run['mode'], run['revisited'], run['removed']) == ('incremental', 2, 1)
+        with db.get_db() as conn:
+            segments = dict(conn.execute('SELECT customer_id, segment FROM customer_segments').fetchall())
+        assert segments[population['stil']] == 'champions'
+        assert segments[nieuwkomer] == 'new_customers'
+        assert population['kampioen'] not in segments
+        assert _stored_engagement() == _legacy_engagement()
+
+    @pytest.mark.parametrize('days_later', [1, 2, 7, 31, 152, 400])
+    def test_time_boundaries_match_full_recompute(self, population, days_later):
+        mi.refresh_customer_segments()
+        later = datetime.now() + timedelta(days=days_later)
+
+        mi.refresh_customer_segments(now=later)
+        incremental = _stored_engagement()
+        assert incremental == _legacy_engagement(later)
+
+        mi.refresh_customer_segments(full=True, now=later)
+        assert _stored_engagement() == incremental
+
+    def test_boundary_crossing_revisits_only_due_customers(self, population):
+        mi.refresh_customer_segments()
+        run = mi.refresh_customer_segments(now=datetime.now() + timedelta(days=2))
+        # 'bijna_oud' (29 dagen) wordt 30+ dagen oud: van new_customers naar at_risk
+        assert run['revisited'] == 1
+        assert 'bijna_oud' in _stored_engagement()['at_risk']
@@ -0,0 +1,265 @@
+"""
+Tests voor query plans - EXPLAIN QUERY PLAN regressie checks
+Alle SQL statements in database.py, analytics.py en api.py worden tegen het
+schema uit init_db() gepland; hot queries mogen niet terugvallen op een
+full table scan of een temp B-tree sort over de ruwe logs.
+"""
+import ast
+import os
+import re
+import sqlite3
+
+import pytest
+
+import database as db
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['database.py', 'analytics.py', 'api.py']
+
+# Tabellen die meegroeien met verkeer; een SCAN zonder index is hier een regressie
+LARGE_TABLES = {
+    'logs', 'logs_fts', 'log_rollups_hourly', 'log_rollup_ips', 'api_keys', 'webhook_outbox',
+    'audit_logs', 'ai_conversations', 'security_incidents', 'system_errors',
+}
+
+# Bekende uitzonderingen (genormaliseerde SQL prefix -> reden); elke andere SCAN over
+# LARGE_TABLES is een regressie, ook een (covering) index scan
+ALLOWED = {
+    'SELECT c.name, COUNT(l.id) as log_count FROM customers c LEFT JOIN logs l':
+        'admin top-10: sort op aggregaat per klant, logs via idx_logs_customer_timestamp',
+    'SELECT EXISTS (SELECT 1 FROM logs)':
+        'init_db backfill check: EXISTS stopt na de eerste rij',
+    'SELECT l.*, c.name as customer_name FROM logs l JOIN customers c ON l.customer_id = c.id '
+    'ORDER BY l.timestamp DESC, l.id DESC LIMIT ? OFFSET ?':
+        'legacy offset paginatie (admin): index volgorde, stopt na LIMIT + OFFSET rijen; '
+        'zie get_all_logs_page',
+    'SELECT l.*, c.name as customer_name FROM logs l JOIN customers c ON l.customer_id = c.id '
+    'WHERE l.data LIKE ?':
+        'search_logs fallback zonder FTS5: LIKE %..% kan geen index gebruiken',
+    'SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT ?':
+        'audit trail zonder filter: index volgorde, stopt na LIMIT rijen',
+    'SELECT status, COUNT(*) AS n FROM webhook_outbox GROUP BY status':
+        'monitoring: outbox wordt na WEBHOOK_RETENTION_DAYS opgeschoond',
+}
+
+# Fragmenten van dynamisch opgebouwde queries (exacte match); de volledige vorm staat in COMPOSED_QUERIES
+DYNAMIC_FRAGMENTS = {
+    'SELECT * FROM audit_logs WHERE 1=1',
+    'SELECT * FROM logs',
+    'SELECT l.*, c.name as customer_name FROM logs l JOIN customers c ON l.customer_id = c.id',
+}
+
+# Volledig opgebouwde varianten van dynamische queries
+COMPOSED_QUERIES = [
+    ('analytics.get_audit_logs',
+     'SELECT * FROM audit_logs WHERE 1=1 AND action = ? ORDER BY timestamp DESC LIMIT ?'),
+    ('database._fetch_logs_page.customer.next',
+     'SELECT * FROM logs WHERE customer_id = ? AND (timestamp, id) < (?, ?) '
+     'ORDER BY timestamp DESC, id DESC LIMIT ?'),
+    ('database._fetch_logs_page.customer.prev',
+     'SELECT * FROM logs WHERE customer_id = ? AND (timestamp, id) > (?, ?) '
+     'ORDER BY timestamp ASC, id ASC LIMIT ?'),
+    ('database.search_logs_page',
+     "SELECT rowid FROM logs_fts WHERE logs_fts MATCH ? AND rank MATCH 'bm25(1.0, 0.0)' "
+     'ORDER BY rank LIMIT ?'),
+    ('database._fetch_search_rows',
+     'SELECT l.*, c.name as customer_name, bm25(logs_fts, 1.0, 0.0) as score FROM logs_fts '
+     'JOIN logs l ON l.id = logs_fts.rowid JOIN customers c ON l.customer_id = c.id '
+     'WHERE logs_fts MATCH ? AND logs_fts.rowid IN (?, ?, ?)'),
+    ('database._fetch_logs_page.all.next',
+     'SELECT l.*, c.name as customer_name FROM logs l JOIN customers c ON l.customer_id = c.id '
+     'WHERE (l.timestamp, l.id) < (?, ?) ORDER BY l.timestamp DESC, l.id DESC LIMIT ?'),
+    ('database.get_syncable_integrations',
+     "SELECT * FROM integrations WHERE integration_type IN (?, ?) AND status != 'disabled' "
+     'ORDER BY last_sync IS NOT NULL, last_sync'),
+    ('database._enqueue_webhook_events',
+     'SELECT id, customer_id, events FROM customer_webhooks WHERE customer_id IN (?, ?) AND is_active = 1'),
+    ('database.claim_webhook_deliveries',
+     'SELECT id, url, secret, is_active FROM customer_webhooks WHERE id IN (?, ?)'),
+]
+
+# f-string SQL die bewust niet in COMPOSED_QUERIES staat (functie -> reden)
+FSTRING_EXEMPT = {
+    'database._rebuild_log_rollups':
+        'catch-up job: herbouwt rollups bewust vanuit alle logs (of alle logs van één klant)',
+}
+
+_SQL_START = re.compile(r'^(SELECT|INSERT|UPDATE|DELETE|WITH)\s')
+_SQL_KEYWORDS = (
+    'WHERE', 'ON', 'LEFT', 'INNER', 'CROSS', 'JOIN', 'GROUP', 'ORDER', 'LIMIT', 'USING', 'SET',
+    'AND', 'OR', 'UNION', 'HAVING', 'WINDOW', 'NATURAL',
+)
+# Alias groep slaat keywords over: in "FROM logs_fts JOIN logs l" is JOIN geen alias van logs_fts
+_TABLE_REF = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:%s)\b)(\w+))?' % '|'.join(_SQL_KEYWORDS),
+    re.IGNORECASE,
+)
+# f-strings die met een SQL keyword beginnen of een WHERE/ORDER BY fragment zijn
+_FSTRING_SQL = re.compile(r'^(SELECT|INSERT|UPDATE|DELETE|WITH)\s|\b(FROM|WHERE|ORDER BY)\b')
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def _collect_statements():
+    """Alle SQL string literals (geen f-string fragmenten) per module"""
+    statements = []
+    for module in MODULES:
+        with open(os.path.join(PROJECT_ROOT, module), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+
+        fstring_parts = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.JoinedStr):
+                fstring_parts.update(id(v) for v in node.values)
+
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Constant) or not isinstance(node.value, str):
+                continue
+            if id(node) in fstring_parts:
+                continue
+            sql = node.value.strip()
+            if _SQL_START.match(sql):
+                statements.append((f'{module}:{node.lineno}', sql))
+    return statements
+
+
+def _collect_fstring_sites():
+    """(module.functie, locatie) voor elke f-string met SQL: die worden pas bij runtime compleet"""
+    sites = []
+    for module in MODULES:
+        with open(os.path.join(PROJECT_ROOT, module), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for func in ast.walk(tree):
+            if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(func):
+                if not isinstance(node, ast.JoinedStr):
+                    continue
+                text = ' '.join(''.join(
+                    v.value if isinstance(v, ast.Constant) else '{}' for v in node.values
+                ).split())
+                if _FSTRING_SQL.search(text):
+                    sites.append((f'{module[:-3]}.{func.name}', f'{module}:{node.lineno}'))
+    return sites
+
+
+def _aliases(sql):
+    """Map alias/tabelnaam -> tabelnaam voor alle FROM/JOIN referenties"""
+    mapping = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        mapping[table] = table
+        if alias:
+            mapping[alias] = table
+    return mapping
+
+
+def _violations(sql, plan):
+    aliases = _aliases(sql)
+    touches_logs = 'logs' in aliases.values()
+    problems = []
+    for detail in plan:
+        match = re.match(r'SCAN (\w+)(.*)', detail)
+        if match and aliases.get(match.group(1), match.group(1)) in LARGE_TABLES:
+            # FTS5 rapporteert een MATCH als SCAN ... VIRTUAL TABLE INDEX n:M..; dat is een index lookup
+            if re.search(r'VIRTUAL TABLE INDEX \d+:\S*M', match.group(2)):
+                continue
+            # Ook een (covering) index scan leest de hele tabel; alleen SEARCH is begrensd
+            problems.append(detail)
+        if touches_logs and 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+@pytest.fixture(scope='module')
+def plan_conn(tmp_path_factory):
+    """Verse database met het volledige schema en indexen uit init_db()"""
+    original = db.DATABASE
+    db.DATABASE = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    try:
+        db.init_db()
+        conn = sqlite3.connect(db.DATABASE)
+        yield conn
+        conn.close()
+    finally:
+        db.close_pool()
+        db.DATABASE = original
+
+
+def _explain(conn, sql):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * sql.count('?'))]
+
+
+STATEMENTS = _collect_statements()
+
+
+def test_statements_collected():
+    """Sanity check: de extractor vindt de bekende hot queries"""
+    joined = [_normalize(sql) for _, sql in STATEMENTS]
+    assert any(s.startswith('SELECT * FROM logs WHERE customer_id = ?') for s in joined)
+    assert len(STATEMENTS) > 50
+
+
+@pytest.mark.parametrize('location,sql', STATEMENTS, ids=[loc for loc, _ in STATEMENTS])
+def test_query_plan_has_no_full_scan_or_sort(plan_conn, location, sql):
+    normalized = _normalize(sql)
+    if normalized in DYNAMIC_FRAGMENTS:
+        pytest.skip('fragment van dynamische query, zie COMPOSED_QUERIES')
+    if any(normalized.startswith(prefix) for prefix in ALLOWED):
+        pytest.skip(next(reason for prefix, reason in ALLOWED.items() if normalized.startswith(prefix)))
+
+    plan = _explain(plan_conn, sql)
+    problems = _violations(sql, plan)
+    assert not problems, f'{location} degradeert naar {problems}:\n{normalized}'
+
+
+@pytest.mark.parametrize('name,sql', COMPOSED_QUERIES, ids=[n for n, _ in COMPOSED_QUERIES])
+def test_composed_query_plan(plan_conn, name, sql):
+    problems = _violations(sql, _explain(plan_conn, sql))
+    assert not problems, f'{name} degradeert naar {problems}'
+
+
+def test_fstring_sql_is_covered():
+    """Elke f-string SQL site staat in COMPOSED_QUERIES of FSTRING_EXEMPT"""
+    composed = [name for name, _ in COMPOSED_QUERIES]
+    missing = sorted({
+        f'{func} ({location})' for func, location in _collect_fstring_sites()
+        if func not in FSTRING_EXEMPT
+        and not any(name == func or name.startswith(func + '.') for name in composed)
+    })
+    assert not missing, f'f-string SQL zonder COMPOSED_QUERIES entry: {missing}'
+
+
+def test_aliases_skip_keywords():
+    """Regressie: JOIN direct na een tabel zonder alias is geen alias"""
+    sql = ('SELECT l.* FROM logs_fts JOIN logs l ON l.id = logs_fts.rowid '
+           'JOIN customers c ON l.customer_id = c.id WHERE logs_fts MATCH ?')
+    assert _aliases(sql) == {'logs_fts': 'logs_fts', 'logs': 'logs', 'l': 'logs',
+                             'customers': 'customers', 'c': 'customers'}
+    assert _violations(sql + ' ORDER BY l.timestamp', ['USE TEMP B-TREE FOR ORDER BY'])
+
+
+def test_index_scan_over_large_table_is_flagged(plan_conn):
+    """Een covering index scan zonder per-klant filter is ook een full scan"""
+    for sql in ('SELECT COUNT(*) FROM logs', 'SELECT COUNT(*) FROM webhook_outbox',
+                "SELECT COUNT(*) FROM logs_fts WHERE data LIKE 'x%'"):
+        assert _violations(sql, _explain(plan_conn, sql)), sql
+    assert not _violations('SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?',
+                           _explain(plan_conn, 'SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?'))
+
+
+def test_customer_logs_uses_composite_index(plan_conn):
+    plan = _explain(plan_conn, '''
+        SELECT * FROM logs WHERE customer_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?
+    ''')
+    assert any('idx_logs_customer_timestamp' in step for step in plan)
+    assert not any('TEMP B-TREE' in step for step in plan)
+
+
+def test_redundant_single_column_index_dropped(plan_conn):
+    indexes = {row[0] for row in plan_conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'logs'"
+    )}
+    assert 'idx_logs_customer_timestamp' in indexes
+    assert 'idx_logs_customer' not in indexes
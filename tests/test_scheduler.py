@@ -0,0 +1,153 @@
+"""
+Tests voor scheduler.py - Leader lease, run historie en onderhoudsjobs
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import database as db
+import scheduler
+
+
+@pytest.fixture
+def make_scheduler(temp_db):
+    created = []
+
+    def make(holder, lease_seconds=60):
+        s = scheduler.JobScheduler(holder=holder, lease_seconds=lease_seconds, timezone='UTC')
+        created.append(s)
+        return s
+    yield make
+    for s in created:
+        s.shutdown()
+
+
+def _runs():
+    with db.get_db() as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT * FROM system_errors WHERE component = 'scheduler' ORDER BY id").fetchall()]
+
+
+class TestLeaderLease:
+
+    def test_only_one_holder_until_released(self, make_scheduler):
+        a, b = make_scheduler('worker-a'), make_scheduler('worker-b')
+        assert a.heartbeat() is True
+        assert b.heartbeat() is False
+        assert a.heartbeat() is True  # Verlengen door dezelfde holder
+        assert db.get_lease(scheduler.LEASE_NAME)['holder'] == 'worker-a'
+
+        a.shutdown()
+        assert db.get_lease(scheduler.LEASE_NAME) is None
+        assert b.heartbeat() is True
+
+    def test_expired_lease_is_taken_over(self, make_scheduler):
+        a, b = make_scheduler('worker-a', lease_seconds=0.2), make_scheduler('worker-b')
+        assert a.heartbeat()
+        assert not b.heartbeat()
+        time.sleep(0.3)
+        assert b.heartbeat()
+        assert not a.heartbeat()
+
+    def test_concurrent_acquire_has_single_winner(self, make_scheduler):
+        schedulers = [make_scheduler(f'worker-{i}') for i in range(8)]
+        barrier = threading.Barrier(len(schedulers))
+        results = []
+
+        def run(s):
+            barrier.wait()
+            results.append(s.heartbeat())
+        threads = [threading.Thread(target=run, args=(s,)) for s in schedulers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(results) == [False] * 7 + [True]
+
+
+class TestJobRuns:
+
+    def test_job_runs_only_on_leader_and_records_duration(self, make_scheduler):
+        calls = []
+        a, b = make_scheduler('worker-a'), make_scheduler('worker-b')
+        for s in (a, b):
+            s.add_interval_job('count', lambda: calls.append(1) or 3, seconds=60, jitter=5)
+
+        assert a.run_job('count') is True
+        assert b.run_job('count') is None
+        assert calls == [1]
+        assert b.stats()['skipped_not_leader'] == 1
+
+        [run] = _runs()
+        assert run['severity'] == 'info' and run['error_type'] == scheduler.RUN_TYPE
+        metadata = json.loads(run['metadata'])
+        assert metadata['job'] == 'count' and metadata['status'] == 'success'
+        assert metadata['result'] == 3 and metadata['holder'] == 'worker-a'
+        assert metadata['duration_ms'] >= 0
+
+    def test_failure_is_recorded_with_stack_trace(self, make_scheduler):
+        s = make_scheduler('worker-a')
+
+        def broken():
+            raise ValueError('kapot')
+        s.add_cron_job('broken', broken, '0 3 * * *', jitter=60)
+
+        assert s.run_job('broken') is False
+        [run] = _runs()
+        assert run['severity'] == 'high' and run['error_type'] == scheduler.FAILED_TYPE
+        assert 'ValueError: kapot' in run['stack_trace']
+        assert json.loads(run['metadata'])['status'] == 'failed'
+
+    def test_history_and_latency_per_job(self, make_scheduler):
+        s = make_scheduler('worker-a')
+        s.add_interval_job('fast', lambda: None, seconds=60)
+        s.add_interval_job('slow', lambda: time.sleep(0.02), seconds=60)
+        for _ in range(3):
+            s.run_job('fast')
+        s.run_job('slow')
+
+        history = scheduler.get_job_history(10)
+        assert [r['job'] for r in history] == ['slow', 'fast', 'fast', 'fast']
+        assert [r['job'] for r in scheduler.get_job_history(10, job='slow')] == ['slow']
+
+        latency = scheduler.get_job_latency(7)
+        assert latency['fast']['runs'] == 3 and latency['fast']['failures'] == 0
+        assert latency['slow']['p50_ms'] >= 20
+        assert latency['slow']['last_status'] == 'success'
+
+    def test_started_scheduler_fires_interval_job(self, make_scheduler):
+        fired = threading.Event()
+        s = make_scheduler('worker-a')
+        s.add_interval_job('tick', fired.set, seconds=0.2)
+        s.start()
+        assert s.running and s.is_leader
+        assert fired.wait(3)
+        assert [job['name'] for job in s.jobs()] == ['tick']
+        assert s.jobs()[0]['next_run_time'] is not None
+
+
+class TestMaintenanceJobs:
+
+    def test_default_jobs_registered(self, make_scheduler):
+        s = make_scheduler('worker-a')
+        scheduler.register_default_jobs(s)
+        names = {job['name'] for job in s.jobs()}
+        assert {'cleanup_expired_blacklists', 'cleanup_old_errors', 'database_backup',
+                'rebuild_log_rollups'} <= names
+
+    def test_backup_job_uses_configured_paths(self, temp_db, tmp_path, monkeypatch):
+        monkeypatch.setattr(scheduler.Config, 'BACKUP_DIR', str(tmp_path / 'backups'))
+        result = scheduler._backup_database()
+        assert (tmp_path / 'backups' / result['backup']).exists()
+        assert result['deleted'] == 0
+
+    def test_expired_blacklist_cleanup_counts_only_active(self, temp_db):
+        with db.get_db() as conn:
+            conn.execute('''
+                INSERT INTO ip_blacklist (ip_address, reason, expires_at, is_active)
+                VALUES ('10.0.0.1', 'test', datetime('now', '-1 hour'), 1)
+            ''')
+        assert scheduler._cleanup_expired_blacklists() == 1
+        assert scheduler._cleanup_expired_blacklists() == 0
@@ -156,6 +156,73 @@ class TestAIThreatDetector:
         assert any(t['type'] == 'suspicious_characters' for t in result['threats'])
 
 
+def _legacy_analyze(detector, request_data):
+    """Oude implementatie: re.search per patroon over str(request_data)"""
+    import re
+    score = 0
+    for pattern in detector.attack_patterns:
+        if re.search(pattern, str(request_data)):
+            score += 50
+    if len(str(request_data)) > 10000:
+        score += 20
+    for char in detector.suspicious_chars:
+        if char in str(request_data):
+            score += 30
+    return score
+
+
+class TestThreatScanner:
+    """Test de anchored scanner tegen de oude per-patroon implementatie"""
+
+    CORPUS = [
+        'Hello, I want to log my hours',
+        "'; DROP TABLE customers; --",
+        '<script>eval(document.cookie)</script>',
+        '../../etc/passwd%00',
+        'password=hunter2 and select * from x',
+        '<?php system("id"); ?>',
+        '{$var} <% code %>',
+        'UNION SELECT password: 1',
+        'nothing\x00here',
+        'A' * 15000 + '<script>x</script>',
+    ]
+
+    @pytest.fixture
+    def detector(self):
+        from security import AIThreatDetector
+        return AIThreatDetector()
+
+    @pytest.mark.parametrize('payload', CORPUS)
+    def test_same_score_as_legacy(self, detector, payload):
+        assert detector.analyze_request(payload)['threat_score'] == _legacy_analyze(detector, payload)
+
+    def test_overlapping_patterns_all_found(self, detector):
+        result = detector.analyze_request('<script>eval(x)</script>')
+        patterns = [t['pattern'] for t in result['threats']]
+        assert patterns == [detector.attack_patterns[1], detector.attack_patterns[3]]
+        assert result['risk_level'] == 'high'
+
+    def test_fields_scanned_separately(self, detector):
+        result = detector.analyze_request({
+            'args': {'q': 'hello'},
+            'form': {},
+            'json': None,
+            'headers': {'User-Agent': '../../etc'},
+        })
+        assert [t['type'] for t in result['threats']] == ['pattern_match']
+
+    def test_early_exit_keeps_decision(self, detector):
+        payload = {'args': {'q': "DROP TABLE x; <script>a</script>"}, 'headers': {'X': '<?php'}}
+        full = detector.analyze_request(payload)
+        fast = detector.analyze_request(payload, early_exit=True)
+        assert fast['risk_level'] == full['risk_level'] == 'high'
+        assert len(fast['threats']) < len(full['threats'])
+
+    def test_large_payload_short_circuit(self, detector):
+        result = detector.analyze_request({'json': {'blob': 'A' * (detector.MAX_SCAN_CHARS * 2)}})
+        assert [t['type'] for t in result['threats']] == ['large_payload']
+
+
 class TestHoneypotManager:
     """Test honeypot systeem"""
 
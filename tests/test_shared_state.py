@@ -0,0 +1,233 @@
+"""
+Tests voor shared_state.py - Gedeelde state over gunicorn workers
+"""
+import multiprocessing
+import time
+
+import pytest
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from unittest.mock import patch
+
+import shared_state
+from config import Config
+
+
+def _hammer(url, n):
+    """Child proces: eigen backend instantie op hetzelfde bestand"""
+    backend = shared_state.create_backend(url)
+    for _ in range(n):
+        backend.incr('shared', 60)
+        backend.record_event('failed:1.2.3.4', 600)
+    backend.close()
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        b = shared_state.MemoryBackend()
+    else:
+        b = shared_state.SQLiteBackend(str(tmp_path / 'state.db'))
+    yield b
+    b.close()
+
+
+class TestBackends:
+    """Zelfde gedrag voor memory en SQLite"""
+
+    def test_incr_and_expiry(self, backend):
+        assert backend.incr('k', 60) == 1
+        assert backend.incr('k', 60, amount=2) == 3
+        assert backend.get('k') == 3
+        assert backend.get_expiry('k') > time.time()
+        backend.clear('k')
+        assert backend.get('k') == 0
+
+    def test_expired_window_restarts(self, backend):
+        backend.incr('k', 0.01)
+        time.sleep(0.02)
+        assert backend.get('k') == 0
+        assert backend.incr('k', 60) == 1
+
+    def test_event_window(self, backend):
+        for _ in range(3):
+            backend.record_event('e', 60)
+        assert backend.count_events('e', 60) == 3
+        assert backend.count_events('other', 60) == 0
+
+    def test_sets_with_ttl(self, backend):
+        backend.set_add('bl', '1.1.1.1')
+        backend.set_add('bl', '2.2.2.2', ttl=0.01)
+        time.sleep(0.02)
+        assert backend.set_contains('bl', '1.1.1.1')
+        assert not backend.set_contains('bl', '2.2.2.2')
+        assert backend.set_members('bl') == {'1.1.1.1'}
+
+    def test_set_replace(self, backend):
+        backend.set_add('wl', 'old')
+        backend.set_replace('wl', {'a': None, 'b': time.time() + 60})
+        assert backend.set_members('wl') == {'a', 'b'}
+
+    def test_incomplete_backend_fails_on_instantiation(self):
+        class CountersOnly(shared_state.SharedStateBackend):
+            def incr(self, key, expiry, amount=1):
+                return amount
+
+        with pytest.raises(TypeError, match='abstract'):
+            CountersOnly()
+
+
+class TestSlidingWindowCounter:
+    """Gebucketde tellers met vaste bovengrens en LRU eviction"""
+
+    def test_counts_within_window(self):
+        counter = shared_state.SlidingWindowCounter(max_keys=10, bucket_seconds=10)
+        now = 1_000_000.0
+        counter.record('ip', 1800, now=now - 900)
+        for _ in range(3):
+            counter.record('ip', 1800, now=now)
+        assert counter.count('ip', 600, now=now) == 3
+        assert counter.count('ip', 1800, now=now) == 4
+        assert counter.count('other', 600, now=now) == 0
+
+    def test_buckets_bounded_per_key(self):
+        counter = shared_state.SlidingWindowCounter(max_keys=10, bucket_seconds=10)
+        now = 1_000_000.0
+        for i in range(10000):
+            counter.record('ip', 600, now=now + i)
+        stats = counter.stats()
+        assert stats['buckets'] <= 600 // 10 + 2
+        assert counter.count('ip', 600, now=now + 9999) >= 600
+
+    def test_lru_eviction_caps_keys(self):
+        counter = shared_state.SlidingWindowCounter(max_keys=100, bucket_seconds=10)
+        now = 1_000_000.0
+        for i in range(1000):
+            counter.record(f'10.0.{i // 256}.{i % 256}', 1800, now=now)
+        stats = counter.stats()
+        assert stats['keys'] == 100
+        assert stats['evictions'] == 900
+        assert counter.count('10.0.3.231', 600, now=now) == 1  # laatst actief
+        assert counter.count('10.0.0.0', 600, now=now) == 0    # geëvict
+
+    def test_recently_active_key_survives_eviction(self):
+        counter = shared_state.SlidingWindowCounter(max_keys=2, bucket_seconds=10)
+        counter.record('a', 600, now=100.0)
+        counter.record('b', 600, now=101.0)
+        counter.record('a', 600, now=102.0)
+        counter.record('c', 600, now=103.0)
+        assert counter.count('a', 600, now=103.0) == 2
+        assert counter.count('b', 600, now=103.0) == 0
+
+    def test_idle_keys_expire(self):
+        counter = shared_state.SlidingWindowCounter(max_keys=100, bucket_seconds=10)
+        counter.record('old', 600, now=1000.0)
+        counter.record('new', 600, now=5000.0)
+        stats = counter.stats()
+        assert stats['keys'] == 1
+        assert stats['expired'] == 1
+
+    def test_sqlite_prunes_expired_buckets(self, tmp_path):
+        backend = shared_state.SQLiteBackend(str(tmp_path / 'state.db'))
+        with patch.object(shared_state.SQLiteBackend, 'EVENT_PRUNE_EVERY', 1):
+            with patch.object(shared_state.time, 'time', return_value=1_000_000.0):
+                backend.record_event('old', 60)
+            backend.record_event('new', 60)
+        assert backend.event_stats()['keys'] == 1
+        assert backend.count_events('new', 60) == 1
+        backend.close()
+
+
+class TestSQLiteAcrossProcesses:
+    """Meerdere processen (zoals gunicorn workers) delen één state bestand"""
+
+    def test_counters_and_events_consistent(self, tmp_path):
+        url = f'sqlite:///{tmp_path}/state.db'
+        ctx = multiprocessing.get_context('spawn')
+        workers = [ctx.Process(target=_hammer, args=(url, 50)) for _ in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(60)
+            assert w.exitcode == 0
+
+        backend = shared_state.create_backend(url)
+        assert backend.get('shared') == 200
+        assert backend.count_events('failed:1.2.3.4', 600) == 200
+        backend.close()
+
+    def test_sqlite_url_paths(self):
+        assert shared_state._sqlite_path('sqlite:///state.db') == 'state.db'
+        assert shared_state._sqlite_path('sqlite:////var/data/state.db') == '/var/data/state.db'
+
+
+class TestLimiterStorage:
+    """flask_limiter gebruikt de gedeelde SQLite storage"""
+
+    def test_sqlite_storage_uri_enforces_limit_across_apps(self, tmp_path):
+        url = f'sqlite:///{tmp_path}/limits.db'
+
+        def make_app():
+            app = Flask(__name__)
+            Limiter(app=app, key_func=get_remote_address, default_limits=['3 per minute'], storage_uri=url)
+            app.add_url_rule('/', 'index', lambda: 'ok')
+            return app
+
+        # Twee apps = twee workers met elk een eigen Limiter
+        first, second = make_app().test_client(), make_app().test_client()
+        statuses = [client.get('/').status_code for client in (first, second, first, second)]
+        assert statuses == [200, 200, 200, 429]
+
+    def test_storage_accepts_limits_3_and_5_signatures(self, tmp_path):
+        storage = shared_state.SharedStateLimitsStorage(f'sqlite:///{tmp_path}/limits.db')
+        assert storage.incr('k', 60, amount=2) == 2              # limits 5
+        assert storage.incr('k', 60, False, amount=1) == 3       # limits 3/4
+        expiry = storage.get_expiry('k')
+        time.sleep(0.01)
+        assert storage.incr('k', 60, elastic_expiry=True) == 4
+        assert storage.get_expiry('k') > expiry
+
+    def test_only_fixed_window_strategy(self, tmp_path):
+        from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+        storage = shared_state.SharedStateLimitsStorage(f'sqlite:///{tmp_path}/limits.db')
+        FixedWindowRateLimiter(storage)
+        with pytest.raises(NotImplementedError):
+            MovingWindowRateLimiter(storage)
+
+    def test_limiter_uri_defaults_to_shared_state(self):
+        with patch.object(Config, 'RATELIMIT_STORAGE_URL', ''), \
+                patch.object(Config, 'SHARED_STATE_URL', 'sqlite:///x.db'):
+            assert shared_state.limiter_storage_uri() == 'sqlite:///x.db'
+        with patch.object(Config, 'RATELIMIT_STORAGE_URL', 'redis://cache:6379'):
+            assert shared_state.limiter_storage_uri() == 'redis://cache:6379'
+
+
+class TestIPSecurityManagerSharedState:
+    """Twee managers (workers) op één backend zien elkaars state"""
+
+    def test_blacklist_and_failures_visible_to_other_worker(self, temp_db, tmp_path):
+        from security import IPSecurityManager
+        url = f'sqlite:///{tmp_path}/state.db'
+        worker_a = IPSecurityManager(backend=shared_state.create_backend(url))
+        worker_b = IPSecurityManager(backend=shared_state.create_backend(url))
+
+        for _ in range(3):
+            worker_a.record_failed_attempt('9.9.9.9', 'wrong password')
+        assert worker_b.check_ip_reputation('9.9.9.9')['status'] == 'suspicious'
+
+        worker_a.record_failed_attempt('9.9.9.9', 'wrong password')
+        assert worker_b.record_failed_attempt('9.9.9.9', 'wrong password') is True
+        assert worker_a.is_blacklisted('9.9.9.9')
+
+    def test_load_lists_uses_blacklist_expiry(self, temp_db):
+        import database as db
+        from security import IPSecurityManager
+        with db.get_db() as conn:
+            conn.execute("INSERT INTO ip_blacklist (ip_address, expires_at) VALUES ('7.7.7.7', datetime('now', '-1 hour'))")
+            conn.execute("INSERT INTO ip_blacklist (ip_address, expires_at) VALUES ('8.8.4.4', datetime('now', '+1 hour'))")
+            conn.execute("INSERT INTO ip_blacklist (ip_address, expires_at) VALUES ('8.8.4.4', NULL)")
+        manager = IPSecurityManager(backend=shared_state.MemoryBackend())
+        assert not manager.is_blacklisted('7.7.7.7')
+        assert manager.is_blacklisted('8.8.4.4')
+        assert manager.backend._sets['ip_blacklist']['8.8.4.4'] is None
@@ -0,0 +1,67 @@
+"""
+Tests voor unit_economics.py - Batch profitability moet gelijk zijn aan het per-klant pad
+"""
+import pytest
+
+import database as db
+import unit_economics
+from unit_economics import UnitEconomicsCalculator, get_customer_grades
+
+
+@pytest.fixture
+def customers(temp_db):
+    """Klanten over alle tiers met verschillende leeftijd, usage en API gebruik"""
+    tiers = list(unit_economics.PricingConfig.PRICING_TIERS)
+    ids = []
+    with db.get_db() as conn:
+        for i in range(18):
+            tier = tiers[i % len(tiers)]
+            cursor = conn.execute('''
+                INSERT INTO customers (name, access_code, pricing_tier, status, created_at)
+                VALUES (?, ?, ?, ?, datetime('now', ?))
+            ''', (f'Klant {i}', f'CODE{i:04d}', tier, 'inactive' if i == 17 else 'active',
+                  f'-{i * 37} days'))
+            customer_id = cursor.lastrowid
+            ids.append(customer_id)
+            # Oude en recente logs; sommige klanten ver boven hun included_logs
+            conn.executemany('''
+                INSERT INTO logs (customer_id, ip_address, data, timestamp)
+                VALUES (?, '1.2.3.4', 'x', datetime('now', ?))
+            ''', [(customer_id, f'-{(n * 7) % 90} days') for n in range(i * 40)])
+            if i % 3:
+                conn.execute('''
+                    INSERT INTO api_keys (customer_id, key_value, name, usage_count)
+                    VALUES (?, ?, 'key', ?)
+                ''', (customer_id, f'mvai-key-{i}', i * 12345))
+    return ids
+
+
+class TestProfitabilityBatch:
+
+    def test_batch_matches_per_customer_calculation(self, customers):
+        calculator = UnitEconomicsCalculator()
+        batch = calculator.calculate_profitability_batch()
+        assert [p['customer_id'] for p in batch] == customers[:17]  # inactive klant niet mee
+        for profitability in batch:
+            expected = calculator.calculate_customer_profitability(profitability['customer_id'])
+            assert {k: v for k, v in profitability.items() if k != 'customer_name'} == expected
+
+    def test_grades_use_batch_path_and_keep_order(self, customers, monkeypatch):
+        reference = []
+        for customer_id in customers[:17]:
+            p = unit_economics.unit_economics.calculate_customer_profitability(customer_id)
+            reference.append((p['grade'], customer_id, p['monthly_profit'], p['profit_margin_pct']))
+        grade_order = ['A+', 'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D', 'F']
+        reference.sort(key=lambda r: grade_order.index(r[0]))
+
+        def per_customer(*args):
+            raise AssertionError('get_customer_grades mag niet per klant rekenen')
+        monkeypatch.setattr(unit_economics.unit_economics, 'calculate_customer_profitability', per_customer)
+
+        grades = get_customer_grades()
+        assert [(g['grade'], g['customer_id'], g['monthly_profit'], g['profit_margin_pct'])
+                for g in grades] == reference
+        assert grades[0]['customer_name'].startswith('Klant ')
+
+    def test_no_customers(self, temp_db):
+        assert get_customer_grades() == []
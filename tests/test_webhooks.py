@@ -0,0 +1,272 @@
+"""
+Tests voor webhooks.py - Outbox + achtergrond delivery naar een lokale HTTP stub
+"""
+import json
+import time
+
+import pytest
+
+import database as db
+import webhooks
+
+
+@pytest.fixture(autouse=True)
+def no_process_dispatcher(monkeypatch):
+    """Outbox rijen blijven staan tot de test zelf een dispatcher start"""
+    monkeypatch.setattr(webhooks.Config, 'ENABLE_WEBHOOKS', False)
+
+
+@pytest.fixture
+def stub(monkeypatch, http_server):
+    """Lokale ontvanger; statuses en delay sturen de antwoorden"""
+    monkeypatch.setattr(webhooks.Config, 'WEBHOOK_ALLOW_PRIVATE_URLS', True)  # Ontvanger op loopback
+    server = http_server(lambda request: (request['status'], {}, b'ok'))
+    server.url += '/hook'
+    return server
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _outbox(status=None):
+    with db.get_db() as conn:
+        rows = conn.execute('SELECT * FROM webhook_outbox WHERE ? IS NULL OR status = ?', (status, status))
+        return [dict(row) for row in rows]
+
+
+class TestOutbox:
+    """Events komen in dezelfde transactie als de bron-write in de outbox"""
+
+    def test_log_insert_enqueues_for_subscribed_webhooks(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'logs', 'http://127.0.0.1:9/a', 's', 'log.created')
+        db.create_webhook(cid, 'legacy', 'http://127.0.0.1:9/b', 's', 'new_log')
+        db.create_webhook(cid, 'tiers', 'http://127.0.0.1:9/c', 's', 'customer.tier_changed')
+        db.create_logs_many([(cid, '1.2.3.4', f'log {i}', None) for i in range(250)])
+
+        rows = _outbox('pending')
+        assert {row['webhook_id'] for row in rows} == {1, 2}
+        # 250 items per webhook gebundeld in rijen van WEBHOOK_BATCH_SIZE
+        assert sorted(row['item_count'] for row in rows if row['webhook_id'] == 1) == [50, 100, 100]
+
+    def test_no_webhooks_no_outbox_rows(self, temp_db, sample_customer):
+        db.create_log(sample_customer['id'], '1.2.3.4', 'data')
+        assert _outbox('pending') == []
+
+    def test_tier_change_event(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'all', 'http://127.0.0.1:9/a', 's')
+        assert db.update_customer_tier(cid, 'professional') == 'starter'
+        db.update_customer_tier(cid, 'professional')  # geen wijziging, geen event
+        rows = _outbox('pending')
+        assert len(rows) == 1
+        assert rows[0]['event'] == 'customer.tier_changed'
+        assert json.loads(rows[0]['payload']) == [{'customer_id': cid, 'old_tier': 'starter', 'new_tier': 'professional'}]
+
+    def test_stripe_tier_change_keeps_customer_id(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'all', 'http://127.0.0.1:9/a', 's')
+        assert db.update_customer_tier(cid, 'enterprise', 'cus_123') == 'starter'
+        assert db.update_customer_tier(cid, 'demo') == 'enterprise'  # Opzegging
+        assert db.get_customer_by_id(cid)['stripe_customer_id'] == 'cus_123'
+        assert [json.loads(r['payload'])[0]['new_tier'] for r in _outbox('pending')] == ['enterprise', 'demo']
+
+    def test_subscription_matching(self):
+        assert db.webhook_subscribes('all', 'log.created')
+        assert db.webhook_subscribes(None, 'integration.synced')
+        assert db.webhook_subscribes('new_log', 'log.created')
+        assert db.webhook_subscribes('log.created, integration.synced', 'integration.synced')
+        assert not db.webhook_subscribes('export', 'log.created')
+
+    def test_claim_is_exclusive_until_lease_expires(self, temp_db, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'a', 'http://127.0.0.1:9/a', 's')
+        db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': 1})
+        claimed = db.claim_webhook_deliveries(10, lease_seconds=60)
+        assert len(claimed) == 1 and claimed[0]['webhook']['url'] == 'http://127.0.0.1:9/a'
+        assert db.claim_webhook_deliveries(10, lease_seconds=60) == []
+
+        with db.get_db() as conn:
+            conn.execute('UPDATE webhook_outbox SET locked_until = 0')
+        assert len(db.claim_webhook_deliveries(10, lease_seconds=60)) == 1
+
+
+class TestHelpers:
+
+    def test_signature_roundtrip(self):
+        header = webhooks.sign_payload('geheim', b'{"a": 1}', timestamp=1000)
+        assert webhooks.verify_signature('geheim', b'{"a": 1}', header, now=1010)
+        assert not webhooks.verify_signature('geheim', b'{"a": 2}', header, now=1010)
+        assert not webhooks.verify_signature('anders', b'{"a": 1}', header, now=1010)
+        assert not webhooks.verify_signature('geheim', b'{"a": 1}', header, now=5000)
+
+    def test_backoff_grows_with_jitter_and_cap(self):
+        assert webhooks.backoff_delay(1, 5, 3600, rng=lambda: 0.0) == 2.5
+        assert webhooks.backoff_delay(4, 5, 3600, rng=lambda: 1.0) == 40
+        assert webhooks.backoff_delay(20, 5, 3600, rng=lambda: 1.0) == 3600
+
+    def test_coalesce_per_webhook_and_event(self):
+        rows = [
+            {'id': 1, 'webhook_id': 1, 'event': 'log.created', 'item_count': 60},
+            {'id': 2, 'webhook_id': 1, 'event': 'log.created', 'item_count': 30},
+            {'id': 3, 'webhook_id': 1, 'event': 'log.created', 'item_count': 20},
+            {'id': 4, 'webhook_id': 2, 'event': 'log.created', 'item_count': 1},
+            {'id': 5, 'webhook_id': 1, 'event': 'customer.tier_changed', 'item_count': 1},
+        ]
+        batches = [[row['id'] for row in batch] for batch in webhooks.coalesce(rows, 100)]
+        assert batches == [[1, 2], [3], [4], [5]]
+
+
+class TestUrlValidation:
+
+    @pytest.mark.parametrize('url', [
+        'http://127.0.0.1:8080/hook', 'http://localhost/hook', 'http://169.254.169.254/latest/meta-data',
+        'https://10.1.2.3/hook', 'http://192.168.1.10/hook', 'http://[::1]/hook',
+        'http://[::ffff:127.0.0.1]/hook', 'http://0.0.0.0/hook', 'ftp://example.com/hook', 'http:///hook',
+    ])
+    def test_internal_addresses_rejected(self, url):
+        assert webhooks.validate_webhook_url(url).startswith('Ongeldige webhook URL')
+
+    def test_public_address_accepted(self, monkeypatch):
+        monkeypatch.setattr(webhooks.socket, 'getaddrinfo',
+                            lambda *args, **kwargs: [(2, 1, 6, '', ('93.184.216.34', 443))])
+        assert webhooks.validate_webhook_url('https://erp.example.com/hook') is None
+
+    def test_unresolvable_host_rejected(self, monkeypatch):
+        def gaierror(*args, **kwargs):
+            raise webhooks.socket.gaierror('not found')
+        monkeypatch.setattr(webhooks.socket, 'getaddrinfo', gaierror)
+        assert 'host niet gevonden' in webhooks.validate_webhook_url('https://nope.example/hook')
+
+    def test_delivery_to_internal_address_fails_without_request(self, temp_db, stub, sample_customer,
+                                                                monkeypatch):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'rebind', stub.url, 'geheim')
+        db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': 7})
+        monkeypatch.setattr(webhooks.Config, 'WEBHOOK_ALLOW_PRIVATE_URLS', False)
+
+        dispatcher = webhooks.WebhookDispatcher(workers=1, timeout=2, poll_interval=0.05)
+        dispatcher.start()
+        try:
+            assert _wait_for(lambda: len(_outbox('failed')) == 1)
+        finally:
+            dispatcher.stop()
+        assert 'UnsafeWebhookURL' in _outbox('failed')[0]['last_error']
+        assert stub.requests == []
+
+
+class TestDispatcher:
+    """Delivery tegen een lokale HTTP stub"""
+
+    @pytest.fixture
+    def dispatcher(self, temp_db, monkeypatch):
+        monkeypatch.setattr(webhooks.Config, 'WEBHOOK_ALLOW_PRIVATE_URLS', True)
+        d = webhooks.WebhookDispatcher(workers=1, timeout=2, max_attempts=3, backoff_base=0.05,
+                                       backoff_max=0.1, poll_interval=0.05)
+        yield d
+        d.stop()
+
+    def test_delivers_signed_coalesced_batch(self, dispatcher, stub, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'erp', stub.url, 'geheim', 'log.created')
+        for i in range(5):
+            db.create_log(cid, '1.2.3.4', f'log {i}')
+
+        dispatcher.start()
+        assert _wait_for(lambda: len(_outbox('delivered')) == 5)
+        assert len(stub.requests) == 1  # Vijf events in één POST
+        request = stub.requests[0]
+        assert request['headers']['X-MVAI-Event'] == 'log.created'
+        assert webhooks.verify_signature('geheim', request['body'], request['headers']['X-MVAI-Signature'])
+        payload = json.loads(stub.requests[0]['body'])
+        assert payload['count'] == 5
+        assert [item['data'] for item in payload['data']] == [f'log {i}' for i in range(5)]
+
+        webhook = db.get_customer_webhooks(cid)[0]
+        assert webhook['trigger_count'] == 1 and webhook['last_status_code'] == 200
+        assert dispatcher.stats()['events_delivered'] == 5
+
+    def test_retries_server_errors_with_backoff(self, dispatcher, stub, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'erp', stub.url, 'geheim')
+        stub.statuses = [500, 503]
+        db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': 7})
+
+        dispatcher.start()
+        assert _wait_for(lambda: len(_outbox('delivered')) == 1)
+        assert len(stub.requests) == 3
+        assert _outbox('delivered')[0]['attempts'] == 3
+        assert dispatcher.stats()['batches_retried'] == 2
+
+    def test_gives_up_after_max_attempts_and_on_client_errors(self, dispatcher, stub, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'kapot', stub.url, 'geheim', 'integration.synced')
+        db.create_webhook(cid, 'afgewezen', stub.url, 'geheim', 'customer.tier_changed')
+        stub.statuses = [500, 500, 500]
+        db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': 7})
+
+        dispatcher.start()
+        assert _wait_for(lambda: len(_outbox('failed')) == 1)
+        assert len(stub.requests) == 3
+
+        stub.statuses = [400]
+        db.update_customer_tier(cid, 'enterprise')
+        dispatcher.wake()
+        assert _wait_for(lambda: len(_outbox('failed')) == 2)
+        assert len(stub.requests) == 4  # 4xx wordt niet herhaald
+
+    def test_network_error_is_retried(self, dispatcher, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'offline', 'http://127.0.0.1:9/hook', 'geheim')
+        db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': 7})
+
+        dispatcher.start()
+        assert _wait_for(lambda: len(_outbox('failed')) == 1)
+        row = _outbox('failed')[0]
+        assert row['attempts'] == 3 and row['last_status_code'] is None
+        assert 'ConnectionError' in row['last_error']
+
+    def test_keep_alive_connection_reused(self, dispatcher, stub, sample_customer):
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'erp', stub.url, 'geheim')
+        dispatcher.start()
+        for i in range(3):
+            db.enqueue_webhook_event(cid, 'integration.synced', {'integration_id': i})
+            dispatcher.wake()
+            assert _wait_for(lambda: len(stub.requests) == i + 1)
+        assert len({r['client'] for r in stub.requests}) == 1
+
+
+class TestRequestPath:
+    """Request threads schrijven alleen de outbox rij; delivery loopt op de achtergrond"""
+
+    def test_create_log_does_not_wait_for_slow_endpoint(self, temp_db, stub, sample_customer, monkeypatch):
+        monkeypatch.setattr(webhooks.Config, 'ENABLE_WEBHOOKS', True)
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'traag', stub.url, 'geheim')
+        stub.delay = 1.0
+
+        start = time.monotonic()
+        db.create_log(cid, '1.2.3.4', 'data')
+        db.create_log(cid, '1.2.3.4', 'data')
+        assert time.monotonic() - start < 0.5
+
+        # De listener heeft de dispatcher van dit proces gestart
+        assert _wait_for(lambda: len(_outbox('delivered')) == 2)
+        assert webhooks.get_webhook_stats()['outbox']['delivered'] == 2
+
+    def test_integration_sync_emits_event(self, temp_db, sample_customer, monkeypatch):
+        import integrations
+        monkeypatch.setattr(integrations, 'pull_pages', lambda *args: iter([([{'order': 1}, {'order': 2}], None)]))
+        cid = sample_customer['id']
+        db.create_webhook(cid, 'sync', 'http://127.0.0.1:9/a', 's', 'integration.synced')
+        assert integrations.sync_integration(3, 'shopify', '{}', cid) == 2
+        rows = _outbox('pending')
+        assert [row['event'] for row in rows] == ['integration.synced']
+        assert json.loads(rows[0]['payload'])[0]['records'] == 2
@@ -0,0 +1,396 @@
+"""
+MVAI Connexx - Webhook Delivery Module
+Achtergrond dispatcher voor de webhook outbox: gebundelde, gesigneerde POSTs via
+gepoolde keep-alive connecties, met retries (exponential backoff + jitter)
+"""
+import atexit
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import database as db
+from config import Config
+from http_sessions import ThreadLocalSessions
+
+SIGNATURE_HEADER = 'X-MVAI-Signature'
+EVENT_HEADER = 'X-MVAI-Event'
+USER_AGENT = 'MVAI-Connexx-Webhooks/1.0'
+
+# Retry bij netwerkfouten, timeouts, rate limiting en server errors; overige 4xx zijn definitief
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+# ═══════════════════════════════════════════════════════
+# URL VALIDATIE (SSRF)
+# ═══════════════════════════════════════════════════════
+
+class UnsafeWebhookURL(ValueError):
+    """Webhook URL wijst naar een intern, privé of gereserveerd adres"""
+
+
+def check_webhook_url(url):
+    """
+    Resolve de host en weiger loopback, privé (RFC1918), link-local (o.a. cloud
+    metadata), multicast en gereserveerde adressen. WEBHOOK_ALLOW_PRIVATE_URLS
+    staat interne ontvangers toe (on-premise / ontwikkeling).
+    Raises UnsafeWebhookURL of socket.gaierror (host niet te resolven).
+    """
+    parts = urlsplit(url or '')
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeWebhookURL('alleen http(s) URLs met een host')
+    if Config.WEBHOOK_ALLOW_PRIVATE_URLS:
+        return
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    for *_, sockaddr in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise UnsafeWebhookURL(f'{parts.hostname} wijst naar intern adres {address}')
+
+
+def validate_webhook_url(url) -> Optional[str]:
+    """Foutmelding voor een webhook URL bij aanmaken, of None als hij veilig is"""
+    try:
+        check_webhook_url(url)
+    except UnsafeWebhookURL as e:
+        return f'Ongeldige webhook URL: {e}'
+    except (socket.gaierror, UnicodeError):
+        return 'Ongeldige webhook URL: host niet gevonden'
+    return None
+
+
+# ═══════════════════════════════════════════════════════
+# SIGNING
+# ═══════════════════════════════════════════════════════
+
+def sign_payload(secret, body: bytes, timestamp=None) -> str:
+    """Signature header waarde: t=<unix ts>,v1=<hex HMAC-SHA256(secret, "<ts>." + body)>"""
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+def verify_signature(secret, body: bytes, header, tolerance=300, now=None) -> bool:
+    """Controleer een X-MVAI-Signature header (voor ontvangers en tests)"""
+    try:
+        parts = dict(part.split('=', 1) for part in (header or '').split(','))
+        timestamp = int(parts['t'])
+    except (KeyError, ValueError):
+        return False
+    now = time.time() if now is None else now
+    if tolerance and abs(now - timestamp) > tolerance:
+        return False
+    expected = sign_payload(secret, body, timestamp).split('v1=', 1)[1]
+    return hmac.compare_digest(expected, parts.get('v1', ''))
+
+
+def backoff_delay(attempt, base, cap, rng=random.random) -> float:
+    """Exponential backoff met 'equal jitter': tussen de helft en het geheel van base * 2^(attempt-1)"""
+    delay = min(cap, base * (2 ** max(0, attempt - 1)))
+    return delay / 2 + rng() * delay / 2
+
+
+def coalesce(rows, batch_size) -> List[List[Dict]]:
+    """Bundel geclaimde outbox rijen per (webhook, event) tot batches van max batch_size items"""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['webhook_id'], row['event']), []).append(row)
+
+    batches = []
+    for group in groups.values():
+        batch, items = [], 0
+        for row in group:
+            if batch and items + row['item_count'] > batch_size:
+                batches.append(batch)
+                batch, items = [], 0
+            batch.append(row)
+            items += row['item_count']
+        batches.append(batch)
+    return batches
+
+
+# ═══════════════════════════════════════════════════════
+# DISPATCHER
+# ═══════════════════════════════════════════════════════
+
+class WebhookDispatcher:
+    """
+    Poller thread claimt outbox rijen die aan de beurt zijn en geeft gebundelde
+    batches aan een worker pool. Request threads schrijven alleen de outbox rij
+    en wachten nooit op een klant endpoint.
+    """
+
+    # Rijen per vrije worker slot per claim (ruimte voor coalescing)
+    CLAIM_ROWS_PER_SLOT = 10
+    PRUNE_INTERVAL_SECONDS = 3600
+
+    def __init__(self, workers=None, timeout=None, max_attempts=None, backoff_base=None,
+                 backoff_max=None, poll_interval=None, batch_size=None):
+        self.workers = workers or Config.WEBHOOK_WORKERS
+        self.timeout = timeout or Config.WEBHOOK_TIMEOUT
+        self.max_attempts = max_attempts or Config.WEBHOOK_MAX_ATTEMPTS
+        self.backoff_base = backoff_base if backoff_base is not None else Config.WEBHOOK_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else Config.WEBHOOK_BACKOFF_MAX
+        self.poll_interval = poll_interval or Config.WEBHOOK_POLL_INTERVAL
+        self.batch_size = batch_size or db.WEBHOOK_BATCH_SIZE
+        # Lease ruim boven de HTTP timeout, zodat alleen rijen van een gecrashte worker opnieuw geclaimd worden
+        self.lease_seconds = max(60.0, self.timeout * 6)
+        self.max_inflight = self.workers * 2
+        self.pid = os.getpid()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._start_lock = threading.Lock()
+        self._sessions = ThreadLocalSessions(headers={'User-Agent': USER_AGENT})
+        self._inflight = 0
+        self._last_prune = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches_sent': 0,
+            'events_delivered': 0,
+            'batches_retried': 0,
+            'batches_failed': 0,
+            'events_failed': 0,
+            'poll_errors': 0,
+            'http_time_ms_total': 0.0,
+            'last_delivery_ms': 0.0,
+            'max_delivery_ms': 0.0,
+        }
+
+    # ── lifecycle ────────────────────────────────────────
+    def start(self):
+        """Start poller en worker pool (lazy, zodat het na een gunicorn fork gebeurt)"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mvai-webhook')
+            self._thread = threading.Thread(target=self._run, name='mvai-webhook-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop poller; lopende POSTs maken hun poging af, wachtende batches gaan terug naar pending"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout or self.timeout + 5)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self._sessions.close()
+
+    @property
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def wake(self):
+        """Nieuwe outbox rijen: direct pollen i.p.v. op het interval wachten"""
+        if not self.running:
+            self.start()
+        self._wake.set()
+
+    # ── poller ───────────────────────────────────────────
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()  # Vóór het pollen, zodat een wake tijdens de poll niet verloren gaat
+            try:
+                self._poll()
+                self._maybe_prune()
+            except Exception:
+                self._incr('poll_errors')
+            self._wake.wait(self.poll_interval)
+
+    def _poll(self):
+        while not self._stop.is_set():
+            with self._stats_lock:
+                free = self.max_inflight - self._inflight
+            if free <= 0:
+                return  # Worker die klaar is wekt de poller weer
+            rows = db.claim_webhook_deliveries(free * self.CLAIM_ROWS_PER_SLOT, self.lease_seconds)
+            if not rows:
+                return
+            for batch in coalesce(rows, self.batch_size):
+                with self._stats_lock:
+                    self._inflight += 1
+                self._executor.submit(self._deliver, batch)
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        if now - self._last_prune >= self.PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            db.prune_webhook_outbox(Config.WEBHOOK_RETENTION_DAYS)
+
+    # ── workers ──────────────────────────────────────────
+    def build_request(self, batch) -> tuple:
+        """JSON body en headers voor een gebundelde batch outbox rijen"""
+        first = batch[0]
+        items = [item for row in batch for item in json.loads(row['payload'])]
+        body = json.dumps({
+            'event': first['event'],
+            'customer_id': first['customer_id'],
+            'webhook_id': first['webhook_id'],
+            'delivery_ids': [row['id'] for row in batch],
+            'count': len(items),
+            'data': items,
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+        }, default=str).encode()
+        headers = {'Content-Type': 'application/json', EVENT_HEADER: first['event']}
+        secret = (first['webhook'] or {}).get('secret')
+        if secret:
+            headers[SIGNATURE_HEADER] = sign_payload(secret, body)
+        return body, headers
+
+    def _deliver(self, batch):
+        ids = [row['id'] for row in batch]
+        try:
+            if self._stop.is_set():
+                db.release_webhook_deliveries(ids)
+                return
+            webhook = batch[0]['webhook']
+            if not webhook or not webhook['is_active']:
+                db.complete_webhook_deliveries(ids, 'failed', error='webhook inactief of verwijderd')
+                return
+            self._attempt(webhook, batch, ids)
+        except Exception:
+            self._incr('poll_errors')
+        finally:
+            with self._stats_lock:
+                self._inflight -= 1
+            self._wake.set()
+
+    def _attempt(self, webhook, batch, ids):
+        body, headers = self.build_request(batch)
+        status_code = error = retry_after = None
+        start = time.monotonic()
+        try:
+            # Opnieuw bij elke delivery: DNS kan sinds het aanmaken naar intern wijzen
+            check_webhook_url(webhook['url'])
+            # Geen redirects volgen: die zouden de adrescontrole omzeilen
+            response = self._sessions.get().post(webhook['url'], data=body, headers=headers,
+                                            timeout=self.timeout, allow_redirects=False)
+            status_code = response.status_code
+            retry_after = response.headers.get('Retry-After')
+            response.content  # Body uitlezen zodat de connectie terug naar de pool gaat
+        except UnsafeWebhookURL as e:
+            db.update_webhook_trigger(webhook['id'], None)
+            db.complete_webhook_deliveries(ids, 'failed', error=f'{type(e).__name__}: {e}'[:500])
+            self._record(0.0, batches_failed=1, events_failed=sum(row['item_count'] for row in batch))
+            return
+        except (requests.RequestException, socket.gaierror) as e:
+            error = f'{type(e).__name__}: {e}'[:500]
+        elapsed_ms = (time.monotonic() - start) * 1000
+
+        db.update_webhook_trigger(webhook['id'], status_code)
+        items = sum(row['item_count'] for row in batch)
+        attempt = max(row['attempts'] for row in batch) + 1
+
+        if status_code is not None and 200 <= status_code < 300:
+            db.complete_webhook_deliveries(ids, 'delivered', status_code)
+            self._record(elapsed_ms, batches_sent=1, events_delivered=items)
+            return
+
+        retryable = status_code is None or status_code >= 500 or status_code in RETRYABLE_STATUS
+        error = error or f'HTTP {status_code}'
+        if retryable and attempt < self.max_attempts:
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            if retry_after and retry_after.isdigit():
+                delay = min(self.backoff_max, max(delay, float(retry_after)))
+            db.retry_webhook_deliveries(ids, time.time() + delay, status_code, error)
+            self._record(elapsed_ms, batches_retried=1)
+        else:
+            db.complete_webhook_deliveries(ids, 'failed', status_code, error)
+            self._record(elapsed_ms, batches_failed=1, events_failed=items)
+
+    # ── monitoring ───────────────────────────────────────
+    def _incr(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _record(self, elapsed_ms, **counters):
+        with self._stats_lock:
+            for key, amount in counters.items():
+                self._stats[key] += amount
+            self._stats['http_time_ms_total'] += elapsed_ms
+            self._stats['last_delivery_ms'] = elapsed_ms
+            self._stats['max_delivery_ms'] = max(self._stats['max_delivery_ms'], elapsed_ms)
+
+    def stats(self) -> Dict:
+        """Delivery counters, HTTP latency en workers"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['inflight'] = self._inflight
+        attempts = stats['batches_sent'] + stats['batches_retried'] + stats['batches_failed']
+        total = stats.pop('http_time_ms_total')
+        stats['avg_delivery_ms'] = round(total / attempts, 3) if attempts else 0.0
+        stats['last_delivery_ms'] = round(stats['last_delivery_ms'], 3)
+        stats['max_delivery_ms'] = round(stats['max_delivery_ms'], 3)
+        stats['workers'] = self.workers
+        stats['running'] = self.running
+        return stats
+
+
+# ═══════════════════════════════════════════════════════
+# MODULE-LEVEL API
+# ═══════════════════════════════════════════════════════
+
+_dispatcher: Optional[WebhookDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return Config.ENABLE_WEBHOOKS and db.WEBHOOKS_ENABLED
+
+
+def get_dispatcher() -> Optional[WebhookDispatcher]:
+    """Dispatcher voor dit proces (None als webhooks uit staan)"""
+    global _dispatcher
+    if not is_enabled():
+        return None
+    if _dispatcher is None or _dispatcher.pid != os.getpid():
+        with _dispatcher_lock:
+            if _dispatcher is None or _dispatcher.pid != os.getpid():
+                _dispatcher = WebhookDispatcher()
+    return _dispatcher
+
+
+def start():
+    """Start de dispatcher, bijv. na een worker (her)start om openstaande outbox rijen op te pakken"""
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.wake()
+
+
+def get_webhook_stats() -> Dict:
+    """Stats voor monitoring (enabled=False als webhooks uit staan)"""
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
+        return {'enabled': False}
+    return {'enabled': True, **dispatcher.stats(), 'outbox': db.get_webhook_outbox_stats()}
+
+
+def shutdown():
+    """Stop de dispatcher (atexit / gunicorn worker_exit)"""
+    global _dispatcher
+    dispatcher = _dispatcher
+    if dispatcher is not None and dispatcher.pid == os.getpid():
+        dispatcher.stop()
+    _dispatcher = None
+
+
+atexit.register(shutdown)
+
+# Nieuwe outbox rijen (create_log, tier changes, ...) wekken de dispatcher van dit proces
+db.add_webhook_listener(start)